@@ -1,3 +1,4 @@
+import array
 import collections.abc
 import threading
 
@@ -62,6 +63,10 @@ basic_permission_to_str_lookup = {
 
 SEARCH_RESULTS_CACHE_TIMEOUT = 4 * 3600
 
+# a paged search keeps its sorted results here so the next page does not have to search again
+SEARCH_CURSOR_TIMEOUT = 3600
+SEARCH_CURSOR_MAX_NUM = 8
+
 SESSION_EXPIRY = 86400
 
 api_request_dialog_open = False
@@ -284,8 +289,12 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         self._search_tag_filter = search_tag_filter
         
         self._last_search_results = None
+        self._last_search_results_cursor = None
         self._search_results_timeout = 0
         
+        # cursor : ( hash_ids array, timeout )
+        self._search_cursors = {}
+        
         self._lock = threading.Lock()
         
     
@@ -342,6 +351,28 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def AddSearchCursor( self, hash_ids: collections.abc.Collection[ int ] ) -> bytes:
+        
+        cursor = HydrusData.GenerateKey()
+        
+        # 8 bytes an id, rather than a list of python ints
+        hash_ids = array.array( 'q', hash_ids )
+        
+        with self._lock:
+            
+            while len( self._search_cursors ) >= SEARCH_CURSOR_MAX_NUM:
+                
+                del self._search_cursors[ next( iter( self._search_cursors ) ) ]
+                
+            
+            self._search_cursors[ cursor ] = ( hash_ids, HydrusTime.GetNow() + SEARCH_CURSOR_TIMEOUT )
+            
+            self._last_search_results_cursor = cursor
+            
+        
+        return cursor
+        
+    
     def CheckAtLeastOnePermission( self, permissions ):
         
         with self._lock:
@@ -505,6 +536,42 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def GetSearchCursorPage( self, cursor: bytes, offset: int, limit: int | None ):
+        
+        with self._lock:
+            
+            if cursor not in self._search_cursors or HydrusTime.TimeHasPassed( self._search_cursors[ cursor ][1] ):
+                
+                raise HydrusExceptions.BadRequestException( 'It looks like those search results are no longer available--please run the search again!' )
+                
+            
+            ( hash_ids, timeout ) = self._search_cursors[ cursor ]
+            
+            self._search_cursors[ cursor ] = ( hash_ids, HydrusTime.GetNow() + SEARCH_CURSOR_TIMEOUT )
+            
+            if not ( self._permits_everything or self._search_tag_filter.AllowsEverything() ) and self._last_search_results_cursor != cursor:
+                
+                # the client ran another search in the meantime, so we need these files to be the ones it can see again
+                
+                self._last_search_results = set( hash_ids )
+                self._last_search_results_cursor = cursor
+                
+                self._search_results_timeout = HydrusTime.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+                
+            
+            if limit is None:
+                
+                page_hash_ids = hash_ids[ offset : ].tolist()
+                
+            else:
+                
+                page_hash_ids = hash_ids[ offset : offset + limit ].tolist()
+                
+            
+            return ( page_hash_ids, len( hash_ids ) )
+            
+        
+    
     def GetSearchTagFilter( self ):
         
         with self._lock:
@@ -528,6 +595,12 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             if self._last_search_results is not None and HydrusTime.TimeHasPassed( self._search_results_timeout ):
                 
                 self._last_search_results = None
+                self._last_search_results_cursor = None
+                
+            
+            for cursor in [ cursor for ( cursor, ( hash_ids, timeout ) ) in self._search_cursors.items() if HydrusTime.TimeHasPassed( timeout ) ]:
+                
+                del self._search_cursors[ cursor ]
                 
             
         
@@ -550,6 +623,7 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 
             
             self._last_search_results = set( hash_ids )
+            self._last_search_results_cursor = None
             
             self._search_results_timeout = HydrusTime.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
             
@@ -1726,6 +1726,8 @@ class Controller( HydrusController.HydrusController ):
             return
             
         
+        self.WriteSynchronous( 'maintain_related_tags_cache', maintenance_mode = maintenance_mode, stop_time = stop_time )
+        
     
     def MaintainHashedSerialisables( self ):
         
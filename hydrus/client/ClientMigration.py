@@ -268,6 +268,22 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         super().__init__( controller, tag_service_key, content_action )
         
         self._reason = 'Mass Migration Job'
+        self._bulk_ingest = False
+        
+    
+    def _DoingBulkIngest( self ):
+        
+        # bulk ingest skips the per-row cache work and regens at the end, which only makes sense for plain adds to a local service
+        
+        return self._bulk_ingest and self._content_action == HC.CONTENT_UPDATE_ADD and self._tag_service_type == HC.LOCAL_TAG
+        
+    
+    def CleanUp( self ):
+        
+        if self._DoingBulkIngest():
+            
+            self._controller.WriteSynchronous( 'migration_bulk_ingest_commit_mappings', self._tag_service_key )
+            
         
     
     def DoSomeWork( self, source ):
@@ -289,6 +305,13 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         
         tags_to_hashes = HydrusData.BuildKeyToListDict( pairs )
         
+        if self._DoingBulkIngest():
+            
+            self._controller.WriteSynchronous( 'migration_bulk_ingest_stage_mappings', self._tag_service_key, list( tags_to_hashes.items() ) )
+            
+            return 'staging: ' + GetBasicSpeedStatement( num_done, time_started_precise )
+            
+        
         if self._content_action == HC.CONTENT_UPDATE_PETITION:
             
             reason = self._reason
@@ -310,6 +333,11 @@ class MigrationDestinationTagServiceMappings( MigrationDestinationTagService ):
         return GetBasicSpeedStatement( num_done, time_started_precise )
         
     
+    def SetBulkIngest( self, bulk_ingest: bool ):
+        
+        self._bulk_ingest = bulk_ingest
+        
+    
     def SetReason( self, reason: str ):
         
         self._reason = reason
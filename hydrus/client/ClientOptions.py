@@ -165,6 +165,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             'elide_page_tab_names' : True,
             'maintain_similar_files_duplicate_pairs_during_active' : True,
             'maintain_similar_files_duplicate_pairs_during_idle' : True,
+            'similar_files_in_memory_search_index' : False,
+            'tag_autocomplete_in_memory_index' : False,
             'show_namespaces' : True,
             'show_number_namespaces' : True,
             'show_subtag_number_namespaces' : True,
@@ -296,6 +298,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             'media_viewer_set_default_viewer_zoom_type_from_menu': False,
             'media_viewer_recenter_media_on_window_resize': True,
             'allow_blurhash_fallback' : True,
+            'use_thumbnail_pack_cache' : False,
             'fade_thumbnails' : True,
             'slideshow_always_play_duration_media_once_through' : False,
             'enable_truncated_images_pil' : True,
@@ -1127,7 +1127,7 @@ class RasterContainerVideo( RasterContainer ):
 
 class HydrusBitmap( ClientCachesBase.CacheableObject ):
     
-    def __init__( self, data, size, depth, compressed = True ):
+    def __init__( self, data, size, depth, compressed = True, data_is_compressed = False ):
         
         super().__init__()
         
@@ -1138,7 +1138,12 @@ class HydrusBitmap( ClientCachesBase.CacheableObject ):
             data = data.tobytes() # this _should_ work and is an emergency relief
             
         
-        if self._compressed:
+        if self._compressed and data_is_compressed:
+            
+            # this came out of GetStoredData, so no need to go round again
+            self._data = data
+            
+        elif self._compressed:
             
             self._data = HydrusCompression.CompressFastBytesToBytes( data )
             
@@ -1215,6 +1220,16 @@ class HydrusBitmap( ClientCachesBase.CacheableObject ):
         return self._size
         
     
+    def GetStoredData( self ):
+        
+        return self._data
+        
+    
+    def IsCompressed( self ):
+        
+        return self._compressed
+        
+    
     def IsFinishedLoading( self ):
         
         return True
@@ -2,6 +2,7 @@ import collections.abc
 import hashlib
 from io import BytesIO
 import json
+import queue
 import random
 import threading
 import time
@@ -18,6 +19,7 @@ from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetwork
 from hydrus.core.networking import HydrusNetworkVariableHandling
 from hydrus.core.networking import HydrusNetworking
+from hydrus.core.processes import HydrusThreading
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientGlobals as CG
@@ -31,6 +33,8 @@ from hydrus.client.networking import ClientNetworkingJobs
 SHORT_DELAY_PERIOD = 50000
 ACCOUNT_SYNC_PERIOD = 250000
 
+REPOSITORY_UPDATE_PREFETCH_DEPTH = 2
+
 def ConvertNumericalRatingToPrettyString( lower, upper, rating, rounded_result = False, out_of = True ):
     
     rating_converted = ( rating * ( upper - lower ) ) + lower
@@ -1703,6 +1707,176 @@ class ServiceRestricted( ServiceRemote ):
         
     
 
+class RepositoryUpdateLoader( object ):
+    
+    # reads and parses update files on a worker thread, so the next update is ready by the time the db has finished with this one
+    
+    def __init__( self, update_hashes: collections.abc.Collection[ bytes ], mime: int, prefetch_depth: int = REPOSITORY_UPDATE_PREFETCH_DEPTH ):
+        
+        self._update_hashes = list( update_hashes )
+        self._mime = mime
+        
+        # bounded, so a fast disk can't fill memory with parsed updates the db isn't ready for
+        self._queue = queue.Queue( maxsize = prefetch_depth )
+        
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop_event = threading.Event()
+        
+        self._time_spent_loading = 0.0
+        self._time_spent_waiting = 0.0
+        
+    
+    def _LoadUpdate( self, update_hash: bytes ):
+        
+        update_path = CG.client_controller.client_files_manager.GetFilePath( update_hash, self._mime )
+        
+        with open( update_path, 'rb' ) as f:
+            
+            update_network_bytes = f.read()
+            
+        
+        try:
+            
+            return HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+            
+        except Exception as e:
+            
+            raise HydrusExceptions.SerialisationException( 'Could not load update {}!'.format( update_hash.hex() ) ) from e
+            
+        
+    
+    def _THREADLoadUpdates( self ):
+        
+        for update_hash in self._update_hashes:
+            
+            start_time = HydrusTime.GetNowPrecise()
+            
+            try:
+                
+                result = ( self._LoadUpdate( update_hash ), None )
+                
+            except Exception as e:
+                
+                result = ( None, e )
+                
+            
+            with self._lock:
+                
+                self._time_spent_loading += HydrusTime.GetNowPrecise() - start_time
+                
+            
+            while True:
+                
+                if self._stop_event.is_set() or HydrusThreading.IsThreadShuttingDown():
+                    
+                    return
+                    
+                
+                try:
+                    
+                    self._queue.put( result, timeout = 0.5 )
+                    
+                    break
+                    
+                except queue.Full:
+                    
+                    continue
+                    
+                
+            
+            ( update, e ) = result
+            
+            if e is not None:
+                
+                return
+                
+            
+        
+    
+    def GetNextUpdate( self ):
+        
+        self.Start()
+        
+        start_time = HydrusTime.GetNowPrecise()
+        
+        while True:
+            
+            try:
+                
+                ( update, e ) = self._queue.get( timeout = 0.5 )
+                
+                break
+                
+            except queue.Empty:
+                
+                HydrusThreading.CheckIfThreadShuttingDown()
+                
+            
+        
+        with self._lock:
+            
+            self._time_spent_waiting += HydrusTime.GetNowPrecise() - start_time
+            
+        
+        if e is not None:
+            
+            raise e
+            
+        
+        return update
+        
+    
+    def GetTimes( self ) -> tuple[ float, float ]:
+        
+        """
+        Returns ( time spent reading and parsing updates in the background, time the caller spent blocked waiting on one ).
+        """
+        
+        with self._lock:
+            
+            return ( self._time_spent_loading, self._time_spent_waiting )
+            
+        
+    
+    def Start( self ):
+        
+        with self._lock:
+            
+            if self._started:
+                
+                return
+                
+            
+            self._started = True
+            
+        
+        if len( self._update_hashes ) > 0:
+            
+            CG.client_controller.CallToThread( self._THREADLoadUpdates )
+            
+        
+    
+    def Stop( self ):
+        
+        self._stop_event.set()
+        
+        # let go of anything we prefetched but won't use
+        
+        while True:
+            
+            try:
+                
+                self._queue.get_nowait()
+                
+            except queue.Empty:
+                
+                break
+                
+            
+        
+    
+
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1835,6 +2009,20 @@ class ServiceRepository( ServiceRestricted ):
         HydrusData.Print( summary )
         
     
+    def _LogUpdateLoadingTimes( self, update_loader: RepositoryUpdateLoader, time_spent_applying: float, row_name ):
+        
+        ( time_spent_loading, time_spent_waiting ) = update_loader.GetTimes()
+        
+        if time_spent_applying == 0 and time_spent_loading == 0:
+            
+            return
+            
+        
+        summary = '{} {}: {} loading updates in the background, {} applying them in the db, {} waiting on the next update'.format( self._name, row_name, HydrusTime.TimeDeltaToPrettyTimeDelta( time_spent_loading ), HydrusTime.TimeDeltaToPrettyTimeDelta( time_spent_applying ), HydrusTime.TimeDeltaToPrettyTimeDelta( time_spent_waiting ) )
+        
+        HydrusData.Print( summary )
+        
+    
     def _ReportOngoingRowSpeed( self, job_status, rows_done, total_rows, precise_timestamp, rows_done_in_last_packet, row_name ):
         
         it_took = HydrusTime.GetNowPrecise() - precise_timestamp
@@ -2109,6 +2297,8 @@ class ServiceRepository( ServiceRestricted ):
         
         work_done = False
         
+        update_loaders = []
+        
         try:
             
             job_status = ClientThreading.JobStatus( cancellable = True, maintenance_mode = maintenance_mode, stop_time = stop_time )
@@ -2136,12 +2326,21 @@ class ServiceRepository( ServiceRestricted ):
             num_updates_done = 0
             num_updates_to_do = len( definition_hashes_and_content_types ) + len( content_hashes_and_content_types )
             
+            # the disk and parse work for the next update happens while the db is busy with this one
+            definition_update_loader = RepositoryUpdateLoader( [ definition_hash for ( definition_hash, content_types ) in definition_hashes_and_content_types ], HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+            content_update_loader = RepositoryUpdateLoader( [ content_hash for ( content_hash, content_types ) in content_hashes_and_content_types ], HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
+            update_loaders = [ definition_update_loader, content_update_loader ]
+            
             CG.client_controller.pub( 'message', job_status )
             CG.client_controller.frame_splash_status.SetTitleText( title, print_to_log = False )
             
             total_definition_rows_completed = 0
             total_content_rows_completed = 0
             
+            definition_time_spent_applying = 0.0
+            content_time_spent_applying = 0.0
+            
             did_definition_analyze = False
             did_content_analyze = False
             
@@ -2164,7 +2363,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = CG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                        definition_update = definition_update_loader.GetNextUpdate()
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -2173,16 +2372,7 @@ class ServiceRepository( ServiceRestricted ):
                         raise Exception( 'An unusual error has occured during repository processing: a definition update file ({}) was missing. Your repository should be paused, and all update files have been scheduled for a presence check. I recommend you run _database->maintenance->clear/fix orphan file records_ too. Please then permit file maintenance under _database->file maintenance->manage scheduled jobs_ to finish its new work, which should fix this, before unpausing your repository.'.format( definition_hash.hex() ) )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except Exception as e:
+                    except HydrusExceptions.SerialisationException:
                         
                         CG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFilesMaintenance.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD )
                         
@@ -2196,6 +2386,12 @@ class ServiceRepository( ServiceRestricted ):
                         raise Exception( 'An unusual error has occured during repository processing: a definition update file ({}) has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance under _database->file maintenance->manage scheduled jobs_ to finish its new work, which should fix this, before unpausing your repository.'.format( definition_hash.hex() ) )
                         
                     
+                    if num_updates_done == len( definition_hashes_and_content_types ) - 1:
+                        
+                        # no more definitions to load, so get the first content updates ready while the db does this last one
+                        content_update_loader.Start()
+                        
+                    
                     rows_in_this_update = definition_update.GetNumRows()
                     rows_done_in_this_update = 0
                     
@@ -2230,6 +2426,8 @@ class ServiceRepository( ServiceRestricted ):
                         
                         actual_work_period = HydrusTime.GetNowPrecise() - start_time
                         
+                        definition_time_spent_applying += actual_work_period
+                        
                         rows_done_in_this_update += num_rows_done
                         total_definition_rows_completed += num_rows_done
                         
@@ -2267,6 +2465,7 @@ class ServiceRepository( ServiceRestricted ):
             finally:
                 
                 self._LogFinalRowSpeed( definition_start_time, total_definition_rows_completed, 'definitions' )
+                self._LogUpdateLoadingTimes( definition_update_loader, definition_time_spent_applying, 'definitions' )
                 
             
             if CG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ) or job_status.IsCancelled():
@@ -2293,7 +2492,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = CG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+                        content_update = content_update_loader.GetNextUpdate()
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -2302,16 +2501,7 @@ class ServiceRepository( ServiceRestricted ):
                         raise Exception( 'An unusual error has occured during repository processing: a content update file ({}) was missing. Your repository should be paused, and all update files have been scheduled for a presence check. I recommend you run _database->maintenance->clear/fix orphan file records_ too. Please then permit file maintenance under _database->file maintenance->manage scheduled jobs_ to finish its new work, which should fix this, before unpausing your repository.'.format( content_hash.hex() ) )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except Exception as e:
+                    except HydrusExceptions.SerialisationException:
                         
                         CG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFilesMaintenance.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD )
                         
@@ -2380,6 +2570,8 @@ class ServiceRepository( ServiceRestricted ):
                         
                         actual_work_period = HydrusTime.GetNowPrecise() - start_time
                         
+                        content_time_spent_applying += actual_work_period
+                        
                         rows_done_in_this_update += num_rows_done
                         total_content_rows_completed += num_rows_done
                         
@@ -2417,6 +2609,7 @@ class ServiceRepository( ServiceRestricted ):
             finally:
                 
                 self._LogFinalRowSpeed( content_start_time, total_content_rows_completed, 'content rows' )
+                self._LogUpdateLoadingTimes( content_update_loader, content_time_spent_applying, 'content rows' )
                 
             
         except HydrusExceptions.ShutdownException:
@@ -2445,6 +2638,11 @@ class ServiceRepository( ServiceRestricted ):
             
         finally:
             
+            for update_loader in update_loaders:
+                
+                update_loader.Stop()
+                
+            
             if work_done:
                 
                 with self._lock:
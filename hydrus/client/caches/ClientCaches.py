@@ -1,6 +1,8 @@
 import collections
 import collections.abc
+import concurrent.futures
 import json
+import os
 import threading
 import time
 import typing
@@ -21,10 +23,19 @@ from hydrus.client import ClientRendering
 from hydrus.client import ClientSVGHandling
 from hydrus.client import ClientThreading
 from hydrus.client.caches import ClientCachesBase
+from hydrus.client.caches import ClientThumbnailPacks
 from hydrus.client.files import ClientFilesMaintenance
 from hydrus.client.parsing import ClientParsing
 from hydrus.client.media import ClientMediaResult
 
+# thumbnail decode and resize is mostly PIL/OpenCV work that releases the GIL, so a few threads go a long way
+MAX_THUMBNAIL_DECODE_WORKERS = 16
+
+def GetNumThumbnailDecodeWorkers():
+    
+    return max( 1, min( os.cpu_count() or 1, MAX_THUMBNAIL_DECODE_WORKERS ) )
+    
+
 class ParsingCache( object ):
     
     def __init__( self ):
@@ -143,7 +154,7 @@ class ImageRendererCache( object ):
         # I looked into adding pin tech to the datacache itself. not a bad idea, but I'm not sure how to handle various overflow events, so that needs careful thought
         # the problem is not so much the caching atm, but the overflows
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout, eviction_policy = ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
         
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         self._controller.sub( self, 'Clear', 'clear_image_cache' )
@@ -285,7 +296,7 @@ class ImageTileCache( object ):
         cache_size = self._controller.new_options.GetInteger( 'image_tile_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_tile_cache_timeout' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout, eviction_policy = ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
         
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         self._controller.sub( self, 'Clear', 'clear_image_tile_cache' )
@@ -365,7 +376,7 @@ class ThumbnailCache( object ):
         cache_size = self._controller.new_options.GetInteger( 'thumbnail_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'thumbnail cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'thumbnail cache', cache_size, timeout = cache_timeout, eviction_policy = ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -375,9 +386,15 @@ class ThumbnailCache( object ):
         
         self._thumbnail_error_occurred = False
         
+        # hash -> ( done event, list of the error if it failed ), so waterfall workers that hit the same broken thumbnail share one regen
+        self._hashes_to_thumbnail_regenerations = {}
+        
         self._waterfall_queue_quick = set()
         self._waterfall_queue = []
         
+        # ( page_key, media ) -> future, in the order we popped them off the waterfall queue
+        self._waterfall_in_flight = {}
+        
         self._waterfall_queue_empty_event = threading.Event()
         
         self._delayed_regeneration_queue_quick = set()
@@ -385,6 +402,9 @@ class ThumbnailCache( object ):
         
         self._allow_blurhash_fallback = self._controller.new_options.GetBoolean( 'allow_blurhash_fallback' )
         
+        self._use_thumbnail_pack_cache = self._controller.new_options.GetBoolean( 'use_thumbnail_pack_cache' )
+        self._thumbnail_pack_cache = None
+        
         self._waterfall_event = threading.Event()
         
         self._special_thumbs = {}
@@ -398,6 +418,26 @@ class ThumbnailCache( object ):
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         
     
+    def _CancelWaterfallInFlight( self, results ):
+        
+        # anything a worker has already started will finish and go in the cache, but nothing gets published
+        
+        for result in results:
+            
+            if result in self._waterfall_in_flight:
+                
+                future = self._waterfall_in_flight[ result ]
+                
+                if future is not None:
+                    
+                    future.cancel()
+                    
+                
+                del self._waterfall_in_flight[ result ]
+                
+            
+        
+    
     def _GetBestRecoveryThumbnailHydrusBitmap( self, media_result: ClientMediaResult.MediaResult ):
         
         if self._allow_blurhash_fallback:
@@ -408,13 +448,7 @@ class ThumbnailCache( object ):
                 
                 try:
                     
-                    ( media_width, media_height ) = media_result.GetResolution()
-                    
-                    bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
-                    thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
-                    thumbnail_dpr_percent = CG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-                    
-                    ( expected_width, expected_height ) = HydrusImageHandling.GetThumbnailResolution( ( media_width, media_height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+                    ( expected_width, expected_height ) = self._GetExpectedThumbnailResolution( media_result )
                     
                     numpy_image = HydrusBlurhash.GetNumpyFromBlurhash( blurhash, expected_width, expected_height )
                     
@@ -432,6 +466,17 @@ class ThumbnailCache( object ):
         return self._special_thumbs[ HC.APPLICATION_UNKNOWN ]
         
     
+    def _GetExpectedThumbnailResolution( self, media_result: ClientMediaResult.MediaResult ):
+        
+        ( media_width, media_height ) = media_result.GetResolution()
+        
+        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
+        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
+        thumbnail_dpr_percent = CG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+        
+        return HydrusImageHandling.GetThumbnailResolution( ( media_width, media_height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+        
+    
     def _GetThumbnailHydrusBitmap( self, media_result: ClientMediaResult.MediaResult ):
         
         if HG.blurhash_mode:
@@ -443,6 +488,32 @@ class ThumbnailCache( object ):
         
         locations_manager = media_result.GetLocationsManager()
         
+        ( expected_width, expected_height ) = self._GetExpectedThumbnailResolution( media_result )
+        
+        thumbnail_pack_cache = self._thumbnail_pack_cache
+        
+        # a deleted file loses its thumb, so we only trust the pack for files that should still have one
+        we_have_thumb = locations_manager.IsLocal() or not locations_manager.GetCurrent().isdisjoint( CG.client_controller.services_manager.GetServiceKeys( ( HC.FILE_REPOSITORY, ) ) )
+        
+        if thumbnail_pack_cache is not None and we_have_thumb:
+            
+            try:
+                
+                hydrus_bitmap = thumbnail_pack_cache.GetHydrusBitmap( hash, expected_resolution = ( expected_width, expected_height ) )
+                
+                if hydrus_bitmap is not None:
+                    
+                    return hydrus_bitmap
+                    
+                
+            except Exception as e:
+                
+                self._HandleThumbnailPackCacheException( e )
+                
+                thumbnail_pack_cache = None
+                
+            
+        
         try:
             
             thumbnail_path = self._controller.client_files_manager.GetThumbnailPath( media_result )
@@ -472,7 +543,7 @@ class ThumbnailCache( object ):
             try:
                 
                 # file is malformed, let's force a regen
-                self._controller.files_maintenance_manager.RunJobImmediately( [ media_result ], ClientFilesMaintenance.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, pub_job_status = False )
+                self._RegenerateThumbnail( media_result )
                 
             except Exception as e:
                 
@@ -499,14 +570,6 @@ class ThumbnailCache( object ):
         
         ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
         
-        ( media_width, media_height ) = media_result.GetResolution()
-        
-        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
-        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
-        thumbnail_dpr_percent = CG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-        
-        ( expected_width, expected_height ) = HydrusImageHandling.GetThumbnailResolution( ( media_width, media_height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
-        
         exactly_as_expected = current_width == expected_width and current_height == expected_height
         
         rotation_exception = current_width == expected_height and current_height == expected_width
@@ -549,19 +612,39 @@ class ThumbnailCache( object ):
         
         hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
         
+        # a wrong-size thumb is either about to be regenerated or is a scaled stopgap, so we only keep the real thing
+        if thumbnail_pack_cache is not None and correct_size:
+            
+            try:
+                
+                thumbnail_pack_cache.StoreHydrusBitmap( hash, hydrus_bitmap )
+                
+            except Exception as e:
+                
+                self._HandleThumbnailPackCacheException( e )
+                
+            
+        
         return hydrus_bitmap
         
     
     def _HandleThumbnailException( self, hash, e, summary ):
         
-        if self._thumbnail_error_occurred:
+        # several waterfall workers can fail at once, so only one of them gets to show the popup
+        
+        with self._lock:
+            
+            first_error = not self._thumbnail_error_occurred
+            
+            self._thumbnail_error_occurred = True
+            
+        
+        if not first_error:
             
             HydrusData.Print( summary )
             
         else:
             
-            self._thumbnail_error_occurred = True
-            
             message = 'A thumbnail error has occurred. The problem thumbnail will appear with the default \'hydrus\' symbol. You may need to take hard drive recovery actions, and if the error is not obviously fixable, you can contact hydrus dev for additional help. Specific information for this first error follows. Subsequent thumbnail errors in this session will be silently printed to the log.'
             message += '\n' * 2
             message += str( e )
@@ -577,6 +660,26 @@ class ThumbnailCache( object ):
             
         
     
+    def _HandleThumbnailPackCacheException( self, e ):
+        
+        # the pack cache is only ever a shortcut, so if the disk is full or something got corrupted, we turn it off for the session and carry on normally
+        
+        with self._lock:
+            
+            thumbnail_pack_cache = self._thumbnail_pack_cache
+            
+            self._thumbnail_pack_cache = None
+            
+        
+        if thumbnail_pack_cache is not None:
+            
+            HydrusData.Print( 'The thumbnail pack cache had an error, so it is turned off for the rest of this session. The error follows.' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+            thumbnail_pack_cache.Close()
+            
+        
+    
     def _InitialiseMagicMimeScores( self ):
         
         # let's render our thumbs in order of ease of regeneration, so we rush what we can to screen as fast as possible and leave big vids until the end
@@ -657,7 +760,7 @@ class ThumbnailCache( object ):
         # we pop off the end, so reverse
         self._waterfall_queue.sort( key = sort_waterfall, reverse = True )
         
-        if len( self._waterfall_queue ) == 0:
+        if len( self._waterfall_queue ) == 0 and len( self._waterfall_in_flight ) == 0:
             
             self._waterfall_queue_empty_event.set()
             
@@ -684,6 +787,97 @@ class ThumbnailCache( object ):
         self._delayed_regeneration_queue.sort( key = sort_regen, reverse = True )
         
     
+    def _RegenerateThumbnail( self, media_result: ClientMediaResult.MediaResult ):
+        
+        # the waterfall loads thumbnails on several threads at once, so two of them can find the same broken thumbnail
+        # the first one regenerates it, and any others wait for that and get the same result
+        
+        hash = media_result.GetHash()
+        
+        with self._lock:
+            
+            if hash in self._hashes_to_thumbnail_regenerations:
+                
+                ( regeneration_done_event, regeneration_errors ) = self._hashes_to_thumbnail_regenerations[ hash ]
+                
+                we_are_regenerating = False
+                
+            else:
+                
+                ( regeneration_done_event, regeneration_errors ) = ( threading.Event(), [] )
+                
+                self._hashes_to_thumbnail_regenerations[ hash ] = ( regeneration_done_event, regeneration_errors )
+                
+                we_are_regenerating = True
+                
+            
+        
+        if not we_are_regenerating:
+            
+            regeneration_done_event.wait()
+            
+            if len( regeneration_errors ) > 0:
+                
+                raise regeneration_errors[0]
+                
+            
+            return
+            
+        
+        try:
+            
+            self._controller.files_maintenance_manager.RunJobImmediately( [ media_result ], ClientFilesMaintenance.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, pub_job_status = False )
+            
+        except Exception as e:
+            
+            regeneration_errors.append( e )
+            
+            raise
+            
+        finally:
+            
+            with self._lock:
+                
+                del self._hashes_to_thumbnail_regenerations[ hash ]
+                
+            
+            regeneration_done_event.set()
+            
+        
+    
+    def _ResetThumbnailPackCache( self ):
+        
+        if self._use_thumbnail_pack_cache:
+            
+            try:
+                
+                if self._thumbnail_pack_cache is None:
+                    
+                    self._thumbnail_pack_cache = ClientThumbnailPacks.ThumbnailPackCache( os.path.join( self._controller.GetDBDir(), 'client_thumbnail_packs' ) )
+                    
+                
+                bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
+                thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
+                thumbnail_dpr_percent = CG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+                
+                self._thumbnail_pack_cache.CheckSettings( ( bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent ) )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not load the thumbnail pack cache! The error follows.' )
+                HydrusData.PrintException( e, do_wait = False )
+                
+                self._thumbnail_pack_cache = None
+                
+            
+        elif self._thumbnail_pack_cache is not None:
+            
+            self._thumbnail_pack_cache.Close()
+            
+            self._thumbnail_pack_cache = None
+            
+        
+    
     def _ShouldBeAbleToProvideThumb( self, media_result: ClientMediaResult.MediaResult ):
         
         locations_manager = media_result.GetLocationsManager()
@@ -695,12 +889,151 @@ class ThumbnailCache( object ):
         return we_have_file or we_should_have_thumb or we_have_blurhash
         
     
+    def _WorkOnDelayedRegeneration( self ):
+        
+        # now we will do regen if appropriate
+        
+        with self._lock:
+            
+            # got more important work or no work to do
+            if len( self._waterfall_queue ) > 0 or len( self._waterfall_in_flight ) > 0 or len( self._delayed_regeneration_queue ) == 0 or CG.client_controller.CurrentlyPubSubbing():
+                
+                return
+                
+            
+            media_result = self._delayed_regeneration_queue.pop()
+            
+            self._delayed_regeneration_queue_quick.discard( media_result )
+            
+        
+        if HG.file_report_mode:
+            
+            hash = media_result.GetHash()
+            
+            HydrusData.ShowText( 'Thumbnail {} now regenerating from source.'.format( hash.hex() ) )
+            
+        
+        try:
+            
+            self._RegenerateThumbnail( media_result )
+            
+        except HydrusExceptions.FileMissingException:
+            
+            pass
+            
+        except Exception as e:
+            
+            hash = media_result.GetHash()
+            
+            summary = 'The thumbnail for file {} was incorrect, but a later attempt to regenerate it or load the new file back failed.'.format( hash.hex() )
+            
+            self._HandleThumbnailException( hash, e, summary )
+            
+        
+    
+    def _WorkOnWaterfall( self, executor: concurrent.futures.ThreadPoolExecutor, max_in_flight: int ):
+        
+        start_time = HydrusTime.GetNowPrecise()
+        stop_time = start_time + 0.005 # a bit of a typical frame
+        
+        page_keys_to_rendered_medias = collections.defaultdict( list )
+        
+        while True:
+            
+            with self._lock:
+                
+                # top up the workers. the queue is sorted by _RecalcQueues, so this is still the order things get decoded
+                
+                while len( self._waterfall_in_flight ) < max_in_flight and len( self._waterfall_queue ) > 0:
+                    
+                    result = self._waterfall_queue.pop()
+                    
+                    self._waterfall_queue_quick.discard( result )
+                    
+                    if result in self._waterfall_in_flight:
+                        
+                        continue
+                        
+                    
+                    ( page_key, media ) = result
+                    
+                    display_media_result = media.GetDisplayMediaResult()
+                    
+                    if display_media_result is None:
+                        
+                        future = None
+                        
+                    else:
+                        
+                        future = executor.submit( self.GetThumbnail, display_media_result )
+                        
+                    
+                    self._waterfall_in_flight[ result ] = future
+                    
+                
+                # and collect what is done. a page gets its thumbs in waterfall order, so a slow thumb holds up the ones behind it on the same page, but no other page
+                
+                blocked_page_keys = set()
+                pending_futures = []
+                
+                for ( result, future ) in list( self._waterfall_in_flight.items() ):
+                    
+                    ( page_key, media ) = result
+                    
+                    if page_key in blocked_page_keys:
+                        
+                        continue
+                        
+                    
+                    if future is None or future.done():
+                        
+                        del self._waterfall_in_flight[ result ]
+                        
+                        if future is not None:
+                            
+                            page_keys_to_rendered_medias[ page_key ].append( media )
+                            
+                        
+                    else:
+                        
+                        blocked_page_keys.add( page_key )
+                        pending_futures.append( future )
+                        
+                    
+                
+                if len( self._waterfall_queue ) == 0 and len( self._waterfall_in_flight ) == 0:
+                    
+                    self._waterfall_queue_empty_event.set()
+                    
+                
+            
+            if len( pending_futures ) == 0 or HydrusTime.TimeHasPassedPrecise( stop_time ):
+                
+                break
+                
+            
+            concurrent.futures.wait( pending_futures, timeout = max( 0, stop_time - HydrusTime.GetNowPrecise() ), return_when = concurrent.futures.FIRST_COMPLETED )
+            
+        
+        if len( page_keys_to_rendered_medias ) > 0:
+            
+            for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
+                
+                self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+                
+            
+            time.sleep( 0.00001 )
+            
+        
+    
     def CancelWaterfall( self, page_key: bytes, medias: list ):
         
         with self._lock:
             
             self._waterfall_queue_quick.difference_update( ( ( page_key, media ) for media in medias ) )
             
+            self._CancelWaterfallInFlight( [ ( page_key, media ) for media in medias ] )
+            
             cancelled_media_results = { media.GetDisplayMediaResult() for media in medias }
             
             cancelled_media_results.discard( None )
@@ -776,8 +1109,12 @@ class ThumbnailCache( object ):
             self._waterfall_queue_quick = set()
             self._delayed_regeneration_queue_quick = set()
             
+            self._CancelWaterfallInFlight( list( self._waterfall_in_flight.keys() ) )
+            
             self._RecalcQueues()
             
+            self._ResetThumbnailPackCache()
+            
         
     
     def ClearThumbnails( self, hashes ):
@@ -789,6 +1126,20 @@ class ThumbnailCache( object ):
                 self._data_cache.DeleteData( hash )
                 
             
+            thumbnail_pack_cache = self._thumbnail_pack_cache
+            
+        
+        if thumbnail_pack_cache is not None:
+            
+            try:
+                
+                thumbnail_pack_cache.Invalidate( hashes )
+                
+            except Exception as e:
+                
+                self._HandleThumbnailPackCacheException( e )
+                
+            
         
     
     def WaitUntilFree( self ):
@@ -914,6 +1265,18 @@ class ThumbnailCache( object ):
             self.Clear()
             
         
+        use_thumbnail_pack_cache = self._controller.new_options.GetBoolean( 'use_thumbnail_pack_cache' )
+        
+        if use_thumbnail_pack_cache != self._use_thumbnail_pack_cache:
+            
+            with self._lock:
+                
+                self._use_thumbnail_pack_cache = use_thumbnail_pack_cache
+                
+                self._ResetThumbnailPackCache()
+                
+            
+        
     
     def Waterfall( self, page_key, medias ):
         
@@ -931,111 +1294,39 @@ class ThumbnailCache( object ):
         
         # TODO: Wangle this guy to a ManagerWithMainLoop
         
-        while not HydrusThreading.IsThreadShuttingDown():
-            
-            time.sleep( 0.00001 )
-            
-            with self._lock:
-                
-                do_wait = len( self._waterfall_queue ) == 0 and len( self._delayed_regeneration_queue ) == 0
-                
+        num_workers = GetNumThumbnailDecodeWorkers()
+        
+        # enough to keep every worker busy while we are publishing the last batch
+        max_in_flight = num_workers * 4
+        
+        executor = concurrent.futures.ThreadPoolExecutor( max_workers = num_workers, thread_name_prefix = 'thumbnail decode' )
+        
+        try:
             
-            if do_wait:
-                
-                self._waterfall_event.wait( 1 )
-                
-                self._waterfall_event.clear()
+            while not HydrusThreading.IsThreadShuttingDown():
                 
-            
-            start_time = HydrusTime.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
-            
-            page_keys_to_rendered_medias = collections.defaultdict( list )
-            
-            num_done = 0
-            max_at_once = 16
-            
-            while not HydrusTime.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+                time.sleep( 0.00001 )
                 
                 with self._lock:
                     
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        self._waterfall_queue_empty_event.set()
-                        
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
-                
-                ( page_key, media ) = result
-                
-                display_media_result = media.GetDisplayMediaResult()
-                
-                if display_media_result is not None:
-                    
-                    self.GetThumbnail( display_media_result )
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
+                    do_wait = len( self._waterfall_queue ) == 0 and len( self._waterfall_in_flight ) == 0 and len( self._delayed_regeneration_queue ) == 0
                     
                 
-                num_done += 1
-                
-            
-            if len( page_keys_to_rendered_medias ) > 0:
-                
-                for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
-                    
-                    self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+                if do_wait:
                     
-                
-                time.sleep( 0.00001 )
-                
-            
-            # now we will do regen if appropriate
-            
-            with self._lock:
-                
-                # got more important work or no work to do
-                if len( self._waterfall_queue ) > 0 or len( self._delayed_regeneration_queue ) == 0 or CG.client_controller.CurrentlyPubSubbing():
+                    self._waterfall_event.wait( 1 )
                     
-                    continue
+                    self._waterfall_event.clear()
                     
                 
-                media_result = self._delayed_regeneration_queue.pop()
+                self._WorkOnWaterfall( executor, max_in_flight )
                 
-                self._delayed_regeneration_queue_quick.discard( media_result )
+                self._WorkOnDelayedRegeneration()
                 
             
-            if HG.file_report_mode:
-                
-                hash = media_result.GetHash()
-                
-                HydrusData.ShowText( 'Thumbnail {} now regenerating from source.'.format( hash.hex() ) )
-                
+        finally:
             
-            try:
-                
-                self._controller.files_maintenance_manager.RunJobImmediately( [ media_result ], ClientFilesMaintenance.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, pub_job_status = False )
-                
-            except HydrusExceptions.FileMissingException:
-                
-                pass
-                
-            except Exception as e:
-                
-                hash = media_result.GetHash()
-                
-                summary = 'The thumbnail for file {} was incorrect, but a later attempt to regenerate it or load the new file back failed.'.format( hash.hex() )
-                
-                self._HandleThumbnailException( hash, e, summary )
-                
+            executor.shutdown( wait = False, cancel_futures = True )
             
         
     
@@ -3,12 +3,46 @@ import collections.abc
 import threading
 import time
 import typing
+import weakref
 
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientGlobals as CG
 
+CACHE_EVICTION_LRU = 0
+CACHE_EVICTION_SCAN_RESISTANT = 1
+
+# in the scan-resistant policy, how much of the cache is for data that has been hit more than once
+PROTECTED_FRACTION = 0.8
+
+# an item bigger than this fraction of the protected space stays in probation, so one giant image can't flush everything else out
+PROTECTED_MAX_ITEM_FRACTION = 0.25
+
+# hits this soon after an add are probably the same paint or render asking twice, so they don't count towards promotion
+CORRELATED_REFERENCE_PERIOD = 2.0
+
+# how many recently evicted keys we remember, relative to how many keys we hold
+GHOST_MULTIPLIER = 2
+GHOST_MIN_SIZE = 256
+
+all_data_caches = weakref.WeakSet()
+all_data_caches_lock = threading.Lock()
+
+def GetAllDataCacheStats() -> list[ dict ]:
+    
+    with all_data_caches_lock:
+        
+        data_caches = list( all_data_caches )
+        
+    
+    all_stats = [ data_cache.GetStats() for data_cache in data_caches ]
+    
+    all_stats.sort( key = lambda d: d[ 'name' ] )
+    
+    return all_stats
+    
+
 class CacheableObject( object ):
     
     def GetEstimatedMemoryFootprint( self ) -> int:
@@ -37,21 +71,263 @@ class DataCacheEntry( object ):
         
     
 
+class DataCacheEvictionPolicy( object ):
+    
+    def __init__( self, cache_size: int ):
+        
+        self._cache_size = cache_size
+        
+    
+    def Add( self, key, size_estimate: int ):
+        
+        raise NotImplementedError()
+        
+    
+    def Clear( self ):
+        
+        raise NotImplementedError()
+        
+    
+    def IterateKeysInEvictionOrder( self ) -> collections.abc.Iterator:
+        
+        raise NotImplementedError()
+        
+    
+    def Remove( self, key, evicted: bool ):
+        
+        raise NotImplementedError()
+        
+    
+    def Resize( self, key, size_estimate: int ):
+        
+        pass
+        
+    
+    def SetCacheSize( self, cache_size: int ):
+        
+        self._cache_size = cache_size
+        
+    
+    def Touch( self, key ):
+        
+        raise NotImplementedError()
+        
+    
+
+class DataCacheEvictionPolicyLRU( DataCacheEvictionPolicy ):
+    
+    def __init__( self, cache_size: int ):
+        
+        super().__init__( cache_size )
+        
+        self._keys = collections.OrderedDict()
+        
+    
+    def Add( self, key, size_estimate: int ):
+        
+        self._keys[ key ] = None
+        
+    
+    def Clear( self ):
+        
+        self._keys.clear()
+        
+    
+    def IterateKeysInEvictionOrder( self ) -> collections.abc.Iterator:
+        
+        return iter( self._keys )
+        
+    
+    def Remove( self, key, evicted: bool ):
+        
+        del self._keys[ key ]
+        
+    
+    def Touch( self, key ):
+        
+        self._keys.move_to_end( key )
+        
+    
+
+class DataCacheEvictionPolicyScanResistant( DataCacheEvictionPolicy ):
+    
+    # a size-aware 2Q
+    # new data goes into a probation fifo, and only a later hit promotes it to the protected lru. a fast scroll through thousands of new thumbs churns probation and leaves the hot set alone
+    # keys we recently evicted from probation are remembered as ghosts. if they come back, they were worth keeping, so they go straight into protected
+    
+    def __init__( self, cache_size: int ):
+        
+        super().__init__( cache_size )
+        
+        self._keys_to_sizes = {}
+        
+        self._probation = collections.OrderedDict()
+        self._protected = collections.OrderedDict()
+        self._ghosts = collections.OrderedDict()
+        
+        self._protected_size = 0
+        
+    
+    def _Demote( self ):
+        
+        # protected is full, so its least recently used go back to the fresh end of probation for another chance
+        
+        protected_size_limit = self._cache_size * PROTECTED_FRACTION
+        
+        while self._protected_size > protected_size_limit and len( self._protected ) > 0:
+            
+            ( key, value ) = self._protected.popitem( last = False )
+            
+            self._protected_size -= self._keys_to_sizes[ key ]
+            
+            self._probation[ key ] = time.monotonic()
+            
+        
+    
+    def _Promote( self, key ):
+        
+        size_estimate = self._keys_to_sizes[ key ]
+        
+        if size_estimate > self._cache_size * PROTECTED_FRACTION * PROTECTED_MAX_ITEM_FRACTION:
+            
+            self._probation.move_to_end( key )
+            
+            return
+            
+        
+        del self._probation[ key ]
+        
+        self._protected[ key ] = None
+        self._protected_size += size_estimate
+        
+        self._Demote()
+        
+    
+    def Add( self, key, size_estimate: int ):
+        
+        self._keys_to_sizes[ key ] = size_estimate
+        
+        self._probation[ key ] = time.monotonic()
+        
+        if key in self._ghosts:
+            
+            del self._ghosts[ key ]
+            
+            self._Promote( key )
+            
+        
+    
+    def Clear( self ):
+        
+        self._keys_to_sizes = {}
+        
+        self._probation.clear()
+        self._protected.clear()
+        self._ghosts.clear()
+        
+        self._protected_size = 0
+        
+    
+    def IterateKeysInEvictionOrder( self ) -> collections.abc.Iterator:
+        
+        yield from self._probation
+        yield from self._protected
+        
+    
+    def Remove( self, key, evicted: bool ):
+        
+        size_estimate = self._keys_to_sizes.pop( key )
+        
+        if key in self._protected:
+            
+            del self._protected[ key ]
+            
+            self._protected_size -= size_estimate
+            
+        else:
+            
+            del self._probation[ key ]
+            
+            if evicted:
+                
+                self._ghosts[ key ] = None
+                
+                max_num_ghosts = max( GHOST_MIN_SIZE, len( self._keys_to_sizes ) * GHOST_MULTIPLIER )
+                
+                while len( self._ghosts ) > max_num_ghosts:
+                    
+                    self._ghosts.popitem( last = False )
+                    
+                
+            
+        
+    
+    def Resize( self, key, size_estimate: int ):
+        
+        if key in self._protected:
+            
+            self._protected_size += size_estimate - self._keys_to_sizes[ key ]
+            
+        
+        self._keys_to_sizes[ key ] = size_estimate
+        
+        self._Demote()
+        
+    
+    def SetCacheSize( self, cache_size: int ):
+        
+        super().SetCacheSize( cache_size )
+        
+        self._Demote()
+        
+    
+    def Touch( self, key ):
+        
+        if key in self._protected:
+            
+            self._protected.move_to_end( key )
+            
+        elif time.monotonic() - self._probation[ key ] >= CORRELATED_REFERENCE_PERIOD:
+            
+            self._Promote( key )
+            
+        
+    
+
 class DataCache( object ):
     
-    def __init__( self, controller: "CG.ClientController.Controller", name, cache_size, timeout = 1200 ):
+    def __init__( self, controller: "CG.ClientController.Controller", name, cache_size, timeout = 1200, eviction_policy = CACHE_EVICTION_LRU ):
         
         self._controller = controller
         self._name = name
         self._cache_size = cache_size
         self._timeout = timeout
         
-        self._keys_to_data: collections.OrderedDict[ typing.Any, DataCacheEntry ] = collections.OrderedDict()
+        self._keys_to_data: dict[ typing.Any, DataCacheEntry ] = {}
+        
+        if eviction_policy == CACHE_EVICTION_SCAN_RESISTANT:
+            
+            self._eviction_policy = DataCacheEvictionPolicyScanResistant( cache_size )
+            
+        else:
+            
+            self._eviction_policy = DataCacheEvictionPolicyLRU( cache_size )
+            
         
         self._total_estimated_memory_footprint = 0
         
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        self._num_bytes_evicted = 0
+        
         self._lock = threading.Lock()
         
+        with all_data_caches_lock:
+            
+            all_data_caches.add( self )
+            
+        
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
         
     
@@ -66,6 +342,8 @@ class DataCache( object ):
         
         del self._keys_to_data[ key ]
         
+        self._eviction_policy.Remove( key, False )
+        
         self._total_estimated_memory_footprint -= entry.size_estimate
         
         if HG.cache_report_mode:
@@ -87,7 +365,9 @@ class DataCache( object ):
         
         expected_free_space = self._cache_size - self._total_estimated_memory_footprint
         
-        for ( key, entry ) in self._keys_to_data.items():
+        for key in self._eviction_policy.IterateKeysInEvictionOrder():
+            
+            entry = self._keys_to_data[ key ]
             
             if not entry.data.IsFinishedLoading():
                 
@@ -108,7 +388,7 @@ class DataCache( object ):
             
             for key in deletee_keys:
                 
-                self._Delete( key )
+                self._Evict( key )
                 
             
             return True
@@ -122,10 +402,22 @@ class DataCache( object ):
     
     def _DeleteOldestItem( self ):
         
-        ( key, entry ) = self._keys_to_data.popitem( last = False )
+        key = next( self._eviction_policy.IterateKeysInEvictionOrder() )
+        
+        self._Evict( key )
+        
+    
+    def _Evict( self, key ):
+        
+        entry = self._keys_to_data.pop( key )
+        
+        self._eviction_policy.Remove( key, True )
         
         self._total_estimated_memory_footprint -= entry.size_estimate
         
+        self._num_evictions += 1
+        self._num_bytes_evicted += entry.size_estimate
+        
         if HG.cache_report_mode:
             
             HydrusData.ShowText( 'Cache "{}" removing oldest item "{}", size "{}". Current size {}.'.format( self._name, key, HydrusData.ToHumanBytes( entry.size_estimate ), HydrusData.ConvertValueRangeToBytes( self._total_estimated_memory_footprint, self._cache_size ) ) )
@@ -140,7 +432,9 @@ class DataCache( object ):
             
         
         self._TouchKey( key )
-
+        
+        self._num_hits += 1
+        
         entry = self._keys_to_data[ key ]
         
         data = entry.data
@@ -154,6 +448,8 @@ class DataCache( object ):
             
             entry.size_estimate = new_estimate
             
+            self._eviction_policy.Resize( key, new_estimate )
+            
         
         return data
         
@@ -161,7 +457,7 @@ class DataCache( object ):
     def _TouchKey( self, key ):
         
         self._keys_to_data[ key ].touch()
-        self._keys_to_data.move_to_end( key )
+        self._eviction_policy.Touch( key )
         
     
     def Clear( self ):
@@ -169,6 +465,7 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data.clear()
+            self._eviction_policy.Clear()
             
             self._total_estimated_memory_footprint = 0
             
@@ -180,7 +477,7 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
+                while self._total_estimated_memory_footprint > self._cache_size and len( self._keys_to_data ) > 0:
                     
                     self._DeleteOldestItem()
                     
@@ -190,6 +487,7 @@ class DataCache( object ):
                 entry = DataCacheEntry( data )
                 
                 self._keys_to_data[ key ] = entry
+                self._eviction_policy.Add( key, entry.size_estimate )
                 
                 self._total_estimated_memory_footprint += entry.size_estimate
                 
@@ -242,6 +540,8 @@ class DataCache( object ):
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
@@ -255,6 +555,23 @@ class DataCache( object ):
             
         
     
+    def GetStats( self ) -> dict:
+        
+        with self._lock:
+            
+            return {
+                'name' : self._name,
+                'num_items' : len( self._keys_to_data ),
+                'size' : self._total_estimated_memory_footprint,
+                'size_limit' : self._cache_size,
+                'num_hits' : self._num_hits,
+                'num_misses' : self._num_misses,
+                'num_evictions' : self._num_evictions,
+                'num_bytes_evicted' : self._num_bytes_evicted
+            }
+            
+        
+    
     def HasData( self, key ) -> bool:
         
         with self._lock:
@@ -276,26 +593,12 @@ class DataCache( object ):
                 
                 older_than_this_has_timed_out = time.monotonic() - self._timeout
                 
-                num_to_remove = 0
+                # the eviction order is not always access order, so we check everything
+                timed_out_keys = [ key for ( key, entry ) in self._keys_to_data.items() if entry.last_access_time < older_than_this_has_timed_out ]
                 
-                for entry in self._keys_to_data.values():
+                for key in timed_out_keys:
                     
-                    if entry.last_access_time < older_than_this_has_timed_out:
-                        
-                        num_to_remove += 1
-                        
-                    else:
-                        
-                        break
-                        
-                    
-                
-                if num_to_remove > 0:
-                    
-                    for i in range( num_to_remove ):
-                        
-                        self._DeleteOldestItem()
-                        
+                    self._Evict( key )
                     
                 
             
@@ -308,6 +611,8 @@ class DataCache( object ):
             self._cache_size = cache_size
             self._timeout = timeout
             
+            self._eviction_policy.SetCacheSize( cache_size )
+            
         
         self.MaintainCache()
         
@@ -0,0 +1,433 @@
+import json
+import mmap
+import os
+import struct
+import threading
+
+from hydrus.core import HydrusCompression
+from hydrus.core import HydrusPaths
+
+from hydrus.client import ClientRendering
+
+# a disk cache of thumbnails that are already decoded and scaled to the current bounding box
+# a pack file is raw HydrusBitmap data appended end to end, and the index is an append-only journal that says where each hash's data is
+# we never rewrite anything in place. an invalidation is just a tombstone in the index, and if the dead space gets too big we throw it all away and start again
+
+PACK_CACHE_VERSION = 1
+
+CODEC_RAW = 0
+CODEC_LZ4 = 1
+
+# hash, pack_num, offset, length, width, height, depth, codec. a length of 0 is a tombstone
+INDEX_RECORD_STRUCT = struct.Struct( '>32sIQIHHBB' )
+
+MAX_PACK_SIZE = 512 * 1048576
+
+# when the cache loads, it starts again if more than this fraction of the pack data is dead and the dead part is bigger than the min
+DEAD_SPACE_WIPE_FRACTION = 0.5
+DEAD_SPACE_WIPE_MIN_SIZE = 64 * 1048576
+
+INDEX_FILENAME = 'index.bin'
+SETTINGS_FILENAME = 'settings.json'
+
+def GetPackFilename( pack_num: int ):
+    
+    return 'pack_{:04}.bin'.format( pack_num )
+    
+
+class ThumbnailPackCache( object ):
+    
+    def __init__( self, path: str ):
+        
+        self._path = path
+        
+        self._lock = threading.Lock()
+        
+        self._closed = False
+        
+        self._settings = None
+        
+        self._hashes_to_records = {}
+        self._pack_nums_to_sizes = {}
+        self._pack_nums_to_maps = {}
+        
+        self._active_pack_num = 0
+        self._active_pack_file = None
+        self._index_file = None
+        
+        self._Load()
+        
+    
+    def _CloseFiles( self ):
+        
+        for pack_map in self._pack_nums_to_maps.values():
+            
+            pack_map.close()
+            
+        
+        self._pack_nums_to_maps = {}
+        
+        if self._active_pack_file is not None:
+            
+            self._active_pack_file.close()
+            
+            self._active_pack_file = None
+            
+        
+        if self._index_file is not None:
+            
+            self._index_file.close()
+            
+            self._index_file = None
+            
+        
+    
+    def _GetPackMap( self, pack_num: int, end: int ):
+        
+        if pack_num in self._pack_nums_to_maps:
+            
+            pack_map = self._pack_nums_to_maps[ pack_num ]
+            
+            if len( pack_map ) >= end:
+                
+                return pack_map
+                
+            
+            # the pack has grown since we mapped it
+            
+            pack_map.close()
+            
+            del self._pack_nums_to_maps[ pack_num ]
+            
+        
+        if pack_num == self._active_pack_num and self._active_pack_file is not None:
+            
+            self._active_pack_file.flush()
+            
+        
+        with open( os.path.join( self._path, GetPackFilename( pack_num ) ), 'rb' ) as f:
+            
+            pack_map = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+            
+        
+        self._pack_nums_to_maps[ pack_num ] = pack_map
+        
+        return pack_map
+        
+    
+    def _Load( self ):
+        
+        HydrusPaths.MakeSureDirectoryExists( self._path )
+        
+        settings_path = os.path.join( self._path, SETTINGS_FILENAME )
+        
+        try:
+            
+            with open( settings_path, 'r', encoding = 'utf-8' ) as f:
+                
+                settings_dict = json.load( f )
+                
+            
+            if settings_dict[ 'version' ] != PACK_CACHE_VERSION:
+                
+                raise Exception( 'Old version!' )
+                
+            
+            self._settings = settings_dict[ 'settings' ]
+            
+        except Exception as e:
+            
+            self._Wipe()
+            
+            return
+            
+        
+        for filename in os.listdir( self._path ):
+            
+            if filename.startswith( 'pack_' ) and filename.endswith( '.bin' ):
+                
+                try:
+                    
+                    pack_num = int( filename[ 5 : -4 ] )
+                    
+                except ValueError:
+                    
+                    continue
+                    
+                
+                self._pack_nums_to_sizes[ pack_num ] = os.path.getsize( os.path.join( self._path, filename ) )
+                
+            
+        
+        index_path = os.path.join( self._path, INDEX_FILENAME )
+        
+        index_bytes = b''
+        
+        if os.path.exists( index_path ):
+            
+            with open( index_path, 'rb' ) as f:
+                
+                index_bytes = f.read()
+                
+            
+        
+        # if we were killed halfway through writing a record, we drop the fragment
+        num_whole_records = len( index_bytes ) // INDEX_RECORD_STRUCT.size
+        
+        if num_whole_records * INDEX_RECORD_STRUCT.size != len( index_bytes ):
+            
+            index_bytes = index_bytes[ : num_whole_records * INDEX_RECORD_STRUCT.size ]
+            
+            with open( index_path, 'wb' ) as f:
+                
+                f.write( index_bytes )
+                
+            
+        
+        for ( hash, pack_num, offset, length, width, height, depth, codec ) in INDEX_RECORD_STRUCT.iter_unpack( index_bytes ):
+            
+            if length == 0:
+                
+                if hash in self._hashes_to_records:
+                    
+                    del self._hashes_to_records[ hash ]
+                    
+                
+                continue
+                
+            
+            if pack_num not in self._pack_nums_to_sizes or offset + length > self._pack_nums_to_sizes[ pack_num ]:
+                
+                continue
+                
+            
+            self._hashes_to_records[ hash ] = ( pack_num, offset, length, width, height, depth, codec )
+            
+        
+        total_size = sum( self._pack_nums_to_sizes.values() )
+        live_size = sum( ( record[2] for record in self._hashes_to_records.values() ) )
+        
+        dead_size = total_size - live_size
+        
+        if dead_size > DEAD_SPACE_WIPE_MIN_SIZE and dead_size > total_size * DEAD_SPACE_WIPE_FRACTION:
+            
+            self._Wipe()
+            
+            return
+            
+        
+        self._OpenFiles()
+        
+    
+    def _OpenFiles( self ):
+        
+        if len( self._pack_nums_to_sizes ) == 0:
+            
+            self._active_pack_num = 0
+            
+        else:
+            
+            self._active_pack_num = max( self._pack_nums_to_sizes.keys() )
+            
+        
+        active_pack_path = os.path.join( self._path, GetPackFilename( self._active_pack_num ) )
+        
+        self._active_pack_file = open( active_pack_path, 'ab' )
+        
+        self._pack_nums_to_sizes[ self._active_pack_num ] = self._active_pack_file.tell()
+        
+        self._index_file = open( os.path.join( self._path, INDEX_FILENAME ), 'ab' )
+        
+    
+    def _Wipe( self ):
+        
+        self._CloseFiles()
+        
+        self._hashes_to_records = {}
+        self._pack_nums_to_sizes = {}
+        
+        for filename in os.listdir( self._path ):
+            
+            if filename == INDEX_FILENAME or ( filename.startswith( 'pack_' ) and filename.endswith( '.bin' ) ):
+                
+                os.unlink( os.path.join( self._path, filename ) )
+                
+            
+        
+        with open( os.path.join( self._path, SETTINGS_FILENAME ), 'w', encoding = 'utf-8' ) as f:
+            
+            json.dump( { 'version' : PACK_CACHE_VERSION, 'settings' : self._settings }, f )
+            
+        
+        self._OpenFiles()
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._CloseFiles()
+            
+            self._closed = True
+            
+        
+    
+    def CheckSettings( self, settings ):
+        
+        # settings is whatever decides the thumbnail size, e.g. bounding dimensions, scale type, dpr. if it changes, everything we have is the wrong size
+        settings = json.loads( json.dumps( settings ) )
+        
+        with self._lock:
+            
+            if self._closed:
+                
+                return
+                
+            
+            if settings != self._settings:
+                
+                self._settings = settings
+                
+                self._Wipe()
+                
+            
+        
+    
+    def GetHydrusBitmap( self, hash: bytes, expected_resolution = None ):
+        
+        with self._lock:
+            
+            if self._closed or hash not in self._hashes_to_records:
+                
+                return None
+                
+            
+            ( pack_num, offset, length, width, height, depth, codec ) = self._hashes_to_records[ hash ]
+            
+            if expected_resolution is not None:
+                
+                ( expected_width, expected_height ) = expected_resolution
+                
+                if ( width, height ) not in ( ( expected_width, expected_height ), ( expected_height, expected_width ) ):
+                    
+                    return None
+                    
+                
+            
+            if codec == CODEC_LZ4 and not HydrusCompression.LZ4_OK:
+                
+                return None
+                
+            
+            pack_map = self._GetPackMap( pack_num, offset + length )
+            
+            data = pack_map[ offset : offset + length ]
+            
+        
+        if codec == CODEC_LZ4:
+            
+            return ClientRendering.HydrusBitmap( data, ( width, height ), depth, data_is_compressed = True )
+            
+        else:
+            
+            return ClientRendering.HydrusBitmap( data, ( width, height ), depth )
+            
+        
+    
+    def GetNumThumbnails( self ):
+        
+        with self._lock:
+            
+            return len( self._hashes_to_records )
+            
+        
+    
+    def HasThumbnail( self, hash: bytes ):
+        
+        with self._lock:
+            
+            return hash in self._hashes_to_records
+            
+        
+    
+    def Invalidate( self, hashes ):
+        
+        with self._lock:
+            
+            if self._closed:
+                
+                return
+                
+            
+            hashes = [ hash for hash in hashes if hash in self._hashes_to_records ]
+            
+            if len( hashes ) == 0:
+                
+                return
+                
+            
+            for hash in hashes:
+                
+                del self._hashes_to_records[ hash ]
+                
+            
+            self._index_file.write( b''.join( ( INDEX_RECORD_STRUCT.pack( hash, 0, 0, 0, 0, 0, 0, 0 ) for hash in hashes ) ) )
+            self._index_file.flush()
+            
+        
+    
+    def StoreHydrusBitmap( self, hash: bytes, hydrus_bitmap: ClientRendering.HydrusBitmap ):
+        
+        ( width, height ) = hydrus_bitmap.GetSize()
+        depth = hydrus_bitmap.GetDepth()
+        data = hydrus_bitmap.GetStoredData()
+        
+        if hydrus_bitmap.IsCompressed() and HydrusCompression.LZ4_OK:
+            
+            codec = CODEC_LZ4
+            
+        else:
+            
+            codec = CODEC_RAW
+            
+        
+        length = len( data )
+        
+        if length == 0:
+            
+            return
+            
+        
+        with self._lock:
+            
+            if self._closed:
+                
+                return
+                
+            
+            offset = self._pack_nums_to_sizes[ self._active_pack_num ]
+            
+            if offset > 0 and offset + length > MAX_PACK_SIZE:
+                
+                self._active_pack_file.close()
+                
+                self._active_pack_num += 1
+                
+                self._active_pack_file = open( os.path.join( self._path, GetPackFilename( self._active_pack_num ) ), 'ab' )
+                
+                offset = 0
+                
+            
+            # data first, so the index never points at something that is not there
+            self._active_pack_file.write( data )
+            self._active_pack_file.flush()
+            
+            self._pack_nums_to_sizes[ self._active_pack_num ] = offset + length
+            
+            self._index_file.write( INDEX_RECORD_STRUCT.pack( hash, self._active_pack_num, offset, length, width, height, depth, codec ) )
+            self._index_file.flush()
+            
+            self._hashes_to_records[ hash ] = ( self._active_pack_num, offset, length, width, height, depth, codec )
+            
+        
+    
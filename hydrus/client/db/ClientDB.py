@@ -50,6 +50,7 @@ from hydrus.client.db import ClientDBFilesMetadataBasic
 from hydrus.client.db import ClientDBFilesMetadataRich
 from hydrus.client.db import ClientDBFilesPhysicalStorage
 from hydrus.client.db import ClientDBFilesSearch
+from hydrus.client.db import ClientDBFilesSearchCache
 from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBFilesTimestamps
 from hydrus.client.db import ClientDBFilesViewingStats
@@ -242,6 +243,82 @@ class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
     
+    READ_POOL_ACTIONS = [
+        'autocomplete_predicates',
+        'file_duplicate_hashes',
+        'file_duplicate_info',
+        'file_hashes',
+        'file_info_managers',
+        'file_info_managers_from_ids',
+        'file_query_ids',
+        'file_relationships_for_api',
+        'filter_hashes',
+        'hash_ids_to_hashes',
+        'hash_status',
+        'inbox_hashes',
+        'media_predicates',
+        'media_result',
+        'media_results',
+        'media_results_from_ids',
+        'recent_tags',
+        'related_tags',
+        'tag_descendants_lookup',
+        'tag_predicates',
+        'tag_siblings_and_parents_lookup',
+        'tag_siblings_lookup',
+        'url_statuses'
+    ]
+    
+    UNORDERED_WRITE_ACTIONS = [
+        'analyze',
+        'cull_file_viewing_statistics',
+        'do_deferred_table_delete_work',
+        'duplicates_auto_resolution_do_search_work',
+        'maintain_hashed_serialisables',
+        'maintain_related_tags_cache',
+        'maintain_similar_files_search_for_potential_duplicates',
+        'maintain_similar_files_tree',
+        'process_repository_content',
+        'process_repository_definitions',
+        'sync_tag_display_maintenance'
+    ]
+    
+    COALESCABLE_WRITE_ACTIONS = [
+        'content_updates'
+    ]
+    
+    IMPORTER_ACTIONS = [
+        'import_file'
+    ]
+    
+    # these do not change what a file search returns, so they can leave the file search result cache alone
+    FILE_SEARCH_CACHE_SAFE_WRITE_ACTIONS = [
+        'analyze',
+        'backup',
+        'clear_deferred_physical_delete',
+        'clear_orphan_tables',
+        'delete_serialisable_named',
+        'dirty_services',
+        'do_deferred_table_delete_work',
+        'file_maintenance_add_jobs',
+        'file_maintenance_add_jobs_hashes',
+        'file_maintenance_cancel_jobs',
+        'file_maintenance_clear_jobs',
+        'maintain_hashed_serialisables',
+        'maintain_related_tags_cache',
+        'maintain_similar_files_tree',
+        'process_repository_definitions',
+        'push_recent_tags',
+        'register_shutdown_work',
+        'save_options',
+        'serialisable',
+        'serialisable_atomic',
+        'serialisable_simple',
+        'serialisables_overwrite',
+        'set_password',
+        'vacuum'
+    ]
+    
     def __init__( self, controller: "CG.ClientController.Controller", db_dir, db_name ):
         
         self._initial_messages = []
@@ -452,6 +529,7 @@ class DB( HydrusDB.HydrusDB ):
             'num_parents_to_sync' : len( parent_rows_to_add ) + len( parent_rows_to_remove ),
             'num_actual_rows' : num_actual_rows,
             'num_ideal_rows' : num_ideal_rows,
+            'sync_rows_per_second' : self.modules_tag_display.GetSyncRowsPerSecond( service_id ),
             'waiting_on_tag_repos' : []
         }
         
@@ -477,7 +555,7 @@ class DB( HydrusDB.HydrusDB ):
         return status
         
     
-    def _CacheTagDisplaySync( self, service_key: bytes, work_period = 0.5 ):
+    def _CacheTagDisplaySync( self, service_key: bytes, work_period = 0.5, sync_hard = False ):
         
         # ok, this is the big maintenance lad
         # basically, we fetch what is in actual, what should be in ideal, and migrate
@@ -571,10 +649,12 @@ class DB( HydrusDB.HydrusDB ):
             # However, if we try that strategy when adding, we actually increase max job time, as those delayed big jobs only have the option of staying the same or getting bigger! We get zoom speed and then clunk mode.
             # Therefore, when adding, to limit max work time for the whole migration, we want to actually choose the largest jobs first! That work has to be done, and it doesn't get easier!
             
+            iteration_time_started = HydrusTime.GetNowPrecise()
+            
             ( cache_ideal_tag_siblings_lookup_table_name, cache_actual_tag_siblings_lookup_table_name ) = ClientDBTagSiblings.GenerateTagSiblingsLookupCacheTableNames( tag_service_id )
             ( cache_ideal_tag_parents_lookup_table_name, cache_actual_tag_parents_lookup_table_name ) = ClientDBTagParents.GenerateTagParentsLookupCacheTableNames( tag_service_id )
             
-            def GetWeightedSiblingRow( sibling_rows, index ):
+            def GetWeightedSiblingRows( sibling_rows ):
                 
                 # when you change the sibling A->B in the _lookup table_:
                 # you need to add/remove about A number of mappings for B and all it implies. the weight is: A * count( all the B->X implications )
@@ -591,10 +671,10 @@ class DB( HydrusDB.HydrusDB ):
                 
                 weight_and_rows.sort()
                 
-                return weight_and_rows[ index ]
+                return weight_and_rows
                 
             
-            def GetWeightedParentRow( parent_rows, index ):
+            def GetWeightedParentRows( parent_rows ):
                 
                 # when you change the parent A->B in the _lookup table_:
                 # you need to add/remove mappings (of B) for all instances of A and all that implies it. the weight is: sum( all the X->A implications )
@@ -612,179 +692,141 @@ class DB( HydrusDB.HydrusDB ):
                 
                 weight_and_rows.sort()
                 
-                return weight_and_rows[ index ]
+                return weight_and_rows
                 
             
-            # first up, the removees. what is in actual but not ideal
-            
-            some_removee_sibling_rows = HydrusLists.SampleSetByGettingFirst( sibling_rows_to_remove, 20 )
-            some_removee_parent_rows = HydrusLists.SampleSetByGettingFirst( parent_rows_to_remove, 20 )
-            
-            possibly_affected_tag_ids = set()
-            
-            if len( some_removee_sibling_rows ) + len( some_removee_parent_rows ) > 0:
+            def GetRowsToDo( sibling_rows, parent_rows, smallest_first ):
                 
-                smallest_sibling_weight = None
-                smallest_sibling_row = None
-                smallest_parent_weight = None
-                smallest_parent_row = None
+                # normally we do one row at a time, so no single job gets too long
+                # when syncing hard, we take as many as fit in our weight budget, which we learn from how fast we have been going. the same small/large-first rules apply
                 
-                if len( some_removee_sibling_rows ) > 0:
+                if sync_hard:
                     
-                    ( smallest_sibling_weight, smallest_sibling_row ) = GetWeightedSiblingRow( some_removee_sibling_rows, 0 )
+                    sample_size = ClientDBTagDisplay.SYNC_HARD_SAMPLE_SIZE
                     
-                
-                if len( some_removee_parent_rows ) > 0:
+                else:
                     
-                    ( smallest_parent_weight, smallest_parent_row ) = GetWeightedParentRow( some_removee_parent_rows, 0 )
+                    sample_size = 20
                     
                 
-                if smallest_sibling_weight is not None and smallest_parent_weight is not None:
-                    
-                    if smallest_sibling_weight < smallest_parent_weight:
-                        
-                        smallest_parent_weight = None
-                        smallest_parent_row = None
-                        
-                    else:
-                        
-                        smallest_sibling_weight = None
-                        smallest_sibling_row = None
-                        
-                    
+                some_sibling_rows = HydrusLists.SampleSetByGettingFirst( sibling_rows, sample_size )
+                some_parent_rows = HydrusLists.SampleSetByGettingFirst( parent_rows, sample_size )
                 
-                if smallest_sibling_row is not None:
-                    
-                    # the only things changed here are those implied by or that imply one of these values
-                    
-                    ( a, b ) = smallest_sibling_row
-                    
-                    possibly_affected_tag_ids = { a, b }
-                    
-                    # when you delete a sibling, impliesA and impliedbyA should be subsets of impliesB and impliedbyB
-                    # but let's do everything anyway, just in case of invalid cache or something
-                    
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                    
-                    previous_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
-                    
-                    self._Execute( 'DELETE FROM {} WHERE bad_tag_id = ? AND ideal_tag_id = ?;'.format( cache_actual_tag_siblings_lookup_table_name ), smallest_sibling_row )
-                    
-                    after_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+                weight_and_rows = []
+                
+                if len( some_sibling_rows ) > 0:
                     
-                    self.modules_tag_siblings.NotifySiblingDeleteRowSynced( tag_service_id, smallest_sibling_row )
+                    weight_and_rows.extend( ( ( weight, HC.CONTENT_TYPE_TAG_SIBLINGS, row ) for ( weight, row ) in GetWeightedSiblingRows( some_sibling_rows ) ) )
                     
                 
-                if smallest_parent_row is not None:
+                if len( some_parent_rows ) > 0:
                     
-                    # the only things changed here are those implied by or that imply one of these values
+                    weight_and_rows.extend( ( ( weight, HC.CONTENT_TYPE_TAG_PARENTS, row ) for ( weight, row ) in GetWeightedParentRows( some_parent_rows ) ) )
                     
-                    ( a, b ) = smallest_parent_row
+                
+                weight_and_rows.sort( key = lambda w_c_r: w_c_r[0], reverse = not smallest_first )
+                
+                if sync_hard:
                     
-                    possibly_affected_tag_ids = { a, b }
+                    weight_budget = self.modules_tag_display.GetSyncWeightBudget( tag_service_id, work_period )
                     
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                    possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
+                    rows_to_do = []
+                    total_weight = 0
                     
-                    previous_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+                    for ( weight, content_type, row ) in weight_and_rows:
+                        
+                        if len( rows_to_do ) > 0 and total_weight + weight > weight_budget:
+                            
+                            break
+                            
+                        
+                        rows_to_do.append( ( content_type, row ) )
+                        
+                        total_weight += weight
+                        
                     
-                    self._Execute( 'DELETE FROM {} WHERE child_tag_id = ? AND ancestor_tag_id = ?;'.format( cache_actual_tag_parents_lookup_table_name ), smallest_parent_row )
+                else:
                     
-                    after_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+                    ( weight, content_type, row ) = weight_and_rows[0]
                     
-                    self.modules_tag_parents.NotifyParentDeleteRowSynced( tag_service_id, smallest_parent_row )
+                    rows_to_do = [ ( content_type, row ) ]
+                    total_weight = weight
                     
                 
+                sibling_rows_to_do = [ row for ( content_type, row ) in rows_to_do if content_type == HC.CONTENT_TYPE_TAG_SIBLINGS ]
+                parent_rows_to_do = [ row for ( content_type, row ) in rows_to_do if content_type == HC.CONTENT_TYPE_TAG_PARENTS ]
+                
+                return ( sibling_rows_to_do, parent_rows_to_do, total_weight )
+                
+            
+            # first up, the removees. what is in actual but not ideal. smallest jobs first
+            # if there is nothing to remove, we'll now go for what is in ideal but not actual. largest jobs first
+            
+            if len( sibling_rows_to_remove ) + len( parent_rows_to_remove ) > 0:
+                
+                removing = True
+                
+                ( sibling_rows_to_do, parent_rows_to_do, total_weight ) = GetRowsToDo( sibling_rows_to_remove, parent_rows_to_remove, True )
+                
+            elif len( sibling_rows_to_add ) + len( parent_rows_to_add ) > 0:
+                
+                removing = False
+                
+                ( sibling_rows_to_do, parent_rows_to_do, total_weight ) = GetRowsToDo( sibling_rows_to_add, parent_rows_to_add, False )
+                
             else:
                 
-                # there is nothing to remove, so we'll now go for what is in ideal but not actual
+                break
                 
-                some_addee_sibling_rows = HydrusLists.SampleSetByGettingFirst( sibling_rows_to_add, 20 )
-                some_addee_parent_rows = HydrusLists.SampleSetByGettingFirst( parent_rows_to_add, 20 )
+            
+            # the only things changed here are those implied by or that imply one of these values
+            # when you delete a sibling, impliesA and impliedbyA should be subsets of impliesB and impliedbyB
+            # but let's do everything anyway, just in case of invalid cache or something
+            
+            row_tag_ids = set( itertools.chain.from_iterable( sibling_rows_to_do ) )
+            row_tag_ids.update( itertools.chain.from_iterable( parent_rows_to_do ) )
+            
+            possibly_affected_tag_ids = set( row_tag_ids )
+            
+            possibly_affected_tag_ids.update( itertools.chain.from_iterable( self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, row_tag_ids ).values() ) )
+            possibly_affected_tag_ids.update( itertools.chain.from_iterable( self.modules_tag_display.GetTagsToImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, row_tag_ids ).values() ) )
+            
+            previous_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+            
+            if removing:
                 
-                if len( some_addee_sibling_rows ) + len( some_addee_parent_rows ) > 0:
-                    
-                    largest_sibling_weight = None
-                    largest_sibling_row = None
-                    largest_parent_weight = None
-                    largest_parent_row = None
+                self._ExecuteMany( 'DELETE FROM {} WHERE bad_tag_id = ? AND ideal_tag_id = ?;'.format( cache_actual_tag_siblings_lookup_table_name ), sibling_rows_to_do )
+                self._ExecuteMany( 'DELETE FROM {} WHERE child_tag_id = ? AND ancestor_tag_id = ?;'.format( cache_actual_tag_parents_lookup_table_name ), parent_rows_to_do )
+                
+            else:
+                
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_siblings_lookup_table_name ), sibling_rows_to_do )
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_parents_lookup_table_name ), parent_rows_to_do )
+                
+            
+            after_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+            
+            for row in sibling_rows_to_do:
+                
+                if removing:
                     
-                    if len( some_addee_sibling_rows ) > 0:
-                        
-                        ( largest_sibling_weight, largest_sibling_row ) = GetWeightedSiblingRow( some_addee_sibling_rows, -1 )
-                        
+                    self.modules_tag_siblings.NotifySiblingDeleteRowSynced( tag_service_id, row )
                     
-                    if len( some_addee_parent_rows ) > 0:
-                        
-                        ( largest_parent_weight, largest_parent_row ) = GetWeightedParentRow( some_addee_parent_rows, -1 )
-                        
+                else:
                     
-                    if largest_sibling_weight is not None and largest_parent_weight is not None:
-                        
-                        if largest_sibling_weight > largest_parent_weight:
-                            
-                            largest_parent_weight = None
-                            largest_parent_row = None
-                            
-                        else:
-                            
-                            largest_sibling_weight = None
-                            largest_sibling_row = None
-                            
-                        
+                    self.modules_tag_siblings.NotifySiblingAddRowSynced( tag_service_id, row )
                     
-                    if largest_sibling_row is not None:
-                        
-                        # the only things changed here are those implied by or that imply one of these values
-                        
-                        ( a, b ) = largest_sibling_row
-                        
-                        possibly_affected_tag_ids = { a, b }
-                        
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                        
-                        previous_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
-                        
-                        self._Execute( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_siblings_lookup_table_name ), largest_sibling_row )
-                        
-                        after_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
-                        
-                        self.modules_tag_siblings.NotifySiblingAddRowSynced( tag_service_id, largest_sibling_row )
-                        
+                
+            
+            for row in parent_rows_to_do:
+                
+                if removing:
                     
-                    if largest_parent_row is not None:
-                        
-                        # the only things changed here are those implied by or that imply one of these values
-                        
-                        ( a, b ) = largest_parent_row
-                        
-                        possibly_affected_tag_ids = { a, b }
-                        
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, a ) )
-                        possibly_affected_tag_ids.update( self.modules_tag_display.GetImplies( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, b ) )
-                        
-                        previous_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
-                        
-                        self._Execute( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_parents_lookup_table_name ), largest_parent_row )
-                        
-                        after_chain_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
-                        
-                        self.modules_tag_parents.NotifyParentAddRowSynced( tag_service_id, largest_parent_row )
-                        
+                    self.modules_tag_parents.NotifyParentDeleteRowSynced( tag_service_id, row )
                     
                 else:
                     
-                    break
+                    self.modules_tag_parents.NotifyParentAddRowSynced( tag_service_id, row )
                     
                 
             
@@ -824,31 +866,38 @@ class DB( HydrusDB.HydrusDB ):
             # this would only work for tag_ids that have the same current implied by in actual and ideal (e.g. moving a tag sibling from A->B to B->A)
             # may be better to do this in a merged add/deleteimplication function that would be able to well detect this with 'same current implied' of count > 0 for that domain
             
+            # a big batch touches a lot of tags, so we go through them in id order to keep the index pages we hit together
+            
+            tag_ids_to_delete_implied_by = sorted( tag_ids_to_delete_implied_by.items() )
+            tag_ids_to_add_implied_by = sorted( tag_ids_to_add_implied_by.items() )
+            
             file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES )
             
             for file_service_id in file_service_ids:
                 
-                for ( tag_id, implication_tag_ids ) in tag_ids_to_delete_implied_by.items():
+                for ( tag_id, implication_tag_ids ) in tag_ids_to_delete_implied_by:
                     
                     self.modules_mappings_cache_specific_display.DeleteImplications( file_service_id, tag_service_id, implication_tag_ids, tag_id )
                     
                 
-                for ( tag_id, implication_tag_ids ) in tag_ids_to_add_implied_by.items():
+                for ( tag_id, implication_tag_ids ) in tag_ids_to_add_implied_by:
                     
                     self.modules_mappings_cache_specific_display.AddImplications( file_service_id, tag_service_id, implication_tag_ids, tag_id )
                     
                 
             
-            for ( tag_id, implication_tag_ids ) in tag_ids_to_delete_implied_by.items():
+            for ( tag_id, implication_tag_ids ) in tag_ids_to_delete_implied_by:
                 
                 self.modules_mappings_cache_combined_files_display.DeleteImplications( tag_service_id, implication_tag_ids, tag_id )
                 
             
-            for ( tag_id, implication_tag_ids ) in tag_ids_to_add_implied_by.items():
+            for ( tag_id, implication_tag_ids ) in tag_ids_to_add_implied_by:
                 
                 self.modules_mappings_cache_combined_files_display.AddImplications( tag_service_id, implication_tag_ids, tag_id )
                 
             
+            self.modules_tag_display.NotifySyncWorkDone( tag_service_id, len( sibling_rows_to_do ) + len( parent_rows_to_do ), total_weight, HydrusTime.GetNowPrecise() - iteration_time_started )
+            
             ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = self.modules_tag_display.GetApplicationStatus( tag_service_id )
             
         
@@ -945,6 +994,37 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _CanCoalesceWriteJob( self, action, coalesce_state, args_and_kwargs_so_far, args, kwargs ):
+        
+        if action == 'content_updates':
+            
+            ( first_args, first_kwargs ) = args_and_kwargs_so_far[0]
+            
+            if len( args ) != 1 or kwargs != first_kwargs:
+                
+                return False
+                
+            
+            # a merged package runs service by service, with each service's updates in order
+            # so we can only take a new package if that keeps its updates in the same order relative to what we have
+            
+            service_keys_so_far = coalesce_state[ 'service_keys' ]
+            service_keys_so_far_set = coalesce_state[ 'service_keys_set' ]
+            
+            for ( i, ( service_key, content_updates ) ) in enumerate( args[0].IterateContentUpdates() ):
+                
+                if service_key in service_keys_so_far_set and not ( i == 0 and service_key == service_keys_so_far[-1] ):
+                    
+                    return False
+                    
+                
+            
+            return True
+            
+        
+        return False
+        
+    
     def _CleanAfterJobWork( self ):
         
         self._after_job_content_update_packages.clear()
@@ -1166,6 +1246,8 @@ class DB( HydrusDB.HydrusDB ):
             
             if num_deleted > 0:
                 
+                self.modules_url_map.RegenerateDomainURLCounts()
+                
                 HydrusData.ShowText( f'{HydrusNumbers.ToHumanInt( num_deleted )} orphan url mappings deleted!' )
                 
             else:
@@ -1181,6 +1263,25 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _CoalesceWriteJobArgs( self, action, args_and_kwargs ):
+        
+        if action == 'content_updates':
+            
+            coalesced_content_update_package = ClientContentUpdates.ContentUpdatePackage()
+            
+            for ( args, kwargs ) in args_and_kwargs:
+                
+                coalesced_content_update_package.AddContentUpdatePackage( args[0] )
+                
+            
+            ( first_args, first_kwargs ) = args_and_kwargs[0]
+            
+            return ( ( coalesced_content_update_package, ), first_kwargs )
+            
+        
+        raise NotImplementedError()
+        
+    
     def _CreateDB( self ):
         
         # main
@@ -1481,6 +1582,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self.modules_recent_tags.Drop( service_id )
             
+            self.modules_related_tags_cache.Drop( service_id )
+            
             self.modules_tag_search.Drop( self.modules_services.combined_file_service_id, service_id )
             
             file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES )
@@ -1500,6 +1603,8 @@ class DB( HydrusDB.HydrusDB ):
                 self.modules_tag_search.Drop( service_id, tag_service_id )
                 
             
+            self.modules_related_tags_cache.Drop( service_id )
+            
         
     
     def _DeleteServiceInfo( self, service_key = None, types_to_delete = None ):
@@ -1532,6 +1637,29 @@ class DB( HydrusDB.HydrusDB ):
         self._cursor_transaction_wrapper.pub_after_job( 'notify_new_pending' )
         
     
+    def _DeleteTagCacheSubtagTrigramIndices( self, tag_service_key = None ):
+        
+        if tag_service_key is None:
+            
+            tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            tag_service_ids = ( self.modules_services.GetServiceId( tag_service_key ), )
+            
+        
+        file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES ) )
+        
+        file_service_ids.append( self.modules_services.combined_file_service_id )
+        
+        for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+            
+            self.modules_tag_search.DeleteSubtagTrigramIndex( file_service_id, tag_service_id )
+            
+        
+        HydrusData.ShowText( 'Infix tag search indices removed!' )
+        
+    
     def _DisplayCatastrophicError( self, text ):
         
         message = 'The db encountered a serious error! This is going to be written to the log as well, but here it is for a screenshot:'
@@ -2973,10 +3101,7 @@ class DB( HydrusDB.HydrusDB ):
         
         # this table selection is hacky as anything, but simpler than GetMappingAndTagTables for now
         
-        # this would be an ideal location to have a normal-acting cache of results
-        # a two-table-per service-cross-reference thing with cache entry + a creation timestamp and the actual mappings. invalidate on age or some tag changes I guess
-        # then here we'll poll the search tag to give results, invalidate old ones, then populate as needed and return
-        # only cache what you finish though!
+        # big search tags get a bigger sample remembered in the related tags cache, see _GetRelatedTags and _MaintainRelatedTagsCache
         
         mappings_table_names = []
         
@@ -3044,7 +3169,7 @@ class DB( HydrusDB.HydrusDB ):
             # counter can just take a list of gubbins like this
             results_dict.update( loop_of_results )
             
-            if cancelled_hook():
+            if cancelled_hook is not None and cancelled_hook():
                 
                 we_stopped_early = True
                 
@@ -3184,12 +3309,36 @@ class DB( HydrusDB.HydrusDB ):
         max_num_files_to_search *= magical_later_multiplication_smoothing_coefficient
         
         search_tag_ids_to_tag_ids_to_matching_counts = {}
+        search_tag_ids_to_num_files_searched = {}
         
         for search_tag in search_tags_sorted_ascending:
             
             search_tag_id = self.modules_tags_local_cache.GetTagId( search_tag )
             
-            ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, search_tag_service_id, search_tag_id, max_num_files_to_search, stop_time_for_finding_results = stop_time_for_finding_results )
+            search_tag_count = search_tag_ids_to_total_counts[ search_tag_id ]
+            
+            # a small tag is sampled in full live, no problem. a big one is only sampled, so we'd rather use the bigger sample we did earlier
+            cached_result = None
+            
+            if search_tag_count > max_num_files_to_search:
+                
+                cached_result = self.modules_related_tags_cache.GetCachedCounts( tag_display_type, file_service_id, search_tag_service_id, search_tag_id, search_tag_count )
+                
+            
+            if cached_result is None:
+                
+                ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, search_tag_service_id, search_tag_id, max_num_files_to_search, stop_time_for_finding_results = stop_time_for_finding_results )
+                
+                search_tag_ids_to_num_files_searched[ search_tag_id ] = max_num_files_to_search
+                
+            else:
+                
+                ( tag_ids_to_matching_counts, num_files_searched ) = cached_result
+                
+                it_stopped_early = False
+                
+                search_tag_ids_to_num_files_searched[ search_tag_id ] = num_files_searched
+                
             
             if search_tag_id in tag_ids_to_matching_counts:
                 
@@ -3290,10 +3439,12 @@ class DB( HydrusDB.HydrusDB ):
             
             matching_count_multiplier = 1.0
             
-            if search_tag_count > max_num_files_to_search:
+            num_files_searched = search_tag_ids_to_num_files_searched[ search_tag_id ]
+            
+            if search_tag_count > num_files_searched:
                 
                 # had we searched everything, how much bigger would the results probably be?
-                matching_count_multiplier = search_tag_count / max_num_files_to_search
+                matching_count_multiplier = search_tag_count / num_files_searched
                 
             
             weight = get_weight_from_dict( search_tag_ids_to_search_tags[ search_tag_id ], search_tag_slices_weight_dict )
@@ -3878,6 +4029,7 @@ class DB( HydrusDB.HydrusDB ):
                 'inbox_hashes' : self._FilterInboxHashes,
                 'is_an_orphan' : self._IsAnOrphan,
                 'maintenance_due' : self._GetMaintenanceDue,
+                'migration_bulk_ingest_count' : self._MigrationBulkIngestGetCount,
                 'migration_filter_pairs_by_count' : self._MigrationFilterPairsByCount,
                 'migration_get_mappings' : self._MigrationGetMappings,
                 'migration_get_pairs' : self._MigrationGetPairs,
@@ -3973,12 +4125,15 @@ class DB( HydrusDB.HydrusDB ):
                 'clear_orphan_url_mappings' : self._ClearOrphanURLMappings,
                 'delete_pending' : self._DeletePending,
                 'delete_service_info' : self._DeleteServiceInfo,
+                'delete_subtag_trigram_indices' : self._DeleteTagCacheSubtagTrigramIndices,
                 'dirty_services' : self._SaveDirtyServices,
                 'fix_logically_inconsistent_mappings' : self._FixLogicallyInconsistentMappings,
                 'force_filetype' : self._ForceFiletypes,
                 'import_file' : self._ImportFile,
                 'import_update' : self._ImportUpdate,
                 'maintain_similar_files_search_for_potential_duplicates' : self._PerceptualHashesSearchForPotentialDuplicates,
+                'migration_bulk_ingest_commit_mappings' : self._MigrationBulkIngestCommitMappings,
+                'migration_bulk_ingest_stage_mappings' : self._MigrationBulkIngestStageMappings,
                 'migration_clear_job' : self._MigrationClearJob,
                 'migration_start_mappings_job' : self._MigrationStartMappingsJob,
                 'migration_start_pairs_job' : self._MigrationStartPairsJob,
@@ -3986,6 +4141,7 @@ class DB( HydrusDB.HydrusDB ):
                 'regenerate_local_hash_cache' : self._RegenerateLocalHashCache,
                 'regenerate_local_tag_cache' : self._RegenerateLocalTagCache,
                 'regenerate_searchable_subtag_maps' : self._RegenerateTagCacheSearchableSubtagMaps,
+                'regenerate_subtag_trigram_indices' : self._RegenerateTagCacheSubtagTrigramIndices,
                 'regenerate_tag_cache' : self._RegenerateTagCache,
                 'regenerate_tag_display_mappings_cache' : self._RegenerateTagDisplayMappingsCache,
                 'regenerate_tag_display_pending_mappings_cache' : self._RegenerateTagDisplayPendingMappingsCache,
@@ -4050,12 +4206,15 @@ class DB( HydrusDB.HydrusDB ):
                 'granularise' : self.modules_files_physical_storage.Granularise,
                 'ideal_client_files_locations' : self.modules_files_physical_storage.SetIdealClientFilesLocations,
                 'maintain_hashed_serialisables' : self.modules_serialisable.MaintainHashedStorage,
+                'maintain_related_tags_cache' : self._MaintainRelatedTagsCache,
                 'maintain_similar_files_tree' : self.modules_similar_files.MaintainTree,
                 'missing_archive_timestamps_import_fillin' : self.modules_files_inbox.FillInMissingImportArchiveTimestamps,
                 'missing_archive_timestamps_legacy_fillin' : self.modules_files_inbox.FillInMissingLegacyArchiveTimestamps,
                 'process_repository_definitions' : self.modules_repositories.ProcessRepositoryDefinitions,
                 'push_recent_tags' : self.modules_recent_tags.PushRecentTags,
                 'regenerate_similar_files_tree' : self.modules_similar_files.RegenerateTree,
+                'regenerate_similar_files_tree_commit' : self.modules_similar_files.ReplaceTree,
+                'regenerate_similar_files_tree_snapshot' : self.modules_similar_files.GetTreeRegenerationSnapshot,
                 'regenerate_similar_files_search_count_numbers' : self.modules_similar_files.RegenerateSearchCacheNumbers,
                 'regenerate_tag_siblings_and_parents_cache' : self.modules_tag_display.RegenerateTagSiblingsAndParentsCache,
                 'resync_potential_pairs_to_hydrus_local_file_storage' : self.modules_files_duplicates_updates.ResyncPotentialPairsToHydrusLocalFileStorage,
@@ -4077,6 +4236,20 @@ class DB( HydrusDB.HydrusDB ):
         )
         
     
+    def _InitCaches( self ):
+        
+        try:
+            
+            self.modules_tags_local_cache.PreloadMostCountedTags()
+            
+        except Exception as e:
+            
+            # not a big deal, they'll just load on demand
+            HydrusData.Print( 'Could not preload the most common tags:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+        
+    
     def _InitExternalDatabases( self ):
         
         self._db_filenames[ 'external_caches' ] = 'client.caches.db'
@@ -4220,6 +4393,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._modules.append( self.modules_recent_tags )
         
+        self.modules_related_tags_cache = ClientDBTagSuggestions.ClientDBRelatedTagsCache( self._c )
+        
+        self._modules.append( self.modules_related_tags_cache )
+        
         #
         
         self.modules_ratings = ClientDBRatings.ClientDBRatings( self._c, self.modules_services )
@@ -4469,6 +4646,52 @@ class DB( HydrusDB.HydrusDB ):
         self._modules.append( self.modules_files_duplicates_auto_resolution_search )
         
     
+    def _MaintainRelatedTagsCache( self, maintenance_mode = HC.MAINTENANCE_FORCED, stop_time = None ):
+        
+        # related tags searches on big tags have asked for a bigger sample, so let's do them now while we have time
+        
+        wanted_searches = self.modules_related_tags_cache.GetWanted( 256 )
+        
+        for ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) in wanted_searches:
+            
+            if self._controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ):
+                
+                return
+                
+            
+            if maintenance_mode != HC.MAINTENANCE_FORCED and self._ShouldYieldToWaitingJobs():
+                
+                return
+                
+            
+            search_tag_count = sum( ( abs( current_count ) + abs( pending_count ) for ( tag_id, current_count, pending_count ) in self.modules_mappings_counts.GetCountsForTag( tag_display_type, file_service_id, tag_service_id, search_tag_id ) ) )
+            
+            if search_tag_count == 0:
+                
+                self.modules_related_tags_cache.DeleteWanted( tag_display_type, file_service_id, tag_service_id, search_tag_id )
+                
+                continue
+                
+            
+            num_files_searched = min( search_tag_count, ClientDBTagSuggestions.RELATED_TAGS_CACHE_NUM_FILES_TO_SEARCH )
+            
+            ( tag_ids_to_matching_counts, it_stopped_early ) = self._GetRelatedTagCountsForOneTag( tag_display_type, file_service_id, tag_service_id, search_tag_id, num_files_searched, stop_time_for_finding_results = stop_time )
+            
+            if it_stopped_early:
+                
+                # only cache what we finish
+                return
+                
+            
+            if search_tag_id in tag_ids_to_matching_counts:
+                
+                del tag_ids_to_matching_counts[ search_tag_id ]
+                
+            
+            self.modules_related_tags_cache.SetCounts( tag_display_type, file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, tag_ids_to_matching_counts )
+            
+        
+    
     def _ManageDBError( self, job, e ):
         
         if isinstance( e, MemoryError ):
@@ -4499,6 +4722,162 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _MigrationBulkIngestCommitMappings( self, tag_service_key, job_status = None ):
+        
+        # the staged rows are sorted by tag, so we move them into storage in big ordered blocks, skipping all the per-row cache work, and then regen the caches once
+        # each block leaves the staging table in the same transaction it goes into storage, so if we are interrupted, the next call picks up where we left off
+        
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+        
+        num_to_do = self.modules_mappings_storage.GetBulkIngestMappingsCount( tag_service_id )
+        
+        if num_to_do is None:
+            
+            return
+            
+        
+        bulk_ingest_mappings_table_name = ClientDBMappingsStorage.GenerateBulkIngestMappingsTableName( tag_service_id )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( tag_service_id )
+        
+        if job_status is None:
+            
+            job_status = ClientThreading.JobStatus( cancellable = True )
+            
+        
+        try:
+            
+            job_status.SetStatusTitle( 'committing bulk tag import' )
+            
+            self._controller.pub( 'message', job_status )
+            
+            job_status.SetStatusText( 'moving rows into storage' )
+            
+            num_done = 0
+            
+            while True:
+                
+                if job_status.IsCancelled():
+                    
+                    HydrusData.ShowText( 'The bulk tag import was cancelled with {} rows still to go. They are saved, and the client will finish them off the next time it boots.'.format( HydrusNumbers.ToHumanInt( num_to_do - num_done ) ) )
+                    
+                    return
+                    
+                
+                result = self._Execute( 'SELECT tag_id FROM {} LIMIT 1 OFFSET ?;'.format( bulk_ingest_mappings_table_name ), ( ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE, ) ).fetchone()
+                
+                if result is None:
+                    
+                    result = self._Execute( 'SELECT MAX( tag_id ) FROM {};'.format( bulk_ingest_mappings_table_name ) ).fetchone()
+                    
+                
+                ( last_tag_id, ) = result
+                
+                if last_tag_id is None:
+                    
+                    break
+                    
+                
+                block_started_precise = HydrusTime.GetNowPrecise()
+                
+                ( first_tag_id, num_in_block ) = self._Execute( 'SELECT MIN( tag_id ), COUNT( * ) FROM {} WHERE tag_id <= ?;'.format( bulk_ingest_mappings_table_name ), ( last_tag_id, ) ).fetchone()
+                
+                # adding clears any deleted or pending record, but on a fresh service these are usually empty, so check before we do the expensive bit
+                
+                for table_name in ( deleted_mappings_table_name, pending_mappings_table_name ):
+                    
+                    if self._Execute( 'SELECT 1 FROM {} WHERE tag_id BETWEEN ? AND ? LIMIT 1;'.format( table_name ), ( first_tag_id, last_tag_id ) ).fetchone() is not None:
+                        
+                        self._Execute( 'DELETE FROM {} WHERE tag_id BETWEEN ? AND ? AND ( tag_id, hash_id ) IN ( SELECT tag_id, hash_id FROM {} WHERE tag_id <= ? );'.format( table_name, bulk_ingest_mappings_table_name ), ( first_tag_id, last_tag_id, last_tag_id ) )
+                        
+                    
+                
+                self._Execute( 'INSERT OR IGNORE INTO {} ( tag_id, hash_id ) SELECT tag_id, hash_id FROM {} WHERE tag_id <= ?;'.format( current_mappings_table_name, bulk_ingest_mappings_table_name ), ( last_tag_id, ) )
+                
+                self._Execute( 'DELETE FROM {} WHERE tag_id <= ?;'.format( bulk_ingest_mappings_table_name ), ( last_tag_id, ) )
+                
+                self._cursor_transaction_wrapper.CommitAndBegin()
+                
+                num_done += num_in_block
+                
+                report_content_speed_to_job_status( job_status, num_done, num_to_do, block_started_precise, num_in_block, 'bulk mappings' )
+                
+                job_status.SetGauge( num_done, num_to_do )
+                
+            
+            self._DeleteServiceInfo( service_key = tag_service_key, types_to_delete = ( HC.SERVICE_INFO_NUM_FILE_HASHES, HC.SERVICE_INFO_NUM_TAGS, HC.SERVICE_INFO_NUM_MAPPINGS, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, HC.SERVICE_INFO_NUM_PENDING_MAPPINGS ) )
+            
+            job_status.SetStatusText( 'all rows in, regenerating caches' )
+            
+        finally:
+            
+            job_status.FinishAndDismiss( 5 )
+            
+        
+        # the staging table stays until the regen is done, so a cancel or restart here still knows to regen
+        
+        all_regenerated = self._RegenerateTagMappingsCache( tag_service_key = tag_service_key )
+        
+        if all_regenerated:
+            
+            self.modules_mappings_storage.DropBulkIngestMappingsTable( tag_service_id )
+            
+        else:
+            
+            HydrusData.ShowText( 'The cache regeneration after the bulk tag import was cancelled. All the rows are in storage, but the caches for this service are incomplete. The regeneration will run again the next time the client boots.' )
+            
+        
+    
+    def _MigrationBulkIngestGetCount( self, tag_service_key ):
+        
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+        
+        return self.modules_mappings_storage.GetBulkIngestMappingsCount( tag_service_id )
+        
+    
+    def _MigrationBulkIngestStageMappings( self, tag_service_key, tags_and_hashes ):
+        
+        tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+        
+        tags_and_hashes_cleaned = []
+        
+        for ( tag, hashes ) in tags_and_hashes:
+            
+            try:
+                
+                tag = HydrusTags.CleanTag( tag )
+                
+                HydrusTags.CheckTagNotEmpty( tag )
+                
+            except HydrusExceptions.TagSizeException:
+                
+                continue
+                
+            
+            tags_and_hashes_cleaned.append( ( tag, hashes ) )
+            
+        
+        ok_tags = set( self._controller.tag_display_manager.FilterTags( ClientTags.TAG_DISPLAY_STORAGE, tag_service_key, { tag for ( tag, hashes ) in tags_and_hashes_cleaned } ) )
+        
+        rows = []
+        
+        for ( tag, hashes ) in tags_and_hashes_cleaned:
+            
+            if tag not in ok_tags:
+                
+                continue
+                
+            
+            tag_id = self.modules_tags.GetTagId( tag )
+            
+            hash_ids = self.modules_hashes_local_cache.GetHashIds( hashes )
+            
+            rows.extend( ( ( tag_id, hash_id ) for hash_id in hash_ids ) )
+            
+        
+        self.modules_mappings_storage.StageBulkIngestMappings( tag_service_id, rows )
+        
+    
     def _MigrationClearJob( self, database_temp_job_name ):
         
         self._Execute( 'DROP TABLE {};'.format( database_temp_job_name ) )
@@ -4930,6 +5309,18 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _NotifyReadPoolOfCommit( self ):
+        
+        if self._read_pool_size > 0:
+            
+            self.modules_files_query.NotifyFileSearchResultCacheCommit()
+            self.modules_files_search_tags.NotifyIdBitmapCacheCommit()
+            self.modules_tag_search.NotifyTagAutocompleteIndicesCommit()
+            
+        
+        super()._NotifyReadPoolOfCommit()
+        
+    
     def _PerceptualHashesResetSearchFromHashes( self, hashes ):
         
         hash_ids = self.modules_hashes_local_cache.GetHashIds( hashes )
@@ -4939,6 +5330,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _PerceptualHashesSearchForPotentialDuplicates( self, search_distance: int, work_period: float | None = None ):
         
+        if self.modules_similar_files.GetNumFilesToSimilarSearch( search_distance ) >= ClientDBSimilarFiles.BULK_SEARCH_THRESHOLD:
+            
+            return self._PerceptualHashesSearchForPotentialDuplicatesBulk( search_distance, work_period = work_period )
+            
+        
+        self.modules_similar_files.FinishBulkSearch()
+        
         time_started_float = HydrusTime.GetNowFloat()
         
         num_done = 0
@@ -4974,6 +5372,49 @@ class DB( HydrusDB.HydrusDB ):
         return ( still_work_to_do, num_done )
         
     
+    def _PerceptualHashesSearchForPotentialDuplicatesBulk( self, search_distance: int, work_period: float | None = None ):
+        
+        # a big backlog, like a new client or a raised search distance. we search a whole batch of files at once against an in-memory copy of all the phashes
+        
+        time_started_float = HydrusTime.GetNowFloat()
+        
+        num_done = 0
+        still_work_to_do = True
+        
+        group_of_hash_ids = self.modules_similar_files.GetSomeHashIdsToSimilarSearch( search_distance, ClientDBSimilarFiles.BULK_SEARCH_BATCH_SIZE )
+        
+        while len( group_of_hash_ids ) > 0:
+            
+            hash_ids_to_similar_hash_ids_and_distances = self.modules_similar_files.SearchFilesBulk( group_of_hash_ids, search_distance )
+            
+            for ( hash_id, similar_hash_ids_and_distances ) in hash_ids_to_similar_hash_ids_and_distances.items():
+                
+                media_id = self.modules_files_duplicates_storage.GetMediaId( hash_id )
+                
+                potential_duplicate_media_ids_and_distances = [ ( self.modules_files_duplicates_storage.GetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in similar_hash_ids_and_distances if duplicate_hash_id != hash_id ]
+                
+                self.modules_files_duplicates_updates.AddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                
+            
+            self.modules_similar_files.SetSearchStatuses( group_of_hash_ids, search_distance )
+            
+            num_done += len( group_of_hash_ids )
+            
+            if work_period is not None and ( HydrusTime.TimeHasPassedFloat( time_started_float + work_period ) or self._ShouldYieldToWaitingJobs() ):
+                
+                return ( still_work_to_do, num_done )
+                
+            
+            group_of_hash_ids = self.modules_similar_files.GetSomeHashIdsToSimilarSearch( search_distance, ClientDBSimilarFiles.BULK_SEARCH_BATCH_SIZE )
+            
+        
+        self.modules_similar_files.FinishBulkSearch()
+        
+        still_work_to_do = False
+        
+        return ( still_work_to_do, num_done )
+        
+    
     def _ProcessRepositoryContent( self, service_key, content_hash, content_iterator_dict, content_types_to_process, job_status, work_period ):
         
         FILES_INITIAL_CHUNK_SIZE = 20
@@ -5521,6 +5962,76 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RegenerateTagCacheSubtagTrigramIndices( self, tag_service_key = None ):
+        
+        job_status = ClientThreading.JobStatus( cancellable = True )
+        
+        try:
+            
+            job_status.SetStatusTitle( 'regenerate tag fast search cache infix trigram index' )
+            
+            self._controller.pub( 'modal_message', job_status )
+            
+            if tag_service_key is None:
+                
+                tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+                
+            else:
+                
+                tag_service_ids = ( self.modules_services.GetServiceId( tag_service_key ), )
+                
+            
+            file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES )
+            
+            def status_hook( s ):
+                
+                job_status.SetStatusText( s, 2 )
+                
+            
+            for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+                
+                if job_status.IsCancelled():
+                    
+                    break
+                    
+                
+                message = 'repopulating specific cache {}_{}'.format( file_service_id, tag_service_id )
+                
+                job_status.SetStatusText( message )
+                self._controller.frame_splash_status.SetSubtext( message )
+                
+                time.sleep( 0.01 )
+                
+                self.modules_tag_search.RegenerateSubtagTrigramIndex( file_service_id, tag_service_id, status_hook = status_hook )
+                
+            
+            for tag_service_id in tag_service_ids:
+                
+                if job_status.IsCancelled():
+                    
+                    break
+                    
+                
+                message = 'repopulating combined cache {}'.format( tag_service_id )
+                
+                job_status.SetStatusText( message )
+                self._controller.frame_splash_status.SetSubtext( message )
+                
+                time.sleep( 0.01 )
+                
+                self.modules_tag_search.RegenerateSubtagTrigramIndex( self.modules_services.combined_file_service_id, tag_service_id, status_hook = status_hook )
+                
+            
+        finally:
+            
+            job_status.DeleteStatusText( level = 2 )
+            
+            job_status.SetStatusText( 'done!' )
+            
+            job_status.FinishAndDismiss( 5 )
+            
+        
+    
     def _RegenerateTagCache( self, tag_service_key = None ):
         
         job_status = ClientThreading.JobStatus( cancellable = True )
@@ -5561,9 +6072,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 time.sleep( 0.01 )
                 
+                had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( file_service_id, tag_service_id )
+                
                 self.modules_tag_search.Drop( file_service_id, tag_service_id )
                 
-                self.modules_tag_search.Generate( file_service_id, tag_service_id )
+                self.modules_tag_search.Generate( file_service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                 
                 self._CacheTagsPopulate( file_service_id, tag_service_id, status_hook = status_hook )
                 
@@ -5582,9 +6095,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 time.sleep( 0.01 )
                 
+                had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( self.modules_services.combined_file_service_id, tag_service_id )
+                
                 self.modules_tag_search.Drop( self.modules_services.combined_file_service_id, tag_service_id )
                 
-                self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, tag_service_id )
+                self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                 
                 self._CacheTagsPopulate( self.modules_services.combined_file_service_id, tag_service_id, status_hook = status_hook )
                 
@@ -5831,8 +6346,10 @@ class DB( HydrusDB.HydrusDB ):
                 
                 if file_service_id in tag_cache_file_service_ids:
                     
+                    had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( file_service_id, tag_service_id )
+                    
                     self.modules_tag_search.Drop( file_service_id, tag_service_id )
-                    self.modules_tag_search.Generate( file_service_id, tag_service_id )
+                    self.modules_tag_search.Generate( file_service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                     
                 
                 self.modules_mappings_cache_specific_storage.Drop( file_service_id, tag_service_id )
@@ -5856,8 +6373,10 @@ class DB( HydrusDB.HydrusDB ):
                 
                 time.sleep( 0.01 )
                 
+                had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( self.modules_services.combined_file_service_id, tag_service_id )
+                
                 self.modules_tag_search.Drop( self.modules_services.combined_file_service_id, tag_service_id )
-                self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, tag_service_id )
+                self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                 
                 self.modules_mappings_cache_combined_files_storage.Drop( tag_service_id )
                 
@@ -5866,6 +6385,9 @@ class DB( HydrusDB.HydrusDB ):
                 self._cursor_transaction_wrapper.CommitAndBegin()
                 
             
+            # the loops above break out on cancel, leaving some caches ungenerated
+            all_regenerated = not job_status.IsCancelled()
+            
             if tag_service_key is None:
                 
                 message = 'generating local tag cache'
@@ -5888,6 +6410,8 @@ class DB( HydrusDB.HydrusDB ):
             self._cursor_transaction_wrapper.pub_after_job( 'notify_force_refresh_tags_data' )
             
         
+        return all_regenerated
+        
     
     def _RegenerateTagMappingsTags( self, tags, tag_service_key = None ):
         
@@ -6102,6 +6626,30 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusDB.HydrusDB._RepairDB( self, version )
         
+        # unfinished bulk tag imports
+        
+        unfinished_bulk_ingest_tag_service_ids = [ tag_service_id for tag_service_id in self.modules_services.GetServiceIds( ( HC.LOCAL_TAG, ) ) if self.modules_mappings_storage.GetBulkIngestMappingsCount( tag_service_id ) is not None ]
+        
+        if len( unfinished_bulk_ingest_tag_service_ids ) > 0:
+            
+            message = 'On boot, a bulk tag import was found that did not finish, probably because it was cancelled or the client closed during it. No data is lost. The staged tags will now be moved into storage and the caches for these services regenerated:'
+            message += '\n' * 2
+            message += '\n'.join( ( self.modules_services.GetService( tag_service_id ).GetName() for tag_service_id in unfinished_bulk_ingest_tag_service_ids ) )
+            message += '\n' * 2
+            message += 'If you want to go ahead, click ok on this message and the client will finish the import. It may take some time. If you want to solve this problem otherwise, kill the hydrus process now.'
+            
+            self._controller.BlockingSafeShowMessage( message )
+            
+            for tag_service_id in unfinished_bulk_ingest_tag_service_ids:
+                
+                tag_service_key = self.modules_services.GetServiceKey( tag_service_id )
+                
+                self._MigrationBulkIngestCommitMappings( tag_service_key )
+                
+                self._cursor_transaction_wrapper.CommitAndBegin()
+                
+            
+        
         # caches
         
         tag_service_ids_we_have_regenned_storage_for = set()
@@ -6256,8 +6804,10 @@ class DB( HydrusDB.HydrusDB ):
             
             for ( file_service_id, tag_service_id ) in missing_tag_search_service_pairs:
                 
+                had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( file_service_id, tag_service_id )
+                
                 self.modules_tag_search.Drop( file_service_id, tag_service_id )
-                self.modules_tag_search.Generate( file_service_id, tag_service_id )
+                self.modules_tag_search.Generate( file_service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                 self._CacheTagsPopulate( file_service_id, tag_service_id )
                 
                 self.modules_db_maintenance.TouchAnalyzeNewTables()
@@ -6734,8 +7284,10 @@ class DB( HydrusDB.HydrusDB ):
                         if service_type in HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES:
                             
                             # not clear since siblings and parents can contribute
+                            had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( service_id, tag_service_id )
+                            
                             self.modules_tag_search.Drop( service_id, tag_service_id )
-                            self.modules_tag_search.Generate( service_id, tag_service_id )
+                            self.modules_tag_search.Generate( service_id, tag_service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                             self._CacheTagsPopulate( service_id, tag_service_id )
                             
                         
@@ -6752,8 +7304,10 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self.modules_mappings_cache_combined_files_storage.Clear( service_id, keep_pending = True )
                     
+                    had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( self.modules_services.combined_file_service_id, service_id )
+                    
                     self.modules_tag_search.Drop( self.modules_services.combined_file_service_id, service_id )
-                    self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, service_id )
+                    self.modules_tag_search.Generate( self.modules_services.combined_file_service_id, service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                     self._CacheTagsPopulate( self.modules_services.combined_file_service_id, service_id )
                     
                     file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES )
@@ -6766,8 +7320,10 @@ class DB( HydrusDB.HydrusDB ):
                         if file_service_id in tag_cache_file_service_ids:
                             
                             # not clear since siblings and parents can contribute
+                            had_subtag_trigram_index = self.modules_tag_search.HasSubtagTrigramIndex( file_service_id, service_id )
+                            
                             self.modules_tag_search.Drop( file_service_id, service_id )
-                            self.modules_tag_search.Generate( file_service_id, service_id )
+                            self.modules_tag_search.Generate( file_service_id, service_id, with_subtag_trigram_index = had_subtag_trigram_index )
                             self._CacheTagsPopulate( file_service_id, service_id )
                             
                         
@@ -7001,6 +7557,31 @@ class DB( HydrusDB.HydrusDB ):
         self._SaveOptions( self._controller.options )
         
     
+    def _UpdateCoalesceWriteJobState( self, action, coalesce_state, args, kwargs ):
+        
+        if action == 'content_updates':
+            
+            if 'service_keys' not in coalesce_state:
+                
+                # the merged package's service order, and a set of the same for quick lookup
+                coalesce_state[ 'service_keys' ] = []
+                coalesce_state[ 'service_keys_set' ] = set()
+                
+            
+            service_keys_so_far = coalesce_state[ 'service_keys' ]
+            service_keys_so_far_set = coalesce_state[ 'service_keys_set' ]
+            
+            for ( service_key, content_updates ) in args[0].IterateContentUpdates():
+                
+                if service_key not in service_keys_so_far_set:
+                    
+                    service_keys_so_far.append( service_key )
+                    service_keys_so_far_set.add( service_key )
+                    
+                
+            
+        
+    
     def _UpdateDB( self, version ):
         
         self._controller.frame_splash_status.SetText( 'updating db to v' + str( version + 1 ) )
@@ -8260,6 +8841,33 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 676:
+            
+            try:
+                
+                if not self._TableExists( 'main.url_map_domain_counts' ):
+                    
+                    self._controller.frame_splash_status.SetSubtext( 'generating url domain counts' )
+                    
+                    self._Execute( 'CREATE TABLE IF NOT EXISTS main.url_map_domain_counts ( domain_id INTEGER PRIMARY KEY, url_count INTEGER );' )
+                    
+                    self.modules_url_map.RegenerateDomainURLCounts()
+                    
+                
+                # starts empty
+                self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.related_tags_cache ( cache_id INTEGER PRIMARY KEY, tag_display_type INTEGER, file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, search_tag_count INTEGER, num_files_searched INTEGER, timestamp INTEGER, UNIQUE ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) );' )
+                self._Execute( 'CREATE TABLE IF NOT EXISTS external_caches.related_tags_cache_counts ( cache_id INTEGER, tag_id INTEGER, count INTEGER, PRIMARY KEY ( cache_id, tag_id ) ) WITHOUT ROWID;' )
+                
+            except Exception as e:
+                
+                HydrusData.PrintException( e )
+                
+                message = 'Trying to make the new url domain counts and related tags caches failed! Please let hydrus dev know!'
+                
+                self.pub_initial_message( message )
+                
+            
+        
         #
         
         self._controller.frame_splash_status.SetTitleText( 'updated db to v{}'.format( HydrusNumbers.ToHumanInt( version + 1 ) ) )
@@ -8512,6 +9120,43 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action not in self.FILE_SEARCH_CACHE_SAFE_WRITE_ACTIONS:
+            
+            if action == 'content_updates':
+                
+                dependencies = ClientDBFilesSearchCache.GetContentUpdatePackageDependencies( args[0] )
+                
+            elif action == 'sync_tag_display_maintenance':
+                
+                dependencies = { ( 'tags', None ) }
+                
+            else:
+                
+                dependencies = None
+                
+            
+            # read pool searches may still be looking at the old data, so we'll drop this again when it commits
+            self.modules_files_query.InvalidateFileSearchResultCache( dependencies, until_commit = self._read_pool_size > 0 )
+            self.modules_files_search_tags.InvalidateIdBitmapCache( dependencies, until_commit = self._read_pool_size > 0 )
+            
+        
+        try:
+            
+            return super()._Write( action, *args, **kwargs )
+            
+        except Exception as e:
+            
+            # the job will be rolled back, so anything searched during it is no good
+            self.modules_files_query.InvalidateFileSearchResultCache( None, until_commit = self._read_pool_size > 0 )
+            self.modules_files_search_tags.InvalidateIdBitmapCache( None, until_commit = self._read_pool_size > 0 )
+            self.modules_tag_search.ClearTagAutocompleteIndices()
+            
+            raise
+            
+        
+    
     def pub_content_update_package_after_commit( self, content_update_package ):
         
         self._after_job_content_update_packages.append( content_update_package )
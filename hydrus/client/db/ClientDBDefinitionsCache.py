@@ -20,6 +20,8 @@ from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBServices
 from hydrus.client.metadata import ClientTags
 
+PRELOAD_NUM_TAGS_PER_SERVICE = 20000
+
 class ClientDBCacheLocalHashes( ClientDBModule.ClientDBModule ):
     
     CAN_REPOPULATE_ALL_MISSING_DATA = True
@@ -51,11 +53,11 @@ class ClientDBCacheLocalHashes( ClientDBModule.ClientDBModule ):
         }
         
     
-    def _PopulateHashIdsToHashesCache( self, hash_ids, error_on_missing_hash_ids = False ):
+    def _PopulateHashIdsToHashesCache( self, hash_ids, error_on_missing_hash_ids = False ) -> dict[ int, bytes ]:
         
         self._hash_ids_to_hashes_cache.maintain_touch_record()
         
-        uncached_hash_ids = { hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
+        ( hash_ids_to_hashes, uncached_hash_ids ) = self._hash_ids_to_hashes_cache.get_many( hash_ids )
         
         if len( uncached_hash_ids ) > 0:
             
@@ -79,16 +81,22 @@ class ClientDBCacheLocalHashes( ClientDBModule.ClientDBModule ):
             
             self._hash_ids_to_hashes_cache.update( local_uncached_hash_ids_to_hashes )
             
+            hash_ids_to_hashes.update( local_uncached_hash_ids_to_hashes )
+            
             uncached_hash_ids = { hash_id for hash_id in uncached_hash_ids if hash_id not in local_uncached_hash_ids_to_hashes }
             
         
         if len( uncached_hash_ids ) > 0:
             
-            hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = uncached_hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
+            master_hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = uncached_hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
             
-            self._hash_ids_to_hashes_cache.update( hash_ids_to_hashes )
+            self._hash_ids_to_hashes_cache.update( master_hash_ids_to_hashes )
+            
+            hash_ids_to_hashes.update( master_hash_ids_to_hashes )
             
         
+        return hash_ids_to_hashes
+        
     
     def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
         
@@ -115,19 +123,19 @@ class ClientDBCacheLocalHashes( ClientDBModule.ClientDBModule ):
         
         self._ExecuteMany( 'DELETE FROM local_hashes_cache WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
         
+        self._hash_ids_to_hashes_cache.discard_many( hash_ids )
+        
     
     def GetHash( self, hash_id ) -> bytes:
         
-        self._PopulateHashIdsToHashesCache( ( hash_id, ) )
-        
-        return self._hash_ids_to_hashes_cache[ hash_id ]
+        return self._PopulateHashIdsToHashesCache( ( hash_id, ) )[ hash_id ]
         
     
     def GetHashes( self, hash_ids ) -> list[ bytes ]:
         
-        self._PopulateHashIdsToHashesCache( hash_ids )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids )
         
-        return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
+        return [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
         
     
     def GetHashId( self, hash ) -> int:
@@ -186,9 +194,7 @@ class ClientDBCacheLocalHashes( ClientDBModule.ClientDBModule ):
         
         if hash_ids is not None:
             
-            self._PopulateHashIdsToHashesCache( hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
-            
-            hash_ids_to_hashes = { hash_id : self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids }
+            hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
             
         elif hashes is not None:
             
@@ -391,11 +397,11 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
         }
         
     
-    def _PopulateTagIdsToTagsCache( self, tag_ids ):
+    def _PopulateTagIdsToTagsCache( self, tag_ids, record_stats = True ) -> dict[ int, str ]:
         
         self._tag_ids_to_tags_cache.maintain_touch_record()
         
-        uncached_tag_ids = { tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache }
+        ( tag_ids_to_tags, uncached_tag_ids ) = self._tag_ids_to_tags_cache.get_many( tag_ids, record_stats = record_stats )
         
         if len( uncached_tag_ids ) > 0:
             
@@ -419,16 +425,22 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
             
             self._tag_ids_to_tags_cache.update( local_uncached_tag_ids_to_tags )
             
+            tag_ids_to_tags.update( local_uncached_tag_ids_to_tags )
+            
             uncached_tag_ids = { tag_id for tag_id in uncached_tag_ids if tag_id not in local_uncached_tag_ids_to_tags }
             
         
         if len( uncached_tag_ids ) > 0:
             
-            tag_ids_to_tags = self.modules_tags.GetTagIdsToTags( tag_ids = uncached_tag_ids )
+            master_tag_ids_to_tags = self.modules_tags.GetTagIdsToTags( tag_ids = uncached_tag_ids )
+            
+            self._tag_ids_to_tags_cache.update( master_tag_ids_to_tags )
             
-            self._tag_ids_to_tags_cache.update( tag_ids_to_tags )
+            tag_ids_to_tags.update( master_tag_ids_to_tags )
             
         
+        return tag_ids_to_tags
+        
     
     def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
         
@@ -455,6 +467,8 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
         
         self._ExecuteMany( 'DELETE FROM local_tags_cache WHERE tag_id = ?;', ( ( tag_id, ) for tag_id in tag_ids ) )
         
+        self._tag_ids_to_tags_cache.discard_many( tag_ids )
+        
     
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> list[ tuple[ str, str ] ]:
         
@@ -465,9 +479,7 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
     
     def GetTag( self, tag_id ) -> str:
         
-        self._PopulateTagIdsToTagsCache( ( tag_id, ) )
-        
-        return self._tag_ids_to_tags_cache[ tag_id ]
+        return self._PopulateTagIdsToTagsCache( ( tag_id, ) )[ tag_id ]
         
     
     def GetTagId( self, tag ) -> int:
@@ -503,9 +515,7 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
         
         if tag_ids is not None:
             
-            self._PopulateTagIdsToTagsCache( tag_ids )
-            
-            tag_ids_to_tags = { tag_id : self._tag_ids_to_tags_cache[ tag_id ] for tag_id in tag_ids }
+            tag_ids_to_tags = self._PopulateTagIdsToTagsCache( tag_ids )
             
         elif tags is not None:
             
@@ -515,6 +525,25 @@ class ClientDBCacheLocalTags( ClientDBModule.ClientDBModule ):
         return tag_ids_to_tags
         
     
+    def PreloadMostCountedTags( self, num_tags_per_service = PRELOAD_NUM_TAGS_PER_SERVICE ):
+        
+        # the biggest tags are on half the files of any page and at the top of most autocomplete results, so we fetch them in one go at boot rather than in dribs and drabs
+        
+        tag_ids = set()
+        
+        for tag_service_id in self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES ):
+            
+            counts_cache_table_name = self.modules_mappings_counts.GetCountsCacheTableName( ClientTags.TAG_DISPLAY_STORAGE, self.modules_services.hydrus_local_file_storage_service_id, tag_service_id )
+            
+            tag_ids.update( self._STI( self._Execute( f'SELECT tag_id FROM {counts_cache_table_name} WHERE current_count > 0 ORDER BY current_count DESC LIMIT ?;', ( num_tags_per_service, ) ) ) )
+            
+        
+        if len( tag_ids ) > 0:
+            
+            self._PopulateTagIdsToTagsCache( tag_ids, record_stats = False )
+            
+        
+    
     def UpdateTagInCache( self, tag_id, tag ):
         
         self._Execute( 'UPDATE local_tags_cache SET tag = ? WHERE tag_id = ?;', ( tag, tag_id ) )
@@ -2,11 +2,15 @@ import collections.abc
 import random
 import sqlite3
 
+from hydrus.core import HydrusBitmaps
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusLists
+from hydrus.core import HydrusNumbers
 from hydrus.core import HydrusTags
+from hydrus.core import HydrusTime
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientGlobals as CG
@@ -17,6 +21,7 @@ from hydrus.client.db import ClientDBDefinitionsCache
 from hydrus.client.db import ClientDBFilesDuplicatesStorage
 from hydrus.client.db import ClientDBFilesInbox
 from hydrus.client.db import ClientDBFilesMetadataBasic
+from hydrus.client.db import ClientDBFilesSearchCache
 from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBFilesTimestamps
 from hydrus.client.db import ClientDBFilesViewingStats
@@ -77,6 +82,10 @@ class SearchState( object ):
         self.there_are_simple_files_info_preds_to_search_for = there_are_simple_files_info_preds_to_search_for
         self.done_tricky_incdec_ratings = done_tricky_incdec_ratings
         
+        # the inclusive tag search steps, most selective first, and whether system:inbox has been moved in among them
+        self.inclusive_tag_search_plan = []
+        self.inbox_is_deferred = False
+        
     
     def DoOrPredsInFirstRound( self ):
         
@@ -287,9 +296,101 @@ class ClientDBFilesSearchTags( ClientDBModule.ClientDBModule ):
         self.modules_mappings_counts = modules_mappings_counts
         self.modules_tag_search = modules_tag_search
         
+        self._id_bitmap_cache = ClientDBFilesSearchCache.IdBitmapCache( 'big tag file bitmaps' )
+        
         super().__init__( 'client file search using tags', cursor )
         
     
+    def GetHashIdBitmapFromTag( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_context: ClientSearchTagContext.TagContext, tag, only_if_cached = False, job_status = None ) -> HydrusBitmaps.IdBitmap | None:
+        
+        # a big tag is much cheaper to hold and AND/NOT as a compressed bitmap than as a giant set
+        # small tags are not worth it, so if any part of this tag is small, or we can't do it simply, we return None and the caller does it the normal way
+        
+        ( file_service_keys, file_location_is_cross_referenced ) = location_context.GetCoveringCurrentFileServiceKeys()
+        
+        if not file_location_is_cross_referenced:
+            
+            return None
+            
+        
+        if not self.modules_tags.TagExists( tag ):
+            
+            return None
+            
+        
+        if tag_context.service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = ( self.modules_services.GetServiceId( tag_context.service_key ), )
+            
+        
+        service_ids_to_service_keys = self.modules_services.GetServiceIdsToServiceKeys()
+        
+        tag_id = self.modules_tags.GetTagId( tag )
+        
+        result = None
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            search_tag_service_key = service_ids_to_service_keys[ search_tag_service_id ]
+            
+            search_tag_context = ClientSearchTagContext.TagContext( service_key = search_tag_service_key, include_current_tags = tag_context.include_current_tags, include_pending_tags = tag_context.include_pending_tags, display_service_key = search_tag_service_key )
+            
+            ideal_tag_id = self.modules_tag_siblings.GetIdealTagId( tag_display_type, search_tag_service_id, tag_id )
+            
+            for file_service_key in file_service_keys:
+                
+                key = ( tag_display_type, file_service_key, search_tag_service_key, tag_context.include_current_tags, tag_context.include_pending_tags, ideal_tag_id )
+                
+                bitmap = self._id_bitmap_cache.GetValue( key )
+                
+                if bitmap is None:
+                    
+                    if only_if_cached:
+                        
+                        return None
+                        
+                    
+                    file_service_id = self.modules_services.GetServiceId( file_service_key )
+                    
+                    estimated_count = self.modules_mappings_counts.GetAutocompleteCountEstimate( tag_display_type, search_tag_service_id, file_service_id, ( ideal_tag_id, ), tag_context.include_current_tags, tag_context.include_pending_tags )
+                    
+                    if estimated_count < ClientDBFilesSearchCache.ID_BITMAP_MIN_COUNT:
+                        
+                        return None
+                        
+                    
+                    generation = self._id_bitmap_cache.GetGeneration()
+                    
+                    time_started = HydrusTime.GetNowPrecise()
+                    
+                    bitmap = HydrusBitmaps.IdBitmap.STATICCreateFromIds( self.GetHashIdsFromTagIds( tag_display_type, file_service_key, search_tag_context, ( ideal_tag_id, ), job_status = job_status ) )
+                    
+                    if job_status is not None and job_status.IsCancelled():
+                        
+                        return None
+                        
+                    
+                    self._id_bitmap_cache.AddValue( key, generation, bitmap, { ( 'tags', search_tag_service_key ) }, HydrusTime.GetNowPrecise() - time_started )
+                    
+                
+                if result is None:
+                    
+                    result = bitmap
+                    
+                else:
+                    
+                    result = result | bitmap
+                    
+                
+            
+        
+        return result
+        
+    
     def GetHashIdsAndNonZeroTagCounts( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_context: ClientSearchTagContext.TagContext, hash_ids, namespace_wildcard = '*', job_status = None ):
         
         if namespace_wildcard == '*':
@@ -1055,6 +1156,55 @@ class ClientDBFilesSearchTags( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def GetTagCountEstimate( self, tag_display_type: int, location_context: ClientLocation.LocationContext, tag_context: ClientSearchTagContext.TagContext, tag: str ) -> int:
+        
+        # how many files GetHashIdsFromTag will give, more or less, straight from the counts cache. it is an upper bound when the location has several file services
+        
+        if not self.modules_tags.TagExists( tag ):
+            
+            return 0
+            
+        
+        ( file_service_keys, file_location_is_cross_referenced ) = location_context.GetCoveringCurrentFileServiceKeys()
+        
+        if tag_context.service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = ( self.modules_services.GetServiceId( tag_context.service_key ), )
+            
+        
+        file_service_ids = [ self.modules_services.GetServiceId( file_service_key ) for file_service_key in file_service_keys ]
+        
+        tag_id = self.modules_tags.GetTagId( tag )
+        
+        count = 0
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            ideal_tag_id = self.modules_tag_siblings.GetIdealTagId( tag_display_type, search_tag_service_id, tag_id )
+            
+            for file_service_id in file_service_ids:
+                
+                count += self.modules_mappings_counts.GetAutocompleteCountEstimate( tag_display_type, search_tag_service_id, file_service_id, ( ideal_tag_id, ), tag_context.include_current_tags, tag_context.include_pending_tags )
+                
+            
+        
+        return count
+        
+    
+    def InvalidateIdBitmapCache( self, dependencies, until_commit: bool = False ):
+        
+        self._id_bitmap_cache.Invalidate( dependencies, until_commit = until_commit )
+        
+    
+    def NotifyIdBitmapCacheCommit( self ):
+        
+        self._id_bitmap_cache.NotifyCommit()
+        
+    
 
 
 class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
@@ -1099,6 +1249,8 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         self.modules_files_duplicates_storage = modules_files_duplicates_storage
         self.modules_files_search_tags = modules_files_search_tags
         
+        self._file_search_result_cache = ClientDBFilesSearchCache.FileSearchResultCache( 'file search results' )
+        
         super().__init__( 'client file query', cursor )
         
     
@@ -1251,7 +1403,7 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         
         is_inbox = system_predicates.MustBeInbox()
         
-        if is_inbox:
+        if is_inbox and not search_state.inbox_is_deferred:
             
             query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_inbox.inbox_hash_ids, force_create_new_set = True )
             
@@ -1309,112 +1461,144 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         
         system_predicates = file_search_context.GetSystemPredicates()
         
-        tags_to_include = file_search_context.GetTagsToInclude()
-        
-        namespaces_to_include = file_search_context.GetNamespacesToInclude()
-        
-        wildcards_to_include = file_search_context.GetWildcardsToInclude()
-        
         is_inbox = system_predicates.MustBeInbox()
         
+        # big tags we haven't cross-referenced yet are ANDed here, and only turned into a set when we need one
+        running_tag_bitmap = None
+        
         if search_state.there_are_tags_to_search:
             
-            def sort_longest_tag_first_key( s ):
-                
-                return ( 1 if HydrusTags.IsUnnamespaced( s ) else 0, -len( s ) )
+            for ( search_type, search_value, estimate ) in search_state.inclusive_tag_search_plan:
                 
-            
-            tags_to_include = list( tags_to_include )
-            
-            tags_to_include.sort( key = sort_longest_tag_first_key )
-            
-            for tag in tags_to_include:
+                if running_tag_bitmap is not None and search_type != 'tag':
+                    
+                    query_hash_ids = running_tag_bitmap.ToSet()
+                    
+                    running_tag_bitmap = None
+                    
                 
-                if query_hash_ids is None:
+                if search_type == 'inbox':
                     
-                    tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, job_status = job_status )
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, self.modules_files_inbox.inbox_hash_ids, force_create_new_set = True )
                     
-                elif is_inbox and len( query_hash_ids ) == len( self.modules_files_inbox.inbox_hash_ids ):
+                elif search_type == 'tag':
                     
-                    tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = self.modules_files_inbox.inbox_hash_ids, hash_ids_table_name = 'file_inbox', job_status = job_status )
+                    tag = search_value
                     
-                else:
+                    # if we already have some files to cross-reference, a join is cheap, so we only use a bitmap we already have
+                    tag_bitmap = self.modules_files_search_tags.GetHashIdBitmapFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, only_if_cached = query_hash_ids is not None, job_status = job_status )
                     
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                    if tag_bitmap is not None and query_hash_ids is None:
                         
-                        tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                        if running_tag_bitmap is None:
+                            
+                            running_tag_bitmap = tag_bitmap
+                            
+                        else:
+                            
+                            running_tag_bitmap = running_tag_bitmap & tag_bitmap
+                            
+                        
+                        search_state.have_cross_referenced_file_locations = True
+                        
+                        if running_tag_bitmap.IsEmpty() or job_status.IsCancelled():
+                            
+                            return set()
+                            
+                        
+                        continue
                         
                     
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
-                
-                search_state.have_cross_referenced_file_locations = True
-                
-                if len( query_hash_ids ) == 0:
+                    if running_tag_bitmap is not None:
+                        
+                        query_hash_ids = running_tag_bitmap.ToSet()
+                        
+                        running_tag_bitmap = None
+                        
                     
-                    return set()
+                    if tag_bitmap is not None:
+                        
+                        tag_query_hash_ids = tag_bitmap.FilterIds( query_hash_ids )
+                        
+                    elif query_hash_ids is None:
+                        
+                        tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, job_status = job_status )
+                        
+                    elif is_inbox and len( query_hash_ids ) == len( self.modules_files_inbox.inbox_hash_ids ):
+                        
+                        tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = self.modules_files_inbox.inbox_hash_ids, hash_ids_table_name = 'file_inbox', job_status = job_status )
+                        
+                    else:
+                        
+                        with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                            
+                            tag_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                            
+                        
                     
-                
-            
-            namespaces_to_include = list( namespaces_to_include )
-            
-            namespaces_to_include.sort( key = lambda n: -len( n ) )
-            
-            for namespace in namespaces_to_include:
-                
-                if query_hash_ids is None or ( is_inbox and len( query_hash_ids ) == len( self.modules_files_inbox.inbox_hash_ids ) ):
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
                     
-                    namespace_query_hash_ids = self.modules_files_search_tags.GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, namespace_wildcard = namespace, job_status = job_status )
+                elif search_type == 'namespace':
                     
-                else:
+                    namespace = search_value
                     
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                    if query_hash_ids is None or ( is_inbox and len( query_hash_ids ) == len( self.modules_files_inbox.inbox_hash_ids ) ):
                         
-                        self._AnalyzeTempTable( temp_table_name )
+                        namespace_query_hash_ids = self.modules_files_search_tags.GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, namespace_wildcard = namespace, job_status = job_status )
                         
-                        namespace_query_hash_ids = self.modules_files_search_tags.GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_status = job_status )
+                    else:
+                        
+                        with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                            
+                            self._AnalyzeTempTable( temp_table_name )
+                            
+                            namespace_query_hash_ids = self.modules_files_search_tags.GetHashIdsThatHaveTagsComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, namespace_wildcard = namespace, hash_ids_table_name = temp_table_name, job_status = job_status )
+                            
                         
                     
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
-                
-                search_state.have_cross_referenced_file_locations = True
-                
-                if len( query_hash_ids ) == 0:
-                    
-                    return set()
-                    
-                
-            
-            wildcards_to_include = list( wildcards_to_include )
-            
-            wildcards_to_include.sort( key = lambda w: -len( w ) )
-            
-            for wildcard in wildcards_to_include:
-                
-                if query_hash_ids is None:
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
                     
-                    wildcard_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, wildcard, job_status = job_status )
+                elif search_type == 'wildcard':
                     
-                else:
+                    wildcard = search_value
                     
-                    with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                    if query_hash_ids is None:
                         
-                        self._AnalyzeTempTable( temp_table_name )
+                        wildcard_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, wildcard, job_status = job_status )
                         
-                        wildcard_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                    else:
+                        
+                        with self._MakeTemporaryIntegerTable( query_hash_ids, 'hash_id' ) as temp_table_name:
+                            
+                            self._AnalyzeTempTable( temp_table_name )
+                            
+                            wildcard_query_hash_ids = self.modules_files_search_tags.GetHashIdsFromWildcardComplexLocation( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, wildcard, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                            
                         
                     
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
+                    
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
-                
-                search_state.have_cross_referenced_file_locations = True
+                if search_type != 'inbox':
+                    
+                    search_state.have_cross_referenced_file_locations = True
+                    
                 
                 if len( query_hash_ids ) == 0:
                     
                     return set()
                     
                 
+                if job_status.IsCancelled():
+                    
+                    return set()
+                    
+                
+            
+        
+        if running_tag_bitmap is not None:
+            
+            query_hash_ids = running_tag_bitmap.ToSet()
             
         
         #
@@ -1794,7 +1978,16 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
                 
                 for tag in tags_to_exclude:
                     
-                    unwanted_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                    tag_bitmap = self.modules_files_search_tags.GetHashIdBitmapFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, only_if_cached = True, job_status = job_status )
+                    
+                    if tag_bitmap is None:
+                        
+                        unwanted_hash_ids = self.modules_files_search_tags.GetHashIdsFromTag( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag, hash_ids = query_hash_ids, hash_ids_table_name = temp_table_name, job_status = job_status )
+                        
+                    else:
+                        
+                        unwanted_hash_ids = tag_bitmap.FilterIds( query_hash_ids )
+                        
                     
                     query_hash_ids.difference_update( unwanted_hash_ids )
                     
@@ -2767,93 +2960,37 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return query_hash_ids
         
     
-    def GetHashIdsFromQuery(
-        self,
-        file_search_context: ClientSearchFileSearchContext.FileSearchContext,
-        job_status: ClientThreading.JobStatus | None = None,
-        query_hash_ids: set[ int ] | None = None,
-        apply_implicit_limit: bool = True,
-        sort_by: ClientMediaSort.MediaSort | None = None,
-        limit_sort_by: ClientMediaSort.MediaSort | None = None
-    ) -> list[ int ]:
+    def _GetFileDomainSizeEstimate( self, location_context: ClientLocation.LocationContext ) -> int | None:
         
-        if job_status is None:
-            
-            job_status = ClientThreading.JobStatus( cancellable = True )
-            
-        
-        if query_hash_ids is not None:
-            
-            query_hash_ids = set( query_hash_ids )
-            
+        # the cached service info numbers, so no COUNT( * ). None if we don't have them yet
         
-        system_predicates = file_search_context.GetSystemPredicates()
+        estimate = 0
         
-        system_limit = system_predicates.GetLimit( apply_implicit_limit = apply_implicit_limit )
-        
-        if system_limit == 0:
+        for ( service_keys, info_type ) in ( ( location_context.current_service_keys, HC.SERVICE_INFO_NUM_FILES ), ( location_context.deleted_service_keys, HC.SERVICE_INFO_NUM_DELETED_FILES ) ):
             
-            return []
-            
-        
-        location_context = file_search_context.GetLocationContext()
-        tag_context = file_search_context.GetTagContext()
-        
-        tag_service_key = tag_context.service_key
-        
-        if location_context.IsEmpty():
-            
-            return []
-            
-        
-        current_file_service_ids = set()
-        
-        for current_service_key in location_context.current_service_keys:
-            
-            try:
-                
-                current_file_service_id = self.modules_services.GetServiceId( current_service_key )
-                
-            except HydrusExceptions.DataMissing:
-                
-                HydrusData.ShowText( 'A file search query was run for a file service that does not exist! If you just removed a service, you might want to try checking the search and/or restarting the client.' )
-                
-                return []
+            for service_key in service_keys:
                 
-            
-            current_file_service_ids.add( current_file_service_id )
-            
-        
-        deleted_file_service_ids = set()
-        
-        for deleted_service_key in location_context.deleted_service_keys:
-            
-            try:
+                service_id = self.modules_services.GetServiceId( service_key )
                 
-                deleted_file_service_id = self.modules_services.GetServiceId( deleted_service_key )
+                result = self._Execute( 'SELECT info FROM service_info WHERE service_id = ? AND info_type = ?;', ( service_id, info_type ) ).fetchone()
                 
-            except HydrusExceptions.DataMissing:
+                if result is None:
+                    
+                    return None
+                    
                 
-                HydrusData.ShowText( 'A file search query was run for a file service that does not exist! If you just removed a service, you might want to try checking the search and/or restarting the client.' )
+                ( info, ) = result
                 
-                return []
+                estimate += info
                 
             
-            deleted_file_service_ids.add( deleted_file_service_id )
-            
         
-        db_location_context = self.modules_files_storage.GetDBLocationContext( location_context )
+        return estimate
         
-        try:
-            
-            tag_service_id = self.modules_services.GetServiceId( tag_service_key )
-            
-        except HydrusExceptions.DataMissing:
-            
-            HydrusData.ShowText( 'A file search query was run for a tag service that does not exist! If you just removed a service, you might want to check the search and/or restart the client.' )
-            
-            return []
-            
+    
+    def _GetHashIdsFromQuery( self, file_search_context: ClientSearchFileSearchContext.FileSearchContext, job_status: ClientThreading.JobStatus, query_hash_ids: set[ int ] | None, db_location_context: ClientDBFilesStorage.DBLocationContext, system_predicates: ClientSearchFileSearchContext.FileSystemPredicates ) -> list[ int ]:
+        
+        # the search proper, before any sort or limit
         
         tags_to_include = file_search_context.GetTagsToInclude()
         
@@ -2888,6 +3025,11 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
             done_tricky_incdec_ratings
         )
         
+        if search_state.there_are_tags_to_search:
+            
+            ( search_state.inclusive_tag_search_plan, search_state.inbox_is_deferred ) = self._GetInclusiveTagSearchPlan( file_search_context )
+            
+        
         # And now the search proper
         
         if search_state.DoOrPredsInFirstRound():
@@ -2973,9 +3115,224 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
             return []
             
         
-        #
+        return list( query_hash_ids )
+        
+    
+    def _GetInclusiveTagSearchPlan( self, file_search_context: ClientSearchFileSearchContext.FileSearchContext ):
+        
+        # we want the most selective search first, so everything after it works on a small temp table
+        # exact tags we can count from the counts cache. namespaces and wildcards we can't cheaply, so we assume they are the whole domain, which is what makes them expensive anyway
+        
+        location_context = file_search_context.GetLocationContext()
+        tag_context = file_search_context.GetTagContext()
+        
+        system_predicates = file_search_context.GetSystemPredicates()
+        
+        def sort_longest_tag_first_key( s ):
+            
+            return ( 1 if HydrusTags.IsUnnamespaced( s ) else 0, -len( s ) )
+            
+        
+        tags_to_include = sorted( file_search_context.GetTagsToInclude(), key = sort_longest_tag_first_key )
+        namespaces_to_include = sorted( file_search_context.GetNamespacesToInclude(), key = lambda n: -len( n ) )
+        wildcards_to_include = sorted( file_search_context.GetWildcardsToInclude(), key = lambda w: -len( w ) )
+        
+        domain_size_estimate = self._GetFileDomainSizeEstimate( location_context )
+        
+        search_steps = []
+        
+        for tag in tags_to_include:
+            
+            estimate = self.modules_files_search_tags.GetTagCountEstimate( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, location_context, tag_context, tag )
+            
+            search_steps.append( ( 'tag', tag, estimate ) )
+            
+        
+        search_steps.extend( ( ( 'namespace', namespace, domain_size_estimate ) for namespace in namespaces_to_include ) )
+        search_steps.extend( ( ( 'wildcard', wildcard, domain_size_estimate ) for wildcard in wildcards_to_include ) )
+        
+        if system_predicates.MustBeInbox():
+            
+            search_steps.append( ( 'inbox', None, len( self.modules_files_inbox.inbox_hash_ids ) ) )
+            
+        
+        # unknown goes last, and ties keep the old order
+        def plan_sort_key( index_and_step ):
+            
+            ( index, ( search_type, search_value, estimate ) ) = index_and_step
+            
+            return ( estimate is None, 0 if estimate is None else estimate, index )
+            
+        
+        search_steps = [ step for ( index, step ) in sorted( enumerate( search_steps ), key = plan_sort_key ) ]
+        
+        inbox_is_deferred = False
+        
+        if system_predicates.MustBeInbox():
+            
+            if search_steps[0][0] == 'inbox':
+                
+                # the inbox is small, so do it in the normal place, before all this
+                
+                search_steps = search_steps[1:]
+                
+            else:
+                
+                inbox_is_deferred = True
+                
+            
+        
+        if HG.db_report_mode:
+            
+            def step_to_str( step ):
+                
+                ( search_type, search_value, estimate ) = step
+                
+                pretty_estimate = 'unknown' if estimate is None else HydrusNumbers.ToHumanInt( estimate )
+                
+                if search_type == 'inbox':
+                    
+                    return f'inbox (~{pretty_estimate} files)'
+                    
+                else:
+                    
+                    return f'{search_type} "{search_value}" (~{pretty_estimate} files)'
+                    
+                
+            
+            HydrusData.ShowText( 'File search tag plan: ' + ', then '.join( ( step_to_str( step ) for step in search_steps ) ) )
+            
+        
+        return ( search_steps, inbox_is_deferred )
+        
+    
+    def GetHashIdsFromQuery(
+        self,
+        file_search_context: ClientSearchFileSearchContext.FileSearchContext,
+        job_status: ClientThreading.JobStatus | None = None,
+        query_hash_ids: set[ int ] | None = None,
+        apply_implicit_limit: bool = True,
+        sort_by: ClientMediaSort.MediaSort | None = None,
+        limit_sort_by: ClientMediaSort.MediaSort | None = None
+    ) -> list[ int ]:
+        
+        if job_status is None:
+            
+            job_status = ClientThreading.JobStatus( cancellable = True )
+            
+        
+        if query_hash_ids is not None:
+            
+            query_hash_ids = set( query_hash_ids )
+            
+        
+        system_predicates = file_search_context.GetSystemPredicates()
+        
+        system_limit = system_predicates.GetLimit( apply_implicit_limit = apply_implicit_limit )
+        
+        if system_limit == 0:
+            
+            return []
+            
+        
+        location_context = file_search_context.GetLocationContext()
+        tag_context = file_search_context.GetTagContext()
+        
+        tag_service_key = tag_context.service_key
+        
+        if location_context.IsEmpty():
+            
+            return []
+            
+        
+        current_file_service_ids = set()
+        
+        for current_service_key in location_context.current_service_keys:
+            
+            try:
+                
+                current_file_service_id = self.modules_services.GetServiceId( current_service_key )
+                
+            except HydrusExceptions.DataMissing:
+                
+                HydrusData.ShowText( 'A file search query was run for a file service that does not exist! If you just removed a service, you might want to try checking the search and/or restarting the client.' )
+                
+                return []
+                
+            
+            current_file_service_ids.add( current_file_service_id )
+            
+        
+        deleted_file_service_ids = set()
+        
+        for deleted_service_key in location_context.deleted_service_keys:
+            
+            try:
+                
+                deleted_file_service_id = self.modules_services.GetServiceId( deleted_service_key )
+                
+            except HydrusExceptions.DataMissing:
+                
+                HydrusData.ShowText( 'A file search query was run for a file service that does not exist! If you just removed a service, you might want to try checking the search and/or restarting the client.' )
+                
+                return []
+                
+            
+            deleted_file_service_ids.add( deleted_file_service_id )
+            
+        
+        db_location_context = self.modules_files_storage.GetDBLocationContext( location_context )
+        
+        try:
+            
+            tag_service_id = self.modules_services.GetServiceId( tag_service_key )
+            
+        except HydrusExceptions.DataMissing:
+            
+            HydrusData.ShowText( 'A file search query was run for a tag service that does not exist! If you just removed a service, you might want to check the search and/or restart the client.' )
+            
+            return []
+            
+        
+        cache_key = None
+        
+        if query_hash_ids is None:
         
-        query_hash_ids = list( query_hash_ids )
+            file_search_dependencies = ClientDBFilesSearchCache.GetFileSearchDependencies( file_search_context )
+        
+            if file_search_dependencies is not None:
+        
+                cache_key = file_search_context.DumpToString()
+                
+            
+        
+        if cache_key is None:
+        
+            query_hash_ids = self._GetHashIdsFromQuery( file_search_context, job_status, query_hash_ids, db_location_context, system_predicates )
+            
+        else:
+            
+            query_hash_ids = self._file_search_result_cache.GetHashIds( cache_key )
+            
+            if query_hash_ids is None:
+                
+                generation = self._file_search_result_cache.GetGeneration()
+                
+                time_started = HydrusTime.GetNowPrecise()
+                
+                query_hash_ids = self._GetHashIdsFromQuery( file_search_context, job_status, query_hash_ids, db_location_context, system_predicates )
+                
+                if not job_status.IsCancelled():
+                    
+                    self._file_search_result_cache.AddHashIds( cache_key, generation, query_hash_ids, file_search_dependencies, HydrusTime.GetNowPrecise() - time_started )
+                    
+                
+            
+        
+        if job_status.IsCancelled():
+            
+            return []
+            
         
         #
         
@@ -3017,6 +3374,16 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def InvalidateFileSearchResultCache( self, dependencies, until_commit: bool = False ):
+        
+        self._file_search_result_cache.Invalidate( dependencies, until_commit = until_commit )
+        
+    
+    def NotifyFileSearchResultCacheCommit( self ):
+        
+        self._file_search_result_cache.NotifyCommit()
+        
+    
     def PopulateSearchIntoTempTable( self, file_search_context: ClientSearchFileSearchContext.FileSearchContext, temp_table_name: str, query_hash_ids = None ) -> list[ int ]:
         
         query_hash_ids = self.GetHashIdsFromQuery( file_search_context, apply_implicit_limit = False, query_hash_ids = query_hash_ids )
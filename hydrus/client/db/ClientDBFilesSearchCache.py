@@ -0,0 +1,452 @@
+import array
+import collections
+import collections.abc
+import threading
+import weakref
+
+from hydrus.core import HydrusBitmaps
+from hydrus.core import HydrusConstants as HC
+
+from hydrus.client import ClientConstants as CC
+from hydrus.client.metadata import ClientContentUpdates
+from hydrus.client.search import ClientSearchFileSearchContext
+from hydrus.client.search import ClientSearchPredicate
+
+# a cache of finished file search results, so a page refresh or an api client polling the same search does not have to do all the work again
+# we store the result before sort and limit, so anything that sorts or samples differently can still use it
+# the same machinery holds compressed bitmaps of big tags' files, so big AND/NOT tag searches can skip building giant sets
+# every entry knows what sort of content it depends on, e.g. ( 'tags', service_key ) or ( 'ratings', None ), and content updates only drop what they touch
+# anything we do not understand clears everything, so if we miss something, we are slow, not wrong
+
+FILE_SEARCH_RESULT_CACHE_MAX_SIZE = 64 * 1048576
+
+# compressed posting lists of the biggest tags, see HydrusBitmaps
+ID_BITMAP_CACHE_MAX_SIZE = 128 * 1048576
+
+# below this many files, a normal join is quick enough
+ID_BITMAP_MIN_COUNT = 20000
+
+# one giant entry is not worth pushing everything else out for
+DEPENDENCY_CACHE_MAX_ENTRY_FRACTION = 0.25
+
+# these change as time passes, so we cannot say when their results go stale
+TIME_PREDICATE_TYPES = {
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_IMPORT_TIME,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_MODIFIED_TIME,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TIME,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_LAST_VIEWED_TIME,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_ARCHIVED_TIME
+}
+
+TAG_PREDICATE_TYPES = {
+    ClientSearchPredicate.PREDICATE_TYPE_TAG,
+    ClientSearchPredicate.PREDICATE_TYPE_NAMESPACE,
+    ClientSearchPredicate.PREDICATE_TYPE_PARENT,
+    ClientSearchPredicate.PREDICATE_TYPE_WILDCARD,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_UNTAGGED,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_TAGS,
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_AS_NUMBER
+}
+
+PREDICATE_TYPES_TO_DEPENDENCIES = {
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX : ( 'inbox', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_ARCHIVE : ( 'inbox', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_ADVANCED : ( 'tags', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_RATING : ( 'ratings', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_RATING_ADVANCED : ( 'ratings', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_NOTES : ( 'notes', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NOTES : ( 'notes', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_HAS_NOTE_NAME : ( 'notes', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_KNOWN_URLS : ( 'urls', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_URLS : ( 'urls', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_URLS : ( 'urls', None ),
+    ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_VIEWING_STATS : ( 'viewing', None )
+}
+
+all_dependency_caches = weakref.WeakSet()
+all_dependency_caches_lock = threading.Lock()
+
+def GetAllDependencyCacheStats() -> list[ dict ]:
+    
+    with all_dependency_caches_lock:
+        
+        dependency_caches = list( all_dependency_caches )
+        
+    
+    all_stats = [ dependency_cache.GetStats() for dependency_cache in dependency_caches ]
+    
+    all_stats.sort( key = lambda d: d[ 'name' ] )
+    
+    return all_stats
+    
+
+def DependenciesOverlap( dependencies_a, dependencies_b ) -> bool:
+    
+    # a service_key of None means 'any service'
+    
+    for ( kind_a, service_key_a ) in dependencies_a:
+        
+        for ( kind_b, service_key_b ) in dependencies_b:
+            
+            if kind_a == kind_b and ( service_key_a is None or service_key_b is None or service_key_a == service_key_b ):
+                
+                return True
+                
+            
+        
+    
+    return False
+    
+
+def GetContentUpdatePackageDependencies( content_update_package: ClientContentUpdates.ContentUpdatePackage ):
+    
+    """
+    Returns the set of dependencies this package touches, or None if we cannot say and everything should go.
+    """
+    
+    dependencies = set()
+    
+    for ( service_key, content_updates ) in content_update_package.IterateContentUpdates():
+        
+        for content_update in content_updates:
+            
+            data_type = content_update.GetDataType()
+            action = content_update.GetAction()
+            
+            if data_type == HC.CONTENT_TYPE_MAPPINGS:
+                
+                dependencies.add( ( 'tags', service_key ) )
+                
+            elif data_type in ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_TYPE_TAG_PARENTS ):
+                
+                # display rules can be applied to other services, so these go everywhere
+                dependencies.add( ( 'tags', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_FILES and action in ( HC.CONTENT_UPDATE_ARCHIVE, HC.CONTENT_UPDATE_INBOX ):
+                
+                dependencies.add( ( 'inbox', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_RATINGS:
+                
+                dependencies.add( ( 'ratings', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_NOTES:
+                
+                dependencies.add( ( 'notes', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_URLS:
+                
+                dependencies.add( ( 'urls', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_FILE_VIEWING_STATS:
+                
+                dependencies.add( ( 'viewing', None ) )
+                
+            elif data_type == HC.CONTENT_TYPE_TIMESTAMP:
+                
+                # we never cache a search that looks at time
+                continue
+                
+            else:
+                
+                return None
+                
+            
+        
+    
+    return dependencies
+    
+
+def GetFileSearchDependencies( file_search_context: ClientSearchFileSearchContext.FileSearchContext ):
+    
+    """
+    Returns the set of dependencies this search's results rely on, or None if the search should not be cached.
+    """
+    
+    tag_service_key = file_search_context.GetTagContext().service_key
+    
+    if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
+        
+        tag_dependency = ( 'tags', None )
+        
+    else:
+        
+        tag_dependency = ( 'tags', tag_service_key )
+        
+    
+    dependencies = set()
+    
+    predicates = list( file_search_context.GetPredicates() )
+    
+    while len( predicates ) > 0:
+        
+        predicate = predicates.pop()
+        
+        predicate_type = predicate.GetType()
+        
+        if predicate_type == ClientSearchPredicate.PREDICATE_TYPE_OR_CONTAINER:
+            
+            predicates.extend( predicate.GetORPredicates() )
+            
+        elif predicate_type in TIME_PREDICATE_TYPES:
+            
+            return None
+            
+        elif predicate_type in TAG_PREDICATE_TYPES:
+            
+            dependencies.add( tag_dependency )
+            
+        elif predicate_type in PREDICATE_TYPES_TO_DEPENDENCIES:
+            
+            dependencies.add( PREDICATE_TYPES_TO_DEPENDENCIES[ predicate_type ] )
+            
+        
+    
+    return dependencies
+    
+
+class DependencyCache( object ):
+    
+    def __init__( self, name: str, max_size: int ):
+        
+        self._name = name
+        self._max_size = max_size
+        
+        self._lock = threading.Lock()
+        
+        # key : ( value, dependencies, cost to make it )
+        self._keys_to_entries = collections.OrderedDict()
+        self._size = 0
+        
+        # read pool threads look at committed data, so anything they stored while a write was in flight may be stale once it commits
+        # we remember what the uncommitted writes touched and drop it again at commit time, and the generation lets an in-flight search know not to store its result
+        self._generation = 0
+        self._uncommitted_dependencies = set()
+        self._uncommitted_clear_all = False
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_invalidations = 0
+        self._time_saved = 0.0
+        
+        with all_dependency_caches_lock:
+            
+            all_dependency_caches.add( self )
+            
+        
+    
+    def _Delete( self, key ):
+        
+        ( value, dependencies, cost ) = self._keys_to_entries[ key ]
+        
+        del self._keys_to_entries[ key ]
+        
+        self._size -= self._GetEntrySize( key, value )
+        
+    
+    def _GetEntrySize( self, key, value ) -> int:
+        
+        raise NotImplementedError()
+        
+    
+    def _Invalidate( self, dependencies ):
+        
+        self._generation += 1
+        
+        if dependencies is None:
+            
+            keys_to_delete = list( self._keys_to_entries.keys() )
+            
+        else:
+            
+            keys_to_delete = [ key for ( key, ( value, entry_dependencies, cost ) ) in self._keys_to_entries.items() if DependenciesOverlap( dependencies, entry_dependencies ) ]
+            
+        
+        for key in keys_to_delete:
+            
+            self._Delete( key )
+            
+        
+        self._num_invalidations += len( keys_to_delete )
+        
+    
+    def AddValue( self, key, generation: int, value, dependencies, cost: float ):
+        
+        entry_size = self._GetEntrySize( key, value )
+        
+        if entry_size > self._max_size * DEPENDENCY_CACHE_MAX_ENTRY_FRACTION:
+            
+            return
+            
+        
+        with self._lock:
+            
+            if generation != self._generation:
+                
+                # something changed while we were making it
+                return
+                
+            
+            if key in self._keys_to_entries:
+                
+                self._Delete( key )
+                
+            
+            self._keys_to_entries[ key ] = ( value, frozenset( dependencies ), cost )
+            self._size += entry_size
+            
+            while self._size > self._max_size:
+                
+                ( oldest_key, oldest_entry ) = next( iter( self._keys_to_entries.items() ) )
+                
+                self._Delete( oldest_key )
+                
+            
+        
+    
+    def Clear( self, until_commit: bool = False ):
+        
+        self.Invalidate( None, until_commit = until_commit )
+        
+    
+    def GetGeneration( self ) -> int:
+        
+        with self._lock:
+            
+            return self._generation
+            
+        
+    
+    def GetStats( self ) -> dict:
+        
+        with self._lock:
+            
+            return {
+                'name' : self._name,
+                'num_items' : len( self._keys_to_entries ),
+                'size' : self._size,
+                'size_limit' : self._max_size,
+                'num_hits' : self._num_hits,
+                'num_misses' : self._num_misses,
+                'num_invalidations' : self._num_invalidations,
+                'time_saved' : self._time_saved
+            }
+            
+        
+    
+    def GetValue( self, key ):
+        
+        with self._lock:
+            
+            if key not in self._keys_to_entries:
+                
+                self._num_misses += 1
+                
+                return None
+                
+            
+            self._keys_to_entries.move_to_end( key )
+            
+            ( value, dependencies, cost ) = self._keys_to_entries[ key ]
+            
+            self._num_hits += 1
+            self._time_saved += cost
+            
+            return value
+            
+        
+    
+    def HasValue( self, key ) -> bool:
+        
+        with self._lock:
+            
+            return key in self._keys_to_entries
+            
+        
+    
+    def Invalidate( self, dependencies, until_commit: bool = False ):
+        
+        """
+        Drops everything that depends on any of these dependencies. None means everything.
+        If until_commit is set, the same will be dropped again on NotifyCommit.
+        """
+        
+        with self._lock:
+            
+            self._Invalidate( dependencies )
+            
+            if until_commit:
+                
+                if dependencies is None:
+                    
+                    self._uncommitted_clear_all = True
+                    
+                else:
+                    
+                    self._uncommitted_dependencies.update( dependencies )
+                    
+                
+            
+        
+    
+    def NotifyCommit( self ):
+        
+        with self._lock:
+            
+            if self._uncommitted_clear_all:
+                
+                self._Invalidate( None )
+                
+            elif len( self._uncommitted_dependencies ) > 0:
+                
+                self._Invalidate( self._uncommitted_dependencies )
+                
+            
+            self._uncommitted_dependencies = set()
+            self._uncommitted_clear_all = False
+            
+        
+    
+
+class FileSearchResultCache( DependencyCache ):
+    
+    def __init__( self, name: str, max_size: int = FILE_SEARCH_RESULT_CACHE_MAX_SIZE ):
+        
+        super().__init__( name, max_size )
+        
+    
+    def _GetEntrySize( self, key, value: array.array ) -> int:
+        
+        return len( key ) + len( value ) * value.itemsize
+        
+    
+    def AddHashIds( self, key: str, generation: int, hash_ids: collections.abc.Collection[ int ], dependencies, search_duration: float ):
+        
+        self.AddValue( key, generation, array.array( 'q', hash_ids ), dependencies, search_duration )
+        
+    
+    def GetHashIds( self, key: str ) -> list[ int ] | None:
+        
+        hash_ids = self.GetValue( key )
+        
+        if hash_ids is None:
+            
+            return None
+            
+        
+        return hash_ids.tolist()
+        
+    
+
+class IdBitmapCache( DependencyCache ):
+    
+    def __init__( self, name: str, max_size: int = ID_BITMAP_CACHE_MAX_SIZE ):
+        
+        super().__init__( name, max_size )
+        
+    
+    def _GetEntrySize( self, key, value: HydrusBitmaps.IdBitmap ) -> int:
+        
+        return value.GetMemoryFootprint()
+        
+    
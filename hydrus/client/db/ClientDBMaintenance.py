@@ -283,8 +283,9 @@ class ClientDBMaintenance( ClientDBModule.ClientDBModule ):
                     
                     p1 = CG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time )
                     p2 = job_status.IsCancelled()
+                    p3 = maintenance_mode != HC.MAINTENANCE_FORCED and self._ShouldYieldToWaitingJobs()
                     
-                    if p1 or p2:
+                    if p1 or p2 or p3:
                         
                         break
                         
@@ -497,6 +498,11 @@ class ClientDBMaintenance( ClientDBModule.ClientDBModule ):
                     num_we_want_to_delete = min( 100000, num_we_want_to_delete ) # in my test situation, we could ramp up to 1.7m pretty quick wew
                     
                 
+                if self._ShouldYieldToWaitingJobs():
+                    
+                    break
+                    
+                
             
         
         return still_work_to_do
@@ -282,7 +282,7 @@ class ClientDBMappingsCounts( ClientDBModule.ClientDBModule ):
             count += current_count
             
         
-        if include_current_tags:
+        if include_pending_tags:
             
             count += pending_count
             
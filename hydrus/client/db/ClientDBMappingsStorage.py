@@ -1,3 +1,4 @@
+import collections.abc
 import sqlite3
 
 from hydrus.core import HydrusConstants as HC
@@ -24,6 +25,16 @@ def DoingAFileJoinTagSearchIsFaster( estimated_file_row_count, estimated_tag_row
     return estimated_file_row_count * ( file_lookup_speed_ratio + temp_table_overhead ) < estimated_tag_row_count
     
 
+BULK_INGEST_MAPPINGS_BLOCK_SIZE = 1000000
+BULK_INGEST_MAPPINGS_PREFIX = 'bulk_ingest_mappings_'
+
+def GenerateBulkIngestMappingsTableName( service_id: int ) -> str:
+    
+    # a real table, not durable_temp, so a big import survives a restart
+    
+    return f'external_mappings.{BULK_INGEST_MAPPINGS_PREFIX}{service_id}'
+    
+
 MAPPINGS_CURRENT_PREFIX = 'current_mappings_'
 MAPPINGS_DELETED_PREFIX = 'deleted_mappings_'
 MAPPINGS_PENDING_PREFIX = 'pending_mappings_'
@@ -147,6 +158,13 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         self._Execute( 'DELETE FROM {};'.format( petitioned_mappings_table_name ) )
         
     
+    def DropBulkIngestMappingsTable( self, service_id: int ):
+        
+        bulk_ingest_mappings_table_name = GenerateBulkIngestMappingsTableName( service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( bulk_ingest_mappings_table_name )
+        
+    
     def DropMappingsTables( self, service_id: int ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
@@ -156,6 +174,8 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         self.modules_db_maintenance.DeferredDropTable( pending_mappings_table_name )
         self.modules_db_maintenance.DeferredDropTable( petitioned_mappings_table_name )
         
+        self.DropBulkIngestMappingsTable( service_id )
+        
     
     def FilterExistingUpdateMappings( self, tag_service_id, mappings_ids, action ):
         
@@ -379,6 +399,22 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
             
         
     
+    def GetBulkIngestMappingsCount( self, service_id: int ) -> int | None:
+        
+        # None means there is no bulk ingest going on at all, 0 means the rows are all in but the caches still need regen
+        
+        bulk_ingest_mappings_table_name = GenerateBulkIngestMappingsTableName( service_id )
+        
+        if not self._TableExists( bulk_ingest_mappings_table_name ):
+            
+            return None
+            
+        
+        ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM {};'.format( bulk_ingest_mappings_table_name ) ).fetchone()
+        
+        return count
+        
+    
     def GetCurrentFilesCount( self, service_id: int ) -> int:
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
@@ -504,3 +540,13 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def StageBulkIngestMappings( self, service_id: int, rows: collections.abc.Collection[ tuple[ int, int ] ] ):
+        
+        bulk_ingest_mappings_table_name = GenerateBulkIngestMappingsTableName( service_id )
+        
+        self._Execute( 'CREATE TABLE IF NOT EXISTS {} ( tag_id INTEGER, hash_id INTEGER, PRIMARY KEY ( tag_id, hash_id ) ) WITHOUT ROWID;'.format( bulk_ingest_mappings_table_name ) )
+        
+        # sorted rows go into the primary key in order, which is a lot kinder to the b-tree than random
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( tag_id, hash_id ) VALUES ( ?, ? );'.format( bulk_ingest_mappings_table_name ), sorted( rows ) )
+        
+    
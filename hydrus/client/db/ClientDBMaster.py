@@ -50,11 +50,11 @@ class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
         }
         
     
-    def _PopulateHashIdsToHashesCache( self, hash_ids, error_on_missing_hash_ids = False ):
+    def _PopulateHashIdsToHashesCache( self, hash_ids, error_on_missing_hash_ids = False ) -> dict[ int, bytes ]:
         
         self._hash_ids_to_hashes_cache.maintain_touch_record()
         
-        uncached_hash_ids = { hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
+        ( hash_ids_to_hashes, uncached_hash_ids ) = self._hash_ids_to_hashes_cache.get_many( hash_ids )
         
         if len( uncached_hash_ids ) > 0:
             
@@ -144,6 +144,10 @@ class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
             
             self._hash_ids_to_hashes_cache.update( uncached_hash_ids_to_hashes )
             
+            hash_ids_to_hashes.update( uncached_hash_ids_to_hashes )
+            
+        
+        return hash_ids_to_hashes
         
     
     def GetExtraHash( self, hash_type, hash_id ) -> bytes:
@@ -209,16 +213,14 @@ class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
     
     def GetHash( self, hash_id ) -> bytes:
         
-        self._PopulateHashIdsToHashesCache( ( hash_id, ) )
-        
-        return self._hash_ids_to_hashes_cache[ hash_id ]
+        return self._PopulateHashIdsToHashesCache( ( hash_id, ) )[ hash_id ]
         
     
     def GetHashes( self, hash_ids ) -> list[ bytes ]:
         
-        self._PopulateHashIdsToHashesCache( hash_ids )
+        hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids )
         
-        return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
+        return [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
         
     
     def GetHashId( self, hash ) -> int:
@@ -313,9 +315,7 @@ class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
         
         if hash_ids is not None:
             
-            self._PopulateHashIdsToHashesCache( hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
-            
-            hash_ids_to_hashes = { hash_id : self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids }
+            hash_ids_to_hashes = self._PopulateHashIdsToHashesCache( hash_ids, error_on_missing_hash_ids = error_on_missing_hash_ids )
             
         elif hashes is not None:
             
@@ -512,11 +512,11 @@ class ClientDBMasterTags( ClientDBModule.ClientDBModule ):
         }
         
     
-    def _PopulateTagIdsToTagsCache( self, tag_ids ):
+    def _PopulateTagIdsToTagsCache( self, tag_ids ) -> dict[ int, str ]:
         
         self._tag_ids_to_tags_cache.maintain_touch_record()
         
-        uncached_tag_ids = { tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache }
+        ( tag_ids_to_tags, uncached_tag_ids ) = self._tag_ids_to_tags_cache.get_many( tag_ids )
         
         if len( uncached_tag_ids ) > 0:
             
@@ -559,6 +559,10 @@ class ClientDBMasterTags( ClientDBModule.ClientDBModule ):
             
             self._tag_ids_to_tags_cache.update( uncached_tag_ids_to_tags )
             
+            tag_ids_to_tags.update( uncached_tag_ids_to_tags )
+            
+        
+        return tag_ids_to_tags
         
     
     def GetNamespaceId( self, namespace ) -> int:
@@ -618,9 +622,7 @@ class ClientDBMasterTags( ClientDBModule.ClientDBModule ):
     
     def GetTag( self, tag_id ) -> str:
         
-        self._PopulateTagIdsToTagsCache( ( tag_id, ) )
-        
-        return self._tag_ids_to_tags_cache[ tag_id ]
+        return self._PopulateTagIdsToTagsCache( ( tag_id, ) )[ tag_id ]
         
     
     def GetTagId( self, tag ) -> int:
@@ -663,9 +665,7 @@ class ClientDBMasterTags( ClientDBModule.ClientDBModule ):
         
         if tag_ids is not None:
             
-            self._PopulateTagIdsToTagsCache( tag_ids )
-            
-            tag_ids_to_tags = { tag_id : self._tag_ids_to_tags_cache[ tag_id ] for tag_id in tag_ids }
+            tag_ids_to_tags = self._PopulateTagIdsToTagsCache( tag_ids )
             
         elif tags is not None:
             
@@ -777,10 +777,7 @@ class ClientDBMasterTags( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'UPDATE tags SET namespace_id = ?, subtag_id = ? WHERE tag_id = ?;', ( namespace_id, subtag_id, tag_id ) )
         
-        if tag_id in self._tag_ids_to_tags_cache:
-            
-            del self._tag_ids_to_tags_cache[ tag_id ]
-            
+        self._tag_ids_to_tags_cache.discard_many( ( tag_id, ) )
         
     
 class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
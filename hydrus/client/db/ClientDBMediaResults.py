@@ -496,7 +496,7 @@ class ClientDBMediaResults( ClientDBModule.ClientDBModule ):
                 
                 service_keys_to_ratings = { service_ids_to_service_keys[ service_id ] : rating for ( service_id, rating ) in hash_ids_to_local_ratings[ hash_id ] }
                 
-                ratings_manager = ClientMediaManagers.RatingsManager( service_keys_to_ratings )
+                ratings_manager = ClientMediaManagers.RatingsManager.STATICGenerateManager( service_keys_to_ratings )
                 
                 #
                 
@@ -509,7 +509,7 @@ class ClientDBMediaResults( ClientDBModule.ClientDBModule ):
                     names_to_notes = dict()
                     
                 
-                notes_manager = ClientMediaManagers.NotesManager( names_to_notes )
+                notes_manager = ClientMediaManagers.NotesManager.STATICGenerateManager( names_to_notes )
                 
                 #
                 
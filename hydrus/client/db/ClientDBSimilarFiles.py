@@ -1,7 +1,8 @@
 import collections
 import collections.abc
-import random
+import numpy
 import sqlite3
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -17,6 +18,311 @@ from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBServices
+from hydrus.client.duplicates import ClientVPTreeBuilder
+
+# the in-memory index keeps this many loose changes before folding them into its arrays
+PERCEPTUAL_HASH_INDEX_CONSOLIDATE_THRESHOLD = 4096
+
+# when this many files are waiting for a potential duplicates search, we do them in batches against an in-memory phash index
+BULK_SEARCH_THRESHOLD = 1000
+BULK_SEARCH_BATCH_SIZE = 256
+
+# two phashes within distance d must match exactly on at least one of d + 1 blocks. past this, the blocks are too small to narrow anything down
+PIGEONHOLE_MAX_HAMMING_DISTANCE = 4
+
+def GetBlockSizes( num_blocks: int ) -> list[ int ]:
+    
+    ( block_size, remainder ) = divmod( 64, num_blocks )
+    
+    return [ block_size + 1 if i < remainder else block_size for i in range( num_blocks ) ]
+    
+
+class PerceptualHashIndex( object ):
+    
+    def __init__( self, perceptual_hash_ids_and_perceptual_hashes ):
+        
+        # all our phashes in two flat arrays, so a search is one vectorised xor and popcount rather than a vp-tree walk
+        # it costs about 16 bytes a phash, so 160MB for ten million
+        
+        self._lock = threading.Lock()
+        
+        rows = [ ( perceptual_hash_id, perceptual_hash ) for ( perceptual_hash_id, perceptual_hash ) in perceptual_hash_ids_and_perceptual_hashes if isinstance( perceptual_hash, bytes ) and len( perceptual_hash ) == 8 ]
+        
+        self._perceptual_hash_ids = numpy.array( [ perceptual_hash_id for ( perceptual_hash_id, perceptual_hash ) in rows ], dtype = numpy.int64 )
+        self._perceptual_hashes = ClientVPTreeBuilder.GetPerceptualHashArray( [ perceptual_hash for ( perceptual_hash_id, perceptual_hash ) in rows ] )
+        
+        # rebuilding the arrays is O(n), so small changes wait here until there are enough of them
+        # an id in the removed set masks its entry in the arrays. a re-added id is in both
+        self._pending_perceptual_hash_ids_to_perceptual_hashes = {}
+        self._removed_perceptual_hash_ids = set()
+        
+        # bulk search only. one sorted copy of each block of the arrays, so we can find exact block matches by binary search
+        self._num_blocks_to_block_tables = {}
+        
+    
+    def _ConsolidateIfDue( self ):
+        
+        if len( self._pending_perceptual_hash_ids_to_perceptual_hashes ) + len( self._removed_perceptual_hash_ids ) < PERCEPTUAL_HASH_INDEX_CONSOLIDATE_THRESHOLD:
+            
+            return
+            
+        
+        if len( self._removed_perceptual_hash_ids ) > 0:
+            
+            keep = numpy.isin( self._perceptual_hash_ids, numpy.fromiter( self._removed_perceptual_hash_ids, dtype = numpy.int64 ), invert = True )
+            
+            self._perceptual_hash_ids = self._perceptual_hash_ids[ keep ]
+            self._perceptual_hashes = self._perceptual_hashes[ keep ]
+            
+        
+        if len( self._pending_perceptual_hash_ids_to_perceptual_hashes ) > 0:
+            
+            pending_perceptual_hash_ids = list( self._pending_perceptual_hash_ids_to_perceptual_hashes.keys() )
+            pending_perceptual_hashes = [ self._pending_perceptual_hash_ids_to_perceptual_hashes[ perceptual_hash_id ] for perceptual_hash_id in pending_perceptual_hash_ids ]
+            
+            self._perceptual_hash_ids = numpy.concatenate( ( self._perceptual_hash_ids, numpy.array( pending_perceptual_hash_ids, dtype = numpy.int64 ) ) )
+            self._perceptual_hashes = numpy.concatenate( ( self._perceptual_hashes, ClientVPTreeBuilder.GetPerceptualHashArray( pending_perceptual_hashes ) ) )
+            
+        
+        self._pending_perceptual_hash_ids_to_perceptual_hashes = {}
+        self._removed_perceptual_hash_ids = set()
+        
+        self._num_blocks_to_block_tables = {}
+        
+    
+    def _GetBlockTables( self, num_blocks: int ):
+        
+        if num_blocks not in self._num_blocks_to_block_tables:
+            
+            block_tables = []
+            
+            shift = 0
+            
+            for block_size in GetBlockSizes( num_blocks ):
+                
+                mask = ( 1 << block_size ) - 1
+                
+                keys = ( self._perceptual_hashes >> numpy.uint64( shift ) ) & numpy.uint64( mask )
+                
+                if block_size <= 32:
+                    
+                    keys = keys.astype( numpy.uint32 )
+                    
+                
+                order = numpy.argsort( keys, kind = 'stable' )
+                
+                block_tables.append( ( shift, mask, keys[ order ], order ) )
+                
+                shift += block_size
+                
+            
+            self._num_blocks_to_block_tables[ num_blocks ] = block_tables
+            
+        
+        return self._num_blocks_to_block_tables[ num_blocks ]
+        
+    
+    def _SearchArraysPigeonhole( self, search_values: numpy.ndarray, max_hamming_distance: int ):
+        
+        query_indices_list = []
+        candidate_indices_list = []
+        
+        for ( shift, mask, sorted_keys, order ) in self._GetBlockTables( max_hamming_distance + 1 ):
+            
+            search_keys = ( ( search_values >> numpy.uint64( shift ) ) & numpy.uint64( mask ) ).astype( sorted_keys.dtype )
+            
+            lefts = numpy.searchsorted( sorted_keys, search_keys, side = 'left' )
+            counts = numpy.searchsorted( sorted_keys, search_keys, side = 'right' ) - lefts
+            
+            num_candidates = int( counts.sum() )
+            
+            if num_candidates == 0:
+                
+                continue
+                
+            
+            # expand each query's matching run of the sorted block into flat ( query, position ) arrays
+            run_starts = numpy.repeat( numpy.cumsum( counts ) - counts, counts )
+            positions = numpy.repeat( lefts, counts ) + ( numpy.arange( num_candidates ) - run_starts )
+            
+            query_indices_list.append( numpy.repeat( numpy.arange( len( search_values ) ), counts ) )
+            candidate_indices_list.append( order[ positions ] )
+            
+        
+        if len( query_indices_list ) == 0:
+            
+            return []
+            
+        
+        query_indices = numpy.concatenate( query_indices_list )
+        candidate_indices = numpy.concatenate( candidate_indices_list )
+        
+        distances = ClientVPTreeBuilder.PopCount( numpy.bitwise_xor( self._perceptual_hashes[ candidate_indices ], search_values[ query_indices ] ) )
+        
+        good = distances <= max_hamming_distance
+        
+        # a pair that matches on several blocks comes up several times, but that's fine, the caller's dict sorts it out
+        return zip( query_indices[ good ].tolist(), self._perceptual_hash_ids[ candidate_indices[ good ] ].tolist(), distances[ good ].tolist() )
+        
+    
+    def AddPerceptualHash( self, perceptual_hash_id: int, perceptual_hash: bytes ):
+        
+        if not ( isinstance( perceptual_hash, bytes ) and len( perceptual_hash ) == 8 ):
+            
+            return
+            
+        
+        with self._lock:
+            
+            # if a rolled-back transaction handed this id out before, we don't want its old phash hanging around
+            self._removed_perceptual_hash_ids.add( perceptual_hash_id )
+            self._pending_perceptual_hash_ids_to_perceptual_hashes[ perceptual_hash_id ] = perceptual_hash
+            
+            self._ConsolidateIfDue()
+            
+        
+    
+    def ClearBlockTables( self ):
+        
+        with self._lock:
+            
+            self._num_blocks_to_block_tables = {}
+            
+        
+    
+    def GetNumPerceptualHashes( self ) -> int:
+        
+        with self._lock:
+            
+            num_masked = int( numpy.isin( self._perceptual_hash_ids, numpy.fromiter( self._removed_perceptual_hash_ids, dtype = numpy.int64 ) ).sum() )
+            
+            return len( self._perceptual_hash_ids ) - num_masked + len( self._pending_perceptual_hash_ids_to_perceptual_hashes )
+            
+        
+    
+    def RemovePerceptualHashes( self, perceptual_hash_ids: collections.abc.Collection[ int ] ):
+        
+        with self._lock:
+            
+            for perceptual_hash_id in perceptual_hash_ids:
+                
+                self._removed_perceptual_hash_ids.add( perceptual_hash_id )
+                
+                if perceptual_hash_id in self._pending_perceptual_hash_ids_to_perceptual_hashes:
+                    
+                    del self._pending_perceptual_hash_ids_to_perceptual_hashes[ perceptual_hash_id ]
+                    
+                
+            
+            self._ConsolidateIfDue()
+            
+        
+    
+    def Search( self, search_perceptual_hashes: collections.abc.Collection[ bytes ], max_hamming_distance: int ) -> dict[ int, int ]:
+        
+        similar_perceptual_hash_ids_to_distances = {}
+        
+        search_perceptual_hashes = [ search_perceptual_hash for search_perceptual_hash in search_perceptual_hashes if isinstance( search_perceptual_hash, bytes ) and len( search_perceptual_hash ) == 8 ]
+        
+        if len( search_perceptual_hashes ) == 0:
+            
+            return similar_perceptual_hash_ids_to_distances
+            
+        
+        with self._lock:
+            
+            for ( search_perceptual_hash, search_value ) in zip( search_perceptual_hashes, ClientVPTreeBuilder.GetPerceptualHashArray( search_perceptual_hashes ) ):
+                
+                distances = ClientVPTreeBuilder.PopCount( numpy.bitwise_xor( self._perceptual_hashes, search_value ) )
+                
+                indices = numpy.flatnonzero( distances <= max_hamming_distance )
+                
+                rows = [ ( perceptual_hash_id, distance ) for ( perceptual_hash_id, distance ) in zip( self._perceptual_hash_ids[ indices ].tolist(), distances[ indices ].tolist() ) if perceptual_hash_id not in self._removed_perceptual_hash_ids ]
+                
+                for ( perceptual_hash_id, perceptual_hash ) in self._pending_perceptual_hash_ids_to_perceptual_hashes.items():
+                    
+                    distance = HydrusData.Get64BitHammingDistance( search_perceptual_hash, perceptual_hash )
+                    
+                    if distance <= max_hamming_distance:
+                        
+                        rows.append( ( perceptual_hash_id, distance ) )
+                        
+                    
+                
+                for ( perceptual_hash_id, distance ) in rows:
+                    
+                    if perceptual_hash_id not in similar_perceptual_hash_ids_to_distances or distance < similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ]:
+                        
+                        similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ] = distance
+                        
+                    
+                
+            
+        
+        return similar_perceptual_hash_ids_to_distances
+        
+    
+    def SearchMany( self, search_perceptual_hashes: collections.abc.Collection[ bytes ], max_hamming_distance: int ) -> dict[ bytes, dict[ int, int ] ]:
+        
+        # for the bulk potential duplicates search. one pass over the index for a whole batch of phashes, with each phash's results kept separate
+        
+        search_perceptual_hashes = list( { search_perceptual_hash for search_perceptual_hash in search_perceptual_hashes if isinstance( search_perceptual_hash, bytes ) and len( search_perceptual_hash ) == 8 } )
+        
+        results = { search_perceptual_hash : {} for search_perceptual_hash in search_perceptual_hashes }
+        
+        if len( search_perceptual_hashes ) == 0:
+            
+            return results
+            
+        
+        search_values = ClientVPTreeBuilder.GetPerceptualHashArray( search_perceptual_hashes )
+        
+        with self._lock:
+            
+            if max_hamming_distance <= PIGEONHOLE_MAX_HAMMING_DISTANCE:
+                
+                rows = self._SearchArraysPigeonhole( search_values, max_hamming_distance )
+                
+            else:
+                
+                rows = []
+                
+                for ( query_index, search_value ) in enumerate( search_values ):
+                    
+                    distances = ClientVPTreeBuilder.PopCount( numpy.bitwise_xor( self._perceptual_hashes, search_value ) )
+                    
+                    indices = numpy.flatnonzero( distances <= max_hamming_distance )
+                    
+                    rows.extend( ( ( query_index, perceptual_hash_id, distance ) for ( perceptual_hash_id, distance ) in zip( self._perceptual_hash_ids[ indices ].tolist(), distances[ indices ].tolist() ) ) )
+                    
+                
+            
+            for ( query_index, perceptual_hash_id, distance ) in rows:
+                
+                if perceptual_hash_id not in self._removed_perceptual_hash_ids:
+                    
+                    results[ search_perceptual_hashes[ query_index ] ][ perceptual_hash_id ] = distance
+                    
+                
+            
+            if len( self._pending_perceptual_hash_ids_to_perceptual_hashes ) > 0:
+                
+                pending_perceptual_hash_ids = list( self._pending_perceptual_hash_ids_to_perceptual_hashes.keys() )
+                pending_values = ClientVPTreeBuilder.GetPerceptualHashArray( [ self._pending_perceptual_hash_ids_to_perceptual_hashes[ perceptual_hash_id ] for perceptual_hash_id in pending_perceptual_hash_ids ] )
+                
+                # there are only a few thousand of these at most, so the whole batch-by-pending grid is fine
+                distances = ClientVPTreeBuilder.PopCount( numpy.bitwise_xor( search_values[ :, None ], pending_values[ None, : ] ) )
+                
+                for ( query_index, pending_index ) in zip( *( index_array.tolist() for index_array in numpy.nonzero( distances <= max_hamming_distance ) ) ):
+                    
+                    results[ search_perceptual_hashes[ query_index ] ][ pending_perceptual_hash_ids[ pending_index ] ] = int( distances[ query_index, pending_index ] )
+                    
+                
+            
+        
+        return results
+        
+    
 
 class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
@@ -42,6 +348,9 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._non_vp_treed_perceptual_hash_ids = set()
         self._root_node_perceptual_hash_id = None
         
+        self._perceptual_hash_index = None
+        self._perceptual_hash_index_held_for_bulk_search = False
+        
     
     def _AddLeaf( self, perceptual_hash_id, perceptual_hash ):
         
@@ -162,117 +471,107 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._ClearPerceptualHashesFromVPTreeNodeCache( ( perceptual_hash_id, ) )
         
     
-    def _DeltaShapeSearchCacheNumbers( self, searched_distance, delta ):
-        
-        # hydev's first UPSERT, 2025-09-14
-        self._Execute( 'INSERT INTO shape_search_cache_numbers ( searched_distance, count ) VALUES ( ?, ? ) ON CONFLICT( searched_distance ) DO UPDATE SET count = count + ?;', ( searched_distance, delta, delta ) )
-        
-        self._cursor_transaction_wrapper.pub_after_job( 'notify_new_shape_search_cache_numbers' )
-        
-    
-    def _DeltaShapeSearchCacheNumbersRemoveFile( self, hash_id: int ):
-        
-        result = self._Execute( 'SELECT searched_distance FROM shape_search_cache WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
-        
-        if result is not None:
-            
-            ( searched_distance, ) = result
-            
-            self._DeltaShapeSearchCacheNumbers( searched_distance, -1 )
-            
-        
-    
-    def _GenerateBranch( self, job_status, parent_id, perceptual_hash_id, perceptual_hash, children ):
-        
-        process_queue = collections.deque()
-        
-        process_queue.append( ( parent_id, perceptual_hash_id, perceptual_hash, children ) )
-        
-        insert_rows = []
+    def _CullBadPerceptualHashes( self, nodes ):
         
-        num_done = 0
-        num_to_do = len( children ) + 1
+        good_nodes = []
+        bad_nodes = []
         
-        all_altered_phash_ids = set()
-        
-        while len( process_queue ) > 0:
-            
-            job_status.SetStatusText( 'generating new branch -- ' + HydrusNumbers.ValueRangeToPrettyString( num_done, num_to_do ), 2 )
+        for ( phash_id, phash ) in nodes:
             
-            ( parent_id, perceptual_hash_id, perceptual_hash, children ) = process_queue.popleft()
-            
-            if len( children ) == 0:
-                
-                inner_id = None
-                inner_population = 0
+            if isinstance( phash, bytes ) and len( phash ) == 8:
                 
-                outer_id = None
-                outer_population = 0
-                
-                radius = None
+                good_nodes.append( ( phash_id, phash ) )
                 
             else:
                 
-                children = sorted( ( ( HydrusData.Get64BitHammingDistance( perceptual_hash, child_perceptual_hash ), child_id, child_perceptual_hash ) for ( child_id, child_perceptual_hash ) in children ) )
-                
-                median_index = len( children ) // 2
-                
-                median_radius = children[ median_index ][0]
+                bad_nodes.append( ( phash_id, phash ) )
                 
-                inner_children = [ ( child_id, child_perceptual_hash ) for ( distance, child_id, child_perceptual_hash ) in children if distance < median_radius ]
-                radius_children = [ ( child_id, child_perceptual_hash ) for ( distance, child_id, child_perceptual_hash ) in children if distance == median_radius ]
-                outer_children = [ ( child_id, child_perceptual_hash ) for ( distance, child_id, child_perceptual_hash ) in children if distance > median_radius ]
-                
-                if len( inner_children ) <= len( outer_children ):
-                    
-                    radius = median_radius
-                    
-                    inner_children.extend( radius_children )
-                    
-                else:
-                    
-                    radius = median_radius - 1
-                    
-                    outer_children.extend( radius_children )
-                    
+            
+        
+        if len( bad_nodes ) > 0:
+            
+            bad_phash_ids = { phash_id for ( phash_id, phash ) in bad_nodes }
+            
+            self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( phash_id, ) for phash_id in bad_phash_ids ) )
+            
+            with self._MakeTemporaryIntegerTable( bad_phash_ids, 'phash_id' ) as temp_table_name:
                 
-                inner_population = len( inner_children )
-                outer_population = len( outer_children )
+                affected_hash_ids = self._STS( self._Execute( f'SELECT hash_id FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );' ) )
                 
-                ( inner_id, inner_perceptual_hash ) = self._PopBestRootNode( inner_children ) #HydrusLists.MedianPop( inner_children )
+            
+            self._ExecuteMany( 'DELETE FROM shape_perceptual_hash_map WHERE phash_id = ?;', ( ( phash_id, ) for phash_id in bad_phash_ids ) )
+            
+            message = 'Discovered some bad nodes in your similar files search tree! The nodes have been deleted.'
+            message += '\n'
+            message += 'More details have been written to log, including the file list for affected hashes. You may wish to manually schedule a "similar files regen" job for all the affected file hashes. You should also check the \'Recovery->Help my db is broke\' document in the help, since there are no clean ways these bad nodes got into your database.'
+            
+            HydrusData.ShowText( message )
+            
+            HydrusData.Print( 'The bad nodes:' )
+            
+            for ( phash_id, phash ) in bad_nodes:
                 
-                if len( outer_children ) == 0:
+                if isinstance( phash, bytes ):
                     
-                    outer_id = None
+                    HydrusData.Print( f'phash_id: {phash_id}, presumably incorrect-length phash: "{phash.hex()}"' )
                     
                 else:
                     
-                    ( outer_id, outer_perceptual_hash ) = self._PopBestRootNode( outer_children ) #HydrusLists.MedianPop( outer_children )
+                    HydrusData.Print( f'phash_id: {phash_id}, presumably corrupt phash: "{phash}"' )
                     
                 
             
-            insert_rows.append( ( perceptual_hash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) )
-            
-            all_altered_phash_ids.add( perceptual_hash_id )
+            HydrusData.Print( 'The affected hashes:' )
             
-            if inner_id is not None:
+            try:
                 
-                process_queue.append( ( perceptual_hash_id, inner_id, inner_perceptual_hash, inner_children ) )
+                hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = affected_hash_ids )
                 
-            
-            if outer_id is not None:
+                HydrusData.Print( '\n'.join( ( hash.hex() for hash in hash_ids_to_hashes.values() ) ) )
+                
+            except Exception as e:
                 
-                process_queue.append( ( perceptual_hash_id, outer_id, outer_perceptual_hash, outer_children ) )
+                HydrusData.Print( 'Could not print affected hashes (might be your regular hashes are busted too)' )
                 
             
-            num_done += 1
+        
+        return good_nodes
+        
+    
+    def _DeltaShapeSearchCacheNumbers( self, searched_distance, delta ):
+        
+        # hydev's first UPSERT, 2025-09-14
+        self._Execute( 'INSERT INTO shape_search_cache_numbers ( searched_distance, count ) VALUES ( ?, ? ) ON CONFLICT( searched_distance ) DO UPDATE SET count = count + ?;', ( searched_distance, delta, delta ) )
+        
+        self._cursor_transaction_wrapper.pub_after_job( 'notify_new_shape_search_cache_numbers' )
+        
+    
+    def _DeltaShapeSearchCacheNumbersRemoveFile( self, hash_id: int ):
+        
+        result = self._Execute( 'SELECT searched_distance FROM shape_search_cache WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is not None:
+            
+            ( searched_distance, ) = result
             
+            self._DeltaShapeSearchCacheNumbers( searched_distance, -1 )
+            
+        
+    
+    def _GenerateBranch( self, job_status, parent_id, nodes ):
+        
+        # nodes is a list of ( phash_id, phash ). we return the new branch's root
+        
+        perceptual_hash_ids = numpy.array( [ perceptual_hash_id for ( perceptual_hash_id, perceptual_hash ) in nodes ], dtype = numpy.int64 )
+        perceptual_hashes = ClientVPTreeBuilder.GetPerceptualHashArray( [ perceptual_hash for ( perceptual_hash_id, perceptual_hash ) in nodes ] )
+        
+        rows = ClientVPTreeBuilder.GenerateVPTreeRows( perceptual_hash_ids, perceptual_hashes, parent_id = parent_id, job_status = job_status )
         
         job_status.SetStatusText( 'branch constructed, now committing', 2 )
         
-        self._ExecuteMany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
+        self._InsertVPTreeRows( rows )
         
-        self._ClearPerceptualHashesFromVPTreeNodeCache( all_altered_phash_ids )
+        return int( rows[0][0] )
         
     
     def _GetHashIdsWithPixelHashId( self, pixel_hash_id: int ) -> set[ int ]:
@@ -341,6 +640,11 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._AddLeaf( perceptual_hash_id, perceptual_hash )
             
+            if self._perceptual_hash_index is not None:
+                
+                self._perceptual_hash_index.AddPerceptualHash( perceptual_hash_id, perceptual_hash )
+                
+            
         else:
             
             ( perceptual_hash_id, ) = result
@@ -349,115 +653,91 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return perceptual_hash_id
         
     
-    def _GetPerceptualHashIdsFromHashId( self, hash_id: int ) -> set[ int ]:
-        
-        perceptual_hash_ids = self._STS( self._Execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+    def _GetPerceptualHashIndex( self ) -> PerceptualHashIndex | None:
         
-        return perceptual_hash_ids
-        
-    
-    def _GetPixelHashId( self, hash_id: int ) -> int | None:
-        
-        result = self._Execute( 'SELECT pixel_hash_id FROM pixel_hash_map WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
-        
-        if result is None:
+        if not ( self._perceptual_hash_index_held_for_bulk_search or CG.client_controller.new_options.GetBoolean( 'similar_files_in_memory_search_index' ) ):
             
-            return None
+            self._perceptual_hash_index = None
             
-        else:
+            return None
             
-            ( pixel_hash_id, ) = result
+        
+        if self._perceptual_hash_index is None and not self._IsOnReadPoolThread():
             
-            return pixel_hash_id
+            self._perceptual_hash_index = PerceptualHashIndex( self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall() )
             
         
+        return self._perceptual_hash_index
+        
     
-    def _PopBestRootNode( self, node_rows ):
+    def _GetPerceptualHashIdsFromHashId( self, hash_id: int ) -> set[ int ]:
         
-        if len( node_rows ) == 1:
-            
-            root_row = node_rows.pop()
-            
-            return root_row
-            
+        perceptual_hash_ids = self._STS( self._Execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
         
-        MAX_VIEWPOINTS = 256
-        MAX_SAMPLE = 64
+        return perceptual_hash_ids
         
-        if len( node_rows ) > MAX_VIEWPOINTS:
-            
-            viewpoints = random.sample( node_rows, MAX_VIEWPOINTS )
-            
-        else:
-            
-            viewpoints = node_rows
-            
+    
+    def _GetPixelHashId( self, hash_id: int ) -> int | None:
+        
+        result = self._Execute( 'SELECT pixel_hash_id FROM pixel_hash_map WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
         
-        if len( node_rows ) > MAX_SAMPLE:
+        if result is None:
             
-            sample = random.sample( node_rows, MAX_SAMPLE )
+            return None
             
         else:
             
-            sample = node_rows
+            ( pixel_hash_id, ) = result
+            
+            return pixel_hash_id
             
         
-        final_scores = []
+    
+    def _GetSimilarHashIdsAndDistances( self, similar_perceptual_hash_ids_to_distances: dict[ int, int ] ) -> list[ tuple[ int, int ] ]:
         
-        for ( v_id, v_perceptual_hash ) in viewpoints:
-            
-            views = sorted( ( HydrusData.Get64BitHammingDistance( v_perceptual_hash, s_perceptual_hash ) for ( s_id, s_perceptual_hash ) in sample if v_id != s_id ) )
-            
-            # let's figure out the ratio of left_children to right_children, preferring 1:1, and convert it to a discrete integer score
+        # so, now we have perceptual_hash_ids and distances. let's map that to actual files.
+        # files can have multiple perceptual_hashes, and perceptual_hashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
+        
+        similar_perceptual_hash_ids = list( similar_perceptual_hash_ids_to_distances.keys() )
+        
+        with self._MakeTemporaryIntegerTable( similar_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
             
-            median_index = len( views ) // 2
+            # temp perceptual_hashes to hash map
+            similar_perceptual_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( 'SELECT phash_id, hash_id FROM {} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );'.format( temp_table_name ) ) )
             
-            radius = views[ median_index ]
+        
+        similar_hash_ids_to_distances = {}
+        
+        for ( perceptual_hash_id, hash_ids ) in similar_perceptual_hash_ids_to_hash_ids.items():
             
-            num_left = len( [ 1 for view in views if view < radius ] )
-            num_radius = len( [ 1 for view in views if view == radius ] )
-            num_right = len( [ 1 for view in views if view > radius ] )
+            distance = similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ]
             
-            if num_left <= num_right:
-                
-                num_left += num_radius
-                
-            else:
+            for hash_id in hash_ids:
                 
-                num_right += num_radius
+                if hash_id not in similar_hash_ids_to_distances:
+                    
+                    similar_hash_ids_to_distances[ hash_id ] = distance
+                    
+                else:
+                    
+                    current_distance = similar_hash_ids_to_distances[ hash_id ]
+                    
+                    if distance < current_distance:
+                        
+                        similar_hash_ids_to_distances[ hash_id ] = distance
+                        
+                    
                 
             
-            smaller = min( num_left, num_right )
-            larger = max( num_left, num_right )
-            
-            ratio = smaller / larger
-            
-            ratio_score = int( ratio * MAX_SAMPLE / 2 )
-            
-            # now let's calc the standard deviation--larger sd tends to mean less sphere overlap when searching
-            
-            mean_view = sum( views ) / len( views )
-            squared_diffs = [ ( view - mean_view  ) ** 2 for view in views ]
-            sd = ( sum( squared_diffs ) / len( squared_diffs ) ) ** 0.5
-            
-            final_scores.append( ( ratio_score, sd, v_id ) )
-            
         
-        final_scores.sort()
+        return list( similar_hash_ids_to_distances.items() )
         
-        # we now have a list like [ ( 11, 4.0, [id] ), ( 15, 3.7, [id] ), ( 15, 4.3, [id] ) ]
+    
+    def _InsertVPTreeRows( self, rows ):
         
-        ( ratio_gumpf, sd_gumpf, root_id ) = final_scores.pop()
+        self._ExecuteMany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', ClientVPTreeBuilder.IterateVPTreeRows( rows ) )
         
-        for ( i, ( v_id, v_perceptual_hash ) ) in enumerate( node_rows ):
-            
-            if v_id == root_id:
-                
-                root_row = node_rows.pop( i )
-                
-                return root_row
-                
-            
+        self._ClearPerceptualHashesFromVPTreeNodeCache( rows[0].tolist() )
         
     
     def _RegenerateBranch( self, job_status, perceptual_hash_id ):
@@ -505,32 +785,20 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_perceptual_hash_ids ) )
             
+            if self._perceptual_hash_index is not None:
+                
+                self._perceptual_hash_index.RemovePerceptualHashes( orphan_perceptual_hash_ids )
+                
+            
         
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_perceptual_hash_ids ]
         
         num_useful_population = len( useful_nodes )
         
-        # now create the new branch, starting by choosing a new root and updating the parent's left/right reference to that
-        
-        if num_useful_population > 0:
-            
-            ( new_perceptual_hash_id, new_perceptual_hash ) = self._PopBestRootNode( useful_nodes )
-            
-        else:
-            
-            # the correct regen in this case is to cut the stem here. reset to None/0
-            
-            new_perceptual_hash_id = None
-            new_perceptual_hash = None
-            
-        
-        # ok we have removed the old branch and now picked a better root node for the new one
-        # now we need to construct and insert this branch back into the database
+        # now check the parent is sane, create the new branch, and then point the parent's left/right reference at its new root
         
         if parent_id is not None:
             
-            # let's first update the pre-existing parent with its new child and perhaps let it know it has lost some orphans
-            
             result = self._Execute( 'SELECT inner_id FROM shape_vptree WHERE phash_id = ?;', ( parent_id, ) ).fetchone()
             
             if result is None:
@@ -547,6 +815,22 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             ( parent_inner_id, ) = result
             
+        
+        if num_useful_population > 0:
+            
+            new_perceptual_hash_id = self._GenerateBranch( job_status, parent_id, useful_nodes )
+            
+        else:
+            
+            # the correct regen in this case is to cut the stem here. reset to None/0
+            
+            new_perceptual_hash_id = None
+            
+        
+        if parent_id is not None:
+            
+            # let's update the pre-existing parent with its new child and perhaps let it know it has lost some orphans
+            
             if parent_inner_id == perceptual_hash_id:
                 
                 query = 'UPDATE shape_vptree SET inner_id = ?, inner_population = ? WHERE phash_id = ?;'
@@ -561,11 +845,6 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             self._ClearPerceptualHashesFromVPTreeNodeCache( ( parent_id, ) )
             
         
-        if num_useful_population > 0:
-            
-            self._GenerateBranch( job_status, parent_id, new_perceptual_hash_id, new_perceptual_hash, useful_nodes )
-            
-        
     
     def _ClearPerceptualHashesFromVPTreeNodeCache( self, perceptual_hash_ids: collections.abc.Collection[ int ] ):
         
@@ -593,12 +872,12 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
-    def _TryToPopulatePerceptualHashToVPTreeNodeCache( self, perceptual_hash_ids: collections.abc.Collection[ int ] ):
+    def _TryToPopulatePerceptualHashToVPTreeNodeCache( self, perceptual_hash_ids: collections.abc.Collection[ int ], vp_tree_node_cache: dict, non_vp_treed_perceptual_hash_ids: set ):
         
         # the node cache used to limit itself to 1,000,000 nodes, but on clients with 13m files it was churning
         # if you got a big client, I'm going to eat some ram, simple as
         
-        uncached_perceptual_hash_ids = { perceptual_hash_id for perceptual_hash_id in perceptual_hash_ids if perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_node_cache and perceptual_hash_id not in self._non_vp_treed_perceptual_hash_ids }
+        uncached_perceptual_hash_ids = { perceptual_hash_id for perceptual_hash_id in perceptual_hash_ids if perceptual_hash_id not in vp_tree_node_cache and perceptual_hash_id not in non_vp_treed_perceptual_hash_ids }
         
         if len( uncached_perceptual_hash_ids ) > 0:
             
@@ -625,12 +904,12 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                     
                     if perceptual_hash_id not in uncached_perceptual_hash_ids_to_vp_tree_nodes:
                         
-                        self._non_vp_treed_perceptual_hash_ids.add( perceptual_hash_id )
+                        non_vp_treed_perceptual_hash_ids.add( perceptual_hash_id )
                         
                     
                 
             
-            self._perceptual_hash_id_to_vp_tree_node_cache.update( uncached_perceptual_hash_ids_to_vp_tree_nodes )
+            vp_tree_node_cache.update( uncached_perceptual_hash_ids_to_vp_tree_nodes )
             
         
     
@@ -690,6 +969,26 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return result is not None
         
     
+    def FinishBulkSearch( self ):
+        
+        if self._perceptual_hash_index_held_for_bulk_search:
+            
+            self._perceptual_hash_index_held_for_bulk_search = False
+            
+            if CG.client_controller.new_options.GetBoolean( 'similar_files_in_memory_search_index' ):
+                
+                if self._perceptual_hash_index is not None:
+                    
+                    self._perceptual_hash_index.ClearBlockTables()
+                    
+                
+            else:
+                
+                self._perceptual_hash_index = None
+                
+            
+        
+    
     def GetMaintenanceStatus( self ):
         
         searched_distances_to_count = collections.Counter( dict( self._Execute( 'SELECT searched_distance, count FROM shape_search_cache_numbers;' ) ) )
@@ -702,6 +1001,13 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return dict( self._Execute( f'SELECT {hash_ids_table_name}.hash_id, hash FROM {hash_ids_table_name} CROSS JOIN pixel_hash_map ON ( {hash_ids_table_name}.hash_id = pixel_hash_map.hash_id ) CROSS JOIN hashes ON ( pixel_hash_map.pixel_hash_id = hashes.hash_id );' ) )
         
     
+    def GetNumFilesToSimilarSearch( self, search_distance ) -> int:
+        
+        searched_distances_to_count = self.GetMaintenanceStatus()
+        
+        return sum( ( count for ( searched_distance, count ) in searched_distances_to_count.items() if searched_distance < search_distance ) )
+        
+    
     def GetSomeHashIdsToSimilarSearch( self, search_distance, num_to_get ):
         
         # ok we have the classic problem here of the low-cardinality column not being nicely indexable
@@ -735,6 +1041,28 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return []
         
     
+    def GetTreeRegenerationSnapshot( self ):
+        
+        # the first half of a tree regen. the actual build needs no db, so it can happen off the db thread
+        
+        # we might be deleting bad nodes, so the next search can rebuild this from scratch
+        self._perceptual_hash_index = None
+        
+        all_nodes = self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+        
+        good_nodes = self._CullBadPerceptualHashes( all_nodes )
+        
+        # no point putting orphans in the new tree
+        useful_perceptual_hash_ids = self._STS( self._Execute( 'SELECT DISTINCT phash_id FROM shape_perceptual_hash_map;' ) )
+        
+        useful_nodes = [ ( perceptual_hash_id, perceptual_hash ) for ( perceptual_hash_id, perceptual_hash ) in good_nodes if perceptual_hash_id in useful_perceptual_hash_ids ]
+        
+        perceptual_hash_ids = numpy.array( [ perceptual_hash_id for ( perceptual_hash_id, perceptual_hash ) in useful_nodes ], dtype = numpy.int64 )
+        perceptual_hashes = ClientVPTreeBuilder.GetPerceptualHashArray( [ perceptual_hash for ( perceptual_hash_id, perceptual_hash ) in useful_nodes ] )
+        
+        return ( perceptual_hash_ids, perceptual_hashes )
+        
+    
     def MaintainTree( self, work_period = None ):
         
         if work_period is not None:
@@ -780,7 +1108,7 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                 raise
                 
             
-            if stop_time is not None and HydrusTime.TimeHasPassedFloat( stop_time ):
+            if stop_time is not None and ( HydrusTime.TimeHasPassedFloat( stop_time ) or self._ShouldYieldToWaitingJobs() ):
                 
                 return work_to_do
                 
@@ -813,97 +1141,84 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             job_status.SetStatusText( 'gathering all leaves' )
             
-            self._Execute( 'DELETE FROM shape_vptree;' )
+            ( perceptual_hash_ids, perceptual_hashes ) = self.GetTreeRegenerationSnapshot()
             
-            self._perceptual_hash_id_to_vp_tree_node_cache = {}
-            self._non_vp_treed_perceptual_hash_ids = set()
-            self._root_node_perceptual_hash_id = None
+            job_status.SetStatusText( HydrusNumbers.ToHumanInt( len( perceptual_hash_ids ) ) + ' leaves found, now regenerating' )
             
-            all_nodes = self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+            rows = ClientVPTreeBuilder.GenerateVPTreeRows( perceptual_hash_ids, perceptual_hashes, job_status = job_status )
             
-            good_nodes = []
-            bad_nodes = []
+            job_status.SetStatusText( 'tree constructed, now committing', 2 )
             
-            for ( phash_id, phash ) in all_nodes:
-                
-                if isinstance( phash, bytes ) and len( phash ) == 8:
-                    
-                    good_nodes.append( ( phash_id, phash ) )
-                    
-                else:
-                    
-                    bad_nodes.append( ( phash_id, phash ) )
-                    
-                
+            self.ReplaceTree( perceptual_hash_ids, rows )
             
-            all_nodes = good_nodes
+        finally:
             
-            if len( all_nodes ) == 0:
-                
-                return
-                
+            job_status.SetStatusText( 'done!' )
+            job_status.DeleteStatusText( level = 2 )
             
-            if len( bad_nodes ) > 0:
-                
-                bad_phash_ids = { phash_id for ( phash_id, phash ) in bad_nodes }
-                
-                self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( phash_id, ) for phash_id in bad_phash_ids ) )
-                
-                with self._MakeTemporaryIntegerTable( bad_phash_ids, 'phash_id' ) as temp_table_name:
-                    
-                    affected_hash_ids = self._STS( self._Execute( f'SELECT hash_id FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );' ) )
-                    
-                
-                self._ExecuteMany( 'DELETE FROM shape_perceptual_hash_map WHERE phash_id = ?;', ( ( phash_id, ) for phash_id in bad_phash_ids ) )
+            job_status.FinishAndDismiss( 5 )
+            
+        
+    
+    def ReplaceTree( self, snapshot_perceptual_hash_ids: numpy.ndarray, rows ):
+        
+        # the second half of a tree regen. the rows were built from a snapshot, maybe on another thread, so we patch in whatever changed since
+        
+        current_perceptual_hash_ids = numpy.fromiter( ( perceptual_hash_id for ( perceptual_hash_id, ) in self._Execute( 'SELECT phash_id FROM shape_perceptual_hashes;' ) ), dtype = numpy.int64 )
+        
+        if not numpy.isin( snapshot_perceptual_hash_ids, current_perceptual_hash_ids ).all():
+            
+            # branch maintenance deleted some of our nodes while we were working. we can't patch that, so let's do it all here
+            
+            self.RegenerateTree()
+            
+            return
+            
+        
+        self._Execute( 'DELETE FROM shape_vptree;' )
+        
+        self._perceptual_hash_id_to_vp_tree_node_cache = {}
+        self._non_vp_treed_perceptual_hash_ids = set()
+        self._root_node_perceptual_hash_id = None
+        
+        self._InsertVPTreeRows( rows )
+        
+        # the new tree is balanced, so the only regen work worth keeping is for nodes that lost their files since the snapshot
+        self._Execute( 'DELETE FROM shape_maintenance_branch_regen WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map );' )
+        
+        new_perceptual_hash_ids = set( current_perceptual_hash_ids[ numpy.isin( current_perceptual_hash_ids, snapshot_perceptual_hash_ids, invert = True ) ].tolist() )
+        
+        if len( new_perceptual_hash_ids ) > 0:
+            
+            # these are either files imported since the snapshot or orphans that the snapshot skipped
+            
+            with self._MakeTemporaryIntegerTable( new_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
                 
-                message = 'Discovered some bad nodes in your similar files search tree! The nodes have been deleted.'
-                message += '\n'
-                message += 'More details have been written to log, including the file list for affected hashes. You may wish to manually schedule a "similar files regen" job for all the affected file hashes. You should also check the \'Recovery->Help my db is broke\' document in the help, since there are no clean ways these bad nodes got into your database.'
+                useful_nodes = self._Execute( f'SELECT phash_id, phash FROM {temp_table_name} CROSS JOIN shape_perceptual_hashes USING ( phash_id ) WHERE EXISTS ( SELECT 1 FROM shape_perceptual_hash_map WHERE shape_perceptual_hash_map.phash_id = shape_perceptual_hashes.phash_id );' ).fetchall()
                 
-                HydrusData.ShowText( message )
+            
+            for ( perceptual_hash_id, perceptual_hash ) in useful_nodes:
                 
-                HydrusData.Print( 'The bad nodes:' )
+                self._AddLeaf( perceptual_hash_id, perceptual_hash )
                 
-                for ( phash_id, phash ) in bad_nodes:
-                    
-                    if isinstance( phash, bytes ):
-                        
-                        HydrusData.Print( f'phash_id: {phash_id}, presumably incorrect-length phash: "{phash.hex()}"' )
-                        
-                    else:
-                        
-                        HydrusData.Print( f'phash_id: {phash_id}, presumably corrupt phash: "{phash}"' )
-                        
-                    
+            
+            orphan_perceptual_hash_ids = new_perceptual_hash_ids.difference( ( perceptual_hash_id for ( perceptual_hash_id, perceptual_hash ) in useful_nodes ) )
+            
+            if len( orphan_perceptual_hash_ids ) > 0:
                 
-                HydrusData.Print( 'The affected hashes:' )
+                self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( perceptual_hash_id, ) for perceptual_hash_id in orphan_perceptual_hash_ids ) )
+                self._ExecuteMany( 'DELETE FROM shape_maintenance_branch_regen WHERE phash_id = ?;', ( ( perceptual_hash_id, ) for perceptual_hash_id in orphan_perceptual_hash_ids ) )
                 
-                try:
+                if self._perceptual_hash_index is not None:
                     
-                    hash_ids_to_hashes = self.modules_hashes.GetHashIdsToHashes( hash_ids = affected_hash_ids )
-                    
-                    HydrusData.Print( '\n'.join( ( hash.hex() for hash in hash_ids_to_hashes.values() ) ) )
-                    
-                except Exception as e:
-                    
-                    HydrusData.Print( 'Could not print affected hashes (might be your regular hashes are busted too)' )
+                    self._perceptual_hash_index.RemovePerceptualHashes( orphan_perceptual_hash_ids )
                     
                 
             
-            job_status.SetStatusText( HydrusNumbers.ToHumanInt( len( all_nodes ) ) + ' leaves found, now regenerating' )
-            
-            ( root_id, root_perceptual_hash ) = self._PopBestRootNode( all_nodes ) #HydrusLists.RandomPop( all_nodes )
-            
-            self._GenerateBranch( job_status, None, root_id, root_perceptual_hash, all_nodes )
-            
-            self._Execute( 'DELETE FROM shape_maintenance_branch_regen;' )
-            
-        finally:
-            
-            job_status.SetStatusText( 'done!' )
-            job_status.DeleteStatusText( level = 2 )
+        
+        if self._Execute( 'SELECT 1 FROM shape_maintenance_branch_regen;' ).fetchone() is not None:
             
-            job_status.FinishAndDismiss( 5 )
+            self._cursor_transaction_wrapper.pub_after_job( 'notify_new_shape_search_branch_maintenance_work' )
             
         
     
@@ -952,6 +1267,81 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return similar_hash_ids_and_distances
         
     
+    def SearchFilesBulk( self, hash_ids: collections.abc.Collection[ int ], max_hamming_distance: int ) -> dict[ int, list[ tuple[ int, int ] ] ]:
+        
+        # this does SearchFile for a whole batch of files at once. if we are working through a big backlog, it is much faster than one-by-one tree walks
+        # the phash index is held in memory until FinishBulkSearch
+        
+        hash_ids_to_similar_hash_ids_to_distances = { hash_id : {} for hash_id in hash_ids }
+        
+        def add_result( hash_id, similar_hash_id, distance ):
+            
+            similar_hash_ids_to_distances = hash_ids_to_similar_hash_ids_to_distances[ hash_id ]
+            
+            if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
+                
+                similar_hash_ids_to_distances[ similar_hash_id ] = distance
+                
+            
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_table_name:
+            
+            for ( hash_id, similar_hash_id ) in self._Execute( f'SELECT {temp_table_name}.hash_id, p2.hash_id FROM {temp_table_name} CROSS JOIN pixel_hash_map AS p1 ON ( {temp_table_name}.hash_id = p1.hash_id ) CROSS JOIN pixel_hash_map AS p2 ON ( p1.pixel_hash_id = p2.pixel_hash_id );' ):
+                
+                add_result( hash_id, similar_hash_id, 0 )
+                
+            
+            if max_hamming_distance == 0:
+                
+                for ( hash_id, similar_hash_id ) in self._Execute( f'SELECT {temp_table_name}.hash_id, m2.hash_id FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map AS m1 ON ( {temp_table_name}.hash_id = m1.hash_id ) CROSS JOIN shape_perceptual_hash_map AS m2 ON ( m1.phash_id = m2.phash_id );' ):
+                    
+                    add_result( hash_id, similar_hash_id, 0 )
+                    
+                
+                return { hash_id : list( similar_hash_ids_to_distances.items() ) for ( hash_id, similar_hash_ids_to_distances ) in hash_ids_to_similar_hash_ids_to_distances.items() }
+                
+            
+            perceptual_hashes_to_hash_ids = HydrusData.BuildKeyToListDict( ( ( phash, hash_id ) for ( hash_id, phash ) in self._Execute( f'SELECT {temp_table_name}.hash_id, phash FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map USING ( hash_id ) CROSS JOIN shape_perceptual_hashes USING ( phash_id );' ) ) )
+            
+        
+        if len( perceptual_hashes_to_hash_ids ) > 0:
+            
+            self._perceptual_hash_index_held_for_bulk_search = True
+            
+            perceptual_hash_index = self._GetPerceptualHashIndex()
+            
+            perceptual_hashes_to_similar_perceptual_hash_ids_to_distances = perceptual_hash_index.SearchMany( list( perceptual_hashes_to_hash_ids.keys() ), max_hamming_distance )
+            
+            similar_perceptual_hash_ids = set()
+            
+            for similar_perceptual_hash_ids_to_distances in perceptual_hashes_to_similar_perceptual_hash_ids_to_distances.values():
+                
+                similar_perceptual_hash_ids.update( similar_perceptual_hash_ids_to_distances.keys() )
+                
+            
+            with self._MakeTemporaryIntegerTable( similar_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
+                
+                similar_perceptual_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( f'SELECT phash_id, hash_id FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );' ) )
+                
+            
+            for ( perceptual_hash, similar_perceptual_hash_ids_to_distances ) in perceptual_hashes_to_similar_perceptual_hash_ids_to_distances.items():
+                
+                for hash_id in perceptual_hashes_to_hash_ids[ perceptual_hash ]:
+                    
+                    for ( similar_perceptual_hash_id, distance ) in similar_perceptual_hash_ids_to_distances.items():
+                        
+                        for similar_hash_id in similar_perceptual_hash_ids_to_hash_ids.get( similar_perceptual_hash_id, [] ):
+                            
+                            add_result( hash_id, similar_hash_id, distance )
+                            
+                        
+                    
+                
+            
+        
+        return { hash_id : list( similar_hash_ids_to_distances.items() ) for ( hash_id, similar_hash_ids_to_distances ) in hash_ids_to_similar_hash_ids_to_distances.items() }
+        
+    
     def SearchPixelHashes( self, search_pixel_hash_ids: collections.abc.Collection[ int ] ):
         
         similar_hash_ids_and_distances = []
@@ -1005,7 +1395,38 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             search_radius = max_hamming_distance
             
-            if self._root_node_perceptual_hash_id is None:
+            perceptual_hash_index = self._GetPerceptualHashIndex()
+            
+            if perceptual_hash_index is not None:
+                
+                similar_perceptual_hash_ids_to_distances = perceptual_hash_index.Search( search_perceptual_hashes, search_radius )
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Similar file search checked {} perceptual hashes in memory.'.format( HydrusNumbers.ToHumanInt( perceptual_hash_index.GetNumPerceptualHashes() ) ) )
+                    
+                
+                similar_hash_ids_and_distances.extend( self._GetSimilarHashIdsAndDistances( similar_perceptual_hash_ids_to_distances ) )
+                
+                return HydrusLists.DedupeList( similar_hash_ids_and_distances )
+                
+            
+            if self._IsOnReadPoolThread():
+                
+                # the writer may be clearing the shared node caches under us, and our snapshot of the tree may not match them anyway, so a read pool search keeps its own
+                
+                vp_tree_node_cache = {}
+                non_vp_treed_perceptual_hash_ids = set()
+                root_node_perceptual_hash_id = None
+                
+            else:
+                
+                vp_tree_node_cache = self._perceptual_hash_id_to_vp_tree_node_cache
+                non_vp_treed_perceptual_hash_ids = self._non_vp_treed_perceptual_hash_ids
+                root_node_perceptual_hash_id = self._root_node_perceptual_hash_id
+                
+            
+            if root_node_perceptual_hash_id is None:
                 
                 top_node_result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
                 
@@ -1014,7 +1435,12 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                     return similar_hash_ids_and_distances
                     
                 
-                ( self._root_node_perceptual_hash_id, ) = top_node_result
+                ( root_node_perceptual_hash_id, ) = top_node_result
+                
+                if not self._IsOnReadPoolThread():
+                    
+                    self._root_node_perceptual_hash_id = root_node_perceptual_hash_id
+                    
                 
             
             similar_perceptual_hash_ids_to_distances = {}
@@ -1024,7 +1450,7 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             for search_perceptual_hash in search_perceptual_hashes:
                 
-                next_potentials = [ self._root_node_perceptual_hash_id ]
+                next_potentials = [ root_node_perceptual_hash_id ]
                 
                 while len( next_potentials ) > 0:
                     
@@ -1041,11 +1467,11 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                     # anyway, we now just get the whole lot of results first and then work on the whole lot
                     # UPDATE: we moved to a cache finally, so the iteration danger is less worrying, but leaving the above up anyway
                     
-                    self._TryToPopulatePerceptualHashToVPTreeNodeCache( current_potentials )
+                    self._TryToPopulatePerceptualHashToVPTreeNodeCache( current_potentials, vp_tree_node_cache, non_vp_treed_perceptual_hash_ids )
                     
                     for node_perceptual_hash_id in current_potentials:
                         
-                        result = self._perceptual_hash_id_to_vp_tree_node_cache.get( node_perceptual_hash_id, None )
+                        result = vp_tree_node_cache.get( node_perceptual_hash_id, None )
                         
                         if result is None:
                             
@@ -1114,42 +1540,7 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                 HydrusData.ShowText( 'Similar file search touched {} nodes over {} cycles.'.format( HydrusNumbers.ToHumanInt( total_nodes_searched ), HydrusNumbers.ToHumanInt( num_cycles ) ) )
                 
             
-            # so, now we have perceptual_hash_ids and distances. let's map that to actual files.
-            # files can have multiple perceptual_hashes, and perceptual_hashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
-            
-            similar_perceptual_hash_ids = list( similar_perceptual_hash_ids_to_distances.keys() )
-            
-            with self._MakeTemporaryIntegerTable( similar_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
-                
-                # temp perceptual_hashes to hash map
-                similar_perceptual_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( 'SELECT phash_id, hash_id FROM {} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );'.format( temp_table_name ) ) )
-                
-            
-            similar_hash_ids_to_distances = {}
-            
-            for ( perceptual_hash_id, hash_ids ) in similar_perceptual_hash_ids_to_hash_ids.items():
-                
-                distance = similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ]
-                
-                for hash_id in hash_ids:
-                    
-                    if hash_id not in similar_hash_ids_to_distances:
-                        
-                        similar_hash_ids_to_distances[ hash_id ] = distance
-                        
-                    else:
-                        
-                        current_distance = similar_hash_ids_to_distances[ hash_id ]
-                        
-                        if distance < current_distance:
-                            
-                            similar_hash_ids_to_distances[ hash_id ] = distance
-                            
-                        
-                    
-                
-            
-            similar_hash_ids_and_distances.extend( similar_hash_ids_to_distances.items() )
+            similar_hash_ids_and_distances.extend( self._GetSimilarHashIdsAndDistances( similar_perceptual_hash_ids_to_distances ) )
             
         
         similar_hash_ids_and_distances = HydrusLists.DedupeList( similar_hash_ids_and_distances )
@@ -1199,6 +1590,23 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._DeltaShapeSearchCacheNumbers( search_distance, 1 )
         
     
+    def SetSearchStatuses( self, hash_ids: collections.abc.Collection[ int ], search_distance ):
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_table_name:
+            
+            searched_distances_to_count = dict( self._Execute( f'SELECT searched_distance, COUNT( * ) FROM {temp_table_name} CROSS JOIN shape_search_cache USING ( hash_id ) GROUP BY searched_distance;' ) )
+            
+        
+        for ( searched_distance, count ) in searched_distances_to_count.items():
+            
+            self._DeltaShapeSearchCacheNumbers( searched_distance, -count )
+            
+        
+        self._ExecuteMany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in hash_ids ) )
+        
+        self._DeltaShapeSearchCacheNumbers( search_distance, sum( searched_distances_to_count.values() ) )
+        
+    
     def StopSearchingFile( self, hash_id ):
         
         self._DeltaShapeSearchCacheNumbersRemoveFile( hash_id )
@@ -22,6 +22,13 @@ from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientSearchPredicate
 from hydrus.client.search import ClientSearchTagContext
 
+# when syncing hard, how many rows of each type we look at to fill a batch, and how much work we try before we know how fast we are
+SYNC_HARD_SAMPLE_SIZE = 256
+SYNC_HARD_INITIAL_WEIGHT_BUDGET = 10000
+
+# older speed measurements fade by this much every batch, so the speed follows the kind of work we are doing now
+SYNC_SPEED_DECAY = 0.9
+
 class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
     
     def __init__(
@@ -42,6 +49,8 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         self.modules_tag_parents = modules_tag_parents
         self.modules_tag_siblings = modules_tag_siblings
         
+        self._service_ids_to_sync_speeds = {}
+        
         super().__init__( 'client tag display', cursor )
         
     
@@ -501,6 +510,42 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         return tags_to_service_keys_to_siblings_and_parents
         
     
+    def GetSyncRowsPerSecond( self, service_id ) -> float | None:
+        
+        if service_id not in self._service_ids_to_sync_speeds:
+            
+            return None
+            
+        
+        ( num_rows, weight, num_seconds ) = self._service_ids_to_sync_speeds[ service_id ]
+        
+        if num_seconds <= 0:
+            
+            return None
+            
+        
+        return num_rows / num_seconds
+        
+    
+    def GetSyncWeightBudget( self, service_id, work_period: float ) -> float:
+        
+        # how much row weight we think we can get through in the work period, going by how fast we have been
+        
+        if service_id not in self._service_ids_to_sync_speeds:
+            
+            return SYNC_HARD_INITIAL_WEIGHT_BUDGET
+            
+        
+        ( num_rows, weight, num_seconds ) = self._service_ids_to_sync_speeds[ service_id ]
+        
+        if num_seconds <= 0 or weight <= 0:
+            
+            return SYNC_HARD_INITIAL_WEIGHT_BUDGET
+            
+        
+        return max( 1, ( weight / num_seconds ) * work_period )
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> list[ tuple[ str, str ] ]:
         
         return []
@@ -685,6 +730,17 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         self.modules_tag_parents.RegenChains( interested_tag_service_ids, tag_ids_that_changed )
         
     
+    def NotifySyncWorkDone( self, service_id, num_rows: int, weight: int, num_seconds: float ):
+        
+        ( old_num_rows, old_weight, old_num_seconds ) = self._service_ids_to_sync_speeds.get( service_id, ( 0, 0, 0.0 ) )
+        
+        self._service_ids_to_sync_speeds[ service_id ] = (
+            old_num_rows * SYNC_SPEED_DECAY + num_rows,
+            old_weight * SYNC_SPEED_DECAY + weight,
+            old_num_seconds * SYNC_SPEED_DECAY + num_seconds
+        )
+        
+    
     def RegenerateTagSiblingsAndParentsCache( self, only_these_service_ids = None ):
         
         if only_these_service_ids is None:
@@ -85,6 +85,40 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
         super().__init__( 'client tag parents', cursor )
         
     
+    def _GenerateIdealRows( self, tag_service_id, tag_ids = None ) -> set[ tuple[ int, int ] ]:
+        
+        # all the pairs from the applicable services, collapsed by siblings and closed in memory to ( child_tag_id, ancestor_tag_id ) rows. if tag_ids is set, we only do the chains they are in
+        
+        pairs_in_order = []
+        
+        for applicable_service_id in self.GetApplicableServiceIds( tag_service_id ):
+            
+            if tag_ids is None:
+                
+                unideal_statuses_to_pair_ids = self.GetTagParentsIds( applicable_service_id )
+                
+            else:
+                
+                unideal_statuses_to_pair_ids = self.GetTagParentsIdsChains( applicable_service_id, tag_ids )
+                
+            
+            # we have to collapse the parent ids according to siblings
+            
+            ideal_statuses_to_pair_ids = self.IdealiseStatusesToPairIds( tag_service_id, unideal_statuses_to_pair_ids )
+            
+            petitioned_fast_lookup = set( ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
+            
+            pairs_in_order.extend( ( pair for pair in ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ] if pair not in petitioned_fast_lookup ) )
+            pairs_in_order.extend( ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ] )
+            
+        
+        tps = ClientTagsHandling.TagParentsStructure()
+        
+        tps.AddPairs( pairs_in_order )
+        
+        return set( tps.IterateDescendantAncestorPairs() )
+        
+    
     def _GetInitialIndexGenerationDict( self ) -> dict:
         
         index_generation_dict = {}
@@ -188,6 +222,15 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
         
     
+    def _WriteIdealRowsDiff( self, tag_service_id, rows_to_delete, rows_to_add ):
+        
+        cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
+        
+        self._ExecuteMany( f'DELETE FROM {cache_tag_parents_lookup_table_name} WHERE child_tag_id = ? AND ancestor_tag_id = ?;', rows_to_delete )
+        
+        self._ExecuteMany( f'INSERT OR IGNORE INTO {cache_tag_parents_lookup_table_name} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );', rows_to_add )
+        
+    
     def AddTagParents( self, service_id, pairs ):
         
         statuses_to_storage_table_names = GenerateTagParentsStorageTableNames( service_id )
@@ -848,41 +891,11 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
             cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
             
-            self._Execute( 'DELETE FROM {};'.format( cache_tag_parents_lookup_table_name ) )
+            existing_rows = set( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {cache_tag_parents_lookup_table_name};' ) )
             
-            applicable_service_ids = self.GetApplicableServiceIds( tag_service_id )
+            ideal_rows = self._GenerateIdealRows( tag_service_id )
             
-            tps = ClientTagsHandling.TagParentsStructure()
-            
-            for applicable_service_id in applicable_service_ids:
-                
-                unideal_statuses_to_pair_ids = self.GetTagParentsIds( service_id = applicable_service_id )
-                
-                # we have to collapse the parent ids according to siblings
-                
-                ideal_statuses_to_pair_ids = self.IdealiseStatusesToPairIds( tag_service_id, unideal_statuses_to_pair_ids )
-                
-                #
-                
-                petitioned_fast_lookup = set( ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
-                
-                for ( child_tag_id, parent_tag_id ) in ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ]:
-                    
-                    if ( child_tag_id, parent_tag_id ) in petitioned_fast_lookup:
-                        
-                        continue
-                        
-                    
-                    tps.AddPair( child_tag_id, parent_tag_id )
-                    
-                
-                for ( child_tag_id, parent_tag_id ) in ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ]:
-                    
-                    tps.AddPair( child_tag_id, parent_tag_id )
-                    
-                
-            
-            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_tag_parents_lookup_table_name ), tps.IterateDescendantAncestorPairs() )
+            self._WriteIdealRowsDiff( tag_service_id, existing_rows.difference( ideal_rows ), ideal_rows.difference( existing_rows ) )
             
             if tag_service_id in self._service_ids_to_display_application_status:
                 
@@ -907,78 +920,50 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
             cache_tag_parents_lookup_table_name = GenerateTagParentsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
             
-            # it is possible that the parents cache currently contains non-ideal tag_ids
-            # so, to be safe, we'll also get all sibling chain members
-            
-            tag_ids_to_clear_and_regen = set( tag_ids )
-            
-            ideal_tag_ids = self.modules_tag_siblings.GetIdealTagIds( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids )
-            
-            tag_ids_to_clear_and_regen.update( self.modules_tag_siblings.GetChainsMembersFromIdeals( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, ideal_tag_ids ) )
-            
-            # and now all possible current parent chains based on this
-            
-            tag_ids_to_clear_and_regen.update( self.GetChainsMembers( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids_to_clear_and_regen ) )
-            
-            # this should now contain all possible tag_ids that could be in tag parents right now related to what we were given
-            
-            if tag_service_id in self._service_ids_to_applicable_service_ids:
+            if len( tag_ids ) >= ClientDBTagSiblings.REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD:
                 
-                with self._MakeTemporaryIntegerTable( tag_ids_to_clear_and_regen, 'tag_id' ) as temp_tag_ids_table_name:
-                    
-                    stuff_deleted = set( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_parents_lookup_table_name} ON ( child_tag_id = tag_id );' ) )
-                    stuff_deleted.update( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_parents_lookup_table_name} ON ( ancestor_tag_id = tag_id );' ) )
-                    
+                # a big update touches so many chains that walking them out is slower than doing everything in one go
+                
+                stuff_deleted = set( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {cache_tag_parents_lookup_table_name};' ) )
+                
+                stuff_added = self._GenerateIdealRows( tag_service_id )
                 
             else:
                 
-                stuff_deleted = set()
+                # it is possible that the parents cache currently contains non-ideal tag_ids
+                # so, to be safe, we'll also get all sibling chain members
                 
-            
-            self._ExecuteMany( 'DELETE FROM {} WHERE child_tag_id = ? OR ancestor_tag_id = ?;'.format( cache_tag_parents_lookup_table_name ), ( ( tag_id, tag_id ) for tag_id in tag_ids_to_clear_and_regen ) )
-            
-            # we wipe them
-            
-            applicable_tag_service_ids = self.GetApplicableServiceIds( tag_service_id )
-            
-            tps = ClientTagsHandling.TagParentsStructure()
-            
-            for applicable_tag_service_id in applicable_tag_service_ids:
+                tag_ids_to_clear_and_regen = set( tag_ids )
                 
-                unideal_statuses_to_pair_ids = self.GetTagParentsIdsChains( applicable_tag_service_id, tag_ids_to_clear_and_regen )
+                ideal_tag_ids = self.modules_tag_siblings.GetIdealTagIds( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids )
                 
-                ideal_statuses_to_pair_ids = self.IdealiseStatusesToPairIds( tag_service_id, unideal_statuses_to_pair_ids )
+                tag_ids_to_clear_and_regen.update( self.modules_tag_siblings.GetChainsMembersFromIdeals( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, ideal_tag_ids ) )
                 
-                #
+                # and now all possible current parent chains based on this
                 
-                petitioned_fast_lookup = set( ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
+                tag_ids_to_clear_and_regen.update( self.GetChainsMembers( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids_to_clear_and_regen ) )
                 
-                for ( child_tag_id, parent_tag_id ) in ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ]:
-                    
-                    if ( child_tag_id, parent_tag_id ) in petitioned_fast_lookup:
-                        
-                        continue
-                        
-                    
-                    tps.AddPair( child_tag_id, parent_tag_id )
-                    
+                # this should now contain all possible tag_ids that could be in tag parents right now related to what we were given
                 
-                for ( child_tag_id, parent_tag_id ) in ideal_statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ]:
+                with self._MakeTemporaryIntegerTable( tag_ids_to_clear_and_regen, 'tag_id' ) as temp_tag_ids_table_name:
                     
-                    tps.AddPair( child_tag_id, parent_tag_id )
+                    stuff_deleted = set( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_parents_lookup_table_name} ON ( child_tag_id = tag_id );' ) )
+                    stuff_deleted.update( self._Execute( f'SELECT child_tag_id, ancestor_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_parents_lookup_table_name} ON ( ancestor_tag_id = tag_id );' ) )
                     
                 
+                stuff_added = self._GenerateIdealRows( tag_service_id, tag_ids = tag_ids_to_clear_and_regen )
+                
             
-            stuff_added = set( tps.IterateDescendantAncestorPairs() )
+            # we only write what actually changed
             
-            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_tag_parents_lookup_table_name ), stuff_added )
+            stuff_no_changes = stuff_deleted.intersection( stuff_added )
+            stuff_deleted.difference_update( stuff_no_changes )
+            stuff_added.difference_update( stuff_no_changes )
+            
+            self._WriteIdealRowsDiff( tag_service_id, stuff_deleted, stuff_added )
             
             if tag_service_id in self._service_ids_to_display_application_status:
                 
-                stuff_no_changes = stuff_deleted.intersection( stuff_added )
-                stuff_deleted.difference_update( stuff_no_changes )
-                stuff_added.difference_update( stuff_no_changes )
-                
                 ( actual_parent_rows, ideal_parent_rows, parent_rows_to_add, parent_rows_to_remove ) = self._service_ids_to_display_application_status[ tag_service_id ]
                 
                 ideal_parent_rows.difference_update( stuff_deleted )
@@ -1,5 +1,11 @@
+import bisect
+import collections
 import collections.abc
+import numpy
+import re
 import sqlite3
+import string
+import threading
 import time
 
 from hydrus.core import HydrusConstants as HC
@@ -47,13 +53,25 @@ def ConvertWildcardToSQLiteLikeParameter( wildcard ):
 COMBINED_INTEGER_SUBTAGS_PREFIX = 'combined_files_integer_subtags_cache_'
 COMBINED_SUBTAGS_FTS4_PREFIX = 'combined_files_subtags_fts4_cache_'
 COMBINED_SUBTAGS_SEARCHABLE_MAP_PREFIX = 'combined_files_subtags_searchable_map_cache_'
+COMBINED_SUBTAG_TRIGRAMS_PREFIX = 'combined_files_subtag_trigrams_cache_'
 COMBINED_TAGS_PREFIX = 'combined_files_tags_cache_'
 
 SPECIFIC_INTEGER_SUBTAGS_PREFIX = 'specific_integer_subtags_cache_'
 SPECIFIC_SUBTAGS_FTS4_PREFIX = 'specific_subtags_fts4_cache_'
 SPECIFIC_SUBTAGS_SEARCHABLE_MAP_PREFIX = 'specific_subtags_searchable_map_cache_'
+SPECIFIC_SUBTAG_TRIGRAMS_PREFIX = 'specific_subtag_trigrams_cache_'
 SPECIFIC_TAGS_PREFIX = 'specific_tags_cache_'
 
+# no point asking sqlite to intersect more posting lists than this, the LIKE check does the rest
+MAX_WILDCARD_TRIGRAMS = 16
+
+# the in-memory autocomplete index takes this many loose changes, or a tenth of its size if that is bigger, before it is thrown away and rebuilt on the next search
+TAG_AUTOCOMPLETE_INDEX_MIN_LOOSE_CHANGES = 65536
+
+# our subtag fts4 tables use the 'simple' tokenizer. ascii letters and numbers, and everything over 127, are token characters. only ascii is case-folded
+FTS4_SIMPLE_SEPARATORS_RE = re.compile( r'[\x00-\x2f\x3a-\x40\x5b-\x60\x7b-\x7f]+' )
+FTS4_SIMPLE_CASE_FOLD_TRANSLATE = str.maketrans( string.ascii_uppercase, string.ascii_lowercase )
+
 def GenerateCombinedFilesIntegerSubtagsTableName( tag_service_id ):
     
     suffix = tag_service_id
@@ -81,6 +99,15 @@ def GenerateCombinedFilesSubtagsSearchableMapTableName( tag_service_id ):
     return subtags_searchable_map_table_name
     
 
+def GenerateCombinedFilesSubtagTrigramsTableName( tag_service_id ):
+    
+    suffix = tag_service_id
+    
+    subtag_trigrams_table_name = f'external_caches.{COMBINED_SUBTAG_TRIGRAMS_PREFIX}{suffix}'
+    
+    return subtag_trigrams_table_name
+    
+
 def GenerateCombinedFilesTagsTableName( tag_service_id ):
     
     suffix = tag_service_id
@@ -117,6 +144,15 @@ def GenerateSpecificSubtagsSearchableMapTableName( file_service_id, tag_service_
     return subtags_searchable_map_table_name
     
 
+def GenerateSpecificSubtagTrigramsTableName( file_service_id, tag_service_id ):
+    
+    suffix = '{}_{}'.format( file_service_id, tag_service_id )
+    
+    subtag_trigrams_table_name = f'external_caches.{SPECIFIC_SUBTAG_TRIGRAMS_PREFIX}{suffix}'
+    
+    return subtag_trigrams_table_name
+    
+
 def GenerateSpecificTagsTableName( file_service_id, tag_service_id ):
     
     suffix = '{}_{}'.format( file_service_id, tag_service_id )
@@ -126,6 +162,75 @@ def GenerateSpecificTagsTableName( file_service_id, tag_service_id ):
     return tags_table_name
     
 
+def GetFTS4SimpleTokens( text: str ) -> list[ str ]:
+    
+    return [ token for token in FTS4_SIMPLE_SEPARATORS_RE.split( text.translate( FTS4_SIMPLE_CASE_FOLD_TRANSLATE ) ) if token != '' ]
+    
+
+def GetPrefixSuccessor( prefix: str ) -> str:
+    
+    # the first string after everything that starts with prefix
+    
+    last_code_point = ord( prefix[ -1 ] )
+    
+    if last_code_point == 0x10ffff:
+        
+        # not a real tag character, so close enough
+        return prefix + chr( 0x10ffff )
+        
+    
+    return prefix[ : -1 ] + chr( last_code_point + 1 )
+    
+
+def GetPhraseTokensForTagAutocompleteIndex( subtag_wildcard: str ) -> list[ str ] | None:
+    
+    # the index can do the simple 'samus ar*' fts4 phrase search, where the last token is a prefix. anything fancier goes to sqlite
+    
+    if not subtag_wildcard.endswith( '*' ) or ClientSearchAutocomplete.IsComplexWildcard( subtag_wildcard ) or '"' in subtag_wildcard:
+        
+        return None
+        
+    
+    prefix = subtag_wildcard[ : -1 ]
+    
+    if prefix == '' or FTS4_SIMPLE_SEPARATORS_RE.match( prefix[ -1 ] ) is not None:
+        
+        return None
+        
+    
+    tokens = GetFTS4SimpleTokens( prefix )
+    
+    if len( tokens ) == 0:
+        
+        return None
+        
+    
+    return tokens
+    
+
+def GetSubtagTrigrams( searchable_subtag: str ) -> set[ int ]:
+    
+    # each run of three characters, packed into one int. code points are 21 bits, so three fit in sqlite's signed 64 bit INTEGER
+    
+    text = searchable_subtag.lower()
+    
+    return { ( ord( text[ i ] ) << 42 ) | ( ord( text[ i + 1 ] ) << 21 ) | ord( text[ i + 2 ] ) for i in range( len( text ) - 2 ) }
+    
+
+def GetWildcardTrigrams( subtag_wildcard: str ) -> set[ int ]:
+    
+    # every subtag that matches the wildcard has all of these. '_' and '%' are LIKE wildcards too, so we do not count them as text
+    
+    trigrams = set()
+    
+    for fragment in re.split( r'[\*_%]', subtag_wildcard ):
+        
+        trigrams.update( GetSubtagTrigrams( fragment ) )
+        
+    
+    return trigrams
+    
+
 def WildcardHasFTS4SearchableCharacters( wildcard: str ):
     
     # fts4 says it can do alphanumeric or unicode with a value >= 128
@@ -146,6 +251,299 @@ def WildcardHasFTS4SearchableCharacters( wildcard: str ):
     return False
     
 
+class TagAutocompleteIndex( object ):
+    
+    def __init__( self, rows: collections.abc.Iterable[ tuple[ int, int, str ] ] ):
+        
+        # rows are tag_id, namespace_id, searchable_subtag
+        
+        self._lock = threading.Lock()
+        
+        # every token of every subtag, sorted, with the postings for token i at offsets[ i ] : offsets[ i + 1 ] of the posting arrays
+        # so all the postings for a prefix are one slice
+        
+        tokens_to_first_seen_indices = {}
+        
+        posting_first_seen_indices = []
+        posting_tag_ids = []
+        posting_namespace_ids = []
+        posting_positions = []
+        
+        for ( tag_id, namespace_id, searchable_subtag ) in rows:
+            
+            for ( position, token ) in enumerate( GetFTS4SimpleTokens( searchable_subtag ) ):
+                
+                posting_first_seen_indices.append( tokens_to_first_seen_indices.setdefault( token, len( tokens_to_first_seen_indices ) ) )
+                posting_tag_ids.append( tag_id )
+                posting_namespace_ids.append( namespace_id )
+                posting_positions.append( position )
+                
+            
+        
+        self._tokens = sorted( tokens_to_first_seen_indices.keys() )
+        
+        first_seen_indices_to_sorted_indices = numpy.empty( len( self._tokens ), dtype = numpy.int64 )
+        
+        first_seen_indices_to_sorted_indices[ numpy.array( [ tokens_to_first_seen_indices[ token ] for token in self._tokens ], dtype = numpy.int64 ) ] = numpy.arange( len( self._tokens ), dtype = numpy.int64 )
+        
+        posting_sorted_indices = first_seen_indices_to_sorted_indices[ numpy.array( posting_first_seen_indices, dtype = numpy.int64 ) ]
+        
+        order = numpy.argsort( posting_sorted_indices, kind = 'stable' )
+        
+        self._posting_tag_ids = numpy.array( posting_tag_ids, dtype = numpy.int64 )[ order ]
+        self._posting_namespace_ids = numpy.array( posting_namespace_ids, dtype = numpy.int64 )[ order ]
+        self._posting_positions = numpy.array( posting_positions, dtype = numpy.int64 )[ order ]
+        
+        self._offsets = numpy.zeros( len( self._tokens ) + 1, dtype = numpy.int64 )
+        
+        numpy.cumsum( numpy.bincount( posting_sorted_indices, minlength = len( self._tokens ) ), out = self._offsets[ 1 : ] )
+        
+        # rebuilding the arrays is O(n), so changes wait here. an id in the removed set masks its postings in the arrays. a re-added id is in both
+        self._pending_tag_ids_to_rows = {}
+        self._pending_tokens_to_tag_ids = collections.defaultdict( set )
+        self._pending_sorted_tokens = []
+        self._removed_tag_ids = set()
+        
+        # the read pool sees the last commit, so it stays off us until the writer's changes, or the transaction we were built in, are committed
+        self._has_uncommitted_changes = True
+        
+    
+    def _GetSlice( self, token: str, is_prefix: bool ) -> tuple[ int, int ]:
+        
+        start = bisect.bisect_left( self._tokens, token )
+        
+        if is_prefix:
+            
+            end = bisect.bisect_left( self._tokens, GetPrefixSuccessor( token ), lo = start )
+            
+        elif start < len( self._tokens ) and self._tokens[ start ] == token:
+            
+            end = start + 1
+            
+        else:
+            
+            end = start
+            
+        
+        return ( int( self._offsets[ start ] ), int( self._offsets[ end ] ) )
+        
+    
+    def _RemovePending( self, tag_id: int ):
+        
+        if tag_id not in self._pending_tag_ids_to_rows:
+            
+            return
+            
+        
+        ( namespace_id, tokens ) = self._pending_tag_ids_to_rows.pop( tag_id )
+        
+        for token in set( tokens ):
+            
+            tag_ids = self._pending_tokens_to_tag_ids[ token ]
+            
+            tag_ids.discard( tag_id )
+            
+            if len( tag_ids ) == 0:
+                
+                del self._pending_tokens_to_tag_ids[ token ]
+                
+                del self._pending_sorted_tokens[ bisect.bisect_left( self._pending_sorted_tokens, token ) ]
+                
+            
+        
+    
+    def _SearchMain( self, phrase_tokens: list[ str ], namespace_ids: numpy.ndarray | None ) -> set[ int ]:
+        
+        # a posting is ( tag_id, position ), so we match the phrase by lining up each token's postings at the position the phrase would start
+        
+        matching_keys = None
+        
+        for ( i, token ) in enumerate( phrase_tokens ):
+            
+            is_last = i == len( phrase_tokens ) - 1
+            
+            ( start, end ) = self._GetSlice( token, is_last )
+            
+            tag_ids = self._posting_tag_ids[ start : end ]
+            phrase_starts = self._posting_positions[ start : end ] - i
+            
+            keep = phrase_starts >= 0
+            
+            if i == 0 and namespace_ids is not None:
+                
+                keep &= numpy.isin( self._posting_namespace_ids[ start : end ], namespace_ids )
+                
+            
+            keys = numpy.unique( ( tag_ids[ keep ] << 16 ) | phrase_starts[ keep ] )
+            
+            if matching_keys is None:
+                
+                matching_keys = keys
+                
+            else:
+                
+                matching_keys = numpy.intersect1d( matching_keys, keys, assume_unique = True )
+                
+            
+            if len( matching_keys ) == 0:
+                
+                return set()
+                
+            
+        
+        return set( ( matching_keys >> 16 ).tolist() )
+        
+    
+    def _SearchPending( self, phrase_tokens: list[ str ], namespace_ids: set[ int ] | None ) -> set[ int ]:
+        
+        prefix = phrase_tokens[ -1 ]
+        
+        start = bisect.bisect_left( self._pending_sorted_tokens, prefix )
+        end = bisect.bisect_left( self._pending_sorted_tokens, GetPrefixSuccessor( prefix ), lo = start )
+        
+        candidate_tag_ids = set()
+        
+        for token in self._pending_sorted_tokens[ start : end ]:
+            
+            candidate_tag_ids.update( self._pending_tokens_to_tag_ids[ token ] )
+            
+        
+        for token in phrase_tokens[ : -1 ]:
+            
+            candidate_tag_ids.intersection_update( self._pending_tokens_to_tag_ids.get( token, () ) )
+            
+        
+        result = set()
+        
+        num_tokens = len( phrase_tokens )
+        
+        for tag_id in candidate_tag_ids:
+            
+            ( namespace_id, tokens ) = self._pending_tag_ids_to_rows[ tag_id ]
+            
+            if namespace_ids is not None and namespace_id not in namespace_ids:
+                
+                continue
+                
+            
+            for phrase_start in range( len( tokens ) - num_tokens + 1 ):
+                
+                if tokens[ phrase_start : phrase_start + num_tokens - 1 ] == tuple( phrase_tokens[ : -1 ] ) and tokens[ phrase_start + num_tokens - 1 ].startswith( prefix ):
+                    
+                    result.add( tag_id )
+                    
+                    break
+                    
+                
+            
+        
+        return result
+        
+    
+    def AddTags( self, rows: collections.abc.Iterable[ tuple[ int, int, str ] ] ):
+        
+        with self._lock:
+            
+            self._has_uncommitted_changes = True
+            
+            for ( tag_id, namespace_id, searchable_subtag ) in rows:
+                
+                self._RemovePending( tag_id )
+                
+                tokens = tuple( GetFTS4SimpleTokens( searchable_subtag ) )
+                
+                # if a rolled-back transaction handed this id out before, we don't want its old postings hanging around
+                self._removed_tag_ids.add( tag_id )
+                self._pending_tag_ids_to_rows[ tag_id ] = ( namespace_id, tokens )
+                
+                for token in tokens:
+                    
+                    if token not in self._pending_tokens_to_tag_ids:
+                        
+                        bisect.insort( self._pending_sorted_tokens, token )
+                        
+                    
+                    self._pending_tokens_to_tag_ids[ token ].add( tag_id )
+                    
+                
+            
+        
+    
+    def GetMemoryFootprint( self ) -> int:
+        
+        with self._lock:
+            
+            return self._posting_tag_ids.nbytes + self._posting_namespace_ids.nbytes + self._posting_positions.nbytes + self._offsets.nbytes + sum( ( len( token ) for token in self._tokens ) )
+            
+        
+    
+    def NeedsRebuild( self ) -> bool:
+        
+        with self._lock:
+            
+            num_loose_changes = len( self._pending_tag_ids_to_rows ) + len( self._removed_tag_ids )
+            
+            return num_loose_changes > max( TAG_AUTOCOMPLETE_INDEX_MIN_LOOSE_CHANGES, len( self._posting_tag_ids ) // 10 )
+            
+        
+    
+    def NotifyCommit( self ):
+        
+        with self._lock:
+            
+            self._has_uncommitted_changes = False
+            
+        
+    
+    def RemoveTagIds( self, tag_ids: collections.abc.Iterable[ int ] ):
+        
+        with self._lock:
+            
+            self._has_uncommitted_changes = True
+            
+            for tag_id in tag_ids:
+                
+                self._RemovePending( tag_id )
+                
+                self._removed_tag_ids.add( tag_id )
+                
+            
+        
+    
+    def Search( self, phrase_tokens: list[ str ], namespace_ids: collections.abc.Collection[ int ] | None = None, committed_only: bool = False ) -> set[ int ] | None:
+        
+        """
+        Returns the tag_ids whose subtag matches an fts4 '"phrase tokens*"' search. namespace_ids None means any namespace.
+        If committed_only is set and we have changes that are not committed yet, returns None.
+        """
+        
+        namespace_ids_array = None
+        
+        if namespace_ids is not None:
+            
+            namespace_ids = set( namespace_ids )
+            
+            namespace_ids_array = numpy.fromiter( namespace_ids, dtype = numpy.int64, count = len( namespace_ids ) )
+            
+        
+        with self._lock:
+            
+            if committed_only and self._has_uncommitted_changes:
+                
+                return None
+                
+            
+            tag_ids = self._SearchMain( phrase_tokens, namespace_ids_array )
+            
+            tag_ids.difference_update( self._removed_tag_ids )
+            
+            tag_ids.update( self._SearchPending( phrase_tokens, namespace_ids ) )
+            
+        
+        return tag_ids
+        
+    
+
 class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     CAN_REPOPULATE_ALL_MISSING_DATA = True
@@ -163,6 +561,15 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         self._missing_tag_search_service_pairs = set()
         
+        self._tag_autocomplete_indices = {}
+        
+    
+    def _GenerateSubtagTrigramIndex( self, file_service_id, tag_service_id ):
+        
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        self._CreateTable( 'CREATE TABLE IF NOT EXISTS {} ( trigram INTEGER, subtag_id INTEGER, PRIMARY KEY ( trigram, subtag_id ) ) WITHOUT ROWID;', subtag_trigrams_table_name )
+        
     
     def _GetServiceIndexGenerationDictSingle( self, file_service_id, tag_service_id ) -> dict:
         
@@ -262,6 +669,127 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
         
     
+    def _GetSubtagTrigramQuery( self, file_service_id, tag_service_id, subtag_wildcard ):
+        
+        # fts4 can't do '*amu*' or '*amus', so they are normally a LIKE scan of every subtag
+        # if this service has the optional trigram index, we only LIKE the subtags that have every trigram in the wildcard
+        
+        trigrams = GetWildcardTrigrams( subtag_wildcard )
+        
+        if len( trigrams ) == 0:
+            
+            return None
+            
+        
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        if not self._TableExists( subtag_trigrams_table_name ):
+            
+            return None
+            
+        
+        subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
+        
+        trigrams = sorted( trigrams )[ : MAX_WILDCARD_TRIGRAMS ]
+        
+        candidates_query = ' INTERSECT '.join( ( 'SELECT subtag_id FROM {} WHERE trigram = ?'.format( subtag_trigrams_table_name ) for trigram in trigrams ) )
+        
+        query = 'SELECT docid FROM ( {} ) CROSS JOIN {} ON ( docid = subtag_id ) WHERE subtag LIKE ?;'.format( candidates_query, subtags_fts4_table_name )
+        query_args = tuple( trigrams ) + ( ConvertWildcardToSQLiteLikeParameter( subtag_wildcard ), )
+        
+        return ( query, query_args )
+        
+    
+    def _GetTagAutocompleteIndex( self, file_service_id, tag_service_id ) -> TagAutocompleteIndex | None:
+        
+        if not CG.client_controller.new_options.GetBoolean( 'tag_autocomplete_in_memory_index' ):
+            
+            self._tag_autocomplete_indices = {}
+            
+            return None
+            
+        
+        key = self._GetTagAutocompleteIndexKey( file_service_id, tag_service_id )
+        
+        tag_autocomplete_index = self._tag_autocomplete_indices.get( key, None )
+        
+        if tag_autocomplete_index is not None and tag_autocomplete_index.NeedsRebuild():
+            
+            tag_autocomplete_index = None
+            
+        
+        if tag_autocomplete_index is None and not self._IsOnReadPoolThread():
+            
+            tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
+            
+            rows = ( ( tag_id, namespace_id, ClientSearchTagContext.ConvertSubtagToSearchable( subtag ) ) for ( tag_id, namespace_id, subtag ) in self._Execute( 'SELECT tag_id, namespace_id, subtag FROM {} CROSS JOIN subtags USING ( subtag_id );'.format( tags_table_name ) ) )
+            
+            tag_autocomplete_index = TagAutocompleteIndex( rows )
+            
+            self._tag_autocomplete_indices[ key ] = tag_autocomplete_index
+            
+        
+        return tag_autocomplete_index
+        
+    
+    def _GetTagAutocompleteIndexKey( self, file_service_id, tag_service_id ):
+        
+        # the domains covered by hydrus local file storage share its tags table, so they share its index
+        
+        if file_service_id != self.modules_services.combined_file_service_id and self.modules_services.FileServiceIsCoveredByHydrusLocalFileStorage( file_service_id ):
+            
+            file_service_id = self.modules_services.hydrus_local_file_storage_service_id
+            
+        
+        return ( file_service_id, tag_service_id )
+        
+    
+    def _GetTagIdsFromTagAutocompleteIndices( self, file_service_id, tag_service_id, phrase_tokens, namespace_ids = None ) -> set[ int ] | None:
+        
+        # None means we couldn't do it here and sqlite has to
+        
+        if tag_service_id == self.modules_services.combined_tag_service_id:
+            
+            search_tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = ( tag_service_id, )
+            
+        
+        tag_autocomplete_indices = []
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            tag_autocomplete_index = self._GetTagAutocompleteIndex( file_service_id, search_tag_service_id )
+            
+            if tag_autocomplete_index is None:
+                
+                return None
+                
+            
+            tag_autocomplete_indices.append( tag_autocomplete_index )
+            
+        
+        committed_only = self._IsOnReadPoolThread()
+        
+        tag_ids = set()
+        
+        for tag_autocomplete_index in tag_autocomplete_indices:
+            
+            index_tag_ids = tag_autocomplete_index.Search( phrase_tokens, namespace_ids = namespace_ids, committed_only = committed_only )
+            
+            if index_tag_ids is None:
+                
+                return None
+                
+            
+            tag_ids.update( index_tag_ids )
+            
+        
+        return tag_ids
+        
+    
     def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
         
         file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES ) )
@@ -316,16 +844,26 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             with self._MakeTemporaryIntegerTable( actually_new_tag_ids, 'tag_id' ) as temp_tag_ids_table_name:
                 
                 # temp tags to fast tag definitions to subtags
-                subtag_ids_and_subtags = self._Execute( 'SELECT subtag_id, subtag FROM {} CROSS JOIN {} USING ( tag_id ) CROSS JOIN subtags USING ( subtag_id );'.format( temp_tag_ids_table_name, tags_table_name ) ).fetchall()
+                tag_rows = self._Execute( 'SELECT tag_id, namespace_id, subtag_id, subtag FROM {} CROSS JOIN {} USING ( tag_id ) CROSS JOIN subtags USING ( subtag_id );'.format( temp_tag_ids_table_name, tags_table_name ) ).fetchall()
                 
                 subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
                 subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
                 integer_subtags_table_name = self.GetIntegerSubtagsTableName( file_service_id, tag_service_id )
+                subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+                
+                we_have_trigram_index = self._TableExists( subtag_trigrams_table_name )
                 
-                for ( subtag_id, subtag ) in subtag_ids_and_subtags:
+                tag_autocomplete_index = self._tag_autocomplete_indices.get( self._GetTagAutocompleteIndexKey( file_service_id, tag_service_id ), None )
+                
+                for ( tag_id, namespace_id, subtag_id, subtag ) in tag_rows:
                     
                     searchable_subtag = ClientSearchTagContext.ConvertSubtagToSearchable( subtag )
                     
+                    if tag_autocomplete_index is not None:
+                        
+                        tag_autocomplete_index.AddTags( ( ( tag_id, namespace_id, searchable_subtag ), ) )
+                        
+                    
                     if searchable_subtag != subtag:
                         
                         searchable_subtag_id = self.modules_tags.GetSubtagId( searchable_subtag )
@@ -337,6 +875,11 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     
                     self._Execute( 'INSERT OR IGNORE INTO {} ( docid, subtag ) VALUES ( ?, ? );'.format( subtags_fts4_table_name ), ( subtag_id, searchable_subtag ) )
                     
+                    if we_have_trigram_index:
+                        
+                        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( trigram, subtag_id ) VALUES ( ?, ? );'.format( subtag_trigrams_table_name ), ( ( trigram, subtag_id ) for trigram in GetSubtagTrigrams( searchable_subtag ) ) )
+                        
+                    
                     if subtag.isdecimal():
                         
                         try:
@@ -358,6 +901,20 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         
     
+    def ClearTagAutocompleteIndices( self ):
+        
+        # after a rollback, we cannot trust what went into them
+        
+        self._tag_autocomplete_indices = {}
+        
+    
+    def DeleteSubtagTrigramIndex( self, file_service_id, tag_service_id ):
+        
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( subtag_trigrams_table_name )
+        
+    
     def DeleteTags( self, file_service_id, tag_service_id, tag_ids ):
         
         if len( tag_ids ) == 0:
@@ -388,6 +945,7 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
         integer_subtags_table_name = self.GetIntegerSubtagsTableName( file_service_id, tag_service_id )
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
         
         with self._MakeTemporaryIntegerTable( tag_ids, 'tag_id' ) as temp_tag_ids_table_name:
             
@@ -400,6 +958,13 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
             num_deleted = self._GetRowCount()
             
+            tag_autocomplete_index = self._tag_autocomplete_indices.get( self._GetTagAutocompleteIndexKey( file_service_id, tag_service_id ), None )
+            
+            if tag_autocomplete_index is not None:
+                
+                tag_autocomplete_index.RemoveTagIds( tag_ids )
+                
+            
             if num_deleted > 0:
                 
                 if file_service_id == self.modules_services.combined_file_service_id:
@@ -418,6 +983,23 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 
                 deletee_subtag_ids = subtag_ids.difference( still_existing_subtag_ids )
                 
+                if len( deletee_subtag_ids ) > 0 and self._TableExists( subtag_trigrams_table_name ):
+                    
+                    for subtag_id in deletee_subtag_ids:
+                        
+                        result = self._Execute( 'SELECT subtag FROM {} WHERE docid = ?;'.format( subtags_fts4_table_name ), ( subtag_id, ) ).fetchone()
+                        
+                        if result is None:
+                            
+                            continue
+                            
+                        
+                        ( searchable_subtag, ) = result
+                        
+                        self._ExecuteMany( 'DELETE FROM {} WHERE trigram = ? AND subtag_id = ?;'.format( subtag_trigrams_table_name ), ( ( trigram, subtag_id ) for trigram in GetSubtagTrigrams( searchable_subtag ) ) )
+                        
+                    
+                
                 self._ExecuteMany( 'DELETE FROM {} WHERE docid = ?;'.format( subtags_fts4_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 self._ExecuteMany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( subtags_searchable_map_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 self._ExecuteMany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( integer_subtags_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
@@ -427,6 +1009,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     def Drop( self, file_service_id, tag_service_id ):
         
+        self._tag_autocomplete_indices.pop( self._GetTagAutocompleteIndexKey( file_service_id, tag_service_id ), None )
+        
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         
         self.modules_db_maintenance.DeferredDropTable( tags_table_name )
@@ -443,6 +1027,10 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         self.modules_db_maintenance.DeferredDropTable( integer_subtags_table_name )
         
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( subtag_trigrams_table_name )
+        
     
     def FilterExistingTagIds( self, file_service_id, tag_service_id, tag_ids_table_name ):
         
@@ -451,7 +1039,7 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return self._STS( self._Execute( 'SELECT tag_id FROM {} CROSS JOIN {} USING ( tag_id );'.format( tag_ids_table_name, tags_table_name ) ) )
         
     
-    def Generate( self, file_service_id, tag_service_id ):
+    def Generate( self, file_service_id, tag_service_id, with_subtag_trigram_index = False ):
         
         table_generation_dict = self._GetServiceTableGenerationDictSingle( file_service_id, tag_service_id )
         
@@ -467,6 +1055,12 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             self._CreateIndex( table_name, columns, unique = unique )
             
         
+        if with_subtag_trigram_index:
+            
+            # an empty one, which AddTags will fill as the cache is populated
+            self._GenerateSubtagTrigramIndex( file_service_id, tag_service_id )
+            
+        
     
     def GetAllTagIds( self, leaf: ClientDBServices.FileSearchContextLeaf, job_status = None ):
         
@@ -635,6 +1229,18 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         else:
             
+            tag_ids = None
+            
+            phrase_tokens = GetPhraseTokensForTagAutocompleteIndex( half_complete_searchable_subtag )
+            
+            if phrase_tokens is not None:
+                
+                tag_ids = self._GetTagIdsFromTagAutocompleteIndices( leaf.file_service_id, leaf.tag_service_id, phrase_tokens, namespace_ids = None if namespace == '' else namespace_ids )
+                
+            
+        
+        if tag_ids is None:
+            
             tag_ids = set()
             
             with self._MakeTemporaryIntegerTable( [], 'subtag_id' ) as temp_subtag_ids_table_name:
@@ -867,12 +1473,24 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     
                     like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
                     
+                    trigram_query = None
+                    
                     if subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
                         
+                        trigram_query = self._GetSubtagTrigramQuery( file_service_id, search_tag_service_id, subtag_wildcard )
+                        
+                    
+                    if trigram_query is not None:
+                        
+                        ( query, query_args ) = trigram_query
+                        
+                    elif subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
+                        
                         # this is a SCAN, but there we go
                         # a potential optimisation here, in future, is to store fts4 of subtags reversed, then for '*amus', we can just search that reverse cache for 'suma*'
                         # and this would only double the size of the fts4 cache, the largest cache in the whole db! a steal!
                         # it also would not fix '*amu*', but with some cleverness could speed up '*amus ar*'
+                        # the optional trigram index above does fix it, if the user has built it
                         
                         query = 'SELECT docid FROM {} WHERE subtag LIKE ?;'.format( subtags_fts4_table_name )
                         query_args = ( like_param, )
@@ -982,12 +1600,24 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     
                     like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
                     
+                    trigram_query = None
+                    
                     if subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
                         
+                        trigram_query = self._GetSubtagTrigramQuery( file_service_id, search_tag_service_id, subtag_wildcard )
+                        
+                    
+                    if trigram_query is not None:
+                        
+                        ( query, query_args ) = trigram_query
+                        
+                    elif subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
+                        
                         # this is a SCAN, but there we go
                         # a potential optimisation here, in future, is to store fts4 of subtags reversed, then for '*amus', we can just search that reverse cache for 'suma*'
                         # and this would only double the size of the fts4 cache, the largest cache in the whole db! a steal!
                         # it also would not fix '*amu*', but with some cleverness could speed up '*amus ar*'
+                        # the optional trigram index above does fix it, if the user has built it
                         
                         query = 'SELECT docid FROM {} WHERE subtag LIKE ?;'.format( subtags_fts4_table_name )
                         query_args = ( like_param, )
@@ -1055,6 +1685,25 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         
     
+    def GetSubtagTrigramsTableName( self, file_service_id, tag_service_id ):
+        
+        if file_service_id == self.modules_services.combined_file_service_id:
+            
+            subtag_trigrams_table_name = GenerateCombinedFilesSubtagTrigramsTableName( tag_service_id )
+            
+        else:
+            
+            if self.modules_services.FileServiceIsCoveredByHydrusLocalFileStorage( file_service_id ):
+                
+                file_service_id = self.modules_services.hydrus_local_file_storage_service_id
+                
+            
+            subtag_trigrams_table_name = GenerateSpecificSubtagTrigramsTableName( file_service_id, tag_service_id )
+            
+        
+        return subtag_trigrams_table_name
+        
+    
     def GetSubtagsFTS4TableName( self, file_service_id, tag_service_id ):
         
         if file_service_id == self.modules_services.combined_file_service_id:
@@ -1116,6 +1765,13 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     tables_and_columns.append( ( tags_table_name, 'tag_id' ) )
                     tables_and_columns.append( ( subtags_fts4_table_name, 'docid' ) )
                     
+                    subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+                    
+                    if self._TableExists( subtag_trigrams_table_name ):
+                        
+                        tables_and_columns.append( ( subtag_trigrams_table_name, 'subtag_id' ) )
+                        
+                    
                 
             
         
@@ -1397,6 +2053,13 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return tags_table_name
         
     
+    def HasSubtagTrigramIndex( self, file_service_id, tag_service_id ):
+        
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        return self._TableExists( subtag_trigrams_table_name )
+        
+    
     def HasTag( self, file_service_id, tag_service_id, tag_id ):
         
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
@@ -1406,6 +2069,14 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return result is not None
         
     
+    def NotifyTagAutocompleteIndicesCommit( self ):
+        
+        for tag_autocomplete_index in list( self._tag_autocomplete_indices.values() ):
+            
+            tag_autocomplete_index.NotifyCommit()
+            
+        
+    
     def PopulateTableFromTagFilter( self, file_service_id: int, tag_service_id: int, tag_filter: HydrusTags.TagFilter, temp_tag_ids_table_name: str, my_search_includes_deleted_tags: bool ):
         
         if my_search_includes_deleted_tags:
@@ -1551,12 +2222,57 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         
     
+    def RegenerateSubtagTrigramIndex( self, file_service_id, tag_service_id, status_hook = None ):
+        
+        # this index is optional--it exists only if the user asked for it, and then AddTags and DeleteTags keep it up to date
+        
+        subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( subtag_trigrams_table_name )
+        
+        self._GenerateSubtagTrigramIndex( file_service_id, tag_service_id )
+        
+        query = 'SELECT docid FROM {};'.format( subtags_fts4_table_name )
+        
+        BLOCK_SIZE = 10000
+        
+        for ( group_of_subtag_ids, num_done, num_to_do ) in HydrusDB.ReadLargeIdQueryInSeparateChunks( self._c, query, BLOCK_SIZE ):
+            
+            for subtag_id in group_of_subtag_ids:
+                
+                result = self._Execute( 'SELECT subtag FROM {} WHERE docid = ?;'.format( subtags_fts4_table_name ), ( subtag_id, ) ).fetchone()
+                
+                if result is None:
+                    
+                    continue
+                    
+                
+                ( searchable_subtag, ) = result
+                
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( trigram, subtag_id ) VALUES ( ?, ? );'.format( subtag_trigrams_table_name ), ( ( trigram, subtag_id ) for trigram in GetSubtagTrigrams( searchable_subtag ) ) )
+                
+            
+            message = HydrusNumbers.ValueRangeToPrettyString( num_done, num_to_do )
+            
+            CG.client_controller.frame_splash_status.SetSubtext( message )
+            
+            if status_hook is not None:
+                
+                status_hook( message )
+                
+            
+        
+    
     def RepopulateMissingSubtags( self, file_service_id, tag_service_id ):
         
         tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
         integer_subtags_table_name = self.GetIntegerSubtagsTableName( file_service_id, tag_service_id )
+        subtag_trigrams_table_name = self.GetSubtagTrigramsTableName( file_service_id, tag_service_id )
+        
+        we_have_trigram_index = self._TableExists( subtag_trigrams_table_name )
         
         missing_subtag_ids = self._STS( self._Execute( 'SELECT subtag_id FROM {} EXCEPT SELECT docid FROM {};'.format( tags_table_name, subtags_fts4_table_name ) ) )
         
@@ -1584,6 +2300,11 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
             self._Execute( 'INSERT OR IGNORE INTO {} ( docid, subtag ) VALUES ( ?, ? );'.format( subtags_fts4_table_name ), ( subtag_id, searchable_subtag ) )
             
+            if we_have_trigram_index:
+                
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( trigram, subtag_id ) VALUES ( ?, ? );'.format( subtag_trigrams_table_name ), ( ( trigram, subtag_id ) for trigram in GetSubtagTrigrams( searchable_subtag ) ) )
+                
+            
             if subtag.isdecimal():
                 
                 try:
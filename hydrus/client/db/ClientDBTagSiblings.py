@@ -60,6 +60,9 @@ def GenerateTagSiblingsStorageTableNames( service_id ):
     }
     
 
+# when a chain regen is given this many tags, it is faster to load every pair and do the whole service in memory than to walk the chains out a query at a time
+REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD = 5000
+
 class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
     
     CAN_REPOPULATE_ALL_MISSING_DATA = True
@@ -98,6 +101,44 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
         
     
+    def _GenerateIdealRows( self, tag_service_id, tag_ids = None ) -> set[ tuple[ int, int ] ]:
+        
+        # all the pairs from the applicable services, collapsed in memory to ( bad_tag_id, ideal_tag_id ) rows. if tag_ids is set, we only do the chains they are in
+        
+        tss = ClientTagsHandling.TagSiblingsStructure()
+        
+        for applicable_service_id in self.GetApplicableServiceIds( tag_service_id ):
+            
+            if tag_ids is None:
+                
+                statuses_to_pair_ids = self.GetTagSiblingsIds( applicable_service_id )
+                
+            else:
+                
+                statuses_to_pair_ids = self.GetTagSiblingsIdsChains( applicable_service_id, tag_ids )
+                
+            
+            petitioned_fast_lookup = set( statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
+            
+            for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ]:
+                
+                if ( bad_tag_id, good_tag_id ) in petitioned_fast_lookup:
+                    
+                    continue
+                    
+                
+                tss.AddPair( bad_tag_id, good_tag_id )
+                
+            
+            for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ]:
+                
+                tss.AddPair( bad_tag_id, good_tag_id )
+                
+            
+        
+        return set( tss.GetBadTagsToIdealTags().items() )
+        
+    
     def _GetInitialIndexGenerationDict( self ) -> dict:
         
         index_generation_dict = {}
@@ -201,6 +242,17 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
         
     
+    def _WriteIdealRowsDiff( self, tag_service_id, rows_to_delete, rows_to_add ):
+        
+        cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
+        
+        # deletes first, since a bad tag that moved to a new ideal is in both
+        
+        self._ExecuteMany( f'DELETE FROM {cache_tag_siblings_lookup_table_name} WHERE bad_tag_id = ?;', ( ( bad_tag_id, ) for ( bad_tag_id, ideal_tag_id ) in rows_to_delete ) )
+        
+        self._ExecuteMany( f'INSERT OR IGNORE INTO {cache_tag_siblings_lookup_table_name} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );', rows_to_add )
+        
+    
     def AddTagSiblings( self, service_id, pairs ):
         
         statuses_to_storage_table_names = GenerateTagSiblingsStorageTableNames( service_id )
@@ -985,35 +1037,11 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
             cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
             
-            self._Execute( 'DELETE FROM {};'.format( cache_tag_siblings_lookup_table_name ) )
+            existing_rows = set( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {cache_tag_siblings_lookup_table_name};' ) )
             
-            applicable_service_ids = self.GetApplicableServiceIds( tag_service_id )
+            ideal_rows = self._GenerateIdealRows( tag_service_id )
             
-            tss = ClientTagsHandling.TagSiblingsStructure()
-            
-            for applicable_service_id in applicable_service_ids:
-                
-                statuses_to_pair_ids = self.GetTagSiblingsIds( service_id = applicable_service_id )
-                
-                petitioned_fast_lookup = set( statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
-                
-                for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ]:
-                    
-                    if ( bad_tag_id, good_tag_id ) in petitioned_fast_lookup:
-                        
-                        continue
-                        
-                    
-                    tss.AddPair( bad_tag_id, good_tag_id )
-                    
-                
-                for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ]:
-                    
-                    tss.AddPair( bad_tag_id, good_tag_id )
-                    
-                
-            
-            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_tag_siblings_lookup_table_name ), tss.GetBadTagsToIdealTags().items() )
+            self._WriteIdealRowsDiff( tag_service_id, existing_rows.difference( ideal_rows ), ideal_rows.difference( existing_rows ) )
             
             if tag_service_id in self._service_ids_to_display_application_status:
                 
@@ -1040,63 +1068,41 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
             cache_tag_siblings_lookup_table_name = GenerateTagSiblingsLookupCacheTableName( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id )
             
-            tag_ids_to_clear_and_regen = set( tag_ids )
-            
-            ideal_tag_ids = self.GetIdealTagIds( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids )
-            
-            tag_ids_to_clear_and_regen.update( self.GetChainsMembersFromIdeals( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, ideal_tag_ids ) )
-            
-            if tag_service_id in self._service_ids_to_applicable_service_ids:
+            if len( tag_ids ) >= REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD:
                 
-                with self._MakeTemporaryIntegerTable( tag_ids_to_clear_and_regen, 'tag_id' ) as temp_tag_ids_table_name:
-                    
-                    stuff_deleted = set( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_siblings_lookup_table_name} ON ( bad_tag_id = tag_id );' ) )
-                    stuff_deleted.update( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_siblings_lookup_table_name} ON ( ideal_tag_id = tag_id );' ) )
-                    
+                # a big update touches so many chains that walking them out is slower than doing everything in one go
                 
-            else:
+                stuff_deleted = set( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {cache_tag_siblings_lookup_table_name};' ) )
                 
-                stuff_deleted = set()
+                stuff_added = self._GenerateIdealRows( tag_service_id )
                 
-            
-            self._ExecuteMany( 'DELETE FROM {} WHERE bad_tag_id = ? OR ideal_tag_id = ?;'.format( cache_tag_siblings_lookup_table_name ), ( ( tag_id, tag_id ) for tag_id in tag_ids_to_clear_and_regen ) )
-            
-            applicable_tag_service_ids = self.GetApplicableServiceIds( tag_service_id )
-            
-            tss = ClientTagsHandling.TagSiblingsStructure()
-            
-            for applicable_tag_service_id in applicable_tag_service_ids:
+            else:
                 
-                statuses_to_pair_ids = self.GetTagSiblingsIdsChains( applicable_tag_service_id, tag_ids_to_clear_and_regen )
+                tag_ids_to_clear_and_regen = set( tag_ids )
                 
-                petitioned_fast_lookup = set( statuses_to_pair_ids[ HC.CONTENT_STATUS_PETITIONED ] )
+                ideal_tag_ids = self.GetIdealTagIds( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, tag_ids )
                 
-                for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_CURRENT ]:
-                    
-                    if ( bad_tag_id, good_tag_id ) in petitioned_fast_lookup:
-                        
-                        continue
-                        
-                    
-                    tss.AddPair( bad_tag_id, good_tag_id )
-                    
+                tag_ids_to_clear_and_regen.update( self.GetChainsMembersFromIdeals( ClientTags.TAG_DISPLAY_DISPLAY_IDEAL, tag_service_id, ideal_tag_ids ) )
                 
-                for ( bad_tag_id, good_tag_id ) in statuses_to_pair_ids[ HC.CONTENT_STATUS_PENDING ]:
+                with self._MakeTemporaryIntegerTable( tag_ids_to_clear_and_regen, 'tag_id' ) as temp_tag_ids_table_name:
                     
-                    tss.AddPair( bad_tag_id, good_tag_id )
+                    stuff_deleted = set( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_siblings_lookup_table_name} ON ( bad_tag_id = tag_id );' ) )
+                    stuff_deleted.update( self._Execute( f'SELECT bad_tag_id, ideal_tag_id FROM {temp_tag_ids_table_name} CROSS JOIN {cache_tag_siblings_lookup_table_name} ON ( ideal_tag_id = tag_id );' ) )
                     
                 
+                stuff_added = self._GenerateIdealRows( tag_service_id, tag_ids = tag_ids_to_clear_and_regen )
+                
             
-            stuff_added = set( tss.GetBadTagsToIdealTags().items() )
+            # we only write what actually changed
             
-            self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_tag_siblings_lookup_table_name ), stuff_added )
+            stuff_no_changes = stuff_deleted.intersection( stuff_added )
+            stuff_deleted.difference_update( stuff_no_changes )
+            stuff_added.difference_update( stuff_no_changes )
+            
+            self._WriteIdealRowsDiff( tag_service_id, stuff_deleted, stuff_added )
             
             if tag_service_id in self._service_ids_to_display_application_status:
                 
-                stuff_no_changes = stuff_deleted.intersection( stuff_added )
-                stuff_deleted.difference_update( stuff_no_changes )
-                stuff_added.difference_update( stuff_no_changes )
-                
                 ( actual_sibling_rows, ideal_sibling_rows, sibling_rows_to_add, sibling_rows_to_remove ) = self._service_ids_to_display_application_status[ tag_service_id ]
                 
                 ideal_sibling_rows.difference_update( stuff_deleted )
@@ -1,4 +1,6 @@
+import collections
 import sqlite3
+import threading
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusTime
@@ -9,6 +11,16 @@ from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBServices
 
+# related tags samples a few hundred files live, which is noisy for big tags. for tags like that, we remember a much bigger sample here
+# we only keep the top counts, which is all the related tags scoring ever uses
+RELATED_TAGS_CACHE_NUM_FILES_TO_SEARCH = 20000
+RELATED_TAGS_CACHE_MAX_NUM_RESULTS = 1000
+
+# a cached search is refreshed when its tag's count moves this much, or it gets this old. past the big drift, we stop using it at all
+RELATED_TAGS_CACHE_REFRESH_DRIFT = 0.1
+RELATED_TAGS_CACHE_UNUSABLE_DRIFT = 0.5
+RELATED_TAGS_CACHE_REFRESH_AGE = 86400 * 30
+
 class ClientDBRecentTags( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor, modules_tags: ClientDBMaster.ClientDBMasterTags, modules_services: ClientDBServices.ClientDBMasterServices, modules_tags_local_cache: ClientDBDefinitionsCache.ClientDBCacheLocalTags ):
@@ -100,3 +112,139 @@ class ClientDBRecentTags( ClientDBModule.ClientDBModule ):
             
         
     
+
+
+class ClientDBRelatedTagsCache( ClientDBModule.ClientDBModule ):
+    
+    def __init__( self, cursor: sqlite3.Cursor ):
+        
+        super().__init__( 'client related tags cache', cursor )
+        
+        # related tags is a pool read, which cannot write, so the searches we want done next are just remembered here until maintenance gets to them
+        self._wanted_searches = set()
+        self._wanted_searches_lock = threading.Lock()
+        
+    
+    def _AddWanted( self, tag_display_type, file_service_id, tag_service_id, search_tag_id ):
+        
+        with self._wanted_searches_lock:
+            
+            self._wanted_searches.add( ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) )
+            
+        
+    
+    def _DeleteCacheIds( self, cache_ids ):
+        
+        self._ExecuteMany( 'DELETE FROM related_tags_cache_counts WHERE cache_id = ?;', ( ( cache_id, ) for cache_id in cache_ids ) )
+        self._ExecuteMany( 'DELETE FROM related_tags_cache WHERE cache_id = ?;', ( ( cache_id, ) for cache_id in cache_ids ) )
+        
+    
+    def _GetInitialTableGenerationDict( self ) -> dict:
+        
+        return {
+            'external_caches.related_tags_cache' : ( 'CREATE TABLE IF NOT EXISTS {} ( cache_id INTEGER PRIMARY KEY, tag_display_type INTEGER, file_service_id INTEGER, tag_service_id INTEGER, search_tag_id INTEGER, search_tag_count INTEGER, num_files_searched INTEGER, timestamp INTEGER, UNIQUE ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) );', 677 ),
+            'external_caches.related_tags_cache_counts' : ( 'CREATE TABLE IF NOT EXISTS {} ( cache_id INTEGER, tag_id INTEGER, count INTEGER, PRIMARY KEY ( cache_id, tag_id ) ) WITHOUT ROWID;', 677 )
+        }
+        
+    
+    def Clear( self ):
+        
+        self._Execute( 'DELETE FROM related_tags_cache_counts;' )
+        self._Execute( 'DELETE FROM related_tags_cache;' )
+        
+        with self._wanted_searches_lock:
+            
+            self._wanted_searches = set()
+            
+        
+    
+    def DeleteWanted( self, tag_display_type, file_service_id, tag_service_id, search_tag_id ):
+        
+        with self._wanted_searches_lock:
+            
+            self._wanted_searches.discard( ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) )
+            
+        
+    
+    def Drop( self, service_id ):
+        
+        cache_ids = self._STL( self._Execute( 'SELECT cache_id FROM related_tags_cache WHERE file_service_id = ? OR tag_service_id = ?;', ( service_id, service_id ) ) )
+        
+        self._DeleteCacheIds( cache_ids )
+        
+        with self._wanted_searches_lock:
+            
+            self._wanted_searches = { row for row in self._wanted_searches if service_id not in ( row[1], row[2] ) }
+            
+        
+    
+    def GetCachedCounts( self, tag_display_type, file_service_id, tag_service_id, search_tag_id, search_tag_count ):
+        
+        """
+        Returns ( tag_ids_to_counts, num_files_searched ), or None if we have nothing good. Anything missing or getting stale is queued up for the maintenance job.
+        """
+        
+        result = self._Execute( 'SELECT cache_id, search_tag_count, num_files_searched, timestamp FROM related_tags_cache WHERE tag_display_type = ? AND file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) ).fetchone()
+        
+        if result is None:
+            
+            self._AddWanted( tag_display_type, file_service_id, tag_service_id, search_tag_id )
+            
+            return None
+            
+        
+        ( cache_id, cached_search_tag_count, num_files_searched, timestamp ) = result
+        
+        drift = abs( search_tag_count - cached_search_tag_count ) / max( search_tag_count, 1 )
+        
+        if drift > RELATED_TAGS_CACHE_REFRESH_DRIFT or HydrusTime.TimeHasPassed( timestamp + RELATED_TAGS_CACHE_REFRESH_AGE ):
+            
+            self._AddWanted( tag_display_type, file_service_id, tag_service_id, search_tag_id )
+            
+        
+        if drift > RELATED_TAGS_CACHE_UNUSABLE_DRIFT:
+            
+            return None
+            
+        
+        tag_ids_to_counts = collections.Counter( dict( self._Execute( 'SELECT tag_id, count FROM related_tags_cache_counts WHERE cache_id = ?;', ( cache_id, ) ) ) )
+        
+        return ( tag_ids_to_counts, num_files_searched )
+        
+    
+    def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> list[ tuple[ str, str ] ]:
+        
+        tables_and_columns = []
+        
+        if content_type == HC.CONTENT_TYPE_TAG:
+            
+            tables_and_columns.append( ( 'related_tags_cache', 'search_tag_id' ) )
+            tables_and_columns.append( ( 'related_tags_cache_counts', 'tag_id' ) )
+            
+        
+        return tables_and_columns
+        
+    
+    def GetWanted( self, limit ):
+        
+        with self._wanted_searches_lock:
+            
+            return list( self._wanted_searches )[ : limit ]
+            
+        
+    
+    def SetCounts( self, tag_display_type, file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, tag_ids_to_counts: collections.Counter ):
+        
+        cache_ids = self._STL( self._Execute( 'SELECT cache_id FROM related_tags_cache WHERE tag_display_type = ? AND file_service_id = ? AND tag_service_id = ? AND search_tag_id = ?;', ( tag_display_type, file_service_id, tag_service_id, search_tag_id ) ) )
+        
+        self._DeleteCacheIds( cache_ids )
+        
+        self._Execute( 'INSERT INTO related_tags_cache ( tag_display_type, file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, timestamp ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', ( tag_display_type, file_service_id, tag_service_id, search_tag_id, search_tag_count, num_files_searched, HydrusTime.GetNow() ) )
+        
+        cache_id = self._GetLastRowId()
+        
+        self._ExecuteMany( 'INSERT INTO related_tags_cache_counts ( cache_id, tag_id, count ) VALUES ( ?, ?, ? );', ( ( cache_id, tag_id, count ) for ( tag_id, count ) in tag_ids_to_counts.most_common( RELATED_TAGS_CACHE_MAX_NUM_RESULTS ) ) )
+        
+        self.DeleteWanted( tag_display_type, file_service_id, tag_service_id, search_tag_id )
+        
+    
@@ -5,14 +5,298 @@ import typing
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusLists
 
 from hydrus.client.db import ClientDBMaster
 from hydrus.client.db import ClientDBModule
+from hydrus.client.networking import ClientNetworkingFunctions
 from hydrus.client.networking import ClientNetworkingURLClass
 from hydrus.client.search import ClientNumberTest
 
+def ConvertLiteralToLikePhrase( literal: str ):
+    
+    return literal.replace( '\\', '\\\\' ).replace( '%', '\\%' ).replace( '_', '\\_' )
+    
+
+def GetDomainHintFromSchemeLiteral( scheme_literal: str ):
+    
+    # we know the url's first '://' is followed by this text, so we may know its domain. returns ( domain, is_exact ) or None
+    
+    after_scheme = scheme_literal[ 3 : ]
+    
+    for ( i, c ) in enumerate( after_scheme ):
+        
+        if c in '/?#':
+            
+            domain = after_scheme[ : i ]
+            
+            if len( domain ) == 0:
+                
+                return None
+                
+            
+            return ( domain, True )
+            
+        
+    
+    if len( after_scheme ) == 0:
+        
+        return None
+        
+    
+    return ( after_scheme, False )
+    
+
+def _SkipRegexClass( regex: str, i: int ):
+    
+    # i is on the '['. a ']' straight after the '[' or '[^' is a literal
+    
+    i += 1
+    
+    if i < len( regex ) and regex[ i ] == '^':
+        
+        i += 1
+        
+    
+    if i < len( regex ) and regex[ i ] == ']':
+        
+        i += 1
+        
+    
+    while i < len( regex ):
+        
+        c = regex[ i ]
+        
+        if c == '\\':
+            
+            i += 2
+            
+        elif c == ']':
+            
+            return i + 1
+            
+        else:
+            
+            i += 1
+            
+        
+    
+    return i
+    
+
+def _SkipRegexGroup( regex: str, i: int ):
+    
+    # i is on the '('
+    
+    depth = 0
+    
+    while i < len( regex ):
+        
+        c = regex[ i ]
+        
+        if c == '\\':
+            
+            i += 2
+            
+            continue
+            
+        elif c == '[':
+            
+            i = _SkipRegexClass( regex, i )
+            
+            continue
+            
+        elif c == '(':
+            
+            depth += 1
+            
+        elif c == ')':
+            
+            depth -= 1
+            
+            if depth == 0:
+                
+                return i + 1
+                
+            
+        
+        i += 1
+        
+    
+    return i
+    
+
+def GetRegexLiteralHints( regex: str ):
+    
+    # a conservative look at a regex for literal text that every match must have, so we can prefilter in SQL before we do any python regex
+    # returns ( literals, scheme_literal ), where scheme_literal is the text that follows the url's scheme, starting '://', or None
+    # anything clever--alternation, groups, classes--we just skip over. we only ever lose hints, never make a wrong one
+    
+    try:
+        
+        compiled_regex = re.compile( regex )
+        
+    except re.error:
+        
+        return ( [], None )
+        
+    
+    # LIKE is case-insensitive for ascii, which is fine for a prefilter, but it is case-sensitive for other unicode
+    if compiled_regex.flags & ( re.IGNORECASE | re.VERBOSE ):
+        
+        return ( [], None )
+        
+    
+    literals = []
+    scheme_literal = None
+    
+    current_run = []
+    scheme_colon_position = None
+    
+    # if we are anchored to the start and have only seen literal characters that are not ':', the next ':' is the end of the url's scheme
+    scheme_is_ahead = regex.startswith( '^' )
+    
+    i = 1 if scheme_is_ahead else 0
+    
+    # escapes like \x41, \1 or \u00e9 run on past their first character, so after one we can't trust anything to be literal
+    literals_are_over = False
+    
+    def end_run():
+        
+        nonlocal scheme_literal, scheme_colon_position
+        
+        if len( current_run ) > 0:
+            
+            literal = ''.join( current_run )
+            
+            literals.append( literal )
+            
+            if scheme_colon_position is not None and literal[ scheme_colon_position : ].startswith( '://' ):
+                
+                scheme_literal = literal[ scheme_colon_position : ]
+                
+            
+            current_run.clear()
+            
+        
+        scheme_colon_position = None
+        
+    
+    while i < len( regex ):
+        
+        c = regex[ i ]
+        
+        literal_char = None
+        
+        if c == '\\':
+            
+            if i + 1 < len( regex ) and not regex[ i + 1 ].isalnum():
+                
+                literal_char = regex[ i + 1 ]
+                
+            else:
+                
+                literals_are_over = True
+                
+            
+            i += 2
+            
+        elif c == '[':
+            
+            i = _SkipRegexClass( regex, i )
+            
+        elif c == '(':
+            
+            i = _SkipRegexGroup( regex, i )
+            
+        elif c == '{':
+            
+            i = regex.find( '}', i ) + 1 if '}' in regex[ i : ] else len( regex )
+            
+        elif c == '|':
+            
+            # any branch could match, so nothing is guaranteed
+            return ( [], None )
+            
+        elif c in '.^$*+?':
+            
+            i += 1
+            
+        else:
+            
+            literal_char = c
+            
+            i += 1
+            
+        
+        if literal_char is None or literals_are_over:
+            
+            end_run()
+            
+            scheme_is_ahead = False
+            
+            continue
+            
+        
+        next_c = regex[ i ] if i < len( regex ) else ''
+        
+        if next_c in ( '*', '+', '?', '{' ):
+            
+            # eat the quantifier here, lazy '?' and all
+            
+            if next_c == '{':
+                
+                i = regex.find( '}', i ) + 1 if '}' in regex[ i : ] else len( regex )
+                
+            else:
+                
+                i += 1
+                
+            
+            if i < len( regex ) and regex[ i ] == '?':
+                
+                i += 1
+                
+            
+        
+        if next_c in ( '*', '?', '{' ):
+            
+            # this char may not be there, so it breaks the run
+            end_run()
+            
+            if literal_char == ':':
+                
+                scheme_is_ahead = False
+                
+            
+        else:
+            
+            if literal_char == ':' and scheme_is_ahead:
+                
+                scheme_colon_position = len( current_run )
+                
+                scheme_is_ahead = False
+                
+            
+            current_run.append( literal_char )
+            
+            if next_c == '+':
+                
+                end_run()
+                
+            
+        
+    
+    end_run()
+    
+    return ( literals, scheme_literal )
+    
+
 class ClientDBURLMap( ClientDBModule.ClientDBModule ):
     
+
     def __init__( self, cursor: sqlite3.Cursor, modules_urls: ClientDBMaster.ClientDBMasterURLs ):
         
         self.modules_urls = modules_urls
@@ -20,6 +304,106 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         super().__init__( 'client urls mapping', cursor )
         
     
+    def _GetDomainURLCount( self, domain_ids: collections.abc.Collection[ int ] ) -> int:
+        
+        if len( domain_ids ) == 0:
+            
+            return 0
+            
+        
+        with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
+            
+            ( url_count, ) = self._Execute( 'SELECT SUM( url_count ) FROM {} CROSS JOIN url_map_domain_counts USING ( domain_id );'.format( temp_domain_table_name ) ).fetchone()
+            
+        
+        if url_count is None:
+            
+            url_count = 0
+            
+        
+        return url_count
+        
+    
+    def _GetHashIdsFromURLTest( self, url_test, domain_ids: collections.abc.Collection[ int ] | None, hash_ids = None, hash_ids_table_name = None, url_predicates = None, url_predicate_args = None ):
+        
+        # domain_ids None means any domain. url_predicates are extra SQL tests on 'url' that every url that passes url_test will pass
+        
+        if domain_ids is not None and len( domain_ids ) == 0:
+            
+            return set()
+            
+        
+        if url_predicates is None:
+            
+            url_predicates = []
+            url_predicate_args = []
+            
+        
+        url_predicates = list( url_predicates )
+        
+        if domain_ids is None:
+            
+            num_domain_rows = self._GetTotalURLCount()
+            
+        else:
+            
+            num_domain_rows = self._GetDomainURLCount( domain_ids )
+            
+            url_predicates.insert( 0, 'domain_id IN {}'.format( HydrusLists.SplayListForDB( domain_ids ) ) )
+            
+        
+        result_hash_ids = set()
+        
+        if self._ShouldSearchFromHashIds( hash_ids, hash_ids_table_name, num_domain_rows ):
+            
+            # temp hashes to url map to urls. many files can share a url, so we remember what we tested
+            
+            url_ids_to_results = {}
+            
+            select = 'SELECT hash_id, url_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id )'.format( hash_ids_table_name )
+            
+            if len( url_predicates ) > 0:
+                
+                select += ' WHERE {}'.format( ' AND '.join( url_predicates ) )
+                
+            
+            for ( hash_id, url_id, url ) in self._Execute( select + ';', url_predicate_args ):
+                
+                if hash_id in result_hash_ids:
+                    
+                    continue
+                    
+                
+                if url_id not in url_ids_to_results:
+                    
+                    url_ids_to_results[ url_id ] = url_test( url )
+                    
+                
+                if url_ids_to_results[ url_id ]:
+                    
+                    result_hash_ids.add( hash_id )
+                    
+                
+            
+        else:
+            
+            # every url we have a mapping for, tested once, and then to the files
+            
+            url_predicates.append( 'EXISTS ( SELECT 1 FROM url_map WHERE url_map.url_id = urls.url_id )' )
+            
+            select = 'SELECT url_id, url FROM urls WHERE {};'.format( ' AND '.join( url_predicates ) )
+            
+            matching_url_ids = [ url_id for ( url_id, url ) in self._Execute( select, url_predicate_args ) if url_test( url ) ]
+            
+            with self._MakeTemporaryIntegerTable( matching_url_ids, 'url_id' ) as temp_url_ids_table_name:
+                
+                result_hash_ids = self._STS( self._Execute( 'SELECT hash_id FROM {} CROSS JOIN url_map USING ( url_id );'.format( temp_url_ids_table_name ) ) )
+                
+            
+        
+        return result_hash_ids
+        
+    
     def _GetInitialIndexGenerationDict( self ) -> dict:
         
         index_generation_dict = {}
@@ -34,16 +418,55 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
     def _GetInitialTableGenerationDict( self ) -> dict:
         
         return {
-            'main.url_map' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, url_id INTEGER, PRIMARY KEY ( hash_id, url_id ) );', 485 )
+            'main.url_map' : ( 'CREATE TABLE IF NOT EXISTS {} ( hash_id INTEGER, url_id INTEGER, PRIMARY KEY ( hash_id, url_id ) );', 485 ),
+            'main.url_map_domain_counts' : ( 'CREATE TABLE IF NOT EXISTS {} ( domain_id INTEGER PRIMARY KEY, url_count INTEGER );', 677 )
         }
         
     
+    def _GetTotalURLCount( self ) -> int:
+        
+        ( url_count, ) = self._Execute( 'SELECT SUM( url_count ) FROM url_map_domain_counts;' ).fetchone()
+        
+        if url_count is None:
+            
+            url_count = 0
+            
+        
+        return url_count
+        
+    
+    def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
+        
+        if 'main.url_map_domain_counts' in table_names:
+            
+            self.RegenerateDomainURLCounts()
+            
+        
+    
+    def _ShouldSearchFromHashIds( self, hash_ids, hash_ids_table_name, num_domain_rows: int ) -> bool:
+        
+        # hash_ids -> url_map is at least one row per file, domains -> urls -> url_map is one row per mapping
+        
+        if hash_ids_table_name is None or hash_ids is None:
+            
+            return False
+            
+        
+        return len( hash_ids ) < num_domain_rows
+        
+    
     def AddMapping( self, hash_id: int, url: str ):
         
         url_id = self.modules_urls.GetURLId( url )
         
         self._Execute( 'INSERT OR IGNORE INTO url_map ( hash_id, url_id ) VALUES ( ?, ? );', ( hash_id, url_id ) )
         
+        if self._GetRowCount() > 0:
+            
+            self._Execute( 'INSERT OR IGNORE INTO url_map_domain_counts ( domain_id, url_count ) SELECT domain_id, 0 FROM urls WHERE url_id = ?;', ( url_id, ) )
+            self._Execute( 'UPDATE url_map_domain_counts SET url_count = url_count + 1 WHERE domain_id = ( SELECT domain_id FROM urls WHERE url_id = ? );', ( url_id, ) )
+            
+        
     
     def DeleteMapping( self, hash_id: int, url: str ):
         
@@ -51,6 +474,11 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'DELETE FROM url_map WHERE hash_id = ? AND url_id = ?;', ( hash_id, url_id ) )
         
+        if self._GetRowCount() > 0:
+            
+            self._Execute( 'UPDATE url_map_domain_counts SET url_count = url_count - 1 WHERE domain_id = ( SELECT domain_id FROM urls WHERE url_id = ? );', ( url_id, ) )
+            
+        
     
     def GetHashIds( self, search_url: str ):
         
@@ -145,33 +573,8 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             
             domain_ids = self.modules_urls.GetURLDomainAndSubdomainIds( url_domain_mask )
             
-            result_hash_ids = set()
-            
-            with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
-                
-                if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
-                    
-                    # if we aren't gonk mode with the number of files, temp hashes to url map to urls to domains
-                    # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on url domain count
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id );'.format( hash_ids_table_name, temp_domain_table_name )
-                    
-                else:
-                    
-                    # domains to urls to url map
-                    select = 'SELECT hash_id, url FROM {} CROSS JOIN urls USING ( domain_id ) CROSS JOIN url_map USING ( url_id );'.format( temp_domain_table_name )
-                    
-                
-                for ( hash_id, url ) in self._Execute( select ):
-                    
-                    # this is actually insufficient, as more detailed url classes may match
-                    if hash_id not in result_hash_ids and url_class.Matches( url ):
-                        
-                        result_hash_ids.add( hash_id )
-                        
-                    
-                
-            
-            return result_hash_ids
+            # this is actually insufficient, as more detailed url classes may match
+            return self._GetHashIdsFromURLTest( url_class.Matches, domain_ids, hash_ids = hash_ids, hash_ids_table_name = hash_ids_table_name )
             
         elif rule_type in 'domain':
             
@@ -182,12 +585,13 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             # if we search for site.com, we also want artist.site.com or www.site.com or cdn2.site.com
             domain_ids = self.modules_urls.GetURLDomainAndSubdomainIds( url_domain_mask )
             
+            num_domain_rows = self._GetDomainURLCount( domain_ids )
+            
             with self._MakeTemporaryIntegerTable( domain_ids, 'domain_id' ) as temp_domain_table_name:
                 
-                if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
+                if self._ShouldSearchFromHashIds( hash_ids, hash_ids_table_name, num_domain_rows ):
                     
-                    # if we aren't gonk mode with the number of files, temp hashes to url map to urls to domains
-                    # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on url domain count
+                    # temp hashes to url map to urls to domains
                     select = 'SELECT hash_id FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id ) CROSS JOIN {} USING ( domain_id )'.format( hash_ids_table_name, temp_domain_table_name )
                     
                 else:
@@ -205,28 +609,62 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
             
             regex = rule
             
-            if hash_ids_table_name is not None and hash_ids is not None and len( hash_ids ) < 50000:
+            compiled_regex = re.compile( regex )
+            
+            ( literals, scheme_literal ) = GetRegexLiteralHints( regex )
+            
+            domain_ids = None
+            
+            if scheme_literal is not None:
                 
-                # if we aren't gonk mode with the number of files, temp hashes to url map to urls
-                # next step here is irl profiling and a domain->url_count cache so I can decide whether to do this or not based on _TOTAL_ url count
-                select = 'SELECT hash_id, url FROM {} CROSS JOIN url_map USING ( hash_id ) CROSS JOIN urls USING ( url_id );'.format( hash_ids_table_name )
+                domain_hint = GetDomainHintFromSchemeLiteral( scheme_literal )
                 
-            else:
-                
-                select = 'SELECT hash_id, url FROM url_map NATURAL JOIN urls;'
+                if domain_hint is not None:
+                    
+                    ( domain, is_exact ) = domain_hint
+                    
+                    # stored domains were unicode normalised, and a url that would not parse went in under 'unknown.com', so we look for those too
+                    
+                    if is_exact:
+                        
+                        possible_domains = { domain, 'unknown.com' }
+                        
+                        try:
+                            
+                            possible_domains.add( ClientNetworkingFunctions.ConvertURLIntoDomain( 'http://{}/'.format( domain ) ) )
+                            
+                        except HydrusExceptions.URLClassException:
+                            
+                            pass
+                            
+                        
+                        domain_ids = set()
+                        
+                        for possible_domain in possible_domains:
+                            
+                            domain_ids.update( self._STS( self._Execute( 'SELECT domain_id FROM url_domains WHERE domain = ?;', ( possible_domain, ) ) ) )
+                            
+                        
+                    elif domain.isascii():
+                        
+                        # normalisation leaves ascii alone, but a combining character in the url could merge into the hint's last character
+                        domain_ids = self._STS( self._Execute( 'SELECT domain_id FROM url_domains WHERE domain LIKE ? ESCAPE \'\\\' OR domain = ?;', ( ConvertLiteralToLikePhrase( domain[ : -1 ] ) + '%', 'unknown.com' ) ) )
+                        
+                    
+                    # else we cannot say what a non-ascii prefix normalises to, so we scan everything
+                    
                 
             
-            result_hash_ids = set()
+            # LIKE is a fast C scan, and a superset of what the regex wants, so we only run the python regex on what gets through
+            url_predicates = [ 'url LIKE ? ESCAPE \'\\\'' for literal in literals ]
+            url_predicate_args = [ '%' + ConvertLiteralToLikePhrase( literal ) + '%' for literal in literals ]
             
-            for ( hash_id, url ) in self._Execute( select ):
+            def url_test( url ):
                 
-                if hash_id not in result_hash_ids and re.search( regex, url ) is not None:
-                    
-                    result_hash_ids.add( hash_id )
-                    
+                return compiled_regex.search( url ) is not None
                 
             
-            return result_hash_ids
+            return self._GetHashIdsFromURLTest( url_test, domain_ids, hash_ids = hash_ids, hash_ids_table_name = hash_ids_table_name, url_predicates = url_predicates, url_predicate_args = url_predicate_args )
             
         
     
@@ -256,3 +694,10 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def RegenerateDomainURLCounts( self ):
+        
+        self._Execute( 'DELETE FROM url_map_domain_counts;' )
+        
+        self._Execute( 'INSERT INTO url_map_domain_counts ( domain_id, url_count ) SELECT domain_id, COUNT( * ) FROM url_map CROSS JOIN urls USING ( url_id ) GROUP BY domain_id;' )
+        
+    
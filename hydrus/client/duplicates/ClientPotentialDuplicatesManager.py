@@ -1,10 +1,47 @@
 import threading
 import typing
 
+from hydrus.core import HydrusNumbers
 from hydrus.core import HydrusTime
 
 from hydrus.client import ClientDaemons
 from hydrus.client import ClientGlobals as CG
+from hydrus.client import ClientThreading
+from hydrus.client.duplicates import ClientVPTreeBuilder
+
+def RegenerateSimilarFilesTree():
+    
+    # the db only does the quick snapshot and commit. the tree itself is built on this thread, so the db and gui stay responsive
+    
+    job_status = ClientThreading.JobStatus()
+    
+    try:
+        
+        job_status.SetStatusTitle( 'regenerating similar file search data' )
+        
+        CG.client_controller.pub( 'message', job_status )
+        
+        job_status.SetStatusText( 'gathering all leaves' )
+        
+        ( perceptual_hash_ids, perceptual_hashes ) = CG.client_controller.WriteSynchronous( 'regenerate_similar_files_tree_snapshot' )
+        
+        job_status.SetStatusText( HydrusNumbers.ToHumanInt( len( perceptual_hash_ids ) ) + ' leaves found, now regenerating' )
+        
+        rows = ClientVPTreeBuilder.GenerateVPTreeRows( perceptual_hash_ids, perceptual_hashes, job_status = job_status )
+        
+        job_status.SetStatusText( 'tree constructed, now committing', 2 )
+        
+        CG.client_controller.WriteSynchronous( 'regenerate_similar_files_tree_commit', perceptual_hash_ids, rows )
+        
+    finally:
+        
+        job_status.SetStatusText( 'done!' )
+        job_status.DeleteStatusText( level = 2 )
+        
+        job_status.FinishAndDismiss( 5 )
+        
+    
+
 
 class PotentialDuplicatesMaintenanceNumbersStore( object ):
     
@@ -0,0 +1,358 @@
+import collections.abc
+import concurrent.futures
+import os
+
+import numpy
+
+from hydrus.core import HydrusNumbers
+
+# the vp-tree tables store NULL for a missing child or a leaf's radius. these arrays use -1
+NULL_ID = -1
+
+# picking a vantage point: we try some candidates against a sample of the branch, and we prefer a 50/50 split with a wide spread of distances
+MAX_VIEWPOINTS = 256
+MAX_SAMPLE = 64
+
+# cap on how many candidate-to-sample distances we hold in memory at once when scoring many small branches together
+MAX_SCORING_CELLS = 1 << 22
+
+# below this many nodes, it isn't worth farming subtrees out to other threads
+PARALLEL_MIN_NODES = 65536
+
+def GetPerceptualHashArray( perceptual_hashes: collections.abc.Collection[ bytes ] ) -> numpy.ndarray:
+    
+    # hamming distance only cares about which bits differ, so byte order does not matter as long as we are consistent
+    return numpy.frombuffer( b''.join( perceptual_hashes ), dtype = '>u8' ).astype( numpy.uint64 )
+    
+
+if hasattr( numpy, 'bitwise_count' ):
+    
+    def PopCount( array: numpy.ndarray ) -> numpy.ndarray:
+        
+        return numpy.bitwise_count( array )
+        
+    
+else:
+    
+    # older numpy, so we do the classic SWAR popcount. uint64 multiplication wraps, which is what we want
+    
+    POPCOUNT_M1 = numpy.uint64( 0x5555555555555555 )
+    POPCOUNT_M2 = numpy.uint64( 0x3333333333333333 )
+    POPCOUNT_M4 = numpy.uint64( 0x0f0f0f0f0f0f0f0f )
+    POPCOUNT_H01 = numpy.uint64( 0x0101010101010101 )
+    
+    def PopCount( array: numpy.ndarray ) -> numpy.ndarray:
+        
+        array = array - ( ( array >> numpy.uint64( 1 ) ) & POPCOUNT_M1 )
+        array = ( array & POPCOUNT_M2 ) + ( ( array >> numpy.uint64( 2 ) ) & POPCOUNT_M2 )
+        array = ( array + ( array >> numpy.uint64( 4 ) ) ) & POPCOUNT_M4
+        
+        with numpy.errstate( over = 'ignore' ):
+            
+            array = array * POPCOUNT_H01
+            
+        
+        return array >> numpy.uint64( 56 )
+        
+    
+
+def ChooseVantagePoints( values: numpy.ndarray, segment_starts: numpy.ndarray, segment_counts: numpy.ndarray, rng: numpy.random.Generator ) -> numpy.ndarray:
+    
+    # values holds several branches back to back. for each branch, we return the offset of its best root
+    
+    best_offsets = numpy.zeros( len( segment_counts ), dtype = numpy.int64 )
+    
+    # a branch of one is easy. we do similar sizes together so we don't pad much
+    todo = numpy.flatnonzero( segment_counts > 1 )
+    todo = todo[ numpy.argsort( segment_counts[ todo ], kind = 'stable' ) ]
+    
+    sorted_counts = segment_counts[ todo ]
+    
+    i = 0
+    
+    while i < len( todo ):
+        
+        smallest_count = int( sorted_counts[ i ] )
+        
+        similar_end = int( numpy.searchsorted( sorted_counts, min( smallest_count * 2, MAX_VIEWPOINTS ), side = 'right' ) )
+        
+        largest_count = int( sorted_counts[ max( i, similar_end - 1 ) ] )
+        
+        num_viewpoints = min( largest_count, MAX_VIEWPOINTS )
+        num_samples = min( largest_count, MAX_SAMPLE )
+        
+        num_in_chunk = max( 1, min( similar_end - i, MAX_SCORING_CELLS // ( num_viewpoints * num_samples ) ) )
+        
+        chunk = todo[ i : i + num_in_chunk ]
+        
+        i += num_in_chunk
+        
+        starts = segment_starts[ chunk ][ :, None ]
+        counts = segment_counts[ chunk ][ :, None ]
+        
+        # a branch small enough to look at in full gets every offset, padded out. otherwise we sample at random
+        
+        viewpoint_offsets = numpy.where( counts <= num_viewpoints, numpy.arange( num_viewpoints )[ None, : ], ( rng.random( ( len( chunk ), num_viewpoints ) ) * counts ).astype( numpy.int64 ) )
+        sample_offsets = numpy.where( counts <= num_samples, numpy.arange( num_samples )[ None, : ], ( rng.random( ( len( chunk ), num_samples ) ) * counts ).astype( numpy.int64 ) )
+        
+        viewpoints_valid = viewpoint_offsets < counts
+        samples_valid = sample_offsets < counts
+        
+        viewpoint_values = values[ starts + numpy.minimum( viewpoint_offsets, counts - 1 ) ]
+        sample_values = values[ starts + numpy.minimum( sample_offsets, counts - 1 ) ]
+        
+        views = PopCount( numpy.bitwise_xor( viewpoint_values[ :, :, None ], sample_values[ :, None, : ] ) ).astype( numpy.int16 )
+        
+        valid = viewpoints_valid[ :, :, None ] & samples_valid[ :, None, : ] & ( viewpoint_offsets[ :, :, None ] != sample_offsets[ :, None, : ] )
+        
+        # invalid views sort to the end, out of the way
+        views = numpy.where( valid, views, 255 )
+        
+        num_views = valid.sum( axis = 2 )
+        safe_num_views = numpy.maximum( num_views, 1 )
+        
+        # let's figure out the ratio of left_children to right_children, preferring 1:1, and convert it to a discrete integer score
+        
+        median_index = numpy.minimum( num_views // 2, num_samples - 1 )
+        
+        radius = numpy.take_along_axis( numpy.sort( views, axis = 2 ), median_index[ :, :, None ], axis = 2 )
+        
+        num_left = ( valid & ( views < radius ) ).sum( axis = 2 )
+        num_radius = ( valid & ( views == radius ) ).sum( axis = 2 )
+        num_right = num_views - num_left - num_radius
+        
+        left_gets_radius = num_left <= num_right
+        
+        num_left = numpy.where( left_gets_radius, num_left + num_radius, num_left )
+        num_right = numpy.where( left_gets_radius, num_right, num_right + num_radius )
+        
+        smaller = numpy.minimum( num_left, num_right )
+        larger = numpy.maximum( num_left, num_right )
+        
+        ratio_score = ( smaller / numpy.maximum( larger, 1 ) * MAX_SAMPLE / 2 ).astype( numpy.int64 )
+        
+        # now let's calc the standard deviation--larger sd tends to mean less sphere overlap when searching
+        
+        mean_view = numpy.where( valid, views, 0 ).sum( axis = 2 ) / safe_num_views
+        sd = numpy.sqrt( numpy.where( valid, ( views - mean_view[ :, :, None ] ) ** 2, 0 ).sum( axis = 2 ) / safe_num_views )
+        
+        # sd is never more than 64, so this orders by ratio_score, then sd
+        scores = numpy.where( viewpoints_valid & ( num_views > 0 ), ratio_score * 1000 + sd, -1.0 )
+        
+        best_offsets[ chunk ] = viewpoint_offsets[ numpy.arange( len( chunk ) ), numpy.argmax( scores, axis = 1 ) ]
+        
+    
+    return best_offsets
+    
+
+def _GenerateLevels( perceptual_hash_ids, perceptual_hashes, segment_roots, segment_parent_ids, child_positions, child_segments, rng, job_status = None, num_done = 0, num_to_do = 0, split_when_wider_than = None ):
+    
+    # we build the tree a level at a time. each 'segment' is a node at this level, and its children are contiguous in child_positions
+    # positions are indices into the perceptual_hash_ids and perceptual_hashes arrays
+    
+    row_blocks = []
+    
+    while len( segment_roots ) > 0:
+        
+        if job_status is not None:
+            
+            job_status.SetStatusText( 'generating new branch -- ' + HydrusNumbers.ValueRangeToPrettyString( num_done, num_to_do ), 2 )
+            
+        
+        num_segments = len( segment_roots )
+        
+        if split_when_wider_than is not None and num_segments >= split_when_wider_than:
+            
+            return ( row_blocks, ( segment_roots, segment_parent_ids, child_positions, child_segments ) )
+            
+        
+        counts = numpy.bincount( child_segments, minlength = num_segments )
+        
+        distances = PopCount( numpy.bitwise_xor( perceptual_hashes[ child_positions ], perceptual_hashes[ segment_roots ][ child_segments ] ) ).astype( numpy.int64 )
+        
+        order = numpy.lexsort( ( distances, child_segments ) )
+        
+        child_positions = child_positions[ order ]
+        child_segments = child_segments[ order ]
+        distances = distances[ order ]
+        
+        has_children = counts > 0
+        
+        starts = numpy.cumsum( counts ) - counts
+        
+        median_radius = numpy.full( num_segments, NULL_ID, dtype = numpy.int64 )
+        median_radius[ has_children ] = distances[ starts[ has_children ] + counts[ has_children ] // 2 ]
+        
+        child_median_radius = median_radius[ child_segments ]
+        
+        num_inner = numpy.bincount( child_segments[ distances < child_median_radius ], minlength = num_segments )
+        num_on_radius = numpy.bincount( child_segments[ distances == child_median_radius ], minlength = num_segments )
+        num_outer = counts - num_inner - num_on_radius
+        
+        # same as ever--the median children go whichever side is smaller
+        radius = numpy.where( num_inner <= num_outer, median_radius, median_radius - 1 )
+        radius[ ~has_children ] = NULL_ID
+        
+        child_is_outer = distances > radius[ child_segments ]
+        
+        inner_populations = numpy.bincount( child_segments[ ~child_is_outer ], minlength = num_segments )
+        outer_populations = counts - inner_populations
+        
+        # now regroup the children into the next level's segments, two per segment here, and pick their roots
+        
+        keys = child_segments * 2 + child_is_outer
+        
+        order = numpy.argsort( keys, kind = 'stable' )
+        
+        child_positions = child_positions[ order ]
+        keys = keys[ order ]
+        
+        ( next_keys, next_starts, next_counts ) = numpy.unique( keys, return_index = True, return_counts = True )
+        
+        root_indices = next_starts + ChooseVantagePoints( perceptual_hashes[ child_positions ], next_starts, next_counts, rng )
+        
+        next_segment_roots = child_positions[ root_indices ]
+        
+        inner_ids = numpy.full( num_segments, NULL_ID, dtype = numpy.int64 )
+        outer_ids = numpy.full( num_segments, NULL_ID, dtype = numpy.int64 )
+        
+        next_is_outer = ( next_keys % 2 ) == 1
+        
+        inner_ids[ next_keys[ ~next_is_outer ] // 2 ] = perceptual_hash_ids[ next_segment_roots[ ~next_is_outer ] ]
+        outer_ids[ next_keys[ next_is_outer ] // 2 ] = perceptual_hash_ids[ next_segment_roots[ next_is_outer ] ]
+        
+        segment_ids = perceptual_hash_ids[ segment_roots ]
+        
+        row_blocks.append( ( segment_ids, segment_parent_ids, radius, inner_ids, inner_populations, outer_ids, outer_populations ) )
+        
+        num_done += num_segments
+        
+        keep = numpy.ones( len( child_positions ), dtype = bool )
+        keep[ root_indices ] = False
+        
+        child_segments = numpy.repeat( numpy.arange( len( next_keys ), dtype = numpy.int64 ), next_counts )[ keep ]
+        child_positions = child_positions[ keep ]
+        
+        segment_parent_ids = segment_ids[ next_keys // 2 ]
+        segment_roots = next_segment_roots
+        
+    
+    return ( row_blocks, None )
+    
+
+def GenerateVPTreeRows( perceptual_hash_ids: numpy.ndarray, perceptual_hashes: numpy.ndarray, parent_id = None, job_status = None, num_threads = None ):
+    """
+    Builds a vp-tree (or a branch of one) over the given phash ids and phashes, returning seven parallel arrays, one per shape_vptree column.
+    NULL_ID stands in for NULL. This touches no database, so it can run on any thread.
+    """
+    
+    perceptual_hash_ids = numpy.asarray( perceptual_hash_ids, dtype = numpy.int64 )
+    perceptual_hashes = numpy.asarray( perceptual_hashes, dtype = numpy.uint64 )
+    
+    num_to_do = len( perceptual_hash_ids )
+    
+    if num_to_do == 0:
+        
+        return tuple( numpy.zeros( 0, dtype = numpy.int64 ) for i in range( 7 ) )
+        
+    
+    if num_threads is None:
+        
+        num_threads = min( os.cpu_count() or 1, 8 )
+        
+    
+    rng = numpy.random.default_rng()
+    
+    root_position = int( ChooseVantagePoints( perceptual_hashes, numpy.array( [ 0 ] ), numpy.array( [ num_to_do ] ), rng )[0] )
+    
+    child_positions = numpy.delete( numpy.arange( num_to_do, dtype = numpy.int64 ), root_position )
+    
+    segment_roots = numpy.array( [ root_position ], dtype = numpy.int64 )
+    segment_parent_ids = numpy.array( [ NULL_ID if parent_id is None else parent_id ], dtype = numpy.int64 )
+    child_segments = numpy.zeros( len( child_positions ), dtype = numpy.int64 )
+    
+    if num_threads > 1 and num_to_do >= PARALLEL_MIN_NODES:
+        
+        # numpy lets go of the GIL for the heavy lifting, so once the tree is a few levels wide, each thread can take some subtrees
+        split_when_wider_than = num_threads * 4
+        
+    else:
+        
+        split_when_wider_than = None
+        
+    
+    ( row_blocks, remainder ) = _GenerateLevels( perceptual_hash_ids, perceptual_hashes, segment_roots, segment_parent_ids, child_positions, child_segments, rng, job_status = job_status, num_to_do = num_to_do, split_when_wider_than = split_when_wider_than )
+    
+    if remainder is not None:
+        
+        ( segment_roots, segment_parent_ids, child_positions, child_segments ) = remainder
+        
+        if job_status is not None:
+            
+            job_status.SetStatusText( f'generating new branch over {num_threads} threads', 2 )
+            
+        
+        # children are grouped by segment, so we cut the segments into runs of roughly equal population
+        
+        counts = numpy.bincount( child_segments, minlength = len( segment_roots ) )
+        
+        segment_cuts = numpy.searchsorted( numpy.cumsum( counts ), numpy.linspace( 0, counts.sum(), num_threads + 1 )[ 1 : -1 ], side = 'right' )
+        segment_cuts = numpy.concatenate( ( [ 0 ], segment_cuts, [ len( segment_roots ) ] ) )
+        
+        child_cuts = numpy.searchsorted( child_segments, segment_cuts )
+        
+        with concurrent.futures.ThreadPoolExecutor( max_workers = num_threads ) as executor:
+            
+            futures = []
+            
+            for ( segment_start, segment_end, child_start, child_end ) in zip( segment_cuts[ : -1 ], segment_cuts[ 1 : ], child_cuts[ : -1 ], child_cuts[ 1 : ] ):
+                
+                if segment_start == segment_end:
+                    
+                    continue
+                    
+                
+                futures.append(
+                    executor.submit(
+                        _GenerateLevels,
+                        perceptual_hash_ids,
+                        perceptual_hashes,
+                        segment_roots[ segment_start : segment_end ],
+                        segment_parent_ids[ segment_start : segment_end ],
+                        child_positions[ child_start : child_end ],
+                        child_segments[ child_start : child_end ] - segment_start,
+                        numpy.random.default_rng( rng.integers( 2 ** 32 ) )
+                    )
+                )
+                
+            
+            for future in futures:
+                
+                ( thread_row_blocks, thread_remainder ) = future.result()
+                
+                row_blocks.extend( thread_row_blocks )
+                
+            
+        
+    
+    return tuple( numpy.concatenate( column_blocks ) for column_blocks in zip( *row_blocks ) )
+    
+
+def IterateVPTreeRows( rows, chunk_size = 100000 ):
+    
+    # turns the arrays from GenerateVPTreeRows into database rows, a chunk at a time so we don't make millions of python ints at once
+    
+    ( perceptual_hash_ids, parent_ids, radii, inner_ids, inner_populations, outer_ids, outer_populations ) = rows
+    
+    for i in range( 0, len( perceptual_hash_ids ), chunk_size ):
+        
+        columns = [ column[ i : i + chunk_size ].tolist() for column in ( perceptual_hash_ids, parent_ids, radii, inner_ids, inner_populations, outer_ids, outer_populations ) ]
+        
+        for column_index in ( 1, 2, 3, 5 ):
+            
+            columns[ column_index ] = [ None if value == NULL_ID else value for value in columns[ column_index ] ]
+            
+        
+        yield from zip( *columns )
+        
+    
@@ -153,7 +153,7 @@ class VisualDataStorage( ClientCachesBase.DataCache ):
     
     def __init__( self ):
         
-        super().__init__( CG.client_controller, 'visual_data', 5 * 1024 * 1024 )
+        super().__init__( CG.client_controller, 'visual_data', 5 * 1024 * 1024, eviction_policy = ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
         
     
     @staticmethod
@@ -174,7 +174,7 @@ class VisualDataTiledStorage( ClientCachesBase.DataCache ):
     
     def __init__( self ):
         
-        super().__init__( CG.client_controller, 'visual_data_tiled', 32 * 1024 * 1024 )
+        super().__init__( CG.client_controller, 'visual_data_tiled', 32 * 1024 * 1024, eviction_policy = ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
         
     
     @staticmethod
@@ -13,6 +13,7 @@ from qtpy import QtGui as QG
 from hydrus.client.search import ClientSearchFileSearchContext
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBPopulateCache
 from hydrus.core import HydrusEnvironment
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
@@ -33,6 +34,8 @@ from hydrus.client import ClientLocation
 from hydrus.client import ClientPaths
 from hydrus.client import ClientServices
 from hydrus.client import ClientThreading
+from hydrus.client.caches import ClientCachesBase
+from hydrus.client.duplicates import ClientPotentialDuplicatesManager
 from hydrus.client.exporting import ClientExportingFiles
 from hydrus.client.gui import ClientGUIAboutWindow
 from hydrus.client.gui import ClientGUIAsync
@@ -1609,6 +1612,88 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             
         
     
+    def _DebugShowCacheStats( self ):
+        
+        lines = []
+        
+        for d in ClientCachesBase.GetAllDataCacheStats():
+            
+            num_lookups = d[ 'num_hits' ] + d[ 'num_misses' ]
+            
+            if num_lookups > 0:
+                
+                pretty_hit_rate = HydrusNumbers.FloatToPercentage( d[ 'num_hits' ] / num_lookups )
+                
+            else:
+                
+                pretty_hit_rate = 'n/a'
+                
+            
+            lines.append( '{}: {} items, {}, {} hits, {} misses ({} hit rate), {} evictions ({})'.format(
+                d[ 'name' ],
+                HydrusNumbers.ToHumanInt( d[ 'num_items' ] ),
+                HydrusData.ConvertValueRangeToBytes( d[ 'size' ], d[ 'size_limit' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_hits' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_misses' ] ),
+                pretty_hit_rate,
+                HydrusNumbers.ToHumanInt( d[ 'num_evictions' ] ),
+                HydrusData.ToHumanBytes( d[ 'num_bytes_evicted' ] )
+            ) )
+            
+        
+        for d in HydrusDBPopulateCache.GetAllIdCacheStats():
+            
+            num_lookups = d[ 'num_hits' ] + d[ 'num_misses' ]
+            
+            if num_lookups > 0:
+                
+                pretty_hit_rate = HydrusNumbers.FloatToPercentage( d[ 'num_hits' ] / num_lookups )
+                
+            else:
+                
+                pretty_hit_rate = 'n/a'
+                
+            
+            lines.append( '{} id cache: {} items, {} hits, {} misses ({} hit rate), {} evictions'.format(
+                d[ 'name' ],
+                HydrusNumbers.ValueRangeToPrettyString( d[ 'num_items' ], d[ 'max_size' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_hits' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_misses' ] ),
+                pretty_hit_rate,
+                HydrusNumbers.ToHumanInt( d[ 'num_evictions' ] )
+            ) )
+            
+        
+        from hydrus.client.db import ClientDBFilesSearchCache
+        
+        for d in ClientDBFilesSearchCache.GetAllDependencyCacheStats():
+            
+            num_lookups = d[ 'num_hits' ] + d[ 'num_misses' ]
+            
+            if num_lookups > 0:
+                
+                pretty_hit_rate = HydrusNumbers.FloatToPercentage( d[ 'num_hits' ] / num_lookups )
+                
+            else:
+                
+                pretty_hit_rate = 'n/a'
+                
+            
+            lines.append( '{}: {} items, {}, {} hits, {} misses ({} hit rate), {} invalidations, {} of db time saved'.format(
+                d[ 'name' ],
+                HydrusNumbers.ToHumanInt( d[ 'num_items' ] ),
+                HydrusData.ConvertValueRangeToBytes( d[ 'size' ], d[ 'size_limit' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_hits' ] ),
+                HydrusNumbers.ToHumanInt( d[ 'num_misses' ] ),
+                pretty_hit_rate,
+                HydrusNumbers.ToHumanInt( d[ 'num_invalidations' ] ),
+                HydrusTime.TimeDeltaToPrettyTimeDelta( d[ 'time_saved' ] )
+            ) )
+            
+        
+        HydrusData.ShowText( '\n'.join( lines ) )
+        
+    
     def _DebugShowMemoryUseDifferences( self ):
         
         if not HydrusMemory.PYMPLER_OK:
@@ -3461,6 +3546,7 @@ ATTACH "client.mappings.db" as external_mappings;'''
         ClientGUIMenus.AppendMenuItem( regen_submenu, 'tag text search cache' + HC.UNICODE_ELLIPSIS, 'Delete and regenerate the cache hydrus uses for fast tag search.', self._RegenerateTagCache )
         ClientGUIMenus.AppendMenuItem( regen_submenu, 'tag text search cache (subtags repopulation)' + HC.UNICODE_ELLIPSIS, 'Repopulate the subtags for the cache hydrus uses for fast tag search.', self._RepopulateTagCacheMissingSubtags )
         ClientGUIMenus.AppendMenuItem( regen_submenu, 'tag text search cache (searchable subtag maps)' + HC.UNICODE_ELLIPSIS, 'Regenerate the searchable subtag maps.', self._RegenerateTagCacheSearchableSubtagsMaps )
+        ClientGUIMenus.AppendMenuItem( regen_submenu, 'tag text search cache (infix search index)' + HC.UNICODE_ELLIPSIS, 'Build or remove the optional index that speeds up \'*text*\' tag searches.', self._RegenerateTagCacheSubtagTrigramIndices )
         
         ClientGUIMenus.AppendSeparator( regen_submenu )
         
@@ -3715,6 +3801,7 @@ ATTACH "client.mappings.db" as external_mappings;'''
         ClientGUIMenus.AppendMenuCheckItem( data_actions, 'db ui-hang relief mode', 'Have UI-synchronised database jobs process pending Qt events while they wait.', HG.db_ui_hang_relief_mode, self._SwitchBoolean, 'db_ui_hang_relief_mode' )
         ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
         ClientGUIMenus.AppendMenuItem( data_actions, 'force database commit', 'Command the database to flush all pending changes to disk.', CG.client_controller.ForceDatabaseCommit )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'review db job stats', 'Show how long each type of database job has been waiting and running.', self._ReviewDBJobStats )
         ClientGUIMenus.AppendMenuItem( data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
         ClientGUIMenus.AppendMenuItem( data_actions, 'scan file storage folders', 'Test out that thing.', self._DebugScanStorage )
         ClientGUIMenus.AppendMenuItem( data_actions, 'show env', 'Print your current environment variables.', HydrusEnvironment.DumpEnv )
@@ -3731,6 +3818,7 @@ ATTACH "client.mappings.db" as external_mappings;'''
         ClientGUIMenus.AppendMenuItem( memory_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
         ClientGUIMenus.AppendMenuItem( memory_actions, 'clear all rendering caches', 'Tell the image rendering system to forget all current images, tiles, and thumbs. This will often free up a bunch of memory immediately.', self._controller.ClearCaches )
         ClientGUIMenus.AppendMenuItem( memory_actions, 'clear thumbnail cache', 'Tell the thumbnail cache to forget everything and redraw all current thumbs.', self._controller.pub, 'clear_thumbnail_cache' )
+        ClientGUIMenus.AppendMenuItem( memory_actions, 'show cache stats', 'Show how big the rendering, database definition and file search result caches are and how often they hit, miss, and evict.', self._DebugShowCacheStats )
         
         if HydrusMemory.PYMPLER_OK:
             
@@ -5614,7 +5702,7 @@ ATTACH "client.mappings.db" as external_mappings;'''
         
         message = 'This will delete and then recreate the similar files search tree. This is useful if it has somehow become unbalanced and similar files searches are running slow.'
         message += '\n' * 2
-        message += 'If you have a lot of files, it can take a little while, during which the gui may hang.'
+        message += 'If you have a lot of files, it can take a little while. It works in the background, and you will see a popup with its progress.'
         message += '\n' * 2
         message += 'If you do not have a specific reason to run this, it is pointless.'
         
@@ -5622,7 +5710,7 @@ ATTACH "client.mappings.db" as external_mappings;'''
         
         if result == QW.QDialog.DialogCode.Accepted:
             
-            self._controller.Write( 'regenerate_similar_files_tree' )
+            self._controller.CallToThread( ClientPotentialDuplicatesManager.RegenerateSimilarFilesTree )
             
         
     
@@ -5651,6 +5739,40 @@ ATTACH "client.mappings.db" as external_mappings;'''
             
         
     
+    def _RegenerateTagCacheSubtagTrigramIndices( self ):
+        
+        message = 'This will build or remove an optional extra index on the fast search cache, for one or all tag services.'
+        message += '\n' * 2
+        message += 'The index makes wildcard searches that start with an asterisk, like \'*metroid*\', much faster, since they do not have to scan every tag. It costs some disk space and makes tag processing a little slower. Once built, it is kept up to date automatically.'
+        message += '\n' * 2
+        message += 'If you have a lot of tags, building it can take a little while, during which the gui may hang.'
+        
+        ( result, was_cancelled ) = ClientGUIDialogsQuick.GetYesNo( self, message, yes_label = 'build it', no_label = 'remove it', check_for_cancelled = True )
+        
+        if was_cancelled:
+            
+            return
+            
+        
+        try:
+            
+            tag_service_key = GetTagServiceKeyForMaintenance( self )
+            
+        except HydrusExceptions.CancelledException:
+            
+            return
+            
+        
+        if result == QW.QDialog.DialogCode.Accepted:
+            
+            self._controller.Write( 'regenerate_subtag_trigram_indices', tag_service_key = tag_service_key )
+            
+        elif result == QW.QDialog.DialogCode.Rejected:
+            
+            self._controller.Write( 'delete_subtag_trigram_indices', tag_service_key = tag_service_key )
+            
+        
+    
     def _RegenerateTagParentsLookupCache( self ):
         
         message = 'This will delete and then recreate the tag parents lookup cache, which is used for all basic tag parents operations. This is useful if it has become damaged or otherwise desynchronised.'
@@ -5988,6 +6110,15 @@ ATTACH "client.mappings.db" as external_mappings;'''
         frame.SetPanel( panel )
         
     
+    def _ReviewDBJobStats( self ):
+        
+        frame = ClientGUITopLevelWindowsPanels.FrameThatTakesScrollablePanel( self, 'review db job stats' )
+        
+        panel = ClientGUIScrolledPanelsReview.ReviewDBJobStats( frame, self._controller )
+        
+        frame.SetPanel( panel )
+        
+    
     def _ReviewDeferredDeleteTableData( self ):
         
         frame = ClientGUITopLevelWindowsPanels.FrameThatTakesScrollablePanel( self, 'review deferred delete data' )
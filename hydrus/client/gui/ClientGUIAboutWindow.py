@@ -164,6 +164,7 @@ def ShowAboutWindow( win: QW.QWidget ):
     
     library_version_lines.append( 'db cache size per file: {}MB'.format( HG.db_cache_size ) )
     library_version_lines.append( 'db journal mode: {}'.format( HG.db_journal_mode ) )
+    library_version_lines.append( 'db read connections: {}'.format( HG.db_read_connections ) )
     library_version_lines.append( 'db synchronous mode: {}'.format( HG.db_synchronous ) )
     library_version_lines.append( 'db transaction commit period: {}'.format( HydrusTime.TimeDeltaToPrettyTimeDelta( HG.db_transaction_commit_period ) ) )
     library_version_lines.append( 'db using memory for temp?: {}'.format( HG.no_db_temp_files ) )
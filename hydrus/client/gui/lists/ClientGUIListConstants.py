@@ -1663,3 +1663,38 @@ register_column_type( COLUMN_LIST_URL_CLASS_IMPORT_OPTIONS.ID, COLUMN_LIST_URL_C
 register_column_type( COLUMN_LIST_URL_CLASS_IMPORT_OPTIONS.ID, COLUMN_LIST_URL_CLASS_IMPORT_OPTIONS.SUMMARY, 'summary', False, 20, True )
 
 default_column_list_sort_lookup[ COLUMN_LIST_URL_CLASS_IMPORT_OPTIONS.ID ] = ( COLUMN_LIST_URL_CLASS_IMPORT_OPTIONS.NAME, True )
+
+class COLUMN_LIST_DB_JOB_STATS( COLUMN_LIST_DEFINITION ):
+    
+    ID = 78
+    
+    JOB_TYPE = 0
+    ACTION = 1
+    COUNT = 2
+    TOTAL_RUN_TIME = 3
+    RUN_P50 = 4
+    RUN_P95 = 5
+    RUN_P99 = 6
+    MAX_RUN_TIME = 7
+    WAIT_P50 = 8
+    WAIT_P95 = 9
+    WAIT_P99 = 10
+    MAX_WAIT_TIME = 11
+    
+
+column_list_type_name_lookup[ COLUMN_LIST_DB_JOB_STATS.ID ] = 'db job stats'
+
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.JOB_TYPE, 'type', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.ACTION, 'action', False, 36, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.COUNT, 'count', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.TOTAL_RUN_TIME, 'total run', False, 12, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.RUN_P50, 'run p50', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.RUN_P95, 'run p95', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.RUN_P99, 'run p99', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.MAX_RUN_TIME, 'max run', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.WAIT_P50, 'wait p50', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.WAIT_P95, 'wait p95', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.WAIT_P99, 'wait p99', False, 10, True )
+register_column_type( COLUMN_LIST_DB_JOB_STATS.ID, COLUMN_LIST_DB_JOB_STATS.MAX_WAIT_TIME, 'max wait', False, 10, True )
+
+default_column_list_sort_lookup[ COLUMN_LIST_DB_JOB_STATS.ID ] = ( COLUMN_LIST_DB_JOB_STATS.TOTAL_RUN_TIME, False )
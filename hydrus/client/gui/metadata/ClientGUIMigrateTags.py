@@ -185,6 +185,14 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         self._migration_action = ClientGUICommon.BetterChoice( self._migration_panel )
         
+        self._migration_destination_bulk_ingest = QW.QCheckBox( 'bulk import', self._migration_panel )
+        
+        tt = 'For very big jobs, like a whole Hydrus Tag Archive into a local tag service. The rows are staged and then written to the service in large sorted blocks, and the tag caches for the service are regenerated once at the end, rather than updated for every row.'
+        tt += '\n' * 2
+        tt += 'This is much faster for millions of rows, but the regen at the end takes a while on its own and the service\'s siblings and parents will resync afterwards, so it is not worth it for small jobs. If the job is interrupted, the staged rows are kept and the next bulk import to the same service will finish them.'
+        
+        self._migration_destination_bulk_ingest.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
+        
         self._migration_go = ClientGUICommon.BetterButton( self._migration_panel, 'Go!', self._MigrationGo )
         
         #
@@ -213,6 +221,11 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         QP.AddToLayout( tag_right_vbox, self._migration_source_right_tag_pair_filter, CC.FLAGS_EXPAND_PERPENDICULAR )
         QP.AddToLayout( tag_right_vbox, self._pair_have_count_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
         
+        dest_vbox = QP.VBoxLayout()
+        
+        QP.AddToLayout( dest_vbox, self._migration_destination_archive_path_button, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( dest_vbox, self._migration_destination_bulk_ingest, CC.FLAGS_EXPAND_PERPENDICULAR )
+        
         dest_hash_type_hbox = QP.HBoxLayout()
         
         QP.AddToLayout( dest_hash_type_hbox, self._migration_destination_hash_type_choice_st, CC.FLAGS_CENTER_PERPENDICULAR )
@@ -245,7 +258,7 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         QP.AddToLayout( gridbox, self._migration_source_archive_path_button, CC.FLAGS_EXPAND_PERPENDICULAR )
         QP.AddToLayout( gridbox, file_left_vbox, CC.FLAGS_EXPAND_PERPENDICULAR )
         ClientGUICommon.AddGridboxStretchSpacer( self._migration_panel, gridbox )
-        QP.AddToLayout( gridbox, self._migration_destination_archive_path_button, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( gridbox, dest_vbox, CC.FLAGS_EXPAND_PERPENDICULAR )
         ClientGUICommon.AddGridboxStretchSpacer( self._migration_panel, gridbox )
         
         ClientGUICommon.AddGridboxStretchSpacer( self._migration_panel, gridbox )
@@ -290,6 +303,7 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         self._migration_source.activated.connect( self._UpdateMigrationControlsNewSource )
         self._migration_destination.activated.connect( self._UpdateMigrationControlsNewDestination )
         self._migration_source_content_status_filter.activated.connect( self._UpdateMigrationControlsActions )
+        self._migration_action.activated.connect( self._UpdateMigrationControlsBulkIngest )
         self._migration_source_file_filtering_type.activated.connect( self._UpdateMigrationControlsFileFilter )
         
         self._migration_source_worse_must_have_count.clicked.connect( self._UpdateMigrationControlsPairCount )
@@ -350,6 +364,8 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
                 
                 destination = ClientMigration.MigrationDestinationTagServiceMappings( CG.client_controller, destination_service_key, content_action )
                 
+                destination.SetBulkIngest( self._migration_destination_bulk_ingest.isChecked() )
+                
             
             file_filtering_type = self._migration_source_file_filtering_type.GetValue()
             
@@ -795,6 +811,25 @@ class MigrateTagsPanel( ClientGUIScrolledPanels.ReviewPanel ):
             self._migration_action.setEnabled( False )
             
         
+        self._UpdateMigrationControlsBulkIngest()
+        
+    
+    def _UpdateMigrationControlsBulkIngest( self ):
+        
+        content_type = self._migration_content_type.GetValue()
+        destination = self._migration_destination.GetValue()
+        
+        can_bulk_ingest = False
+        
+        if content_type == HC.CONTENT_TYPE_MAPPINGS and destination not in ( self.HTA_SERVICE_KEY, self.HTPA_SERVICE_KEY ):
+            
+            destination_service = CG.client_controller.services_manager.GetService( destination )
+            
+            can_bulk_ingest = destination_service.GetServiceType() == HC.LOCAL_TAG and self._migration_action.GetValue() == HC.CONTENT_UPDATE_ADD
+            
+        
+        self._migration_destination_bulk_ingest.setVisible( can_bulk_ingest )
+        
     
     def _UpdateMigrationControlsFileFilter( self ):
         
@@ -5,6 +5,7 @@ from qtpy import QtWidgets as QW
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusNumbers
+from hydrus.core import HydrusTime
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientGlobals as CG
@@ -218,6 +219,16 @@ class ReviewTagDisplayMaintenancePanel( ClientGUIScrolledPanels.ReviewPanel ):
                     sync_halted = True
                     
                 
+                sync_rows_per_second = status[ 'sync_rows_per_second' ]
+                
+                if num_items_to_regen > 0 and not sync_halted and sync_rows_per_second is not None and sync_rows_per_second > 0 and CG.client_controller.tag_display_maintenance_manager.CurrentlyGoingFaster( self._service_key ):
+                    
+                    eta = num_items_to_regen / sync_rows_per_second
+                    
+                    message += '\n' * 2
+                    message += 'Working at about {:.1f} rules/s, so roughly {} to go.'.format( sync_rows_per_second, HydrusTime.TimeDeltaToPrettyTimeDelta( eta ) )
+                    
+                
                 self._siblings_and_parents_st.setText( message )
                 
                 #
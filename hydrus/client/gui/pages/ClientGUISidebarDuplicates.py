@@ -543,7 +543,7 @@ class PreparationPanel( QW.QWidget ):
         
         message = 'This will delete and then recreate the similar files search tree. This is useful if it has orphans or if you suspect it has become unbalanced in a way that maintenance cannot correct.'
         message += '\n' * 2
-        message += 'If you have a lot of files, it can take a little while, during which the gui may hang.'
+        message += 'If you have a lot of files, it can take a little while. It works in the background, and you will see a popup with its progress.'
         message += '\n' * 2
         message += 'If you do not have a specific reason to run this, it is pointless.'
         
@@ -551,7 +551,7 @@ class PreparationPanel( QW.QWidget ):
         
         if result == QW.QDialog.DialogCode.Accepted:
             
-            CG.client_controller.Write( 'regenerate_similar_files_tree' )
+            CG.client_controller.CallToThread( ClientPotentialDuplicatesManager.RegenerateSimilarFilesTree )
             
         
     
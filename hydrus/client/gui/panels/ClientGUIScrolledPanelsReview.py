@@ -1799,6 +1799,95 @@ class ThreadsPanel( QW.QWidget ):
         
     
 
+class ReviewDBJobStats( ClientGUIScrolledPanels.ReviewPanel ):
+    
+    def __init__( self, parent: QW.QWidget, controller: "CG.ClientController.Controller" ):
+        
+        super().__init__( parent )
+        
+        self._controller = controller
+        
+        #
+        
+        info_message = '''This is how long each type of database job has been waiting in the queue and then taking to run, this session. The counts, totals, and maxes are for the whole session, and the percentiles are for roughly the last ten to twenty minutes. If the client is lagging, the big totals and the high p99s are the jobs to look at.'''
+        
+        st = ClientGUICommon.BetterStaticText( self, label = info_message )
+        
+        st.setWordWrap( True )
+        
+        self._list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
+        
+        model = ClientGUIListCtrl.HydrusListItemModel( self, CGLC.COLUMN_LIST_DB_JOB_STATS.ID, self._ConvertRowToDisplayTuple, self._ConvertRowToSortTuple )
+        
+        self._list_ctrl = ClientGUIListCtrl.BetterListCtrlTreeView( self._list_ctrl_panel, 24, model )
+        
+        self._list_ctrl_panel.SetListCtrl( self._list_ctrl )
+        
+        self._list_ctrl_panel.AddButton( 'refresh snapshot', self._RefreshSnapshot )
+        
+        #
+        
+        self._RefreshSnapshot()
+        
+        self._list_ctrl.Sort()
+        
+        #
+        
+        vbox = QP.VBoxLayout()
+        
+        QP.AddToLayout( vbox, st, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( vbox, self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        self.widget().setLayout( vbox )
+        
+    
+    def _ConvertRowToDisplayTuple( self, row ):
+        
+        ( job_type, action, count, num_errors, total_run_time, run_p50, run_p95, run_p99, max_run_time, wait_p50, wait_p95, wait_p99, max_wait_time ) = row
+        
+        pretty_count = HydrusNumbers.ToHumanInt( count )
+        
+        if num_errors > 0:
+            
+            pretty_count += ' ({} errors)'.format( HydrusNumbers.ToHumanInt( num_errors ) )
+            
+        
+        times = ( total_run_time, run_p50, run_p95, run_p99, max_run_time, wait_p50, wait_p95, wait_p99, max_wait_time )
+        
+        pretty_times = tuple( self._ConvertTimeToPretty( t ) for t in times )
+        
+        return ( job_type, action, pretty_count ) + pretty_times
+        
+    
+    def _ConvertRowToSortTuple( self, row ):
+        
+        ( job_type, action, count, num_errors, total_run_time, run_p50, run_p95, run_p99, max_run_time, wait_p50, wait_p95, wait_p99, max_wait_time ) = row
+        
+        return ( job_type, action, count, total_run_time, run_p50, run_p95, run_p99, max_run_time, wait_p50, wait_p95, wait_p99, max_wait_time )
+        
+    
+    def _ConvertTimeToPretty( self, t: float ):
+        
+        if t >= 1:
+            
+            return HydrusTime.TimeDeltaToPrettyTimeDelta( t )
+            
+        
+        return '{:.1f}ms'.format( t * 1000 )
+        
+    
+    def _RefreshSnapshot( self ):
+        
+        db_job_stats = self._controller.GetDBJobStats()
+        
+        keys = ( 'job_type', 'action', 'count', 'num_errors', 'total_run_time', 'run_p50', 'run_p95', 'run_p99', 'max_run_time', 'wait_p50', 'wait_p95', 'wait_p99', 'max_wait_time' )
+        
+        rows = [ tuple( d[ key ] for key in keys ) for d in db_job_stats ]
+        
+        self._list_ctrl.SetData( rows )
+        
+    
+
 class ReviewDeferredDeleteTableData( ClientGUIScrolledPanels.ReviewPanel ):
     
     def __init__( self, parent: QW.QWidget, controller: "CG.ClientController.Controller" ):
@@ -51,6 +51,10 @@ class FileSearchPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         tt = 'After users get some experience with the program and a larger collection, they tend to have less use for system:everything.'
         self._show_system_everything.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
         
+        self._tag_autocomplete_in_memory_index = QW.QCheckBox( self._read_autocomplete_panel )
+        tt = 'Keep the words of every tag in memory, one index for each tag service and file domain you search, and look up typed text like "samus ar*" there rather than in the on-disk text search tables. This makes tag autocomplete much faster on large clients, particularly for the first few characters, but it costs about 25 bytes per tag word (e.g. 250MB for a tag service with ten million tags). It applies to every tag autocomplete, not just file search. Each index is built on the first search that needs it after you turn this on, which may take a few seconds for a big service.'
+        self._tag_autocomplete_in_memory_index.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
+        
         #
         
         misc_panel = ClientGUICommon.StaticBox( self, 'file search' )
@@ -84,6 +88,8 @@ class FileSearchPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         
         self._show_system_everything.setChecked( self._new_options.GetBoolean( 'show_system_everything' ) )
         
+        self._tag_autocomplete_in_memory_index.setChecked( self._new_options.GetBoolean( 'tag_autocomplete_in_memory_index' ) )
+        
         self._forced_search_limit.SetValue( self._new_options.GetNoneableInteger( 'forced_search_limit' ) )
         
         self._refresh_search_page_on_system_limited_sort_changed.setChecked( self._new_options.GetBoolean( 'refresh_search_page_on_system_limited_sort_changed' ) )
@@ -105,6 +111,7 @@ class FileSearchPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         rows.append( ( 'Autocomplete list height:', self._ac_read_list_height_num_chars ) )
         rows.append( ( 'Start new search pages in \'searching immediately\':', self._default_search_synchronised ) )
         rows.append( ( 'Show system:everything:', self._show_system_everything ) )
+        rows.append( ( 'Search tags with an in-memory index:', self._tag_autocomplete_in_memory_index ) )
         
         gridbox = ClientGUICommon.WrapInGrid( self._read_autocomplete_panel, rows )
         
@@ -148,6 +155,8 @@ class FileSearchPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         
         self._new_options.SetBoolean( 'show_system_everything', self._show_system_everything.isChecked() )
         
+        self._new_options.SetBoolean( 'tag_autocomplete_in_memory_index', self._tag_autocomplete_in_memory_index.isChecked() )
+        
         self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
         
         self._new_options.SetBoolean( 'refresh_search_page_on_system_limited_sort_changed', self._refresh_search_page_on_system_limited_sort_changed.isChecked() )
@@ -144,6 +144,10 @@ class MaintenanceAndProcessingPanel( ClientGUIOptionsPanelBase.OptionsPagePanel
         
         self._maintain_similar_files_duplicate_pairs_during_active = QW.QCheckBox( self._potential_duplicates_panel )
         
+        self._similar_files_in_memory_search_index = QW.QCheckBox( self._potential_duplicates_panel )
+        tt = 'Keep all your perceptual hashes in memory and check them all at once when searching for similar files, rather than walking the on-disk search tree. This is much faster for the potential duplicates search and "system:similar to" on large clients, but it costs about 16 bytes per perceptual hash (e.g. 160MB for ten million). The index is loaded on the first search after you turn it on.'
+        self._similar_files_in_memory_search_index.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
+        
         self._potential_duplicates_search_work_time_idle = ClientGUITime.TimeDeltaWidget( self._potential_duplicates_panel, min = 0.02, seconds = True, milliseconds = True )
         tt = 'DO NOT CHANGE UNLESS YOU KNOW WHAT YOU ARE DOING. Potential search operates on a work-rest cycle. This setting determines how long it should work for in each work packet. Actual work time will normally be a little larger than this, and on large databases the minimum work time may be upwards of several seconds.'
         self._potential_duplicates_search_work_time_idle.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
@@ -266,6 +270,7 @@ class MaintenanceAndProcessingPanel( ClientGUIOptionsPanelBase.OptionsPagePanel
         
         self._maintain_similar_files_duplicate_pairs_during_idle.setChecked( self._new_options.GetBoolean( 'maintain_similar_files_duplicate_pairs_during_idle' ) )
         self._maintain_similar_files_duplicate_pairs_during_active.setChecked( self._new_options.GetBoolean( 'maintain_similar_files_duplicate_pairs_during_active' ) )
+        self._similar_files_in_memory_search_index.setChecked( self._new_options.GetBoolean( 'similar_files_in_memory_search_index' ) )
         
         self._potential_duplicates_search_work_time_idle.SetValue( HydrusTime.SecondiseMSFloat( self._new_options.GetInteger( 'potential_duplicates_search_work_time_ms_idle' ) ) )
         self._potential_duplicates_search_rest_percentage_idle.setValue( self._new_options.GetInteger( 'potential_duplicates_search_rest_percentage_idle' ) )
@@ -429,6 +434,7 @@ class MaintenanceAndProcessingPanel( ClientGUIOptionsPanelBase.OptionsPagePanel
         rows.append( ( 'Search for potential duplicates in "normal" time: ', self._maintain_similar_files_duplicate_pairs_during_active ) )
         rows.append( ( '"Normal" ideal work packet time: ', self._potential_duplicates_search_work_time_active ) )
         rows.append( ( '"Normal" rest time percentage: ', self._potential_duplicates_search_rest_percentage_active ) )
+        rows.append( ( 'Search similar files with an in-memory index: ', self._similar_files_in_memory_search_index ) )
         
         gridbox = ClientGUICommon.WrapInGrid( self._potential_duplicates_panel, rows )
         
@@ -581,6 +587,7 @@ class MaintenanceAndProcessingPanel( ClientGUIOptionsPanelBase.OptionsPagePanel
         self._new_options.SetBoolean( 'maintain_similar_files_duplicate_pairs_during_active', self._maintain_similar_files_duplicate_pairs_during_active.isChecked() )
         self._new_options.SetInteger( 'potential_duplicates_search_work_time_ms_active', HydrusTime.MillisecondiseS( self._potential_duplicates_search_work_time_active.GetValue() ) )
         self._new_options.SetInteger( 'potential_duplicates_search_rest_percentage_active', self._potential_duplicates_search_rest_percentage_active.value() )
+        self._new_options.SetBoolean( 'similar_files_in_memory_search_index', self._similar_files_in_memory_search_index.isChecked() )
         
         self._new_options.SetBoolean( 'duplicates_auto_resolution_during_idle', self._duplicates_auto_resolution_during_idle.isChecked() )
         self._new_options.SetInteger( 'duplicates_auto_resolution_work_time_ms_idle', HydrusTime.MillisecondiseS( self._duplicates_auto_resolution_work_time_idle.GetValue() ) )
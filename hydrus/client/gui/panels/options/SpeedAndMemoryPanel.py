@@ -42,6 +42,12 @@ class SpeedAndMemoryPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         
         self._thumbnail_cache_timeout.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
         
+        self._use_thumbnail_pack_cache = QW.QCheckBox( thumbnail_cache_panel )
+        
+        tt = 'EXPERIMENTAL: Also save thumbnails, already decoded and scaled to your current thumbnail size, to a set of big cache files in your db directory. Loading a thumbnail from there skips the jpeg/png decode and any resize, which helps when scrolling big pages on a slow CPU. It costs some disk space--roughly the memory size of every thumbnail you have looked at--and is wiped and started again whenever you change your thumbnail size.'
+        
+        self._use_thumbnail_pack_cache.setToolTip( ClientGUIFunctions.WrapToolTip( tt ) )
+        
         image_cache_panel = ClientGUICommon.StaticBox( self, 'image cache', can_expand = True, start_expanded = False )
         
         self._image_cache_size = ClientGUIBytes.BytesControl( image_cache_panel )
@@ -148,6 +154,7 @@ class SpeedAndMemoryPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         self._image_tile_cache_size.SetValue( self._new_options.GetInteger( 'image_tile_cache_size' ) )
         
         self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
+        self._use_thumbnail_pack_cache.setChecked( self._new_options.GetBoolean( 'use_thumbnail_pack_cache' ) )
         self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
         self._image_tile_cache_timeout.SetValue( self._new_options.GetInteger( 'image_tile_cache_timeout' ) )
         
@@ -222,6 +229,7 @@ class SpeedAndMemoryPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         
         rows.append( ( 'Memory reserved for thumbnail cache:', thumbnails_sizer ) )
         rows.append( ( 'Thumbnail cache timeout:', self._thumbnail_cache_timeout ) )
+        rows.append( ( 'EXPERIMENTAL: Keep pre-scaled thumbnails on disk:', self._use_thumbnail_pack_cache ) )
         
         gridbox = ClientGUICommon.WrapInGrid( thumbnail_cache_panel, rows )
         
@@ -490,6 +498,7 @@ class SpeedAndMemoryPanel( ClientGUIOptionsPanelBase.OptionsPagePanel ):
         self._new_options.SetInteger( 'image_tile_cache_size', self._image_tile_cache_size.GetValue() )
         
         self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
+        self._new_options.SetBoolean( 'use_thumbnail_pack_cache', self._use_thumbnail_pack_cache.isChecked() )
         self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
         self._new_options.SetInteger( 'image_tile_cache_timeout', self._image_tile_cache_timeout.GetValue() )
         
@@ -2,6 +2,7 @@ import collections
 import collections.abc
 import itertools
 import threading
+import types
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -19,8 +20,16 @@ from hydrus.client.metadata import ClientContentUpdates
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientSearchTagContext
 
+# read-only stand-ins for the many files that have nothing in a particular slot. never write to these!
+EMPTY_DICT = types.MappingProxyType( {} )
+EMPTY_COUNTER = collections.Counter()
+
+# a big page holds one of each of these per file, so they are all slotted to skip the per-instance __dict__
+
 class FileDuplicatesManager( object ):
     
+    __slots__ = ( 'media_group_king_hash', 'alternates_group_id', 'dupe_statuses_to_count' )
+    
     def __init__( self, media_group_king_hash, alternates_group_id, dupe_statuses_to_counts ):
         
         self.media_group_king_hash = media_group_king_hash
@@ -48,6 +57,26 @@ class FileDuplicatesManager( object ):
 
 class FileInfoManager( object ):
     
+    __slots__ = (
+        'hash_id',
+        'hash',
+        'size',
+        'mime',
+        'width',
+        'height',
+        'duration_ms',
+        'num_frames',
+        'has_audio',
+        'num_words',
+        'original_mime',
+        'has_transparency',
+        'has_exif',
+        'has_human_readable_embedded_metadata',
+        'has_icc_profile',
+        'blurhash',
+        'pixel_hash'
+    )
+    
     def __init__(
         self,
         hash_id: int,
@@ -146,12 +175,21 @@ class FileInfoManager( object ):
 
 class TimesManager( object ):
     
+    __slots__ = (
+        '_simple_timestamp_types_to_timestamps_ms',
+        '_domains_to_modified_timestamps_ms',
+        '_timestamp_types_to_service_keys_to_timestamps_ms',
+        '_canvas_types_to_last_viewed_timestamps_ms',
+        '_aggregate_modified_is_generated'
+    )
+    
     def __init__( self ):
         
         self._simple_timestamp_types_to_timestamps_ms = {}
         self._domains_to_modified_timestamps_ms = {}
         
-        self._timestamp_types_to_service_keys_to_timestamps_ms = { timestamp_type : {} for timestamp_type in ClientTime.FILE_SERVICE_TIMESTAMP_TYPES }
+        # most files only have a couple of these, so the inner dicts are made on first set
+        self._timestamp_types_to_service_keys_to_timestamps_ms = {}
         
         self._canvas_types_to_last_viewed_timestamps_ms = {}
         
@@ -171,7 +209,7 @@ class TimesManager( object ):
     
     def _ClearFileServiceTime( self, timestamp_type: int, service_key: bytes ):
         
-        service_keys_to_timestamps_ms = self._timestamp_types_to_service_keys_to_timestamps_ms[ timestamp_type ]
+        service_keys_to_timestamps_ms = self._timestamp_types_to_service_keys_to_timestamps_ms.get( timestamp_type, EMPTY_DICT )
         
         if service_key in service_keys_to_timestamps_ms:
             
@@ -219,7 +257,7 @@ class TimesManager( object ):
     
     def _GetFileServiceTimestampMS( self, timestamp_type: int, service_key: bytes ) -> int | None:
         
-        return self._timestamp_types_to_service_keys_to_timestamps_ms[ timestamp_type ].get( service_key, None )
+        return self._timestamp_types_to_service_keys_to_timestamps_ms.get( timestamp_type, EMPTY_DICT ).get( service_key, None )
         
     
     def _GetLastViewedTimestampMS( self, canvas_type: int ) -> int | None:
@@ -251,6 +289,11 @@ class TimesManager( object ):
     
     def _SetFileServiceTimestampMS( self, timestamp_type: int, service_key: bytes, timestamp_ms: int ):
         
+        if timestamp_type not in self._timestamp_types_to_service_keys_to_timestamps_ms:
+            
+            self._timestamp_types_to_service_keys_to_timestamps_ms[ timestamp_type ] = {}
+            
+        
         self._timestamp_types_to_service_keys_to_timestamps_ms[ timestamp_type ][ service_key ] = timestamp_ms
         
     
@@ -555,6 +598,8 @@ class TimesManager( object ):
 
 class FileViewingStatsManager( object ):
     
+    __slots__ = ( '_times_manager', 'views', 'viewtimes_ms' )
+    
     def __init__(
         self,
         times_manager: TimesManager,
@@ -563,8 +608,9 @@ class FileViewingStatsManager( object ):
         
         self._times_manager = times_manager
         
-        self.views = collections.Counter()
-        self.viewtimes_ms = collections.Counter()
+        # most files have never been viewed, so they all share the one empty counter until they are
+        self.views = EMPTY_COUNTER
+        self.viewtimes_ms = EMPTY_COUNTER
         
         for ( canvas_type, last_viewed_timestamp_ms, views, viewtime_ms ) in view_rows:
             
@@ -575,16 +621,33 @@ class FileViewingStatsManager( object ):
             
             if views != 0:
                 
+                self._MakeCountersWritable()
+                
                 self.views[ canvas_type ] = views
                 
             
             if viewtime_ms != 0:
                 
+                self._MakeCountersWritable()
+                
                 self.viewtimes_ms[ canvas_type ] = viewtime_ms
                 
             
         
     
+    def _MakeCountersWritable( self ):
+        
+        if self.views is EMPTY_COUNTER:
+            
+            self.views = collections.Counter()
+            
+        
+        if self.viewtimes_ms is EMPTY_COUNTER:
+            
+            self.viewtimes_ms = collections.Counter()
+            
+        
+    
     def Duplicate( self, pre_duped_times_manager: TimesManager ) -> "FileViewingStatsManager":
         
         view_rows = []
@@ -684,6 +747,8 @@ class FileViewingStatsManager( object ):
                 
             
         
+        self._MakeCountersWritable()
+        
         self.views.update( file_viewing_stats_manager.views )
         self.viewtimes_ms.update( file_viewing_stats_manager.viewtimes_ms )
         
@@ -701,6 +766,8 @@ class FileViewingStatsManager( object ):
                 self._times_manager.SetLastViewedTimestampMS( canvas_type, view_timestamp_ms )
                 
             
+            self._MakeCountersWritable()
+            
             self.views[ canvas_type ] += views_delta
             self.viewtimes_ms[ canvas_type ] += viewtime_delta_ms
             
@@ -713,6 +780,8 @@ class FileViewingStatsManager( object ):
                 self._times_manager.SetLastViewedTimestampMS( canvas_type, view_timestamp_ms )
                 
             
+            self._MakeCountersWritable()
+            
             self.views[ canvas_type ] = views
             self.viewtimes_ms[ canvas_type ] = viewtime_ms
             
@@ -722,8 +791,8 @@ class FileViewingStatsManager( object ):
             self._times_manager.ClearLastViewedTime( CC.CANVAS_PREVIEW )
             self._times_manager.ClearLastViewedTime( CC.CANVAS_CLIENT_API )
             
-            self.views = collections.Counter()
-            self.viewtimes_ms = collections.Counter()
+            self.views = EMPTY_COUNTER
+            self.viewtimes_ms = EMPTY_COUNTER
             
         
     
@@ -749,6 +818,18 @@ class FileViewingStatsManager( object ):
 
 class LocationsManager( object ):
     
+    __slots__ = (
+        '_current',
+        '_deleted',
+        '_pending',
+        '_petitioned',
+        '_times_manager',
+        'inbox',
+        '_urls',
+        '_service_keys_to_filenames',
+        '_local_file_deletion_reason'
+    )
+    
     def __init__(
         self,
         current: set[ bytes ],
@@ -1356,10 +1437,22 @@ class LocationsManager( object ):
     
 class NotesManager( object ):
     
-    def __init__( self, names_to_notes: dict[ str, str ] ):
+    __slots__ = ( '_names_to_notes', '_is_shared' )
+    
+    def __init__( self, names_to_notes: dict[ str, str ], is_shared = False ):
         
         self._names_to_notes = names_to_notes
         
+        self._is_shared = is_shared
+        
+    
+    def _CheckNotShared( self ):
+        
+        if self._is_shared:
+            
+            raise Exception( 'Tried to edit the shared empty notes manager! It needs to be duplicated first.' )
+            
+        
     
     def Duplicate( self ):
         
@@ -1380,6 +1473,8 @@ class NotesManager( object ):
     
     def SetNamesToNotes( self, names_to_notes: dict[ str, str ] ):
         
+        self._CheckNotShared()
+        
         self._names_to_notes = names_to_notes
         
     
@@ -1405,8 +1500,15 @@ class NotesManager( object ):
         return name in self._names_to_notes
         
     
+    def IsShared( self ):
+        
+        return self._is_shared
+        
+    
     def ProcessContentUpdate( self, content_update ):
         
+        self._CheckNotShared()
+        
         ( data_type, action, row ) = content_update.ToTuple()
         
         if action == HC.CONTENT_UPDATE_SET:
@@ -1436,12 +1538,38 @@ class NotesManager( object ):
             
         
     
+    @staticmethod
+    def STATICGenerateManager( names_to_notes: dict[ str, str ] ):
+        
+        if len( names_to_notes ) == 0:
+            
+            return EMPTY_NOTES_MANAGER
+            
+        
+        return NotesManager( names_to_notes )
+        
+    
+
+EMPTY_NOTES_MANAGER = NotesManager( {}, is_shared = True )
+
 class RatingsManager( object ):
     
-    def __init__( self, service_keys_to_ratings: dict[ bytes, int | float | None ] ):
+    __slots__ = ( '_service_keys_to_ratings', '_is_shared' )
+    
+    def __init__( self, service_keys_to_ratings: dict[ bytes, int | float | None ], is_shared = False ):
         
         self._service_keys_to_ratings = service_keys_to_ratings
         
+        self._is_shared = is_shared
+        
+    
+    def _CheckNotShared( self ):
+        
+        if self._is_shared:
+            
+            raise Exception( 'Tried to edit the shared empty ratings manager! It needs to be duplicated first.' )
+            
+        
     
     def Duplicate( self ):
         
@@ -1529,8 +1657,15 @@ class RatingsManager( object ):
         return frozenset( { self._service_keys_to_ratings[ service_key ] for service_key in service_keys if service_key in self._service_keys_to_ratings } )
         
     
+    def IsShared( self ):
+        
+        return self._is_shared
+        
+    
     def ProcessContentUpdate( self, service_key, content_update ):
         
+        self._CheckNotShared()
+        
         ( data_type, action, row ) = content_update.ToTuple()
         
         if action == HC.CONTENT_UPDATE_ADD:
@@ -1550,15 +1685,39 @@ class RatingsManager( object ):
     
     def ResetService( self, service_key ):
         
+        self._CheckNotShared()
+        
         if service_key in self._service_keys_to_ratings:
             
             del self._service_keys_to_ratings[ service_key ]
             
         
     
+    @staticmethod
+    def STATICGenerateManager( service_keys_to_ratings: dict[ bytes, int | float | None ] ):
+        
+        if len( service_keys_to_ratings ) == 0:
+            
+            return EMPTY_RATINGS_MANAGER
+            
+        
+        return RatingsManager( service_keys_to_ratings )
+        
+    
+
+EMPTY_RATINGS_MANAGER = RatingsManager( {}, is_shared = True )
 
 class TagsManager( object ):
     
+    __slots__ = (
+        '_tag_display_types_to_service_keys_to_statuses_to_tags',
+        '_storage_cache_is_dirty',
+        '_display_cache_is_dirty',
+        '_single_media_cache_is_dirty',
+        '_selection_list_cache_is_dirty',
+        '_lock'
+    )
+    
     def __init__(
         self,
         service_keys_to_statuses_to_storage_tags: dict[ bytes, dict[ int, set[ str ] ] ],
@@ -7,6 +7,18 @@ from hydrus.client.media import ClientMediaManagers
 
 class MediaResult( object ):
     
+    # the media result cache holds these in a WeakValueDictionary, hence the weakref slot
+    __slots__ = (
+        '_file_info_manager',
+        '_tags_manager',
+        '_times_manager',
+        '_locations_manager',
+        '_ratings_manager',
+        '_notes_manager',
+        '_file_viewing_stats_manager',
+        '__weakref__'
+    )
+    
     def __init__(
         self,
         file_info_manager: ClientMediaManagers.FileInfoManager,
@@ -295,10 +307,20 @@ class MediaResult( object ):
             
         elif service_type in HC.RATINGS_SERVICES:
             
+            if self._ratings_manager.IsShared():
+                
+                self._ratings_manager = self._ratings_manager.Duplicate()
+                
+            
             self._ratings_manager.ProcessContentUpdate( service_key, content_update )
             
         elif service_type == HC.LOCAL_NOTES:
             
+            if self._notes_manager.IsShared():
+                
+                self._notes_manager = self._notes_manager.Duplicate()
+                
+            
             self._notes_manager.ProcessContentUpdate( content_update )
             
         
@@ -41,6 +41,8 @@ CLIENT_API_INT_PARAMS = {
     'duplicate_pair_sort_type',
     'file_id',
     'file_sort_type',
+    'offset',
+    'limit',
     'potentials_search_type',
     'pixel_duplicates',
     'max_hamming_distance',
@@ -65,7 +67,8 @@ CLIENT_API_BYTE_PARAMS = {
     'tag_service_key_1',
     'tag_service_key_2',
     'rating_service_key',
-    'job_status_key'
+    'job_status_key',
+    'cursor'
 }
 
 CLIENT_API_STRING_PARAMS = {
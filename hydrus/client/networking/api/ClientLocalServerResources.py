@@ -1,4 +1,5 @@
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core.networking import HydrusServerRequest
@@ -11,6 +12,8 @@ class HydrusResourceClientAPI( HydrusServerResources.HydrusResource ):
     
     BLOCKED_WHEN_BUSY = True
     
+    DB_JOB_PRIORITY = HydrusDBBase.JOB_PRIORITY_CLIENT_API
+    
     def _callbackParseGETArgs( self, request: HydrusServerRequest.HydrusRequest ):
         
         parsed_request_args = ClientLocalServerCore.ParseClientAPIGETArgs( request.args )
@@ -35,7 +35,7 @@ class HydrusResourceClientAPIRestrictedGetFiles( ClientLocalServerResources.Hydr
 
 class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClientAPIRestrictedGetFiles ):
     
-    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+    def _DoSearch( self, request: HydrusServerRequest.HydrusRequest ) -> list[ int ]:
         
         location_context = ClientLocalServerCore.ParseLocationContext( request, ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_LOCAL_FILE_DOMAINS_SERVICE_KEY ) )
         
@@ -52,54 +52,88 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
         tag_context = ClientSearchTagContext.TagContext( service_key = tag_service_key, include_current_tags = include_current_tags, include_pending_tags = include_pending_tags )
         predicates = ClientLocalServerCore.ParseClientAPISearchPredicates( request )
         
-        return_hashes = False
-        return_file_ids = True
-        
         if len( predicates ) == 0:
             
-            hash_ids = []
+            return []
             
-        else:
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = predicates )
+        
+        file_sort_type = CC.SORT_FILES_BY_IMPORT_TIME
+        
+        if 'file_sort_type' in request.parsed_request_args:
             
-            file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = predicates )
+            file_sort_type = request.parsed_request_args[ 'file_sort_type' ]
             
-            file_sort_type = CC.SORT_FILES_BY_IMPORT_TIME
+        
+        if file_sort_type not in CC.SYSTEM_SORT_TYPES:
             
-            if 'file_sort_type' in request.parsed_request_args:
-                
-                file_sort_type = request.parsed_request_args[ 'file_sort_type' ]
-                
+            raise HydrusExceptions.BadRequestException( 'Sorry, did not understand that sort type!' )
             
-            if file_sort_type not in CC.SYSTEM_SORT_TYPES:
-                
-                raise HydrusExceptions.BadRequestException( 'Sorry, did not understand that sort type!' )
-                
+        
+        file_sort_asc = request.parsed_request_args.GetValue( 'file_sort_asc', bool, default_value = True )
+        
+        sort_order = CC.SORT_ASC if file_sort_asc else CC.SORT_DESC
+        
+        # newest first
+        sort_by = ClientMediaSort.MediaSort( sort_type = ( 'system', file_sort_type ), sort_order = sort_order )
+        
+        job_status = ClientThreading.JobStatus( cancellable = True )
+        
+        request.disconnect_callables.append( job_status.Cancel )
+        
+        hash_ids = CG.client_controller.Read( 'file_query_ids', file_search_context, job_status = job_status, sort_by = sort_by, apply_implicit_limit = False )
+        
+        return list( hash_ids )
+        
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        offset = request.parsed_request_args.GetValue( 'offset', int, default_value = 0 )
+        limit = request.parsed_request_args.GetValueOrNone( 'limit', int )
+        
+        if offset < 0:
             
-            file_sort_asc = request.parsed_request_args.GetValue( 'file_sort_asc', bool, default_value = True )
+            raise HydrusExceptions.BadRequestException( 'Offset must be 0 or greater!' )
             
-            sort_order = CC.SORT_ASC if file_sort_asc else CC.SORT_DESC
+        
+        if limit is not None and limit < 1:
             
-            # newest first
-            sort_by = ClientMediaSort.MediaSort( sort_type = ( 'system', file_sort_type ), sort_order = sort_order )
+            raise HydrusExceptions.BadRequestException( 'Limit must be greater than 0!' )
             
-            if 'return_hashes' in request.parsed_request_args:
-                
-                return_hashes = request.parsed_request_args.GetValue( 'return_hashes', bool )
-                
+        
+        return_hashes = request.parsed_request_args.GetValue( 'return_hashes', bool, default_value = False )
+        return_file_ids = request.parsed_request_args.GetValue( 'return_file_ids', bool, default_value = True )
+        
+        cursor = None
+        
+        if 'cursor' in request.parsed_request_args:
             
-            if 'return_file_ids' in request.parsed_request_args:
-                
-                return_file_ids = request.parsed_request_args.GetValue( 'return_file_ids', bool )
-                
+            # the next page of a search we already did
             
-            job_status = ClientThreading.JobStatus( cancellable = True )
+            cursor = request.parsed_request_args.GetValue( 'cursor', bytes )
             
-            request.disconnect_callables.append( job_status.Cancel )
+            ( hash_ids, num_results ) = request.client_api_permissions.GetSearchCursorPage( cursor, offset, limit )
             
-            hash_ids = CG.client_controller.Read( 'file_query_ids', file_search_context, job_status = job_status, sort_by = sort_by, apply_implicit_limit = False )
+        else:
+            
+            hash_ids = self._DoSearch( request )
+            
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
+            
+            num_results = len( hash_ids )
+                
+            if limit is not None:
+                
+                cursor = request.client_api_permissions.AddSearchCursor( hash_ids )
+                
+                hash_ids = hash_ids[ offset : offset + limit ]
+                
+            elif offset > 0:
+                
+                hash_ids = hash_ids[ offset : ]
+                
             
-        
-        request.client_api_permissions.SetLastSearchResults( hash_ids )
         
         body_dict = {}
         
@@ -116,6 +150,12 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
             body_dict[ 'file_ids' ] = list( hash_ids )
             
         
+        if cursor is not None:
+            
+            body_dict[ 'cursor' ] = cursor.hex()
+            body_dict[ 'num_results' ] = num_results
+            
+        
         body = ClientLocalServerCore.Dumps( body_dict, request.preferred_mime )
         
         response_context = HydrusServerResources.ResponseContext( 200, mime = request.preferred_mime, body = body )
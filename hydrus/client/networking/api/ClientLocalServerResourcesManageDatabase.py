@@ -175,3 +175,21 @@ class HydrusResourceClientAPIRestrictedManageDatabaseGetClientOptions( HydrusRes
         return response_context
         
     
+
+class HydrusResourceClientAPIRestrictedManageDatabaseGetDBJobStats( HydrusResourceClientAPIRestrictedManageDatabase ):
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        # this is all in memory, so it answers even when the db queue is stalled
+        db_job_stats = CG.client_controller.GetDBJobStats()
+        
+        body_dict = { 'db_job_stats' : db_job_stats }
+        
+        mime = request.preferred_mime
+        body = ClientLocalServerCore.Dumps( body_dict, mime )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        
+        return response_context
+        
+    
@@ -0,0 +1,408 @@
+import collections.abc
+
+import numpy
+
+# a compressed set of non-negative ids, for when a python set of millions of ints is too fat
+# this is the 'roaring' idea: split the id space into chunks of 65536, and store each chunk as whichever is smaller:
+#   a sorted uint16 array of the low bits, for sparse chunks
+#   a 1024 x uint64 bitmap, for dense ones
+# at 4096 members the two are the same size (8KB), so that is where we flip
+# a set of ints is about 60 bytes an item, so a big dense tag can be a hundred times smaller like this, and and/or/not are vectorised
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+SPARSE_MAX_SIZE = 4096
+
+SPARSE_DTYPE = numpy.uint16
+DENSE_DTYPE = numpy.dtype( '<u8' )
+
+def _ContainerIsDense( container: numpy.ndarray ):
+    
+    return container.dtype == DENSE_DTYPE
+    
+
+def _GetContainerSize( container: numpy.ndarray ) -> int:
+    
+    if _ContainerIsDense( container ):
+        
+        return int( numpy.unpackbits( container.view( numpy.uint8 ) ).sum() )
+        
+    else:
+        
+        return len( container )
+        
+    
+
+def _ToDense( container: numpy.ndarray ) -> numpy.ndarray:
+    
+    if _ContainerIsDense( container ):
+        
+        return container
+        
+    
+    bits = numpy.zeros( CHUNK_SIZE, dtype = bool )
+    
+    bits[ container ] = True
+    
+    return numpy.packbits( bits, bitorder = 'little' ).view( DENSE_DTYPE )
+    
+
+def _ToSparse( container: numpy.ndarray ) -> numpy.ndarray:
+    
+    if not _ContainerIsDense( container ):
+        
+        return container
+        
+    
+    return numpy.flatnonzero( numpy.unpackbits( container.view( numpy.uint8 ), bitorder = 'little' ) ).astype( SPARSE_DTYPE )
+    
+
+def _Tidy( container: numpy.ndarray ) -> numpy.ndarray | None:
+    
+    # whatever the op gave us, store it in the best format, or None if it is empty
+    
+    if _ContainerIsDense( container ):
+        
+        size = _GetContainerSize( container )
+        
+        if size == 0:
+            
+            return None
+            
+        elif size <= SPARSE_MAX_SIZE:
+            
+            return _ToSparse( container )
+            
+        
+    else:
+        
+        if len( container ) == 0:
+            
+            return None
+            
+        elif len( container ) > SPARSE_MAX_SIZE:
+            
+            return _ToDense( container )
+            
+        
+    
+    return container
+    
+
+def _SparseInDense( sparse: numpy.ndarray, dense: numpy.ndarray ) -> numpy.ndarray:
+    
+    # a bool mask of which sparse members are set in the dense bitmap
+    
+    sparse = sparse.astype( numpy.uint64 )
+    
+    return ( ( dense[ sparse >> numpy.uint64( 6 ) ] >> ( sparse & numpy.uint64( 63 ) ) ) & numpy.uint64( 1 ) ).astype( bool )
+    
+
+def _And( a: numpy.ndarray, b: numpy.ndarray ) -> numpy.ndarray | None:
+    
+    a_is_dense = _ContainerIsDense( a )
+    b_is_dense = _ContainerIsDense( b )
+    
+    if a_is_dense and b_is_dense:
+        
+        result = a & b
+        
+    elif a_is_dense:
+        
+        result = b[ _SparseInDense( b, a ) ]
+        
+    elif b_is_dense:
+        
+        result = a[ _SparseInDense( a, b ) ]
+        
+    else:
+        
+        result = numpy.intersect1d( a, b, assume_unique = True )
+        
+    
+    return _Tidy( result )
+    
+
+def _AndNot( a: numpy.ndarray, b: numpy.ndarray ) -> numpy.ndarray | None:
+    
+    a_is_dense = _ContainerIsDense( a )
+    b_is_dense = _ContainerIsDense( b )
+    
+    if a_is_dense:
+        
+        result = a & ~_ToDense( b )
+        
+    elif b_is_dense:
+        
+        result = a[ ~_SparseInDense( a, b ) ]
+        
+    else:
+        
+        result = numpy.setdiff1d( a, b, assume_unique = True )
+        
+    
+    return _Tidy( result )
+    
+
+def _Or( a: numpy.ndarray, b: numpy.ndarray ) -> numpy.ndarray:
+    
+    if _ContainerIsDense( a ) or _ContainerIsDense( b ) or len( a ) + len( b ) > SPARSE_MAX_SIZE:
+        
+        result = _ToDense( a ) | _ToDense( b )
+        
+    else:
+        
+        result = numpy.union1d( a, b )
+        
+    
+    return _Tidy( result )
+    
+
+class IdBitmap( object ):
+    
+    __slots__ = ( '_chunks', )
+    
+    def __init__( self, chunks = None ):
+        
+        if chunks is None:
+            
+            chunks = {}
+            
+        
+        # chunk index : container
+        self._chunks = chunks
+        
+    
+    def __and__( self, other: "IdBitmap" ) -> "IdBitmap":
+        
+        if len( self._chunks ) > len( other._chunks ):
+            
+            ( smaller, larger ) = ( other, self )
+            
+        else:
+            
+            ( smaller, larger ) = ( self, other )
+            
+        
+        chunks = {}
+        
+        for ( chunk_index, container ) in smaller._chunks.items():
+            
+            if chunk_index in larger._chunks:
+                
+                result = _And( container, larger._chunks[ chunk_index ] )
+                
+                if result is not None:
+                    
+                    chunks[ chunk_index ] = result
+                    
+                
+            
+        
+        return IdBitmap( chunks )
+        
+    
+    def __len__( self ):
+        
+        return sum( ( _GetContainerSize( container ) for container in self._chunks.values() ) )
+        
+    
+    def __or__( self, other: "IdBitmap" ) -> "IdBitmap":
+        
+        chunks = dict( self._chunks )
+        
+        for ( chunk_index, container ) in other._chunks.items():
+            
+            if chunk_index in chunks:
+                
+                chunks[ chunk_index ] = _Or( chunks[ chunk_index ], container )
+                
+            else:
+                
+                chunks[ chunk_index ] = container
+                
+            
+        
+        return IdBitmap( chunks )
+        
+    
+    def __sub__( self, other: "IdBitmap" ) -> "IdBitmap":
+        
+        chunks = {}
+        
+        for ( chunk_index, container ) in self._chunks.items():
+            
+            if chunk_index in other._chunks:
+                
+                result = _AndNot( container, other._chunks[ chunk_index ] )
+                
+                if result is not None:
+                    
+                    chunks[ chunk_index ] = result
+                    
+                
+            else:
+                
+                chunks[ chunk_index ] = container
+                
+            
+        
+        return IdBitmap( chunks )
+        
+    
+    def FilterIds( self, ids: collections.abc.Collection[ int ], keep_members = True ) -> set[ int ]:
+        
+        """
+        Returns the ids that are (or, with keep_members False, are not) in this bitmap, without building a bitmap of the ids first.
+        """
+        
+        if len( ids ) == 0:
+            
+            return set()
+            
+        
+        ids_array = numpy.fromiter( ids, dtype = numpy.int64, count = len( ids ) )
+        
+        is_member = numpy.zeros( len( ids_array ), dtype = bool )
+        
+        chunk_indices = ids_array >> CHUNK_BITS
+        
+        for chunk_index in numpy.unique( chunk_indices ):
+            
+            chunk_index = int( chunk_index )
+            
+            if chunk_index not in self._chunks:
+                
+                continue
+                
+            
+            container = self._chunks[ chunk_index ]
+            
+            in_chunk = chunk_indices == chunk_index
+            
+            low_bits = ( ids_array[ in_chunk ] & CHUNK_MASK ).astype( SPARSE_DTYPE )
+            
+            if _ContainerIsDense( container ):
+                
+                is_member[ in_chunk ] = _SparseInDense( low_bits, container )
+                
+            else:
+                
+                is_member[ in_chunk ] = numpy.isin( low_bits, container, assume_unique = True )
+                
+            
+        
+        if not keep_members:
+            
+            is_member = ~is_member
+            
+        
+        return set( ids_array[ is_member ].tolist() )
+        
+    
+    def GetMemoryFootprint( self ) -> int:
+        
+        return sum( ( container.nbytes for container in self._chunks.values() ) )
+        
+    
+    def IsEmpty( self ) -> bool:
+        
+        return len( self._chunks ) == 0
+        
+    
+    def ToList( self ) -> list[ int ]:
+        
+        arrays = []
+        
+        for chunk_index in sorted( self._chunks.keys() ):
+            
+            low_bits = _ToSparse( self._chunks[ chunk_index ] ).astype( numpy.int64 )
+            
+            arrays.append( low_bits + ( chunk_index << CHUNK_BITS ) )
+            
+        
+        if len( arrays ) == 0:
+            
+            return []
+            
+        
+        return numpy.concatenate( arrays ).tolist()
+        
+    
+    def ToSet( self ) -> set[ int ]:
+        
+        return set( self.ToList() )
+        
+    
+    @staticmethod
+    def STATICCreateFromIds( ids: collections.abc.Iterable[ int ] ) -> "IdBitmap":
+        
+        if isinstance( ids, collections.abc.Collection ):
+            
+            ids_array = numpy.fromiter( ids, dtype = numpy.int64, count = len( ids ) )
+            
+        else:
+            
+            ids_array = numpy.fromiter( ids, dtype = numpy.int64 )
+            
+        
+        ids_array = numpy.unique( ids_array )
+        
+        chunks = {}
+        
+        if len( ids_array ) == 0:
+            
+            return IdBitmap( chunks )
+            
+        
+        chunk_indices = ids_array >> CHUNK_BITS
+        
+        # ids are sorted, so each chunk is one run
+        ( unique_chunk_indices, starts ) = numpy.unique( chunk_indices, return_index = True )
+        
+        ends = starts[ 1 : ].tolist() + [ len( ids_array ) ]
+        
+        for ( chunk_index, start, end ) in zip( unique_chunk_indices.tolist(), starts.tolist(), ends ):
+            
+            low_bits = ( ids_array[ start : end ] & CHUNK_MASK ).astype( SPARSE_DTYPE )
+            
+            chunks[ chunk_index ] = _Tidy( low_bits )
+            
+        
+        return IdBitmap( chunks )
+        
+    
+    @staticmethod
+    def STATICIntersectMany( bitmaps: collections.abc.Collection[ "IdBitmap" ] ) -> "IdBitmap":
+        
+        # smallest first, so the running result shrinks as fast as it can
+        
+        answer = None
+        
+        for bitmap in sorted( bitmaps, key = lambda b: len( b._chunks ) ):
+            
+            if answer is None:
+                
+                answer = bitmap
+                
+            else:
+                
+                answer = answer & bitmap
+                
+            
+            if answer.IsEmpty():
+                
+                break
+                
+            
+        
+        if answer is None:
+            
+            return IdBitmap()
+            
+        
+        return answer
+        
+    
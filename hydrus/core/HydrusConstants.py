@@ -127,7 +127,7 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 20
-SOFTWARE_VERSION = 676
+SOFTWARE_VERSION = 677
 CLIENT_API_VERSION = 93
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
@@ -484,6 +484,16 @@ class HydrusController( object ):
         return self.db_dir
         
     
+    def GetDBJobStats( self ):
+        
+        if self.db is None:
+            
+            raise Exception( 'Sorry, database does not seem to be alive at the moment!' )
+            
+        
+        return self.db.GetJobStats()
+        
+    
     def GetDBStatus( self ):
         
         return self.db.GetStatus()
@@ -1,4 +1,5 @@
 import os
+import pathlib
 import queue
 import sqlite3
 import threading
@@ -6,6 +7,7 @@ import traceback
 import time
 
 from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusDBJobStats
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusEncryption
@@ -297,9 +299,29 @@ def VacuumDBInto( db_path: str ):
     HydrusData.ShowText( f'Vacuumed {db_path} in {HydrusTime.TimeDeltaToPrettyTimeDelta( time_took )} ({HydrusData.ToHumanBytes(bytes_per_sec)}/s). It went from {HydrusData.ToHumanBytes( original_size )} to {HydrusData.ToHumanBytes( vacuum_size )}' )
     
 
+def GetReadOnlyURI( db_path: str ):
+    
+    return '{}?mode=ro'.format( pathlib.Path( db_path ).absolute().as_uri() )
+    
+
 class HydrusDB( HydrusDBBase.DBBase ):
     
     READ_WRITE_ACTIONS = []
+    
+    # reads that may be served by the read pool. they must not rely on anything but committed database state and module caches
+    READ_POOL_ACTIONS = []
+    
+    # background maintenance writes. read pool jobs do not wait for these to commit before they run
+    UNORDERED_WRITE_ACTIONS = []
+    
+    # asynchronous writes that may be merged with their queued neighbours into one job
+    COALESCABLE_WRITE_ACTIONS = []
+    
+    # jobs that go in the importer priority class. UNORDERED_WRITE_ACTIONS go in the maintenance class
+    IMPORTER_ACTIONS = []
+    
+    MAX_COALESCED_WRITE_JOBS = 256
+    
     UPDATE_WAIT = 2
     
     def __init__( self, controller: "HG.HydrusController.HydrusController", db_dir, db_name ):
@@ -373,12 +395,33 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._ready_to_serve_requests = False
         self._could_not_initialise = False
         
-        self._jobs = queue.Queue()
+        self._jobs = HydrusDBBase.DBJobQueue()
+        
+        self._read_pool_size = 0
+        
+        if HG.db_journal_mode == 'WAL':
+            
+            self._read_pool_size = HG.db_read_connections
+            
+        
+        self._read_pool_jobs = queue.Queue()
+        self._read_pool_condition = threading.Condition()
+        self._read_pool_open = False
+        self._read_pool_generation = 0
+        self._read_pool_num_connected = 0
+        self._read_pool_num_jobs_in_progress = 0
+        self._read_pool_num_waiting_for_commit = 0
+        
+        self._ordered_write_seq_submitted = 0
+        self._ordered_write_seq_done = 0
+        self._ordered_write_seq_committed = 0
         
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
         
+        self._job_stats = HydrusDBJobStats.DBJobStats()
+        
         self._db = None
         self._is_connected = False
         
@@ -519,6 +562,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._Execute( 'ATTACH ? AS durable_temp;', ( db_path, ) )
         
     
+    def _CanCoalesceWriteJob( self, action, coalesce_state, args_and_kwargs_so_far, args, kwargs ):
+        
+        return False
+        
+    
     def _CleanAfterJobWork( self ):
         
         self._cursor_transaction_wrapper.CleanPubSubs()
@@ -534,6 +582,10 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 
                 self._cursor_transaction_wrapper.Commit()
                 
+                self._NotifyReadPoolOfCommit()
+                
+            
+            self._CloseReadPool()
             
             self._CloseCursor()
             
@@ -551,6 +603,96 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
         
     
+    def _CloseReadPool( self ):
+        
+        if self._read_pool_size == 0:
+            
+            return
+            
+        
+        with self._read_pool_condition:
+            
+            if not self._read_pool_open:
+                
+                return
+                
+            
+            self._read_pool_open = False
+            self._read_pool_generation += 1
+            
+            self._read_pool_condition.notify_all()
+            
+            # wake up idle readers so they drop their connections
+            for i in range( self._read_pool_size ):
+                
+                self._read_pool_jobs.put( None )
+                
+            
+            # we cannot vacuum or backup or whatever while anyone else has a file handle open, so wait for everyone to disconnect
+            while self._read_pool_num_jobs_in_progress > 0 or self._read_pool_num_connected > 0:
+                
+                self._read_pool_condition.wait( 0.5 )
+                
+            
+        
+    
+    def _CoalesceWriteJobArgs( self, action, args_and_kwargs ):
+        
+        raise NotImplementedError()
+        
+    
+    def _CoalesceWriteJobs( self, job: HydrusDBBase.JobDatabase ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        jobs = [ job ]
+        args_and_kwargs = [ ( args, kwargs ) ]
+        
+        # whatever the subclass wants to remember about the jobs taken so far, so it does not have to look through them all again for every candidate
+        coalesce_state = {}
+        
+        self._UpdateCoalesceWriteJobState( action, coalesce_state, args, kwargs )
+        
+        while len( jobs ) < self.MAX_COALESCED_WRITE_JOBS:
+            
+            try:
+                
+                next_job = self._jobs.get_nowait()
+                
+            except queue.Empty:
+                
+                break
+                
+            
+            ( next_action, next_args, next_kwargs ) = next_job.GetCallableTuple()
+            
+            if not ( self._JobIsCoalescable( next_job ) and next_action == action and self._CanCoalesceWriteJob( action, coalesce_state, args_and_kwargs, next_args, next_kwargs ) ):
+                
+                self._jobs.PutBack( next_job )
+                
+                break
+                
+            
+            jobs.append( next_job )
+            args_and_kwargs.append( ( next_args, next_kwargs ) )
+            
+            self._UpdateCoalesceWriteJobState( action, coalesce_state, next_args, next_kwargs )
+            
+        
+        if len( jobs ) == 1:
+            
+            return job
+            
+        
+        ( coalesced_args, coalesced_kwargs ) = self._CoalesceWriteJobArgs( action, args_and_kwargs )
+        
+        coalesced_job = self._GenerateDBJob( 'write', False, action, *coalesced_args, **coalesced_kwargs )
+        
+        coalesced_job.SetCoalescedJobs( jobs )
+        
+        return coalesced_job
+        
+    
     def _CreateDB( self ):
         
         raise NotImplementedError()
@@ -575,6 +717,41 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return HydrusDBBase.JobDatabase( job_type, synchronous, action, *args, **kwargs )
         
     
+    def _GetJobPriority( self, action ):
+        
+        if action in self.UNORDERED_WRITE_ACTIONS:
+            
+            return HydrusDBBase.JOB_PRIORITY_MAINTENANCE
+            
+        
+        # the client api sets this on its request threads
+        job_priority = HydrusDBBase.GetThreadLocalJobPriority()
+        
+        if job_priority is not None:
+            
+            return job_priority
+            
+        
+        if action in self.IMPORTER_ACTIONS:
+            
+            return HydrusDBBase.JOB_PRIORITY_IMPORTER
+            
+        
+        return HydrusDBBase.JOB_PRIORITY_INTERACTIVE
+        
+    
+    def _GetNextJob( self ) -> HydrusDBBase.JobDatabase:
+        
+        job = self._jobs.get( timeout = 1 )
+        
+        if self._JobIsCoalescable( job ):
+            
+            job = self._CoalesceWriteJobs( job )
+            
+        
+        return job
+        
+    
     def _GetPossibleAdditionalDBFilenames( self ):
         
         return [ self._ssl_cert_filename, self._ssl_key_filename ]
@@ -837,12 +1014,68 @@ class HydrusDB( HydrusDBBase.DBBase ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        if self._ready_to_serve_requests:
+            
+            self._OpenReadPool()
+            
+        
     
     def _InitExternalDatabases( self ):
         
         pass
         
     
+    def _InitReadPoolConnection( self ):
+        
+        main_db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        # all the persistent files are read-only to us. 'mem' is our own, so temp integer tables still work
+        db = sqlite3.connect( GetReadOnlyURI( main_db_path ), isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, uri = True )
+        
+        c = db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        for ( name, filename ) in self._db_filenames.items():
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            c.execute( 'ATTACH ? AS ' + name + ';', ( GetReadOnlyURI( os.path.join( self._db_dir, filename ) ), ) )
+            
+        
+        durable_temp_db_path = os.path.join( self._db_dir, self._durable_temp_db_filename )
+        
+        if os.path.exists( durable_temp_db_path ):
+            
+            c.execute( 'ATTACH ? AS durable_temp;', ( GetReadOnlyURI( durable_temp_db_path ), ) )
+            
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        # we do not want to multiply the main cache by the number of readers, so this is a little more modest
+        cache_size = max( 16, HG.db_cache_size // 4 ) * 1024
+        
+        db_names = [ name for ( index, name, path ) in c.execute( 'PRAGMA database_list;' ).fetchall() if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            c.execute( 'PRAGMA {}.cache_size = -{};'.format( db_name, cache_size ) )
+            
+        
+        return ( db, c )
+        
+    
+    def _JobIsCoalescable( self, job: HydrusDBBase.JobDatabase ):
+        
+        return job.GetType() == 'write' and not job.IsSynchronous() and job.GetCallableTuple()[0] in self.COALESCABLE_WRITE_ACTIONS
+        
+    
     def _LoadModules( self ):
         
         pass
@@ -853,14 +1086,58 @@ class HydrusDB( HydrusDBBase.DBBase ):
         raise NotImplementedError()
         
     
+    def _NotifyReadPoolOfCommit( self ):
+        
+        if self._read_pool_size == 0:
+            
+            return
+            
+        
+        with self._read_pool_condition:
+            
+            self._ordered_write_seq_committed = self._ordered_write_seq_done
+            
+            self._read_pool_condition.notify_all()
+            
+        
+    
+    def _OpenReadPool( self ):
+        
+        if self._read_pool_size == 0:
+            
+            return
+            
+        
+        with self._read_pool_condition:
+            
+            self._read_pool_open = True
+            
+            self._read_pool_condition.notify_all()
+            
+        
+    
     def _ProcessJob( self, job: HydrusDBBase.JobDatabase ):
         
         job_type = job.GetType()
         
         ( action, args, kwargs ) = job.GetCallableTuple()
         
+        write_seq = job.GetWriteSeq()
+        
+        time_job_started = None
+        time_job_finished = None
+        
         try:
             
+            if job_type == 'write' and write_seq is None and self._ReadPoolIsWaitingOnCommit():
+                
+                # we are about to do some long background work, so let's get any user changes out to the read pool first
+                
+                self._cursor_transaction_wrapper.CommitAndBegin()
+                
+                self._NotifyReadPoolOfCommit()
+                
+            
             if job_type in ( 'read_write', 'write' ):
                 
                 self._current_status = 'db writing'
@@ -888,12 +1165,14 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 result = self._Write( action, *args, **kwargs )
                 
             
+            time_job_finished = HydrusTime.GetNowPrecise()
+            
+            self._job_stats.AddJob( job_type, action, job.GetTimeCreated(), time_job_started, time_job_finished )
+            
             idle_at_job_end = self._controller.CurrentlyIdle()
             
             if not idle_at_job_start or not idle_at_job_end:
                 
-                time_job_finished = HydrusTime.GetNowPrecise()
-                
                 time_job_took = time_job_finished - time_job_started
                 
                 if time_job_took > 15:
@@ -909,7 +1188,12 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             self._cursor_transaction_wrapper.Save()
             
-            if self._cursor_transaction_wrapper.TimeToCommit():
+            if write_seq is not None and job_type == 'write':
+                
+                self._ordered_write_seq_done = max( self._ordered_write_seq_done, write_seq )
+                
+            
+            if self._cursor_transaction_wrapper.TimeToCommit() or self._ReadPoolIsWaitingOnCommit():
                 
                 self._current_status = 'db committing'
                 
@@ -917,12 +1201,24 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 
                 self._cursor_transaction_wrapper.CommitAndBegin()
                 
+                self._NotifyReadPoolOfCommit()
+                
             
             self._DoAfterJobWork()
             
         except Exception as e:
             
-            self._ManageDBError( job, e )
+            if time_job_started is not None and time_job_finished is None:
+                
+                self._job_stats.AddJob( job_type, action, job.GetTimeCreated(), time_job_started, HydrusTime.GetNowPrecise(), error = True )
+                
+            
+            coalesced_jobs = job.GetCoalescedJobs()
+            
+            if len( coalesced_jobs ) == 0:
+                
+                self._ManageDBError( job, e )
+                
             
             try:
                 
@@ -939,8 +1235,26 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 HydrusData.PrintException( rollback_e )
                 
             
+            if len( coalesced_jobs ) > 0:
+                
+                # one of the merged jobs is bad. run them again one at a time so only it fails
+                
+                self._CleanAfterJobWork()
+                
+                for coalesced_job in coalesced_jobs:
+                    
+                    self._ProcessJob( coalesced_job )
+                    
+                
+            
         finally:
             
+            if write_seq is not None and job_type == 'write':
+                
+                # even if we failed, nothing is going to wait on this job any more
+                self._ordered_write_seq_done = max( self._ordered_write_seq_done, write_seq )
+                
+            
             self._CleanAfterJobWork()
             
             self._current_status = ''
@@ -949,6 +1263,53 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
         
     
+    def _ProcessReadPoolJob( self, job: HydrusDBBase.JobDatabase ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Running db job on the read pool: ' + job.ToString() )
+            
+        
+        time_job_started = HydrusTime.GetNowPrecise()
+        
+        try:
+            
+            result = self._Read( action, *args, **kwargs )
+            
+            self._job_stats.AddJob( 'read', action, job.GetTimeCreated(), time_job_started, HydrusTime.GetNowPrecise() )
+            
+            job.PutResult( result )
+            
+        except sqlite3.OperationalError as e:
+            
+            if 'readonly' in str( e ):
+                
+                # this job wanted to write something after all, maybe a new hash definition. the main loop can do it
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Read pool job needed to write, so it is going back to the main queue: ' + job.ToString() )
+                    
+                
+                self._jobs.put( job )
+                
+            else:
+                
+                self._job_stats.AddJob( 'read', action, job.GetTimeCreated(), time_job_started, HydrusTime.GetNowPrecise(), error = True )
+                
+                self._ManageDBError( job, e )
+                
+            
+        except Exception as e:
+            
+            self._job_stats.AddJob( 'read', action, job.GetTimeCreated(), time_job_started, HydrusTime.GetNowPrecise(), error = True )
+            
+            self._ManageDBError( job, e )
+            
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         if action not in self._read_commands_to_methods:
@@ -959,6 +1320,155 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return self._read_commands_to_methods[ action ]( *args, **kwargs )
         
     
+    def _ReadPoolIsWaitingOnCommit( self ):
+        
+        return self._read_pool_num_waiting_for_commit > 0 and self._ordered_write_seq_done > self._ordered_write_seq_committed
+        
+    
+    def _ReadPoolLoop( self ):
+        
+        db = None
+        c = None
+        connection_generation = None
+        
+        HydrusDBBase.TemporaryIntegerTableNameCache( thread_local = True )
+        
+        def disconnect():
+            
+            nonlocal db, c
+            
+            if db is not None:
+                
+                HydrusDBBase.SetThreadLocalCursor( None )
+                HydrusDBBase.TemporaryIntegerTableNameCache.instance().Clear()
+                
+                c.close()
+                db.close()
+                
+                db = None
+                c = None
+                
+                with self._read_pool_condition:
+                    
+                    self._read_pool_num_connected -= 1
+                    
+                    self._read_pool_condition.notify_all()
+                    
+                
+            
+        
+        try:
+            
+            while not ( ( self._local_shutdown or HG.model_shutdown ) and self._read_pool_jobs.empty() ):
+                
+                try:
+                    
+                    job = self._read_pool_jobs.get( timeout = 1 )
+                    
+                except queue.Empty:
+                    
+                    job = None
+                    
+                
+                if db is not None and connection_generation != self._read_pool_generation:
+                    
+                    disconnect()
+                    
+                
+                if job is None:
+                    
+                    continue
+                    
+                
+                with self._read_pool_condition:
+                    
+                    self._read_pool_num_waiting_for_commit += 1
+                    
+                    try:
+                        
+                        while self._read_pool_open and self._ordered_write_seq_committed < job.GetWriteSeq():
+                            
+                            if self._local_shutdown or HG.model_shutdown:
+                                
+                                break
+                                
+                            
+                            self._read_pool_condition.wait( 0.5 )
+                            
+                        
+                    finally:
+                        
+                        self._read_pool_num_waiting_for_commit -= 1
+                        
+                    
+                    can_run = self._read_pool_open and self._ordered_write_seq_committed >= job.GetWriteSeq()
+                    
+                    if can_run:
+                        
+                        self._read_pool_num_jobs_in_progress += 1
+                        
+                    
+                
+                if not can_run:
+                    
+                    # we are disconnecting for a vacuum or shutting down or something, so let the main loop sort it out
+                    self._jobs.put( job )
+                    
+                    continue
+                    
+                
+                try:
+                    
+                    if db is None:
+                        
+                        with self._read_pool_condition:
+                            
+                            self._read_pool_num_connected += 1
+                            
+                            connection_generation = self._read_pool_generation
+                            
+                        
+                        try:
+                            
+                            ( db, c ) = self._InitReadPoolConnection()
+                            
+                        except Exception as e:
+                            
+                            with self._read_pool_condition:
+                                
+                                self._read_pool_num_connected -= 1
+                                
+                            
+                            HydrusData.Print( 'A read pool connection could not be made, so its job is going back to the main queue. Error follows:' )
+                            HydrusData.PrintException( e )
+                            
+                            self._jobs.put( job )
+                            
+                            continue
+                            
+                        
+                        HydrusDBBase.SetThreadLocalCursor( c )
+                        
+                    
+                    self._ProcessReadPoolJob( job )
+                    
+                finally:
+                    
+                    with self._read_pool_condition:
+                        
+                        self._read_pool_num_jobs_in_progress -= 1
+                        
+                        self._read_pool_condition.notify_all()
+                        
+                    
+                
+            
+        finally:
+            
+            disconnect()
+            
+        
+    
     def _RepairDB( self, version ):
         
         for module in self._modules:
@@ -985,6 +1495,22 @@ class HydrusDB( HydrusDBBase.DBBase ):
         pass
         
     
+    def _ShouldUseReadPool( self, job_type, action ):
+        
+        if not self._read_pool_open or job_type != 'read' or action not in self.READ_POOL_ACTIONS:
+            
+            return False
+            
+        
+        if HydrusProfiling.IsProfileMode( 'db' ):
+            
+            return False
+            
+        
+        # if the main loop is idle, it is faster and simpler to just do it there
+        return self._currently_doing_job or not self._jobs.empty()
+        
+    
     def _ShrinkMemory( self ):
         
         self._Execute( 'PRAGMA shrink_memory;' )
@@ -995,6 +1521,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._modules = []
         
     
+    def _UpdateCoalesceWriteJobState( self, action, coalesce_state, args, kwargs ):
+        
+        pass
+        
+    
     def _UpdateDB( self, version ):
         
         raise NotImplementedError()
@@ -1071,6 +1602,11 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return total
         
     
+    def GetJobStats( self ) -> list[ dict ]:
+        
+        return self._job_stats.GetReport()
+        
+    
     def GetSafeTransactionDiskSpaceAndCurrentFreeSpace( self ):
         
         total_db_size = self.GetApproxTotalFileSize()
@@ -1137,7 +1673,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and self._read_pool_jobs.empty() and self._read_pool_num_jobs_in_progress == 0
         
     
     def MainLoop( self ):
@@ -1159,13 +1695,22 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         self._ready_to_serve_requests = True
         
+        HydrusDBBase.SetThreadLocalJobQueue( self._jobs )
+        
+        for i in range( self._read_pool_size ):
+            
+            self._controller.CallToThreadLongRunning( self._ReadPoolLoop )
+            
+        
+        self._OpenReadPool()
+        
         error_count = 0
         
         while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.empty() ):
             
             try:
                 
-                job = self._jobs.get( timeout = 1 )
+                job = self._GetNextJob()
                 
                 self._currently_doing_job = True
                 self._current_job_name = job.ToString()
@@ -1203,7 +1748,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
                         raise
                         
                     
-                    self._jobs.put( job ) # couldn't lock db; put job back on queue
+                    self._jobs.PutBack( job ) # couldn't lock db; put job back on queue
                     
                     time.sleep( 5 )
                     
@@ -1215,7 +1760,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 
             except queue.Empty:
                 
-                if self._cursor_transaction_wrapper.TimeToCommit():
+                if self._cursor_transaction_wrapper.TimeToCommit() or self._ReadPoolIsWaitingOnCommit():
                     
                     self._current_status = 'db committing'
                     
@@ -1223,6 +1768,8 @@ class HydrusDB( HydrusDBBase.DBBase ):
                     
                     self._cursor_transaction_wrapper.CommitAndBegin()
                     
+                    self._NotifyReadPoolOfCommit()
+                    
                 
             finally:
                 
@@ -1283,12 +1830,27 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         job = self._GenerateDBJob( job_type, synchronous, action, *args, **kwargs )
         
+        job.SetPriority( self._GetJobPriority( action ) )
+        
         if HG.model_shutdown:
             
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        if self._ShouldUseReadPool( job_type, action ):
+            
+            with self._read_pool_condition:
+                
+                # we will not run until every normal write submitted before us is committed
+                job.SetWriteSeq( self._ordered_write_seq_submitted )
+                
+            
+            self._read_pool_jobs.put( job )
+            
+        else:
+            
+            self._jobs.put( job )
+            
         
         return job.GetResult()
         
@@ -1330,12 +1892,29 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         job = self._GenerateDBJob( job_type, synchronous, action, *args, **kwargs )
         
+        job.SetPriority( self._GetJobPriority( action ) )
+        
         if HG.model_shutdown:
             
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        if action in self.UNORDERED_WRITE_ACTIONS:
+            
+            self._jobs.put( job )
+            
+        else:
+            
+            with self._read_pool_condition:
+                
+                self._ordered_write_seq_submitted += 1
+                
+                job.SetWriteSeq( self._ordered_write_seq_submitted )
+                
+                # put under the lock so queue order and seq order agree
+                self._jobs.put( job )
+                
+            
         
         if synchronous: return job.GetResult()
         
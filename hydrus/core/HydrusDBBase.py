@@ -1,5 +1,6 @@
 import collections
 import collections.abc
+import queue
 import threading
 import time
 
@@ -14,6 +15,69 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTemp
 from hydrus.core import HydrusTime
 
+# the read pool runs the same module objects as the main db thread, but on its own connection
+# so, a pool thread sets its cursor and temp table name cache here and DBBase picks them up
+THREAD_LOCAL_DB_STATE = threading.local()
+
+def SetThreadLocalCursor( c: sqlite3.Cursor | None ):
+    
+    THREAD_LOCAL_DB_STATE.cursor = c
+    
+
+# the db main loop thread sets this so long maintenance jobs can see if they are holding anyone up
+def SetThreadLocalJobQueue( job_queue: "DBJobQueue | None" ):
+    
+    THREAD_LOCAL_DB_STATE.job_queue = job_queue
+    
+
+# lower number goes first
+JOB_PRIORITY_INTERACTIVE = 0
+JOB_PRIORITY_CLIENT_API = 1
+JOB_PRIORITY_IMPORTER = 2
+JOB_PRIORITY_MAINTENANCE = 3
+
+ALL_JOB_PRIORITIES = ( JOB_PRIORITY_INTERACTIVE, JOB_PRIORITY_CLIENT_API, JOB_PRIORITY_IMPORTER, JOB_PRIORITY_MAINTENANCE )
+
+job_priority_str_lookup = {
+    JOB_PRIORITY_INTERACTIVE : 'interactive',
+    JOB_PRIORITY_CLIENT_API : 'client api',
+    JOB_PRIORITY_IMPORTER : 'importer',
+    JOB_PRIORITY_MAINTENANCE : 'maintenance'
+}
+
+def GetThreadLocalJobPriority() -> int | None:
+    
+    return getattr( THREAD_LOCAL_DB_STATE, 'job_priority', None )
+    
+
+class DBJobPriorityContext( object ):
+    
+    def __init__( self, job_priority: int | None ):
+        
+        self._job_priority = job_priority
+        self._previous_job_priority = None
+        
+    
+    def __enter__( self ):
+        
+        self._previous_job_priority = GetThreadLocalJobPriority()
+        
+        if self._job_priority is not None:
+            
+            THREAD_LOCAL_DB_STATE.job_priority = self._job_priority
+            
+        
+        return self
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        THREAD_LOCAL_DB_STATE.job_priority = self._previous_job_priority
+        
+        return False
+        
+    
+
 def CheckHasSpaceForDBTransaction( db_dir, num_bytes, no_temp_needed = False ):
     
     if no_temp_needed:
@@ -137,9 +201,16 @@ class TemporaryIntegerTableNameCache( object ):
     
     my_instance = None
     
-    def __init__( self ):
+    def __init__( self, thread_local = False ):
         
-        TemporaryIntegerTableNameCache.my_instance = self
+        if thread_local:
+            
+            THREAD_LOCAL_DB_STATE.temporary_integer_table_name_cache = self
+            
+        else:
+            
+            TemporaryIntegerTableNameCache.my_instance = self
+            
         
         self._column_name_tuples_to_table_names = collections.defaultdict( collections.deque )
         self._column_name_tuples_counter = collections.Counter()
@@ -148,6 +219,13 @@ class TemporaryIntegerTableNameCache( object ):
     @staticmethod
     def instance() -> 'TemporaryIntegerTableNameCache':
         
+        thread_local_instance = getattr( THREAD_LOCAL_DB_STATE, 'temporary_integer_table_name_cache', None )
+        
+        if thread_local_instance is not None:
+            
+            return thread_local_instance
+            
+        
         if TemporaryIntegerTableNameCache.my_instance is None:
             
             raise Exception( 'TemporaryIntegerTableNameCache is not yet initialised!' )
@@ -296,6 +374,17 @@ class JobDatabase( object ):
         self._args = args
         self._kwargs = kwargs
         
+        # for writes, our place in the ordered write queue. for read pool reads, the ordered write that has to be committed before we can run
+        self._write_seq = None
+        
+        self._time_created = HydrusTime.GetNowPrecise()
+        
+        # if this job is several asynchronous writes merged together, these are the originals
+        self._coalesced_jobs = []
+        
+        self._priority = JOB_PRIORITY_INTERACTIVE
+        self._queue_position = None
+        
         self._result_ready = threading.Event()
         
     
@@ -314,6 +403,21 @@ class JobDatabase( object ):
         return ( self._action, self._args, self._kwargs )
         
     
+    def GetCoalescedJobs( self ) -> list[ "JobDatabase" ]:
+        
+        return self._coalesced_jobs
+        
+    
+    def GetPriority( self ) -> int:
+        
+        return self._priority
+        
+    
+    def GetQueuePosition( self ) -> int | None:
+        
+        return self._queue_position
+        
+    
     def GetResult( self ):
         
         time.sleep( 0.00001 ) # this one neat trick can save hassle on superquick jobs as event.wait can be laggy
@@ -347,11 +451,27 @@ class JobDatabase( object ):
             
         
     
+    def GetTimeCreated( self ) -> float:
+        
+        return self._time_created
+        
+    
     def GetType( self ):
         
         return self._type
         
     
+    def GetWriteSeq( self ) -> int | None:
+        
+        return self._write_seq
+        
+    
+    def IsOrderedWrite( self ):
+        
+        # unordered maintenance writes have no write seq
+        return ( self._type == 'write' and self._write_seq is not None ) or self._type == 'read_write'
+        
+    
     def IsSynchronous( self ):
         
         return self._synchronous
@@ -364,17 +484,230 @@ class JobDatabase( object ):
         self._result_ready.set()
         
     
+    def SetCoalescedJobs( self, jobs: list[ "JobDatabase" ] ):
+        
+        self._coalesced_jobs = jobs
+        
+        self._time_created = min( job.GetTimeCreated() for job in jobs )
+        
+        # we stand in the first job's place in the queue
+        self._priority = jobs[0].GetPriority()
+        self._queue_position = jobs[0].GetQueuePosition()
+        
+        write_seqs = [ job.GetWriteSeq() for job in jobs if job.GetWriteSeq() is not None ]
+        
+        if len( write_seqs ) > 0:
+            
+            self._write_seq = max( write_seqs )
+            
+        
+    
+    def SetPriority( self, priority: int ):
+        
+        self._priority = priority
+        
+    
+    def SetQueuePosition( self, queue_position: int ):
+        
+        self._queue_position = queue_position
+        
+    
+    def SetWriteSeq( self, write_seq: int ):
+        
+        self._write_seq = write_seq
+        
+    
     def ToString( self ):
         
+        if len( self._coalesced_jobs ) > 0:
+            
+            return '{} {} ({} coalesced jobs)'.format( self._type, self._action, len( self._coalesced_jobs ) )
+            
+        
         return '{} {}'.format( self._type, self._action )
         
     
 
+class DBJobQueue( object ):
+    
+    # jobs are FIFO within a priority, and a higher priority job goes before a lower one
+    # but an ordered write never overtakes an earlier ordered write, or we could apply user changes out of order
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        self._condition = threading.Condition( self._lock )
+        
+        self._priorities_to_jobs = { priority : collections.deque() for priority in ALL_JOB_PRIORITIES }
+        self._priorities_to_ordered_write_positions = { priority : collections.deque() for priority in ALL_JOB_PRIORITIES }
+        
+        self._next_position = 0
+        self._num_jobs = 0
+        
+    
+    def _PopNextJob( self ) -> JobDatabase:
+        
+        earliest_ordered_write_position = None
+        earliest_ordered_write_priority = None
+        
+        for priority in ALL_JOB_PRIORITIES:
+            
+            ordered_write_positions = self._priorities_to_ordered_write_positions[ priority ]
+            
+            if len( ordered_write_positions ) > 0 and ( earliest_ordered_write_position is None or ordered_write_positions[0] < earliest_ordered_write_position ):
+                
+                earliest_ordered_write_position = ordered_write_positions[0]
+                earliest_ordered_write_priority = priority
+                
+            
+        
+        for priority in ALL_JOB_PRIORITIES:
+            
+            jobs = self._priorities_to_jobs[ priority ]
+            
+            if len( jobs ) == 0:
+                
+                continue
+                
+            
+            if jobs[0].IsOrderedWrite() and jobs[0].GetQueuePosition() > earliest_ordered_write_position:
+                
+                # an earlier write is stuck in a lower priority. that priority's head is at or before that write, so we do it first
+                priority = earliest_ordered_write_priority
+                
+                jobs = self._priorities_to_jobs[ priority ]
+                
+            
+            job = jobs.popleft()
+            
+            if job.IsOrderedWrite():
+                
+                self._priorities_to_ordered_write_positions[ priority ].popleft()
+                
+            
+            self._num_jobs -= 1
+            
+            return job
+            
+        
+        raise queue.Empty()
+        
+    
+    def empty( self ):
+        
+        with self._lock:
+            
+            return self._num_jobs == 0
+            
+        
+    
+    def get( self, timeout = None ) -> JobDatabase:
+        
+        with self._condition:
+            
+            if self._num_jobs == 0:
+                
+                self._condition.wait( timeout = timeout )
+                
+            
+            return self._PopNextJob()
+            
+        
+    
+    def get_nowait( self ) -> JobDatabase:
+        
+        with self._lock:
+            
+            return self._PopNextJob()
+            
+        
+    
+    def HasJobsAbovePriority( self, priority: int ):
+        
+        with self._lock:
+            
+            return any( ( len( self._priorities_to_jobs[ p ] ) > 0 for p in ALL_JOB_PRIORITIES if p < priority ) )
+            
+        
+    
+    def put( self, job: JobDatabase ):
+        
+        with self._condition:
+            
+            position = job.GetQueuePosition()
+            
+            if position is None:
+                
+                position = self._next_position
+                
+                self._next_position += 1
+                
+                job.SetQueuePosition( position )
+                
+            
+            priority = job.GetPriority()
+            
+            self._priorities_to_jobs[ priority ].append( job )
+            
+            if job.IsOrderedWrite():
+                
+                self._priorities_to_ordered_write_positions[ priority ].append( position )
+                
+            
+            self._num_jobs += 1
+            
+            self._condition.notify()
+            
+        
+    
+    def PutBack( self, job: JobDatabase ):
+        
+        # we took this job but cannot do it yet, so it goes back to the front of its line
+        
+        with self._condition:
+            
+            priority = job.GetPriority()
+            
+            self._priorities_to_jobs[ priority ].appendleft( job )
+            
+            if job.IsOrderedWrite():
+                
+                self._priorities_to_ordered_write_positions[ priority ].appendleft( job.GetQueuePosition() )
+                
+            
+            self._num_jobs += 1
+            
+            self._condition.notify()
+            
+        
+    
+    def qsize( self ):
+        
+        with self._lock:
+            
+            return self._num_jobs
+            
+        
+    
+
 class DBBase( object ):
     
     def __init__( self ):
         
-        self._c = None
+        self._main_c = None
+        
+    
+    @property
+    def _c( self ) -> sqlite3.Cursor:
+        
+        thread_local_cursor = getattr( THREAD_LOCAL_DB_STATE, 'cursor', None )
+        
+        if thread_local_cursor is not None:
+            
+            return thread_local_cursor
+            
+        
+        return self._main_c
         
     
     def _AnalyzeTempTable( self, temp_table_name ):
@@ -387,13 +720,13 @@ class DBBase( object ):
     
     def _CloseCursor( self ):
         
-        if self._c is not None:
+        if self._main_c is not None:
             
-            self._c.close()
+            self._main_c.close()
             
-            del self._c
+            del self._main_c
             
-            self._c = None
+            self._main_c = None
             
         
     
@@ -604,6 +937,13 @@ class DBBase( object ):
         return False
         
     
+    def _IsOnReadPoolThread( self ):
+        
+        # a read pool thread sees the last commit, not the main thread's ongoing transaction, so it should not build long-lived caches
+        
+        return getattr( THREAD_LOCAL_DB_STATE, 'cursor', None ) is not None
+        
+    
     def _MakeTemporaryIntegerTable( self, integers_iterable, column_names ):
         
         return TemporaryIntegerTable( self._c, integers_iterable, column_names )
@@ -611,7 +951,21 @@ class DBBase( object ):
     
     def _SetCursor( self, c: sqlite3.Cursor ):
         
-        self._c = c
+        self._main_c = c
+        
+    
+    def _ShouldYieldToWaitingJobs( self ):
+        
+        # long maintenance work calls this between chunks. if it returns True, the work should wrap up and let the queue move
+        
+        job_queue = getattr( THREAD_LOCAL_DB_STATE, 'job_queue', None )
+        
+        if job_queue is None:
+            
+            return False
+            
+        
+        return job_queue.HasJobsAbovePriority( JOB_PRIORITY_MAINTENANCE )
         
     
     def _STI( self, iterable_cursor ):
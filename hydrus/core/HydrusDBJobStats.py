@@ -0,0 +1,230 @@
+import math
+import threading
+
+from hydrus.core import HydrusTime
+
+# log-scale buckets, four per doubling, from 50us up to about three and a half minutes. anything outside goes in the end buckets
+HISTOGRAM_MIN_TIME = 0.00005
+HISTOGRAM_BUCKETS_PER_DOUBLING = 4
+HISTOGRAM_NUM_BUCKETS = HISTOGRAM_BUCKETS_PER_DOUBLING * 22
+
+# we keep a current and a previous window, so percentiles cover the last 10-20 minutes
+ROLLING_WINDOW_PERIOD = 600
+
+def GetBucketIndex( time_took: float ) -> int:
+    
+    if time_took <= HISTOGRAM_MIN_TIME:
+        
+        return 0
+        
+    
+    index = int( math.log2( time_took / HISTOGRAM_MIN_TIME ) * HISTOGRAM_BUCKETS_PER_DOUBLING )
+    
+    return min( index, HISTOGRAM_NUM_BUCKETS - 1 )
+    
+
+def GetBucketUpperBound( index: int ) -> float:
+    
+    return HISTOGRAM_MIN_TIME * 2 ** ( ( index + 1 ) / HISTOGRAM_BUCKETS_PER_DOUBLING )
+    
+
+class LatencyHistogram( object ):
+    
+    def __init__( self ):
+        
+        self._counts = [ 0 ] * HISTOGRAM_NUM_BUCKETS
+        self._num_samples = 0
+        
+    
+    def AddSample( self, time_took: float ):
+        
+        self._counts[ GetBucketIndex( time_took ) ] += 1
+        self._num_samples += 1
+        
+    
+    def GetNumSamples( self ) -> int:
+        
+        return self._num_samples
+        
+    
+    def GetPercentiles( self, percentiles, other: "LatencyHistogram | None" = None ) -> list[ float ]:
+        
+        counts = list( self._counts )
+        num_samples = self._num_samples
+        
+        if other is not None:
+            
+            counts = [ a + b for ( a, b ) in zip( counts, other._counts ) ]
+            num_samples += other._num_samples
+            
+        
+        if num_samples == 0:
+            
+            return [ 0.0 for percentile in percentiles ]
+            
+        
+        results = []
+        
+        for percentile in percentiles:
+            
+            target = max( 1, math.ceil( num_samples * percentile ) )
+            
+            running_total = 0
+            
+            for ( index, count ) in enumerate( counts ):
+                
+                running_total += count
+                
+                if running_total >= target:
+                    
+                    results.append( GetBucketUpperBound( index ) )
+                    
+                    break
+                    
+                
+            
+        
+        return results
+        
+    
+
+class ActionStats( object ):
+    
+    def __init__( self ):
+        
+        self.count = 0
+        self.num_errors = 0
+        
+        self.total_run_time = 0.0
+        self.total_wait_time = 0.0
+        self.max_run_time = 0.0
+        self.max_wait_time = 0.0
+        
+        self.run_histogram = LatencyHistogram()
+        self.wait_histogram = LatencyHistogram()
+        
+        self.previous_run_histogram = LatencyHistogram()
+        self.previous_wait_histogram = LatencyHistogram()
+        
+    
+    def AddSample( self, wait_time: float, run_time: float, error: bool ):
+        
+        self.count += 1
+        
+        if error:
+            
+            self.num_errors += 1
+            
+        
+        self.total_run_time += run_time
+        self.total_wait_time += wait_time
+        
+        self.max_run_time = max( self.max_run_time, run_time )
+        self.max_wait_time = max( self.max_wait_time, wait_time )
+        
+        self.run_histogram.AddSample( run_time )
+        self.wait_histogram.AddSample( wait_time )
+        
+    
+    def GetDict( self, job_type, action ):
+        
+        ( run_p50, run_p95, run_p99 ) = self.run_histogram.GetPercentiles( ( 0.5, 0.95, 0.99 ), other = self.previous_run_histogram )
+        ( wait_p50, wait_p95, wait_p99 ) = self.wait_histogram.GetPercentiles( ( 0.5, 0.95, 0.99 ), other = self.previous_wait_histogram )
+        
+        return {
+            'job_type' : job_type,
+            'action' : action,
+            'count' : self.count,
+            'num_errors' : self.num_errors,
+            'recent_count' : self.run_histogram.GetNumSamples() + self.previous_run_histogram.GetNumSamples(),
+            'total_run_time' : self.total_run_time,
+            'total_wait_time' : self.total_wait_time,
+            'max_run_time' : self.max_run_time,
+            'max_wait_time' : self.max_wait_time,
+            'run_p50' : run_p50,
+            'run_p95' : run_p95,
+            'run_p99' : run_p99,
+            'wait_p50' : wait_p50,
+            'wait_p95' : wait_p95,
+            'wait_p99' : wait_p99
+        }
+        
+    
+    def Rotate( self ):
+        
+        self.previous_run_histogram = self.run_histogram
+        self.previous_wait_histogram = self.wait_histogram
+        
+        self.run_histogram = LatencyHistogram()
+        self.wait_histogram = LatencyHistogram()
+        
+    
+
+class DBJobStats( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._keys_to_action_stats = {}
+        
+        self._window_started = HydrusTime.GetNowPrecise()
+        
+    
+    def _RotateIfDue( self, now ):
+        
+        if now - self._window_started > ROLLING_WINDOW_PERIOD:
+            
+            for action_stats in self._keys_to_action_stats.values():
+                
+                action_stats.Rotate()
+                
+            
+            self._window_started = now
+            
+        
+    
+    def AddJob( self, job_type: str, action: str, time_created: float, time_started: float, time_finished: float, error: bool = False ):
+        
+        wait_time = max( 0.0, time_started - time_created )
+        run_time = max( 0.0, time_finished - time_started )
+        
+        key = ( job_type, action )
+        
+        with self._lock:
+            
+            self._RotateIfDue( time_finished )
+            
+            if key not in self._keys_to_action_stats:
+                
+                self._keys_to_action_stats[ key ] = ActionStats()
+                
+            
+            self._keys_to_action_stats[ key ].AddSample( wait_time, run_time, error )
+            
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._keys_to_action_stats = {}
+            
+            self._window_started = HydrusTime.GetNowPrecise()
+            
+        
+    
+    def GetReport( self ) -> list[ dict ]:
+        
+        with self._lock:
+            
+            self._RotateIfDue( HydrusTime.GetNowPrecise() )
+            
+            report = [ action_stats.GetDict( job_type, action ) for ( ( job_type, action ), action_stats ) in self._keys_to_action_stats.items() ]
+            
+        
+        report.sort( key = lambda d: d[ 'total_run_time' ], reverse = True )
+        
+        return report
+        
+    
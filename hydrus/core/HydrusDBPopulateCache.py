@@ -1,8 +1,27 @@
 import collections
 import collections.abc
+import sys
+import threading
 import time
 import weakref
 
+all_id_caches = weakref.WeakSet()
+all_id_caches_lock = threading.Lock()
+
+def GetAllIdCacheStats() -> list[ dict ]:
+    
+    with all_id_caches_lock:
+        
+        id_caches = list( all_id_caches )
+        
+    
+    all_stats = [ id_cache.get_stats() for id_cache in id_caches ]
+    
+    all_stats.sort( key = lambda d: d[ 'name' ] )
+    
+    return all_stats
+    
+
 # ok, what's going on here?
 # we used to have a 'tag_ids_to_tags = {}' style cache for some tag and hash calls. it was pretty basic but saved SQLite time on fetching expensive strings. it uses a funky 'populate' pre-call
 # every time the current population request caused it to overflow 100,000 items or whatever, it would cull itself back to a copy of a dict of the current request
@@ -302,6 +321,8 @@ class IdToPrimitiveCacheTTL( object ):
     
 
 # roughly 16MB per 100k integers, sans the string or whatever 'value' that is held
+# strings are interned on the way in, so a tag held here and in a hundred media results is one string
+# the db read pool and the main db thread share these, so everything is behind a lock, and callers should use get_many rather than a populate-then-getitem, which another thread can evict from in between
 class IdToPrimitiveCache( object ):
     
     def __init__( self, name: str, max_size: int ):
@@ -309,79 +330,198 @@ class IdToPrimitiveCache( object ):
         self._name = name
         self._max_size = max_size
         
+        self._lock = threading.Lock()
+        
         self._ids_to_values = collections.OrderedDict()
         
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        
+        with all_id_caches_lock:
+            
+            all_id_caches.add( self )
+            
+        
     
     def __contains__( self, key ):
         
-        return key in self._ids_to_values
+        with self._lock:
+            
+            return key in self._ids_to_values
+            
         
     
     def __delitem__( self, key: int ):
         
-        del self._ids_to_values[ key ]
+        with self._lock:
+            
+            del self._ids_to_values[ key ]
+            
         
     
     def __getitem__( self, key: int ):
         
-        obj = self._ids_to_values.get( key )
-        
-        if obj is None:
+        with self._lock:
             
-            raise KeyError( f'An Id Cache ({self._name}) was asked for key "{key}", but it does not hold an entry for that! This should never happen, please let hydev know.' )
+            obj = self._ids_to_values.get( key )
+            
+            if obj is None:
+                
+                raise KeyError( f'An Id Cache ({self._name}) was asked for key "{key}", but it does not hold an entry for that! This should never happen, please let hydev know.' )
+                
+            
+            self._ids_to_values.move_to_end( key )
+            
+            return obj
             
-        
-        self._ids_to_values.move_to_end( key )
-        
-        return obj
         
     
     def __setitem__( self, key: int, obj: object ):
         
-        if key in self._ids_to_values:
+        # this may be a correction, e.g. a tag definition that was repaired, so we always take the new value
+        
+        if isinstance( obj, str ):
             
-            self._ids_to_values.move_to_end( key )
+            obj = sys.intern( obj )
             
-        else:
+        
+        with self._lock:
             
             self._ids_to_values[ key ] = obj
             
+            self._ids_to_values.move_to_end( key )
+            
         
     
     def clear( self ):
         
-        self._ids_to_values.clear()
+        with self._lock:
+            
+            self._ids_to_values.clear()
+            
         
     
-    def maintain_touch_record( self ):
+    def discard_many( self, keys: collections.abc.Iterable[ int ] ):
+        
+        with self._lock:
+            
+            for key in keys:
+                
+                if key in self._ids_to_values:
+                    
+                    del self._ids_to_values[ key ]
+                    
+                
+            
+        
+    
+    def filter_uncached( self, keys: collections.abc.Iterable[ int ], record_stats = True ) -> set[ int ]:
         
-        current_size = len( self._ids_to_values )
+        keys = set( keys )
         
-        if current_size > self._max_size:
+        with self._lock:
+            
+            uncached_keys = { key for key in keys if key not in self._ids_to_values }
             
-            max_deletes_this_call = max( 1, int( current_size / 16 ) )
+            if record_stats:
+                
+                self._num_hits += len( keys ) - len( uncached_keys )
+                self._num_misses += len( uncached_keys )
+                
+            
+        
+        return uncached_keys
+        
+    
+    def get_many( self, keys: collections.abc.Iterable[ int ], record_stats = True ) -> tuple[ dict[ int, object ], set[ int ] ]:
+        
+        """
+        Returns ( keys_to_objs for what we have, the keys we do not have ) in one go.
+        """
+        
+        keys_to_objs = {}
+        uncached_keys = set()
+        
+        with self._lock:
             
-            num_to_remove = min( current_size - self._max_size, max_deletes_this_call )
+            for key in keys:
+                
+                obj = self._ids_to_values.get( key )
+                
+                if obj is None:
+                    
+                    uncached_keys.add( key )
+                    
+                else:
+                    
+                    keys_to_objs[ key ] = obj
+                    
+                    self._ids_to_values.move_to_end( key )
+                    
+                
             
-            for i in range( num_to_remove ):
+            if record_stats:
                 
-                self._ids_to_values.popitem( last = False )
+                self._num_hits += len( keys_to_objs )
+                self._num_misses += len( uncached_keys )
                 
             
         
+        return ( keys_to_objs, uncached_keys )
+        
     
-    def update( self, keys_to_objs: dict[ int, object ] ):
+    def get_stats( self ) -> dict:
         
-        for ( key, obj ) in keys_to_objs.items():
+        with self._lock:
             
-            if key in self._ids_to_values:
+            return {
+                'name' : self._name,
+                'num_items' : len( self._ids_to_values ),
+                'max_size' : self._max_size,
+                'num_hits' : self._num_hits,
+                'num_misses' : self._num_misses,
+                'num_evictions' : self._num_evictions
+            }
+            
+        
+    
+    def maintain_touch_record( self ):
+        
+        with self._lock:
+            
+            current_size = len( self._ids_to_values )
+            
+            if current_size > self._max_size:
                 
-                self._ids_to_values.move_to_end( key )
+                max_deletes_this_call = max( 1, int( current_size / 16 ) )
                 
-            else:
+                num_to_remove = min( current_size - self._max_size, max_deletes_this_call )
+                
+                for i in range( num_to_remove ):
+                    
+                    self._ids_to_values.popitem( last = False )
+                    
+                
+                self._num_evictions += num_to_remove
+                
+            
+        
+    
+    def update( self, keys_to_objs: dict[ int, object ] ):
+        
+        keys_to_objs = { key : sys.intern( obj ) if isinstance( obj, str ) else obj for ( key, obj ) in keys_to_objs.items() }
+        
+        with self._lock:
+            
+            for ( key, obj ) in keys_to_objs.items():
+                
+                # as with setitem, always take the new value
                 
                 self._ids_to_values[ key ] = obj
                 
+                self._ids_to_values.move_to_end( key )
+                
             
         
     
@@ -294,6 +294,197 @@ def TagOK( t ):
         return False
         
     
+class TagFilterMatcher( object ):
+    
+    # an immutable, pre-resolved form of a TagFilter's rules
+    # since it never changes, any thread can match against it without a lock. when the rules change, the filter makes a new one
+    
+    __slots__ = ( '_allows_everything', '_tags_whitelist', '_tags_blacklist', '_unnamespaced_ok', '_namespaced_ok', '_namespace_exceptions' )
+    
+    def __init__( self, tag_slices_to_rules: dict ):
+        
+        tags_whitelist = set()
+        tags_blacklist = set()
+        namespaces_whitelist = set()
+        namespaces_blacklist = set()
+        
+        self._unnamespaced_ok = True
+        self._namespaced_ok = True
+        
+        for ( tag_slice, rule ) in tag_slices_to_rules.items():
+            
+            if tag_slice == ALL_UNNAMESPACED_TAG_SLICE:
+                
+                self._unnamespaced_ok = rule == HC.FILTER_WHITELIST
+                
+            elif tag_slice == ALL_NAMESPACED_TAG_SLICE:
+                
+                self._namespaced_ok = rule == HC.FILTER_WHITELIST
+                
+            elif IsNamespaceTagSlice( tag_slice ):
+                
+                if rule == HC.FILTER_WHITELIST:
+                    
+                    namespaces_whitelist.add( tag_slice[:-1] )
+                    
+                else:
+                    
+                    namespaces_blacklist.add( tag_slice[:-1] )
+                    
+                
+            else:
+                
+                if rule == HC.FILTER_WHITELIST:
+                    
+                    tags_whitelist.add( tag_slice )
+                    
+                else:
+                    
+                    tags_blacklist.add( tag_slice )
+                    
+                
+            
+        
+        # tags beat namespaces beat all namespaces. a namespace rule only matters if it disagrees with the all namespaces rule, so we boil them down to a set of exceptions
+        
+        self._tags_whitelist = frozenset( tags_whitelist )
+        self._tags_blacklist = frozenset( tags_blacklist )
+        
+        if self._namespaced_ok:
+            
+            self._namespace_exceptions = frozenset( namespaces_blacklist )
+            
+        else:
+            
+            self._namespace_exceptions = frozenset( namespaces_whitelist )
+            
+        
+        # only a blacklist rule can say no
+        self._allows_everything = HC.FILTER_BLACKLIST not in tag_slices_to_rules.values()
+        
+    
+    def AllowsEverything( self ) -> bool:
+        
+        return self._allows_everything
+        
+    
+    def FilterMany( self, tags: collections.abc.Iterable[ str ], apply_unnamespaced_rules_to_namespaced_tags = False ) -> list[ str ]:
+        
+        if self._allows_everything:
+            
+            return list( tags )
+            
+        
+        # this is TagOK splayed out with everything in locals, since it can be millions of tags
+        # we split inline because a call to SplitTag, or worse an lru_cache'd one, costs more than the split itself
+        
+        tags_whitelist = self._tags_whitelist
+        tags_blacklist = self._tags_blacklist
+        namespace_exceptions = self._namespace_exceptions
+        namespaced_ok = self._namespaced_ok
+        unnamespaced_ok = self._unnamespaced_ok
+        
+        result = []
+        
+        for tag in tags:
+            
+            if tag in tags_whitelist:
+                
+                result.append( tag )
+                
+                continue
+                
+            
+            if tag in tags_blacklist:
+                
+                continue
+                
+            
+            if ':' in tag:
+                
+                ( namespace, subtag ) = tag.split( ':', 1 )
+                
+                if namespace != '':
+                    
+                    if apply_unnamespaced_rules_to_namespaced_tags:
+                        
+                        if subtag in tags_whitelist:
+                            
+                            result.append( tag )
+                            
+                            continue
+                            
+                        
+                        if subtag in tags_blacklist:
+                            
+                            continue
+                            
+                        
+                    
+                    if ( namespace in namespace_exceptions ) != namespaced_ok:
+                        
+                        result.append( tag )
+                        
+                    
+                    continue
+                    
+                
+            
+            if unnamespaced_ok:
+                
+                result.append( tag )
+                
+            
+        
+        return result
+        
+    
+    def TagOK( self, tag: str, apply_unnamespaced_rules_to_namespaced_tags = False ) -> bool:
+        
+        if self._allows_everything:
+            
+            return True
+            
+        
+        if tag in self._tags_whitelist:
+            
+            return True
+            
+        
+        if tag in self._tags_blacklist:
+            
+            return False
+            
+        
+        if ':' in tag:
+            
+            ( namespace, subtag ) = tag.split( ':', 1 )
+            
+            if namespace != '':
+                
+                if apply_unnamespaced_rules_to_namespaced_tags:
+                    
+                    if subtag in self._tags_whitelist:
+                        
+                        return True
+                        
+                    
+                    if subtag in self._tags_blacklist:
+                        
+                        return False
+                        
+                    
+                
+                return ( namespace in self._namespace_exceptions ) != self._namespaced_ok
+                
+            
+        
+        return self._unnamespaced_ok
+        
+    
+
+EMPTY_TAG_FILTER_MATCHER = TagFilterMatcher( {} )
+
 class TagFilter( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_TAG_FILTER
@@ -311,25 +502,15 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
             # "all namespaces, except blocking creator:, but allowing creator:yo"
             # "no namespaces, except allowing creator:, but still blocking creator:yo"
         # the 'all namespaces' applies first, then namespaces, then tags
-        # I updated _TagOK to basically reflect this, but these cached values and whether the 'all' white/blacklist rule actually exists or is implicit is all fuzzy, so clean it up!
+        # I updated TagFilterMatcher to basically reflect this, but these cached values and whether the 'all' white/blacklist rule actually exists or is implicit is all fuzzy, so clean it up!
         # also the UI should display this properly, atm it just does Case 1
         
         self._lock = threading.Lock()
         
         self._tag_slices_to_rules = {}
         
-        self._all_unnamespaced_whitelisted = False
-        self._all_namespaced_whitelisted = False
-        self._namespaces_whitelist = set()
-        self._tags_whitelist = set()
-        
-        self._all_unnamespaced_blacklisted = False
-        self._all_namespaced_blacklisted = False
-        self._namespaces_blacklist = set()
-        self._tags_blacklist = set()
-        
-        self._namespaces_interesting = False
-        self._tags_interesting = False
+        # the lock is only for editing the rules. matching goes through this, which is swapped out whole whenever the rules change
+        self._matcher = EMPTY_TAG_FILTER_MATCHER
         
     
     def __eq__( self, other ):
@@ -378,171 +559,14 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
         self._UpdateRuleCache()
         
     
-    def _TagOK( self, tag, apply_unnamespaced_rules_to_namespaced_tags = False ):
-        
-        # this is called a whole bunch and overhead piles up, so try to splay the logic out to hardcoded tests
-        # we handle exceptions by testing tags before namespaces and namespaces before all namespaces
-        
-        if self._tags_interesting:
-            
-            if tag in self._tags_whitelist:
-                
-                return True
-                
-            
-            if tag in self._tags_blacklist:
-                
-                return False
-                
-            
-            if apply_unnamespaced_rules_to_namespaced_tags:
-                
-                ( namespace, subtag ) = SplitTag( tag )
-                
-                if namespace != '':
-                    
-                    if subtag in self._tags_whitelist:
-                        
-                        return True
-                        
-                    
-                    if subtag in self._tags_blacklist:
-                        
-                        return False
-                        
-                    
-                
-            
-        
-        if self._namespaces_interesting:
-            
-            ( namespace, subtag ) = SplitTag( tag )
-            
-            if namespace == '':
-                
-                if self._all_unnamespaced_whitelisted:
-                    
-                    return True
-                    
-                
-                if self._all_unnamespaced_blacklisted:
-                    
-                    return False
-                    
-                
-            else:
-                
-                if namespace in self._namespaces_whitelist:
-                    
-                    return True
-                    
-                
-                if namespace in self._namespaces_blacklist:
-                    
-                    return False
-                    
-                
-                if self._all_namespaced_whitelisted:
-                    
-                    return True
-                    
-                
-                if self._all_namespaced_blacklisted:
-                    
-                    return False
-                    
-                
-            
-        
-        return True # no rules against or explicitly for, so permitted
-        
-    
     def _UpdateRuleCache( self ):
         
-        self._all_unnamespaced_whitelisted = False
-        self._all_namespaced_whitelisted = False
-        self._namespaces_whitelist = set()
-        self._tags_whitelist = set()
-        
-        self._all_unnamespaced_blacklisted = False
-        self._all_namespaced_blacklisted = False
-        self._namespaces_blacklist = set()
-        self._tags_blacklist = set()
-        
-        self._namespaces_interesting = False
-        self._tags_interesting = False
-        
-        for ( tag_slice, rule ) in self._tag_slices_to_rules.items():
-            
-            if tag_slice == '':
-                
-                if rule == HC.FILTER_WHITELIST:
-                    
-                    self._all_unnamespaced_whitelisted = True
-                    
-                else:
-                    
-                    self._all_unnamespaced_blacklisted = True
-                    
-                
-                self._namespaces_interesting = True # yes, the namespace of a tag matters to the outcome
-                
-            elif tag_slice == ':':
-                
-                if rule == HC.FILTER_WHITELIST:
-                    
-                    self._all_namespaced_whitelisted = True
-                    
-                else:
-                    
-                    self._all_namespaced_blacklisted = True
-                    
-                
-                self._namespaces_interesting = True # yes, the namespace of a tag matters to the outcome
-                
-            elif IsNamespaceTagSlice( tag_slice ):
-                
-                if rule == HC.FILTER_WHITELIST:
-                    
-                    self._namespaces_whitelist.add( tag_slice[:-1] )
-                    
-                else:
-                    
-                    self._namespaces_blacklist.add( tag_slice[:-1] )
-                    
-                
-                self._namespaces_interesting = True
-                
-            else:
-                
-                if rule == HC.FILTER_WHITELIST:
-                    
-                    self._tags_whitelist.add( tag_slice )
-                    
-                else:
-                    
-                    self._tags_blacklist.add( tag_slice )
-                    
-                
-                self._tags_interesting = True
-                
-            
+        self._matcher = TagFilterMatcher( self._tag_slices_to_rules )
         
     
     def AllowsEverything( self ):
         
-        with self._lock:
-            
-            for ( tag_slice, rule ) in self._tag_slices_to_rules.items():
-                
-                if rule == HC.FILTER_BLACKLIST:
-                    
-                    return False
-                    
-                
-            
-            return True
-            
+        return self._matcher.AllowsEverything()
         
     
     def CleanRules( self ):
@@ -600,10 +624,16 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
     
     def Filter( self, tags, apply_unnamespaced_rules_to_namespaced_tags = False ):
         
-        with self._lock:
-            
-            return { tag for tag in tags if self._TagOK( tag, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags ) }
-            
+        return set( self._matcher.FilterMany( tags, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags ) )
+        
+    
+    def FilterMany( self, tags: collections.abc.Iterable[ str ], apply_unnamespaced_rules_to_namespaced_tags = False ) -> list[ str ]:
+        
+        """
+        Returns the tags that pass, in order. Takes any iterable, so big jobs do not have to make a set first.
+        """
+        
+        return self._matcher.FilterMany( tags, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags )
         
     
     def GetChanges( self, old_tag_filter: "TagFilter" ):
@@ -688,6 +718,11 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
         return inverted_tag_filter
         
     
+    def GetMatcher( self ) -> TagFilterMatcher:
+        
+        return self._matcher
+        
+    
     def GetTagSlicesToRules( self ):
         
         with self._lock:
@@ -720,10 +755,7 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
     
     def TagOK( self, tag, apply_unnamespaced_rules_to_namespaced_tags = False ):
         
-        with self._lock:
-            
-            return self._TagOK( tag, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags )
-            
+        return self._matcher.TagOK( tag, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags )
         
     
     def ToBlacklistString( self ):
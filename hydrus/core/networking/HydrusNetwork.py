@@ -1208,6 +1208,13 @@ class ClientToServerUpdate( HydrusSerialisable.SerialisableBase ):
     
     def ApplyTagFilterToPendingMappings( self, tag_filter: HydrusTags.TagFilter ):
         
+        tag_filter_matcher = tag_filter.GetMatcher()
+        
+        if tag_filter_matcher.AllowsEverything():
+            
+            return
+            
+        
         if HC.CONTENT_UPDATE_PEND in self._actions_to_contents_and_reasons:
             
             contents_and_reasons = self._actions_to_contents_and_reasons[ HC.CONTENT_UPDATE_PEND ]
@@ -1220,7 +1227,7 @@ class ClientToServerUpdate( HydrusSerialisable.SerialisableBase ):
                     
                     ( tag, hashes ) = content.GetContentData()
                     
-                    if not tag_filter.TagOK( tag ):
+                    if not tag_filter_matcher.TagOK( tag ):
                         
                         continue
                         
@@ -11,6 +11,7 @@ from twisted.web.static import NoRangeStaticProducer, SingleRangeStaticProducer
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusProfiling
@@ -424,6 +425,9 @@ class HydrusDomain( object ):
     
 class HydrusResource( Resource ):
     
+    # the priority class this resource's db jobs get, if it is not the default
+    DB_JOB_PRIORITY = None
+    
     def __init__( self, service, domain ):
         
         super().__init__()
@@ -460,11 +464,11 @@ class HydrusResource( Resource ):
         
         if HydrusProfiling.IsProfileMode( 'client_api' ):
             
-            d = deferToThread( self._profileJob, self._threadDoGETJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._profileJob, self._threadDoGETJob, request )
             
         else:
             
-            d = deferToThread( self._threadDoGETJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._threadDoGETJob, request )
             
         
         d.addCallback( wrap_thread_result )
@@ -483,11 +487,11 @@ class HydrusResource( Resource ):
         
         if HydrusProfiling.IsProfileMode( 'client_api' ):
             
-            d = deferToThread( self._profileJob, self._threadDoOPTIONSJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._profileJob, self._threadDoOPTIONSJob, request )
             
         else:
             
-            d = deferToThread( self._threadDoOPTIONSJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._threadDoOPTIONSJob, request )
             
         
         d.addCallback( wrap_thread_result )
@@ -506,11 +510,11 @@ class HydrusResource( Resource ):
         
         if HydrusProfiling.IsProfileMode( 'client_api' ):
             
-            d = deferToThread( self._profileJob, self._threadDoPOSTJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._profileJob, self._threadDoPOSTJob, request )
             
         else:
             
-            d = deferToThread( self._threadDoPOSTJob, request )
+            d = deferToThread( self._threadCallWithDBJobPriority, self._threadDoPOSTJob, request )
             
         
         d.addCallback( wrap_thread_result )
@@ -1126,6 +1130,14 @@ class HydrusResource( Resource ):
         HG.controller.ReportRequestUsed()
         
     
+    def _threadCallWithDBJobPriority( self, call, *args ):
+        
+        with HydrusDBBase.DBJobPriorityContext( self.DB_JOB_PRIORITY ):
+            
+            return call( *args )
+            
+        
+    
     def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
         
         raise HydrusExceptions.NotFoundException( 'This service does not support that request!' )
@@ -15,6 +15,7 @@ from twisted.internet import reactor
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBJobStats
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusPaths
@@ -5392,6 +5393,32 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( len( file_search_context.GetPredicates() ), 2 )
         
+        #
+        
+        db_job_stats = HydrusDBJobStats.DBJobStats()
+        
+        db_job_stats.AddJob( 'read', 'media_results', 10.0, 10.5, 10.6 )
+        db_job_stats.AddJob( 'write', 'content_updates', 30.0, 30.0, 33.0 )
+        
+        TG.test_controller.SetDBJobStats( db_job_stats )
+        
+        path = '/manage_database/get_db_job_stats'
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'db_job_stats' ], db_job_stats.GetReport() )
+        self.assertEqual( [ row[ 'action' ] for row in d[ 'db_job_stats' ] ], [ 'content_updates', 'media_results' ] )
+        
     
     def _test_manage_duplicates( self, connection, set_up_permissions ):
         
@@ -7529,6 +7556,91 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( response.status, 200 )
         
+        # paged
+        
+        TG.test_controller.ClearReads( 'file_query_ids' )
+        
+        sorted_hash_ids = list( hash_ids )
+        
+        random.shuffle( sorted_hash_ids )
+        
+        TG.test_controller.SetRead( 'file_query_ids', list( sorted_hash_ids ) )
+        
+        tags = [ 'kino', 'green' ]
+        
+        path = '/get_files/search_files?tags={}&limit=5'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], sorted_hash_ids[ : 5 ] )
+        self.assertEqual( d[ 'num_results' ], len( sorted_hash_ids ) )
+        
+        cursor = d[ 'cursor' ]
+        
+        self.assertEqual( len( TG.test_controller.GetRead( 'file_query_ids' ) ), 1 )
+        
+        # another search in between, and the cursor still gives us the first one's results without searching again
+        
+        TG.test_controller.SetRead( 'file_query_ids', [ 1, 2, 3 ] )
+        
+        connection.request( 'GET', '/get_files/search_files?tags={}'.format( urllib.parse.quote( json.dumps( tags ) ) ), headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        TG.test_controller.ClearReads( 'file_query_ids' )
+        
+        path = '/get_files/search_files?cursor={}&offset=15&limit=5&return_hashes=true'.format( cursor )
+        
+        hash_ids_to_hashes = { hash_id : os.urandom( 32 ) for hash_id in sorted_hash_ids[ 15 : ] }
+        
+        TG.test_controller.SetRead( 'hash_ids_to_hashes', hash_ids_to_hashes )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], sorted_hash_ids[ 15 : ] )
+        self.assertEqual( d[ 'hashes' ], [ hash_ids_to_hashes[ hash_id ].hex() for hash_id in sorted_hash_ids[ 15 : ] ] )
+        self.assertEqual( d[ 'cursor' ], cursor )
+        
+        self.assertEqual( TG.test_controller.GetRead( 'file_query_ids' ), [] )
+        
+        # and the client can look at those files again
+        
+        api_permissions.CheckPermissionToSeeFiles( sorted_hash_ids[ 15 : ] )
+        
+        # a cursor we do not have
+        
+        path = '/get_files/search_files?cursor={}&limit=5'.format( os.urandom( 32 ).hex() )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
     
     def _test_search_files_predicate_parsing( self, connection, set_up_permissions ):
         
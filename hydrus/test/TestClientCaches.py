@@ -0,0 +1,608 @@
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+
+from hydrus.client import ClientRendering
+from hydrus.client.caches import ClientCaches
+from hydrus.client.caches import ClientCachesBase
+from hydrus.client.caches import ClientThumbnailPacks
+
+from hydrus.test import TestGlobals as TG
+
+class FakeCacheableObject( ClientCachesBase.CacheableObject ):
+    
+    def __init__( self, size ):
+        
+        self._size = size
+        
+    
+    def GetEstimatedMemoryFootprint( self ) -> int:
+        
+        return self._size
+        
+    
+    def IsFinishedLoading( self ):
+        
+        return True
+        
+    
+
+class FakeMediaResult( object ):
+    
+    def __init__( self, hash ):
+        
+        self._hash = hash
+        
+    
+    def GetHash( self ):
+        
+        return self._hash
+        
+    
+    def GetMime( self ):
+        
+        return HC.IMAGE_JPEG
+        
+    
+
+class FakeMedia( object ):
+    
+    def __init__( self, hash ):
+        
+        self._media_result = FakeMediaResult( hash )
+        
+    
+    def GetDisplayMediaResult( self ):
+        
+        return self._media_result
+        
+    
+
+class FakeThumbnailCacheController( object ):
+    
+    def __init__( self ):
+        
+        self.waterfall_pubs = []
+        
+    
+    def __getattr__( self, name ):
+        
+        return getattr( TG.test_controller, name )
+        
+    
+    def pub( self, topic, *args, **kwargs ):
+        
+        if topic == 'waterfall_thumbnails':
+            
+            self.waterfall_pubs.append( args )
+            
+        
+    
+    def sub( self, *args, **kwargs ):
+        
+        pass
+        
+    
+    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+        
+        # the tests drive the waterfall themselves
+        
+        pass
+        
+    
+
+class FakeFilesMaintenanceManager( object ):
+    
+    def __init__( self ):
+        
+        self.num_jobs_run = 0
+        self.job_started_event = threading.Event()
+        self.release_event = threading.Event()
+        self.error = None
+        
+    
+    def RunJobImmediately( self, media_results, job_type, pub_job_status = True ):
+        
+        self.num_jobs_run += 1
+        
+        self.job_started_event.set()
+        
+        self.release_event.wait( 10 )
+        
+        if self.error is not None:
+            
+            raise self.error
+            
+        
+    
+
+class RegenerationWatchingDict( dict ):
+    
+    def __init__( self, num_joins_to_wait_for ):
+        
+        super().__init__()
+        
+        self._num_joins_to_wait_for = num_joins_to_wait_for
+        self._num_joins = 0
+        
+        self.all_joined_event = threading.Event()
+        
+    
+    def __contains__( self, key ):
+        
+        # the cache only asks this under its lock, and a hit means that thread is now waiting on the regen in flight
+        
+        result = super().__contains__( key )
+        
+        if result:
+            
+            self._num_joins += 1
+            
+            if self._num_joins >= self._num_joins_to_wait_for:
+                
+                self.all_joined_event.set()
+                
+            
+        
+        return result
+        
+    
+
+class BlockingThumbnailCache( ClientCaches.ThumbnailCache ):
+    
+    def __init__( self, controller ):
+        
+        self.hashes_to_release_events = {}
+        
+        super().__init__( controller )
+        
+    
+    def GetThumbnail( self, media_result ):
+        
+        hash = media_result.GetHash()
+        
+        if hash in self.hashes_to_release_events:
+            
+            self.hashes_to_release_events[ hash ].wait( 10 )
+            
+        
+        return None
+        
+    
+
+class TestDataCache( unittest.TestCase ):
+    
+    def _get_cache( self, eviction_policy ):
+        
+        return ClientCachesBase.DataCache( TG.test_controller, 'test cache', 10 * 100, eviction_policy = eviction_policy )
+        
+    
+    def _touch_hot_set( self, data_cache ):
+        
+        original_correlated_reference_period = ClientCachesBase.CORRELATED_REFERENCE_PERIOD
+        
+        try:
+            
+            ClientCachesBase.CORRELATED_REFERENCE_PERIOD = 0
+            
+            for i in range( 5 ):
+                
+                data_cache.GetData( ( 'hot', i ) )
+                
+            
+        finally:
+            
+            ClientCachesBase.CORRELATED_REFERENCE_PERIOD = original_correlated_reference_period
+            
+        
+    
+    def _do_scan( self, data_cache, scan_name ):
+        
+        # lots of new data, each seen once, like a fast scroll through a big page
+        
+        for i in range( 100 ):
+            
+            data_cache.AddData( ( scan_name, i ), FakeCacheableObject( 100 ) )
+            
+            data_cache.GetIfHasData( ( scan_name, i ) )
+            
+        
+    
+    def test_lru( self ):
+        
+        data_cache = self._get_cache( ClientCachesBase.CACHE_EVICTION_LRU )
+        
+        for i in range( 5 ):
+            
+            data_cache.AddData( ( 'hot', i ), FakeCacheableObject( 100 ) )
+            
+        
+        self._touch_hot_set( data_cache )
+        
+        self._do_scan( data_cache, 'scan' )
+        
+        self.assertFalse( any( data_cache.HasData( ( 'hot', i ) ) for i in range( 5 ) ) )
+        
+    
+    def test_scan_resistant( self ):
+        
+        data_cache = self._get_cache( ClientCachesBase.CACHE_EVICTION_SCAN_RESISTANT )
+        
+        for i in range( 5 ):
+            
+            data_cache.AddData( ( 'hot', i ), FakeCacheableObject( 100 ) )
+            
+        
+        self.assertEqual( data_cache.GetIfHasData( ( 'hot', 5 ) ), None )
+        
+        self._touch_hot_set( data_cache )
+        
+        self._do_scan( data_cache, 'scan' )
+        
+        self.assertTrue( all( data_cache.HasData( ( 'hot', i ) ) for i in range( 5 ) ) )
+        self.assertTrue( data_cache.HasData( ( 'scan', 99 ) ) )
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'num_items' ], 11 )
+        self.assertEqual( stats[ 'size' ], 1100 )
+        self.assertEqual( stats[ 'num_hits' ], 105 )
+        self.assertEqual( stats[ 'num_misses' ], 1 )
+        self.assertEqual( stats[ 'num_evictions' ], 94 )
+        self.assertEqual( stats[ 'num_bytes_evicted' ], 9400 )
+        
+        # something we threw out too early comes back into the protected part
+        
+        data_cache.AddData( ( 'scan', 0 ), FakeCacheableObject( 100 ) )
+        
+        self._do_scan( data_cache, 'second scan' )
+        
+        self.assertTrue( data_cache.HasData( ( 'scan', 0 ) ) )
+        
+        # a giant does not get to push the hot set out
+        
+        data_cache.AddData( 'giant', FakeCacheableObject( 900 ) )
+        
+        data_cache.GetData( 'giant' )
+        
+        self._do_scan( data_cache, 'third scan' )
+        
+        self.assertFalse( data_cache.HasData( 'giant' ) )
+        self.assertTrue( all( data_cache.HasData( ( 'hot', i ) ) for i in range( 5 ) ) )
+        
+        self.assertIn( 'test cache', [ d[ 'name' ] for d in ClientCachesBase.GetAllDataCacheStats() ] )
+        
+    
+
+class TestThumbnailPackCache( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._dir = tempfile.mkdtemp()
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        shutil.rmtree( cls._dir )
+        
+    
+    def _get_hydrus_bitmap( self, width, height, value ):
+        
+        numpy_image = numpy.full( ( height, width, 3 ), value, dtype = numpy.uint8 )
+        
+        return ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
+        
+    
+    def test_pack_cache( self ):
+        
+        path = os.path.join( self._dir, 'test_pack_cache' )
+        
+        settings = ( [ 150, 125 ], 0, 100 )
+        
+        thumbnail_pack_cache = ClientThumbnailPacks.ThumbnailPackCache( path )
+        
+        thumbnail_pack_cache.CheckSettings( settings )
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+        
+        for ( i, hash ) in enumerate( hashes ):
+            
+            thumbnail_pack_cache.StoreHydrusBitmap( hash, self._get_hydrus_bitmap( 100 + i, 50, i ) )
+            
+        
+        hydrus_bitmap = thumbnail_pack_cache.GetHydrusBitmap( hashes[2], expected_resolution = ( 102, 50 ) )
+        
+        self.assertEqual( hydrus_bitmap.GetSize(), ( 102, 50 ) )
+        self.assertTrue( ( hydrus_bitmap.GetNumpyImage() == 2 ).all() )
+        
+        # rotated is fine, wrong size is not
+        self.assertIsNotNone( thumbnail_pack_cache.GetHydrusBitmap( hashes[2], expected_resolution = ( 50, 102 ) ) )
+        self.assertIsNone( thumbnail_pack_cache.GetHydrusBitmap( hashes[2], expected_resolution = ( 100, 50 ) ) )
+        
+        thumbnail_pack_cache.Invalidate( [ hashes[1] ] )
+        
+        self.assertIsNone( thumbnail_pack_cache.GetHydrusBitmap( hashes[1] ) )
+        
+        # the regenerated thumb goes on the end
+        thumbnail_pack_cache.StoreHydrusBitmap( hashes[3], self._get_hydrus_bitmap( 103, 50, 33 ) )
+        
+        thumbnail_pack_cache.Close()
+        
+        # and it all survives a reload, including a half-written index record from a crash
+        
+        with open( os.path.join( path, ClientThumbnailPacks.INDEX_FILENAME ), 'ab' ) as f:
+            
+            f.write( b'ab' )
+            
+        
+        thumbnail_pack_cache = ClientThumbnailPacks.ThumbnailPackCache( path )
+        
+        thumbnail_pack_cache.CheckSettings( settings )
+        
+        self.assertEqual( thumbnail_pack_cache.GetNumThumbnails(), 4 )
+        self.assertFalse( thumbnail_pack_cache.HasThumbnail( hashes[1] ) )
+        self.assertTrue( ( thumbnail_pack_cache.GetHydrusBitmap( hashes[3] ).GetNumpyImage() == 33 ).all() )
+        self.assertTrue( ( thumbnail_pack_cache.GetHydrusBitmap( hashes[4] ).GetNumpyImage() == 4 ).all() )
+        
+        thumbnail_pack_cache.StoreHydrusBitmap( hashes[1], self._get_hydrus_bitmap( 101, 50, 11 ) )
+        
+        self.assertTrue( ( thumbnail_pack_cache.GetHydrusBitmap( hashes[1] ).GetNumpyImage() == 11 ).all() )
+        
+        # new thumbnail size, so everything goes
+        
+        thumbnail_pack_cache.CheckSettings( ( [ 200, 200 ], 0, 100 ) )
+        
+        self.assertEqual( thumbnail_pack_cache.GetNumThumbnails(), 0 )
+        self.assertIsNone( thumbnail_pack_cache.GetHydrusBitmap( hashes[0] ) )
+        
+        thumbnail_pack_cache.Close()
+        
+        self.assertIsNone( thumbnail_pack_cache.GetHydrusBitmap( hashes[0] ) )
+        
+    
+
+class TestThumbnailCacheWaterfall( unittest.TestCase ):
+    
+    def _get_medias( self, num_medias ):
+        
+        # the waterfall goes in hash order for the same mime
+        return [ FakeMedia( bytes( [ i ] ) * 32 ) for i in range( num_medias ) ]
+        
+    
+    def _get_published_medias( self, controller, page_key ):
+        
+        return [ media for ( published_page_key, medias ) in controller.waterfall_pubs if published_page_key == page_key for media in medias ]
+        
+    
+    def _work_until( self, thumbnail_cache, executor, test_callable ):
+        
+        for i in range( 2000 ):
+            
+            if test_callable():
+                
+                return
+                
+            
+            thumbnail_cache._WorkOnWaterfall( executor, 16 )
+            
+        
+        self.fail( 'The waterfall did not get there!' )
+        
+    
+    def test_cancel( self ):
+        
+        for cancel_with_clear in ( False, True ):
+            
+            controller = FakeThumbnailCacheController()
+            
+            thumbnail_cache = BlockingThumbnailCache( controller )
+            
+            page_key = HydrusData.GenerateKey()
+            
+            ( media_1, media_2 ) = self._get_medias( 2 )
+            
+            release_event = threading.Event()
+            
+            thumbnail_cache.hashes_to_release_events[ media_1.GetDisplayMediaResult().GetHash() ] = release_event
+            
+            executor = concurrent.futures.ThreadPoolExecutor( max_workers = 4 )
+            
+            try:
+                
+                thumbnail_cache.Waterfall( page_key, [ media_1, media_2 ] )
+                
+                thumbnail_cache._WorkOnWaterfall( executor, 16 )
+                
+                # the second is held up behind the first
+                self.assertEqual( len( thumbnail_cache._waterfall_in_flight ), 2 )
+                
+                if cancel_with_clear:
+                    
+                    thumbnail_cache.Clear()
+                    
+                else:
+                    
+                    thumbnail_cache.CancelWaterfall( page_key, [ media_1, media_2 ] )
+                    
+                
+                self.assertEqual( len( thumbnail_cache._waterfall_in_flight ), 0 )
+                self.assertTrue( thumbnail_cache._waterfall_queue_empty_event.is_set() )
+                
+                release_event.set()
+                
+                executor.shutdown( wait = True )
+                
+                thumbnail_cache._WorkOnWaterfall( executor, 16 )
+                
+                self.assertEqual( controller.waterfall_pubs, [] )
+                
+            finally:
+                
+                release_event.set()
+                
+                executor.shutdown( wait = True )
+                
+            
+        
+    
+    def test_empty_event( self ):
+        
+        controller = FakeThumbnailCacheController()
+        
+        thumbnail_cache = BlockingThumbnailCache( controller )
+        
+        page_key = HydrusData.GenerateKey()
+        
+        ( media, ) = self._get_medias( 1 )
+        
+        release_event = threading.Event()
+        
+        thumbnail_cache.hashes_to_release_events[ media.GetDisplayMediaResult().GetHash() ] = release_event
+        
+        executor = concurrent.futures.ThreadPoolExecutor( max_workers = 4 )
+        
+        try:
+            
+            thumbnail_cache.Waterfall( page_key, [ media ] )
+            
+            self.assertFalse( thumbnail_cache._waterfall_queue_empty_event.is_set() )
+            
+            thumbnail_cache._WorkOnWaterfall( executor, 16 )
+            
+            # the queue is empty, but the thumb is still in flight
+            self.assertEqual( len( thumbnail_cache._waterfall_queue ), 0 )
+            self.assertFalse( thumbnail_cache._waterfall_queue_empty_event.is_set() )
+            
+            # and a queue recalc does not think it is empty either
+            thumbnail_cache.Waterfall( HydrusData.GenerateKey(), [] )
+            
+            self.assertFalse( thumbnail_cache._waterfall_queue_empty_event.is_set() )
+            
+            release_event.set()
+            
+            self._work_until( thumbnail_cache, executor, thumbnail_cache._waterfall_queue_empty_event.is_set )
+            
+            self.assertEqual( self._get_published_medias( controller, page_key ), [ media ] )
+            
+        finally:
+            
+            release_event.set()
+            
+            executor.shutdown( wait = True )
+            
+        
+    
+    def test_publish_order( self ):
+        
+        controller = FakeThumbnailCacheController()
+        
+        thumbnail_cache = BlockingThumbnailCache( controller )
+        
+        page_key_1 = HydrusData.GenerateKey()
+        page_key_2 = HydrusData.GenerateKey()
+        
+        # the pages interleave in the waterfall
+        ( media_1_1, media_2_1, media_1_2, media_2_2 ) = self._get_medias( 4 )
+        
+        release_event = threading.Event()
+        
+        thumbnail_cache.hashes_to_release_events[ media_1_1.GetDisplayMediaResult().GetHash() ] = release_event
+        
+        executor = concurrent.futures.ThreadPoolExecutor( max_workers = 4 )
+        
+        try:
+            
+            thumbnail_cache.Waterfall( page_key_1, [ media_1_1, media_1_2 ] )
+            thumbnail_cache.Waterfall( page_key_2, [ media_2_1, media_2_2 ] )
+            
+            self._work_until( thumbnail_cache, executor, lambda: len( self._get_published_medias( controller, page_key_2 ) ) == 2 )
+            
+            # a slow thumb holds up its own page and nothing else
+            self.assertEqual( self._get_published_medias( controller, page_key_1 ), [] )
+            self.assertEqual( self._get_published_medias( controller, page_key_2 ), [ media_2_1, media_2_2 ] )
+            
+            release_event.set()
+            
+            self._work_until( thumbnail_cache, executor, lambda: len( self._get_published_medias( controller, page_key_1 ) ) == 2 )
+            
+            self.assertEqual( self._get_published_medias( controller, page_key_1 ), [ media_1_1, media_1_2 ] )
+            self.assertTrue( thumbnail_cache._waterfall_queue_empty_event.is_set() )
+            
+        finally:
+            
+            release_event.set()
+            
+            executor.shutdown( wait = True )
+            
+        
+    
+    def test_regeneration_is_shared( self ):
+        
+        num_followers = 3
+        
+        for error in ( None, HydrusExceptions.FileMissingException( 'no file!' ) ):
+            
+            controller = FakeThumbnailCacheController()
+            
+            files_maintenance_manager = FakeFilesMaintenanceManager()
+            files_maintenance_manager.error = error
+            
+            controller.files_maintenance_manager = files_maintenance_manager
+            
+            thumbnail_cache = BlockingThumbnailCache( controller )
+            
+            regenerations = RegenerationWatchingDict( num_followers )
+            
+            thumbnail_cache._hashes_to_thumbnail_regenerations = regenerations
+            
+            media_result = FakeMediaResult( os.urandom( 32 ) )
+            
+            executor = concurrent.futures.ThreadPoolExecutor( max_workers = 1 + num_followers )
+            
+            try:
+                
+                leader_future = executor.submit( thumbnail_cache._RegenerateThumbnail, media_result )
+                
+                self.assertTrue( files_maintenance_manager.job_started_event.wait( 10 ) )
+                
+                follower_futures = [ executor.submit( thumbnail_cache._RegenerateThumbnail, media_result ) for i in range( num_followers ) ]
+                
+                self.assertTrue( regenerations.all_joined_event.wait( 10 ) )
+                
+                files_maintenance_manager.release_event.set()
+                
+                for future in [ leader_future ] + follower_futures:
+                    
+                    if error is None:
+                        
+                        self.assertIsNone( future.result( 10 ) )
+                        
+                    else:
+                        
+                        self.assertIs( future.exception( 10 ), error )
+                        
+                    
+                
+                self.assertEqual( files_maintenance_manager.num_jobs_run, 1 )
+                self.assertEqual( len( regenerations ), 0 )
+                
+            finally:
+                
+                files_maintenance_manager.release_event.set()
+                
+                executor.shutdown( wait = True )
+                
+            
+        
+    
@@ -1,10 +1,13 @@
 import os
+import random
 import time
 import typing
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusNumbers
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusStaticDir
@@ -17,7 +20,15 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientLocation
 from hydrus.client import ClientServices
+from hydrus.client import ClientStrings
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBFilesSearchCache
+from hydrus.client.db import ClientDBSimilarFiles
+from hydrus.client.db import ClientDBTagSearch
+from hydrus.client.db import ClientDBURLMap
+from hydrus.client.duplicates import ClientDuplicates
+from hydrus.client.duplicates import ClientPotentialDuplicatesSearchContext
+from hydrus.client.duplicates import ClientVPTreeBuilder
 from hydrus.client.exporting import ClientExportingFiles
 from hydrus.client.files import ClientFilesPhysical
 from hydrus.client.files.images import ClientImagePerceptualHashes
@@ -30,6 +41,7 @@ from hydrus.client.importing.options import ImportOptionsContainer
 from hydrus.client.importing.options import ImportOptionsManager
 from hydrus.client.metadata import ClientContentUpdates
 from hydrus.client.metadata import ClientTags
+from hydrus.client.networking import ClientNetworkingURLClass
 from hydrus.client.search import ClientNumberTest
 from hydrus.client.search import ClientSearchFileSearchContext
 from hydrus.client.search import ClientSearchPredicate
@@ -94,6 +106,33 @@ class TestClientDB( unittest.TestCase ):
     def _read( self, action, *args, **kwargs ): return TestClientDB._db.Read( action, *args, **kwargs )
     def _write( self, action, *args, **kwargs ): return TestClientDB._db.Write( action, True, *args, **kwargs )
     
+    def _fake_import_perceptual_hashes( self, perceptual_hashes ):
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        for perceptual_hash in perceptual_hashes:
+            
+            fake_file_import_job = ClientImportFiles.FileImportJob( 'fake path', full_import_options_container )
+            
+            fake_file_import_job._pre_import_file_status = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, os.urandom( 32 ) )
+            fake_file_import_job._file_info = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._perceptual_hashes = [ perceptual_hash ]
+            
+            self._write( 'import_file', fake_file_import_job )
+            
+        
+    
+    def _get_perceptual_hash_ladder( self ):
+        
+        base_perceptual_hash_int = int.from_bytes( os.urandom( 8 ), 'big' )
+        
+        bit_positions = random.sample( range( 64 ), 12 )
+        
+        # hash n is n bits away from the first, and hashes i and j are |i - j| apart
+        return [ ( base_perceptual_hash_int ^ sum( 1 << bit_position for bit_position in bit_positions[ : num_bits ] ) ).to_bytes( 8, 'big' ) for num_bits in range( 13 ) ]
+        
+    
     def test_autocomplete( self ):
         
         full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
@@ -242,6 +281,338 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( set( result ), preds )
         
     
+    def test_autocomplete_in_memory_index( self ):
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        TestClientDB._clear_db()
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 3 ) ]
+        
+        def do_mappings( action, tags ):
+            
+            content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, hashes ) ) for tag in tags ]
+            
+            self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates ) )
+            
+        
+        def get_tags( search_text ):
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = search_text )
+            
+            return { predicate.GetValue() for predicate in result }
+            
+        
+        do_mappings( HC.CONTENT_UPDATE_ADD, ( 'samus aran', 'samus returns', 'series:metroid prime', 'character:samus aran', 'ridley', 'samurai-jack', 'Émile', 'man hat', 'happy man', '日本 語', 'title:a samus story' ) )
+        
+        search_texts = ( 's*', 'sa*', 'samus*', 'samus a*', 'samus ar*', 'aran*', 'character:sam*', 'series:sam*', '*:sam*', 'chara*:samus*', 'jack*', 'samurai-j*', 'samurai j*', 'man ha*', 'ha*', 'ÉM*', 'émile*', '日*', '日本 語*', 'zzz*', 'samus  a*' )
+        
+        without_index_results = { search_text : get_tags( search_text ) for search_text in search_texts }
+        
+        self.assertEqual( without_index_results[ 'samus a*' ], { 'samus aran', 'character:samus aran' } )
+        self.assertEqual( without_index_results[ 'man ha*' ], { 'man hat' } )
+        
+        try:
+            
+            TG.test_controller.new_options.SetBoolean( 'tag_autocomplete_in_memory_index', True )
+            
+            for ( search_text, tags ) in without_index_results.items():
+                
+                self.assertEqual( get_tags( search_text ), tags )
+                
+            
+            self.assertGreater( len( self._db.modules_tag_search._tag_autocomplete_indices ), 0 )
+            
+            # the index keeps up with new and deleted tags
+            
+            do_mappings( HC.CONTENT_UPDATE_ADD, ( 'samus fusion', 'character:ridley' ) )
+            do_mappings( HC.CONTENT_UPDATE_DELETE, ( 'samus aran', ) )
+            
+            self.assertEqual( get_tags( 'samus*' ), { 'samus returns', 'samus fusion', 'character:samus aran', 'title:a samus story' } )
+            self.assertEqual( get_tags( 'samus a*' ), { 'character:samus aran' } )
+            self.assertEqual( get_tags( 'character:*' ), { 'character:samus aran', 'character:ridley' } )
+            self.assertEqual( get_tags( 'character:r*' ), { 'character:ridley' } )
+            
+            do_mappings( HC.CONTENT_UPDATE_ADD, ( 'samus aran', ) )
+            
+            self.assertEqual( get_tags( 'samus a*' ), { 'samus aran', 'character:samus aran' } )
+            
+            # and too many changes means it is rebuilt from the tables
+            
+            original_min_loose_changes = ClientDBTagSearch.TAG_AUTOCOMPLETE_INDEX_MIN_LOOSE_CHANGES
+            
+            try:
+                
+                ClientDBTagSearch.TAG_AUTOCOMPLETE_INDEX_MIN_LOOSE_CHANGES = 0
+                
+                self.assertEqual( get_tags( 'samus*' ), { 'samus aran', 'samus returns', 'samus fusion', 'character:samus aran', 'title:a samus story' } )
+                
+            finally:
+                
+                ClientDBTagSearch.TAG_AUTOCOMPLETE_INDEX_MIN_LOOSE_CHANGES = original_min_loose_changes
+                
+            
+            self.assertEqual( get_tags( 'fus*' ), { 'samus fusion' } )
+            
+            # 'my files' shares the hydrus local file storage tags table, so it shares that index
+            
+            path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+            
+            full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            my_files_hash = file_import_job.GetHash()
+            
+            my_files_file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), tag_context = tag_context )
+            
+            def do_my_files_mappings( action, tags ):
+                
+                content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, ( my_files_hash, ) ) ) for tag in tags ]
+                
+                self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates ) )
+                
+            
+            def get_my_files_tags( search_text ):
+                
+                result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, my_files_file_search_context, search_text = search_text )
+                
+                return { predicate.GetValue() for predicate in result }
+                
+            
+            do_my_files_mappings( HC.CONTENT_UPDATE_ADD, ( 'metroid zero mission', ) )
+            
+            self.assertEqual( get_my_files_tags( 'metroid*' ), { 'metroid zero mission' } )
+            
+            do_my_files_mappings( HC.CONTENT_UPDATE_ADD, ( 'metroid dread', ) )
+            do_my_files_mappings( HC.CONTENT_UPDATE_DELETE, ( 'metroid zero mission', ) )
+            
+            self.assertEqual( get_my_files_tags( 'metroid*' ), { 'metroid dread' } )
+            
+            do_my_files_mappings( HC.CONTENT_UPDATE_ADD, ( 'metroid zero mission', ) )
+            
+            self.assertEqual( get_my_files_tags( 'metroid z*' ), { 'metroid zero mission' } )
+            
+            # a failed write is rolled back, so the indices go
+            
+            self.assertGreater( len( self._db.modules_tag_search._tag_autocomplete_indices ), 0 )
+            
+            with self.assertRaises( HydrusExceptions.DBException ):
+                
+                self._write( 'not a real write action' )
+                
+            
+            self.assertEqual( len( self._db.modules_tag_search._tag_autocomplete_indices ), 0 )
+            
+            self.assertEqual( get_my_files_tags( 'metroid*' ), { 'metroid dread', 'metroid zero mission' } )
+            
+        finally:
+            
+            TG.test_controller.new_options.SetBoolean( 'tag_autocomplete_in_memory_index', False )
+            
+        
+        # the read pool does not get to see changes until they are committed
+        
+        tag_autocomplete_index = ClientDBTagSearch.TagAutocompleteIndex( [ ( 1, 1, 'samus aran' ) ] )
+        
+        self.assertIsNone( tag_autocomplete_index.Search( [ 'sam' ], committed_only = True ) )
+        
+        tag_autocomplete_index.NotifyCommit()
+        
+        self.assertEqual( tag_autocomplete_index.Search( [ 'sam' ], committed_only = True ), { 1 } )
+        
+        tag_autocomplete_index.AddTags( [ ( 2, 1, 'samus returns' ) ] )
+        
+        self.assertIsNone( tag_autocomplete_index.Search( [ 'sam' ], committed_only = True ) )
+        self.assertEqual( tag_autocomplete_index.Search( [ 'sam' ] ), { 1, 2 } )
+            
+        
+    
+    def test_autocomplete_trigram_index( self ):
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        def do_mappings( action, tags ):
+            
+            content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, ( hash, ) ) ) for tag in tags ]
+            
+            self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates ) )
+            
+        
+        def get_tags( search_text ):
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = search_text )
+            
+            return { predicate.GetValue() for predicate in result }
+            
+        
+        do_mappings( HC.CONTENT_UPDATE_ADD, ( 'samus aran', 'series:metroid prime', 'ridley' ) )
+        
+        without_index_results = { search_text : get_tags( search_text ) for search_text in ( '*amu*', '*troid pr*', '*id*', '*us*', '*i*e*', 'series:*prime' ) }
+        
+        self._write( 'regenerate_subtag_trigram_indices' )
+        
+        for ( search_text, tags ) in without_index_results.items():
+            
+            self.assertEqual( get_tags( search_text ), tags )
+            
+        
+        self.assertEqual( get_tags( '*amu*' ), { 'samus aran' } )
+        self.assertEqual( get_tags( '*troid pr*' ), { 'series:metroid prime' } )
+        self.assertEqual( get_tags( '*id*' ), { 'series:metroid prime', 'ridley' } )
+        self.assertEqual( get_tags( '*zzz*' ), set() )
+        
+        # the index keeps up with new and deleted tags
+        
+        do_mappings( HC.CONTENT_UPDATE_ADD, ( 'samus returns', ) )
+        
+        self.assertEqual( get_tags( '*retu*' ), { 'samus returns' } )
+        self.assertEqual( get_tags( '*amu*' ), { 'samus aran', 'samus returns' } )
+        
+        do_mappings( HC.CONTENT_UPDATE_DELETE, ( 'samus aran', ) )
+        
+        self.assertEqual( get_tags( '*amu*' ), { 'samus returns' } )
+        
+        # and a cache regen keeps it
+        
+        self._write( 'regenerate_tag_cache' )
+        
+        self.assertEqual( get_tags( '*retu*' ), { 'samus returns' } )
+        
+        self._write( 'delete_subtag_trigram_indices' )
+        
+        self.assertEqual( get_tags( '*retu*' ), { 'samus returns' } )
+        self.assertEqual( get_tags( '*troid pr*' ), { 'series:metroid prime' } )
+        
+    
+    def test_coalesced_content_updates( self ):
+        
+        db = TestClientDB._db
+        
+        def get_num_content_update_jobs():
+            
+            for d in db.GetJobStats():
+                
+                if ( d[ 'job_type' ], d[ 'action' ] ) == ( 'write', 'content_updates' ):
+                    
+                    return d[ 'count' ]
+                    
+                
+            
+            return 0
+            
+        
+        num_jobs_before = get_num_content_update_jobs()
+        
+        # pause the db so our writes pile up in the queue
+        
+        db.PauseAndDisconnect( True )
+        
+        while db.IsConnected():
+            
+            time.sleep( 0.05 )
+            
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+        
+        for hash in hashes:
+            
+            content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'coalesce test', ( hash, ) ) ) ]
+            
+            content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates )
+            
+            db.Write( 'content_updates', False, content_update_package )
+            
+        
+        db.PauseAndDisconnect( False )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = 'coalesce test' )
+        
+        pred = ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'coalesce test', count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 5 ) )
+        
+        self.assertEqual( result, [ pred ] )
+        
+        self.assertEqual( get_num_content_update_jobs() - num_jobs_before, 1 )
+        
+        # a package that would be reordered by the merge is not taken
+        
+        def get_args_and_kwargs( service_keys ):
+            
+            content_update_package = ClientContentUpdates.ContentUpdatePackage()
+            
+            for service_key in service_keys:
+                
+                content_update_package.AddContentUpdate( service_key, ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'coalesce test', ( hashes[0], ) ) ) )
+                
+            
+            return ( ( content_update_package, ), {} )
+            
+        
+        a = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY
+        b = CC.COMBINED_TAG_SERVICE_KEY
+        
+        so_far = [ get_args_and_kwargs( ( a, b ) ) ]
+        
+        coalesce_state = {}
+        
+        db._UpdateCoalesceWriteJobState( 'content_updates', coalesce_state, *so_far[0] )
+        
+        self.assertEqual( coalesce_state[ 'service_keys' ], [ a, b ] )
+        
+        self.assertTrue( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, *get_args_and_kwargs( ( b, ) ) ) )
+        self.assertFalse( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, *get_args_and_kwargs( ( a, ) ) ) )
+        self.assertFalse( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, *get_args_and_kwargs( ( b, a ) ) ) )
+        
+        ( args, kwargs ) = get_args_and_kwargs( ( b, ) )
+        
+        self.assertFalse( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, args, { 'publish_content_updates' : False } ) )
+        
+        # the state keeps up as packages are taken, without going back over them
+        
+        so_far.append( ( args, {} ) )
+        
+        db._UpdateCoalesceWriteJobState( 'content_updates', coalesce_state, args, {} )
+        
+        self.assertEqual( coalesce_state[ 'service_keys' ], [ a, b ] )
+        self.assertEqual( coalesce_state[ 'service_keys_set' ], { a, b } )
+        
+        self.assertTrue( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, *get_args_and_kwargs( ( b, ) ) ) )
+        self.assertFalse( db._CanCoalesceWriteJob( 'content_updates', coalesce_state, so_far, *get_args_and_kwargs( ( a, ) ) ) )
+        
+    
     def test_export_folders( self ):
         
         tag_context = ClientSearchTagContext.TagContext( service_key = HydrusData.GenerateKey() )
@@ -703,6 +1074,26 @@ class TestClientDB( unittest.TestCase ):
         
         run_or_predicate_tests( tests )
         
+        # mixed tag searches, which get planned most selective first
+        
+        tests = []
+        
+        tests.append( ( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_NAMESPACE, 'series' ) ], 1 ) )
+        tests.append( ( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_NAMESPACE, 'series' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX ) ], 0 ) )
+        tests.append( ( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'car' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_WILDCARD, 'maker:f*' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_ARCHIVE ) ], 1 ) )
+        tests.append( ( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'truck' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_NAMESPACE, 'series' ) ], 0 ) )
+        
+        HG.db_report_mode = True
+        
+        try:
+            
+            run_or_predicate_tests( tests )
+            
+        finally:
+            
+            HG.db_report_mode = False
+            
+        
         #
         
         from hydrus.test import TestController
@@ -795,11 +1186,21 @@ class TestClientDB( unittest.TestCase ):
         run_system_predicate_tests( tests )
         
     
-    def test_file_system_predicates( self ):
+    def test_file_search_result_cache( self ):
         
         TestClientDB._clear_db()
         
-        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        def get_num_hits():
+            
+            return sum( ( d[ 'num_hits' ] for d in ClientDBFilesSearchCache.GetAllDependencyCacheStats() if d[ 'name' ] == 'file search results' ) )
+            
+        
+        def get_search_context( predicates ):
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            return ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+            
         
         path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
         
@@ -813,61 +1214,215 @@ class TestClientDB( unittest.TestCase ):
         
         self._write( 'import_file', file_import_job )
         
-        #
+        hash = file_import_job.GetHash()
         
-        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), tag_context = ClientSearchTagContext.TagContext() )
+        tag_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'cache test' ) ] )
+        inbox_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX ) ] )
+        time_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_IMPORT_TIME, ( '<', 'delta', ( 1, 1, 1, 1, ) ) ) ] )
         
-        result = self._read( 'file_system_predicates', file_search_context )
+        self.assertEqual( len( self._read( 'file_query_ids', tag_search_context ) ), 0 )
+        self.assertEqual( len( self._read( 'file_query_ids', inbox_search_context ) ), 1 )
+        self.assertEqual( len( self._read( 'file_query_ids', time_search_context ) ), 1 )
         
-        predicates = []
+        num_hits = get_num_hits()
         
-        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_EVERYTHING, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 1 ) ) )
-        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 1 ) ) )
-        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_ARCHIVE, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 0 ) ) )
-        predicates.extend( [ ClientSearchPredicate.Predicate( predicate_type ) for predicate_type in [ ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_LIMIT, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIZE, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TIME, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_URLS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_PROPERTIES, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_HASH, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_DIMENSIONS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_DURATION, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NOTES, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_WORDS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_MIME, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_RATING, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_SERVICE, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_ADVANCED, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_AS_NUMBER, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_VIEWING_STATS ] ] )
+        self.assertEqual( len( self._read( 'file_query_ids', tag_search_context ) ), 0 )
+        self.assertEqual( len( self._read( 'file_query_ids', inbox_search_context ) ), 1 )
+        self.assertEqual( len( self._read( 'file_query_ids', time_search_context ) ), 1 )
         
-        self.assertEqual( set( result ), set( predicates ) )
+        # we don't cache time searches
+        self.assertEqual( get_num_hits(), num_hits + 2 )
         
-        for i in range( len( predicates ) ): self.assertEqual( result[i].GetCount().GetMinCount(), predicates[i].GetCount().GetMinCount() )
+        # new tag drops the tag search but not the inbox one
         
-    
-    def test_file_updates( self ):
+        content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdate( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'cache test', ( hash, ) ) ) )
         
-        TestClientDB._clear_db()
+        self._write( 'content_updates', content_update_package )
         
-        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        num_hits = get_num_hits()
         
-        md5 = bytes.fromhex( 'fdadb2cae78f2dfeb629449cd005f2a2' )
+        self.assertEqual( len( self._read( 'file_query_ids', tag_search_context ) ), 1 )
+        self.assertEqual( len( self._read( 'file_query_ids', inbox_search_context ) ), 1 )
         
-        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        self.assertEqual( get_num_hits(), num_hits + 1 )
         
-        ( media_result, ) = self._read( 'media_results', ( hash, ) )
+        # and the other way around
         
-        hash_id = media_result.GetHashId()
+        content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdate( CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY, ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash, ) ) )
         
-        locations_manager = media_result.GetLocationsManager()
+        self._write( 'content_updates', content_update_package )
         
-        self.assertFalse( locations_manager.IsLocal() )
-        self.assertFalse( CC.LOCAL_FILE_SERVICE_KEY in locations_manager.GetCurrent() )
-        self.assertFalse( CC.LOCAL_FILE_SERVICE_KEY in locations_manager.GetDeleted() )
-        self.assertFalse( CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY in locations_manager.GetCurrent() )
-        self.assertFalse( CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY in locations_manager.GetDeleted() )
-        self.assertFalse( CC.TRASH_SERVICE_KEY in locations_manager.GetCurrent() )
-        self.assertFalse( CC.TRASH_SERVICE_KEY in locations_manager.GetDeleted() )
+        num_hits = get_num_hits()
         
-        self._db.modules_media_results._weakref_media_result_cache.DropMediaResult( hash_id, hash )
+        self.assertEqual( len( self._read( 'file_query_ids', tag_search_context ) ), 1 )
+        self.assertEqual( len( self._read( 'file_query_ids', inbox_search_context ) ), 0 )
         
-        #
+        self.assertEqual( get_num_hits(), num_hits + 1 )
         
-        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        # something the cache doesn't understand clears everything
         
-        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        self._write( 'delete_service_info' )
         
-        file_import_job.GeneratePreImportHashAndStatus()
+        num_hits = get_num_hits()
         
-        file_import_job.GenerateInfo()
+        self.assertEqual( len( self._read( 'file_query_ids', tag_search_context ) ), 1 )
         
-        self._write( 'import_file', file_import_job )
+        self.assertEqual( get_num_hits(), num_hits )
+        
+    
+    def test_file_search_tag_bitmaps( self ):
+        
+        TestClientDB._clear_db()
+        
+        def get_num_bitmaps():
+            
+            return sum( ( d[ 'num_items' ] for d in ClientDBFilesSearchCache.GetAllDependencyCacheStats() if d[ 'name' ] == 'big tag file bitmaps' ) )
+            
+        
+        def get_search_context( predicates ):
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            # one tag service, so one bitmap per tag
+            tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+            
+            return ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = predicates )
+            
+        
+        def set_tags( tags, content_update_action ):
+            
+            content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, content_update_action, ( tag, ( hash, ) ) ) for tag in tags ]
+            
+            self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates ) )
+            
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        set_tags( [ 'bitmap a', 'bitmap b', 'bitmap c' ], HC.CONTENT_UPDATE_ADD )
+        
+        and_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'bitmap a' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'bitmap b' ) ] )
+        not_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'bitmap a' ), ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'bitmap c', inclusive = False ) ] )
+        c_search_context = get_search_context( [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'bitmap c' ) ] )
+        
+        original_min_count = ClientDBFilesSearchCache.ID_BITMAP_MIN_COUNT
+        
+        try:
+            
+            # every tag is big enough
+            ClientDBFilesSearchCache.ID_BITMAP_MIN_COUNT = 0
+            
+            self.assertEqual( len( self._read( 'file_query_ids', and_search_context ) ), 1 )
+            
+            self.assertEqual( get_num_bitmaps(), 2 )
+            
+            # a NOT only uses a bitmap we already have
+            
+            self.assertEqual( len( self._read( 'file_query_ids', not_search_context ) ), 0 )
+            self.assertEqual( len( self._read( 'file_query_ids', c_search_context ) ), 1 )
+            
+            self.assertEqual( get_num_bitmaps(), 3 )
+            
+            # a tag change drops them all and the searches are still right
+            
+            set_tags( [ 'bitmap b', 'bitmap c' ], HC.CONTENT_UPDATE_DELETE )
+            
+            self.assertEqual( get_num_bitmaps(), 0 )
+            
+            self.assertEqual( len( self._read( 'file_query_ids', c_search_context ) ), 0 )
+            self.assertEqual( len( self._read( 'file_query_ids', and_search_context ) ), 0 )
+            self.assertEqual( len( self._read( 'file_query_ids', not_search_context ) ), 1 )
+            
+        finally:
+            
+            ClientDBFilesSearchCache.ID_BITMAP_MIN_COUNT = original_min_count
+            
+        
+    
+    def test_file_system_predicates( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        #
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), tag_context = ClientSearchTagContext.TagContext() )
+        
+        result = self._read( 'file_system_predicates', file_search_context )
+        
+        predicates = []
+        
+        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_EVERYTHING, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 1 ) ) )
+        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 1 ) ) )
+        predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_ARCHIVE, count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 0 ) ) )
+        predicates.extend( [ ClientSearchPredicate.Predicate( predicate_type ) for predicate_type in [ ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_LIMIT, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIZE, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TIME, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_URLS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_PROPERTIES, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_HASH, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_DIMENSIONS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_DURATION, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NOTES, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_NUM_WORDS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_MIME, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_RATING, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_SERVICE, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_ADVANCED, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_TAG_AS_NUMBER, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS, ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_FILE_VIEWING_STATS ] ] )
+        
+        self.assertEqual( set( result ), set( predicates ) )
+        
+        for i in range( len( predicates ) ): self.assertEqual( result[i].GetCount().GetMinCount(), predicates[i].GetCount().GetMinCount() )
+        
+    
+    def test_file_updates( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        md5 = bytes.fromhex( 'fdadb2cae78f2dfeb629449cd005f2a2' )
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        ( media_result, ) = self._read( 'media_results', ( hash, ) )
+        
+        hash_id = media_result.GetHashId()
+        
+        locations_manager = media_result.GetLocationsManager()
+        
+        self.assertFalse( locations_manager.IsLocal() )
+        self.assertFalse( CC.LOCAL_FILE_SERVICE_KEY in locations_manager.GetCurrent() )
+        self.assertFalse( CC.LOCAL_FILE_SERVICE_KEY in locations_manager.GetDeleted() )
+        self.assertFalse( CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY in locations_manager.GetCurrent() )
+        self.assertFalse( CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY in locations_manager.GetDeleted() )
+        self.assertFalse( CC.TRASH_SERVICE_KEY in locations_manager.GetCurrent() )
+        self.assertFalse( CC.TRASH_SERVICE_KEY in locations_manager.GetDeleted() )
+        
+        self._db.modules_media_results._weakref_media_result_cache.DropMediaResult( hash_id, hash )
+        
+        #
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
         
         ( media_result, ) = self._read( 'media_results', ( hash, ) )
         
@@ -1992,6 +2547,66 @@ class TestClientDB( unittest.TestCase ):
         TestClientDB._clear_db()
         
     
+    def test_related_tags_cache( self ):
+        
+        TestClientDB._clear_db()
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 350 ) ]
+        
+        def add_tag( tag, tag_hashes ):
+            
+            content_update = ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, tag_hashes ) )
+            
+            self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdate( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_update ) )
+            
+        
+        def get_related_tags():
+            
+            tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+            
+            # a 0.4 threshold samples 200 files live, so 250 files is a 'big' tag here
+            ( num_tags_searched, num_tags_to_search, num_skipped, predicates ) = self._read( 'related_tags', CC.COMBINED_FILE_SERVICE_KEY, tag_context, [ 'series:big' ], concurrence_threshold = 0.4 )
+            
+            return { predicate.GetValue() : predicate.GetCount().min_current_count for predicate in predicates }
+            
+        
+        def get_num_wanted():
+            
+            return len( self._db.modules_related_tags_cache.GetWanted( 256 ) )
+            
+        
+        add_tag( 'series:big', hashes[ : 250 ] )
+        add_tag( 'character:always', hashes[ : 250 ] )
+        add_tag( 'creator:half', hashes[ : 125 ] )
+        
+        related_tags = get_related_tags()
+        
+        self.assertEqual( related_tags[ 'character:always' ], 1000 )
+        self.assertEqual( get_num_wanted(), 1 )
+        
+        self._write( 'maintain_related_tags_cache' )
+        
+        self.assertEqual( get_num_wanted(), 0 )
+        
+        # the cache saw every file, so no sampling noise
+        self.assertEqual( get_related_tags(), { 'character:always' : 1000, 'creator:half' : 707 } )
+        self.assertEqual( get_num_wanted(), 0 )
+        
+        # the tag grows enough that the cache entry wants a refresh
+        
+        add_tag( 'series:big', hashes[ 250 : ] )
+        
+        get_related_tags()
+        
+        self.assertEqual( get_num_wanted(), 1 )
+        
+        self._write( 'maintain_related_tags_cache' )
+        
+        self.assertEqual( get_num_wanted(), 0 )
+        # and creator:half now falls under the threshold
+        self.assertEqual( get_related_tags(), { 'character:always' : 845 } )
+        
+    
     def test_services( self ):
         
         TestClientDB._clear_db()
@@ -2078,3 +2693,485 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_similar_files_bulk_search( self ):
+        
+        def get_num_potentials( max_hamming_distance ):
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            potential_duplicates_search_context = ClientPotentialDuplicatesSearchContext.PotentialDuplicatesSearchContext()
+            
+            potential_duplicates_search_context.SetFileSearchContext1( ClientSearchFileSearchContext.FileSearchContext( location_context = location_context ) )
+            potential_duplicates_search_context.SetDupeSearchType( ClientDuplicates.DUPE_SEARCH_ONE_FILE_MATCHES_ONE_SEARCH )
+            potential_duplicates_search_context.SetPixelDupesPreference( ClientDuplicates.SIMILAR_FILES_PIXEL_DUPES_ALLOWED )
+            potential_duplicates_search_context.SetMaxHammingDistance( max_hamming_distance )
+            
+            return self._read( 'potential_duplicates_count', potential_duplicates_search_context )
+            
+        
+        # pairs |i - j| <= 4 apart on the ladder
+        expected_num_potentials = sum( 13 - distance for distance in range( 1, 5 ) )
+        
+        for bulk_search_threshold in ( ClientDBSimilarFiles.BULK_SEARCH_THRESHOLD, 0 ):
+            
+            TestClientDB._clear_db()
+            
+            self._fake_import_perceptual_hashes( self._get_perceptual_hash_ladder() )
+            
+            original_bulk_search_threshold = ClientDBSimilarFiles.BULK_SEARCH_THRESHOLD
+            
+            try:
+                
+                ClientDBSimilarFiles.BULK_SEARCH_THRESHOLD = bulk_search_threshold
+                
+                ( still_work_to_do, num_done ) = self._write( 'maintain_similar_files_search_for_potential_duplicates', 4 )
+                
+            finally:
+                
+                ClientDBSimilarFiles.BULK_SEARCH_THRESHOLD = original_bulk_search_threshold
+                
+            
+            self.assertFalse( still_work_to_do )
+            self.assertEqual( num_done, 13 )
+            
+            self.assertEqual( { searched_distance : count for ( searched_distance, count ) in self._read( 'similar_files_maintenance_status' ).items() if count > 0 }, { 4 : 13 } )
+            
+            self.assertEqual( get_num_potentials( 4 ), expected_num_potentials )
+            self.assertEqual( get_num_potentials( 2 ), sum( 13 - distance for distance in range( 1, 3 ) ) )
+            
+        
+    
+    def test_similar_files_in_memory_index( self ):
+        
+        TestClientDB._clear_db()
+        
+        base_perceptual_hash_int = int.from_bytes( os.urandom( 8 ), 'big' )
+        
+        bit_positions = random.sample( range( 64 ), 12 )
+        
+        # file n has a phash n bits away from the base
+        perceptual_hashes = [ ( base_perceptual_hash_int ^ sum( 1 << bit_position for bit_position in bit_positions[ : num_bits ] ) ).to_bytes( 8, 'big' ) for num_bits in range( 13 ) ]
+        
+        base_perceptual_hash = perceptual_hashes[0]
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        def do_import( phashes ):
+            
+            for perceptual_hash in phashes:
+                
+                fake_file_import_job = ClientImportFiles.FileImportJob( 'fake path', full_import_options_container )
+                
+                fake_file_import_job._pre_import_file_status = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, os.urandom( 32 ) )
+                fake_file_import_job._file_info = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+                fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+                fake_file_import_job._perceptual_hashes = [ perceptual_hash ]
+                
+                self._write( 'import_file', fake_file_import_job )
+                
+            
+        
+        def get_num_similar( max_hamming_distance ):
+            
+            predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIMILAR_TO_DATA, ( (), ( base_perceptual_hash, ), max_hamming_distance ) ) ]
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+            
+            return len( self._read( 'file_query_ids', search_context ) )
+            
+        
+        do_import( perceptual_hashes[ : 6 ] )
+        
+        try:
+            
+            TG.test_controller.new_options.SetBoolean( 'similar_files_in_memory_search_index', True )
+            
+            self.assertEqual( get_num_similar( 4 ), 5 )
+            
+            # the index exists now, so these go in live
+            do_import( perceptual_hashes[ 6 : ] )
+            
+            index_results = [ get_num_similar( max_hamming_distance ) for max_hamming_distance in range( 14 ) ]
+            
+        finally:
+            
+            TG.test_controller.new_options.SetBoolean( 'similar_files_in_memory_search_index', False )
+            
+        
+        vp_tree_results = [ get_num_similar( max_hamming_distance ) for max_hamming_distance in range( 14 ) ]
+        
+        self.assertEqual( index_results, [ min( max_hamming_distance + 1, 13 ) for max_hamming_distance in range( 14 ) ] )
+        self.assertEqual( index_results, vp_tree_results )
+        
+        #
+        
+        perceptual_hash_index = ClientDBSimilarFiles.PerceptualHashIndex( list( enumerate( perceptual_hashes ) ) )
+        
+        self.assertEqual( perceptual_hash_index.Search( ( base_perceptual_hash, ), 2 ), { 0 : 0, 1 : 1, 2 : 2 } )
+        
+        perceptual_hash_index.RemovePerceptualHashes( ( 1, ) )
+        
+        # an id handed out again gets its new phash, not the old one
+        perceptual_hash_index.AddPerceptualHash( 2, perceptual_hashes[ 12 ] )
+        perceptual_hash_index.AddPerceptualHash( 13, base_perceptual_hash )
+        
+        self.assertEqual( perceptual_hash_index.Search( ( base_perceptual_hash, ), 2 ), { 0 : 0, 13 : 0 } )
+        self.assertEqual( perceptual_hash_index.Search( ( base_perceptual_hash, ), 12 )[ 2 ], 12 )
+        self.assertEqual( perceptual_hash_index.GetNumPerceptualHashes(), 13 )
+        
+    
+    def test_similar_files_tree_regeneration( self ):
+        
+        TestClientDB._clear_db()
+        
+        perceptual_hashes = self._get_perceptual_hash_ladder()
+        
+        base_perceptual_hash = perceptual_hashes[0]
+        
+        def get_similar_results( num_in_ladder ):
+            
+            results = []
+            
+            for max_hamming_distance in range( 14 ):
+                
+                predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIMILAR_TO_DATA, ( (), ( base_perceptual_hash, ), max_hamming_distance ) ) ]
+                
+                location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+                
+                search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+                
+                results.append( len( self._read( 'file_query_ids', search_context ) ) )
+                
+            
+            self.assertEqual( results, [ min( max_hamming_distance + 1, num_in_ladder ) for max_hamming_distance in range( 14 ) ] )
+            
+        
+        # random phashes are about 32 bits from anything, so this is noise that gives the tree some depth
+        noise_perceptual_hashes = [ os.urandom( 8 ) for i in range( 200 ) ]
+        
+        self._fake_import_perceptual_hashes( perceptual_hashes[ : 10 ] + noise_perceptual_hashes )
+        
+        self._write( 'regenerate_similar_files_tree' )
+        
+        get_similar_results( 10 )
+        
+        # now the two-step version, with some imports landing between the snapshot and the commit
+        
+        ( perceptual_hash_ids, snapshot_perceptual_hashes ) = self._write( 'regenerate_similar_files_tree_snapshot' )
+        
+        self.assertEqual( len( perceptual_hash_ids ), 210 )
+        
+        self._fake_import_perceptual_hashes( perceptual_hashes[ 10 : ] )
+        
+        original_parallel_min_nodes = ClientVPTreeBuilder.PARALLEL_MIN_NODES
+        
+        try:
+            
+            ClientVPTreeBuilder.PARALLEL_MIN_NODES = 0
+            
+            rows = ClientVPTreeBuilder.GenerateVPTreeRows( perceptual_hash_ids, snapshot_perceptual_hashes, num_threads = 2 )
+            
+        finally:
+            
+            ClientVPTreeBuilder.PARALLEL_MIN_NODES = original_parallel_min_nodes
+            
+        
+        ( row_perceptual_hash_ids, parent_ids, radii, inner_ids, inner_populations, outer_ids, outer_populations ) = rows
+        
+        self.assertEqual( sorted( row_perceptual_hash_ids.tolist() ), sorted( perceptual_hash_ids.tolist() ) )
+        
+        ( root_index, ) = ( parent_ids == ClientVPTreeBuilder.NULL_ID ).nonzero()[0]
+        
+        self.assertEqual( inner_populations[ root_index ] + outer_populations[ root_index ], 209 )
+        
+        self._write( 'regenerate_similar_files_tree_commit', perceptual_hash_ids, rows )
+        
+        get_similar_results( 13 )
+        
+        self._write( 'maintain_similar_files_tree' )
+        
+        get_similar_results( 13 )
+        
+    
+    def test_url_search( self ):
+        
+        TestClientDB._clear_db()
+        
+        def set_urls( urls, content_update_action ):
+            
+            content_update = ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_URLS, content_update_action, ( urls, ( hash, ) ) )
+            
+            self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdate( CC.COMBINED_LOCAL_FILE_DOMAINS_SERVICE_KEY, content_update ) )
+            
+        
+        def get_num_results( rule_type, rule, inbox = False ):
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_KNOWN_URLS, ( True, rule_type, rule, 'test' ) ) ]
+            
+            if inbox:
+                
+                predicates.append( ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_INBOX ) )
+                
+            
+            file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+            
+            return len( self._read( 'file_query_ids', file_search_context ) )
+            
+        
+        path = HydrusStaticDir.GetStaticPath( 'hydrus.png' )
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, full_import_options_container )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        set_urls( ( 'https://site.com/post/123', 'https://site.com/post/456', 'https://other.org/page?id=5_a' ), HC.CONTENT_UPDATE_ADD )
+        
+        # site.com has more mappings than we have files, so we go from the files, and other.org the other way around. inbox searches go from the domain
+        
+        for inbox in ( False, True ):
+            
+            self.assertEqual( get_num_results( 'domain', 'site.com', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'domain', 'other.org', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'domain', 'nothere.com', inbox = inbox ), 0 )
+            
+            self.assertEqual( get_num_results( 'regex', r'^https?://site\.com/post/\d+$', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'regex', r'^https://site\.com/post/789', inbox = inbox ), 0 )
+            self.assertEqual( get_num_results( 'regex', r'^https://nothere\.com/', inbox = inbox ), 0 )
+            self.assertEqual( get_num_results( 'regex', r'post/4[0-9]6', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'regex', r'other\.org/page\?id=5_a$', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'regex', r'id=5%a', inbox = inbox ), 0 )
+            self.assertEqual( get_num_results( 'regex', r'(?i)SITE\.COM', inbox = inbox ), 1 )
+            self.assertEqual( get_num_results( 'regex', r'zzz|other', inbox = inbox ), 1 )
+            
+        
+        url_class = ClientNetworkingURLClass.URLClass(
+            'test',
+            url_type = HC.URL_TYPE_POST,
+            url_domain_mask = ClientNetworkingURLClass.URLDomainMask( raw_domains = [ 'site.com' ] ),
+            path_components = [
+                ( ClientStrings.StringMatch( match_type = ClientStrings.STRING_MATCH_FIXED, match_value = 'post', example_string = 'post' ), None ),
+                ( ClientStrings.StringMatch( match_type = ClientStrings.STRING_MATCH_FLEXIBLE, match_value = ClientStrings.FLEXIBLE_MATCH_NUMERIC, example_string = '123' ), None )
+            ],
+            parameters = []
+        )
+        
+        self.assertEqual( get_num_results( 'url_class', url_class ), 1 )
+        
+        # the domain hint is normalised like the stored domains were
+        
+        set_urls( ( 'https://ｗｉｄｅ.com/post/1', ), HC.CONTENT_UPDATE_ADD )
+        
+        self.assertEqual( get_num_results( 'regex', r'^https://ｗｉｄｅ\.com/post/1$' ), 1 )
+        self.assertEqual( get_num_results( 'regex', r'^https://ｗｉｄ' ), 1 )
+        self.assertEqual( get_num_results( 'regex', r'^https://wide\.com/post/1$' ), 0 )
+        
+        set_urls( ( 'https://ｗｉｄｅ.com/post/1', ), HC.CONTENT_UPDATE_DELETE )
+        
+        # a long escape is not literal text, so it must not get into the prefilter
+        
+        set_urls( ( 'https://site.com/Abc', ), HC.CONTENT_UPDATE_ADD )
+        
+        self.assertEqual( get_num_results( 'regex', r'site\.com/\x41bc' ), 1 )
+        self.assertEqual( get_num_results( 'regex', r'site\.com/\u0041bc' ), 1 )
+        self.assertEqual( get_num_results( 'regex', r'(site)\.com/\x41bc\1' ), 0 )
+        
+        set_urls( ( 'https://site.com/Abc', ), HC.CONTENT_UPDATE_DELETE )
+        
+        # the counts keep up with deletes
+        
+        set_urls( ( 'https://site.com/post/123', 'https://site.com/post/456' ), HC.CONTENT_UPDATE_DELETE )
+        
+        self.assertEqual( get_num_results( 'domain', 'site.com' ), 0 )
+        self.assertEqual( get_num_results( 'url_class', url_class ), 0 )
+        self.assertEqual( get_num_results( 'regex', r'^https?://site\.com/post/\d+$' ), 0 )
+        self.assertEqual( get_num_results( 'domain', 'other.org' ), 1 )
+        
+        #
+        
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'^https?://gelbooru\.com/index\.php\?page=post' ), ( [ 'http', '://gelbooru.com/index.php?page=post' ], '://gelbooru.com/index.php?page=post' ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'pixiv\.net/(en/)?artworks/\d+' ), ( [ 'pixiv.net/', 'artworks/' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'abc*def[gh]+ij' ), ( [ 'ab', 'def', 'ij' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'site\.com|other\.org' ), ( [], None ) )
+        
+        # escapes that are longer than two characters mean we stop trusting literals, but we still have to notice alternation
+        
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'site\.com/\x41bc' ), ( [ 'site.com/' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'(a)\1xyz' ), ( [], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'caf\u00e9s' ), ( [ 'caf' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'caf\N{LATIN SMALL LETTER E WITH ACUTE}s' ), ( [ 'caf' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'site\.com/\101bc' ), ( [ 'site.com/' ], None ) )
+        self.assertEqual( ClientDBURLMap.GetRegexLiteralHints( r'site\.com/\dabc|other' ), ( [], None ) )
+        
+        self.assertEqual( ClientDBURLMap.GetDomainHintFromSchemeLiteral( '://gelbooru.com/index.php' ), ( 'gelbooru.com', True ) )
+        self.assertEqual( ClientDBURLMap.GetDomainHintFromSchemeLiteral( '://gelbooru.co' ), ( 'gelbooru.co', False ) )
+        self.assertEqual( ClientDBURLMap.GetDomainHintFromSchemeLiteral( '://' ), None )
+        
+    
+
+class TestClientDBReadPool( unittest.TestCase ):
+    
+    _db: typing.Any = None
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        HG.db_read_connections = 2
+        
+        try:
+            
+            cls._db = ClientDB.DB( TG.test_controller, TestController.DB_DIR, 'client' )
+            
+        finally:
+            
+            HG.db_read_connections = 0
+            
+        
+        TG.test_controller.SetTestDB( cls._db )
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        for filename in cls._db._db_filenames.values():
+            
+            os.remove( os.path.join( TestController.DB_DIR, filename ) )
+            
+        
+        del cls._db
+        
+        TG.test_controller.ClearTestDB()
+        
+    
+    def _read( self, action, *args, **kwargs ): return TestClientDBReadPool._db.Read( action, *args, **kwargs )
+    
+    def _read_from_pool( self, action, *args, **kwargs ):
+        
+        # force it onto the pool, even though the main loop is idle
+        
+        db = TestClientDBReadPool._db
+        
+        job = db._GenerateDBJob( 'read', True, action, *args, **kwargs )
+        
+        with db._read_pool_condition:
+            
+            job.SetWriteSeq( db._ordered_write_seq_submitted )
+            
+        
+        db._read_pool_jobs.put( job )
+        
+        return job.GetResult()
+        
+    
+    def test_read_pool( self ):
+        
+        self.assertEqual( TestClientDBReadPool._db._read_pool_size, 2 )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearchTagContext.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        hash = HydrusData.GenerateKey()
+        
+        content_updates = [ ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'read pool test', ( hash, ) ) ) ]
+        
+        content_update_package = ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_updates )
+        
+        # asynchronous, so the pool read has to wait for it to be committed
+        TestClientDBReadPool._db.Write( 'content_updates', False, content_update_package )
+        
+        pool_result = self._read_from_pool( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = 'read pool*' )
+        main_result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = 'read pool*' )
+        
+        pred = ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_TAG, 'read pool test', count = ClientSearchPredicate.PredicateCount.STATICCreateCurrentCount( 1 ) )
+        
+        self.assertEqual( pool_result, [ pred ] )
+        self.assertEqual( pool_result, main_result )
+        
+        # this has to make a new hash definition, so it should bounce back to the main loop
+        
+        new_hash = HydrusData.GenerateKey()
+        
+        hash_ids_to_hashes = self._read_from_pool( 'hash_ids_to_hashes', hashes = [ new_hash ] )
+        
+        self.assertEqual( list( hash_ids_to_hashes.values() ), [ new_hash ] )
+        
+        self.assertEqual( self._read_from_pool( 'hash_ids_to_hashes', hashes = [ new_hash ] ), hash_ids_to_hashes )
+        
+        # pool jobs and main loop jobs both go in the job stats
+        
+        keys_to_counts = { ( d[ 'job_type' ], d[ 'action' ] ) : d[ 'count' ] for d in TestClientDBReadPool._db.GetJobStats() }
+        
+        self.assertEqual( keys_to_counts[ ( 'read', 'autocomplete_predicates' ) ], 2 )
+        self.assertEqual( keys_to_counts[ ( 'read', 'hash_ids_to_hashes' ) ], 2 )
+        self.assertEqual( keys_to_counts[ ( 'write', 'content_updates' ) ], 1 )
+        
+    
+    def test_read_pool_similar_files( self ):
+        
+        db = TestClientDBReadPool._db
+        
+        base_perceptual_hash_int = int.from_bytes( os.urandom( 8 ), 'big' )
+        
+        # file n has a phash n bits away from the base
+        perceptual_hashes = [ ( base_perceptual_hash_int ^ ( ( 1 << num_bits ) - 1 ) ).to_bytes( 8, 'big' ) for num_bits in range( 6 ) ]
+        
+        full_import_options_container = ImportOptionsManager.ImportOptionsManager.STATICGetDefaultInitialisedManager().GetDefaultImportOptionsContainerForCallerType( IOC.IMPORT_OPTIONS_CALLER_TYPE_GLOBAL )
+        
+        for perceptual_hash in perceptual_hashes:
+            
+            fake_file_import_job = ClientImportFiles.FileImportJob( 'fake path', full_import_options_container )
+            
+            fake_file_import_job._pre_import_file_status = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, os.urandom( 32 ) )
+            fake_file_import_job._file_info = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._perceptual_hashes = [ perceptual_hash ]
+            
+            db.Write( 'import_file', True, fake_file_import_job )
+            
+        
+        predicates = [ ClientSearchPredicate.Predicate( ClientSearchPredicate.PREDICATE_TYPE_SYSTEM_SIMILAR_TO_DATA, ( (), ( perceptual_hashes[0], ), 3 ) ) ]
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        search_context = ClientSearchFileSearchContext.FileSearchContext( location_context = location_context, predicates = predicates )
+        
+        # start the shared vp tree caches from nothing, so we can see who fills them
+        
+        db.modules_similar_files._perceptual_hash_id_to_vp_tree_node_cache = {}
+        db.modules_similar_files._non_vp_treed_perceptual_hash_ids = set()
+        db.modules_similar_files._root_node_perceptual_hash_id = None
+        
+        pool_result = self._read_from_pool( 'file_query_ids', search_context )
+        
+        self.assertEqual( len( pool_result ), 4 )
+        
+        # the pool searched with its own caches and left the writer's alone
+        
+        self.assertEqual( db.modules_similar_files._perceptual_hash_id_to_vp_tree_node_cache, {} )
+        self.assertIsNone( db.modules_similar_files._root_node_perceptual_hash_id )
+        
+        main_result = self._read( 'file_query_ids', search_context )
+        
+        self.assertEqual( set( pool_result ), set( main_result ) )
+        
+    
@@ -13,6 +13,7 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientLocation
 from hydrus.client import ClientServices
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBTagSiblings
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing.options import ImportOptionsConstants as IOC
 from hydrus.client.importing.options import ImportOptionsManager
@@ -533,6 +534,7 @@ IRL_SIBLING_PAIRS = {
 class TestClientDBTags( unittest.TestCase ):
     
     _db: typing.Any = None
+    _sync_hard = False
     
     @classmethod
     def _create_db( cls ):
@@ -639,7 +641,7 @@ class TestClientDBTags( unittest.TestCase ):
             
             while still_work_to_do:
                 
-                still_work_to_do = self._write( 'sync_tag_display_maintenance', service_key, 1 )
+                still_work_to_do = self._write( 'sync_tag_display_maintenance', service_key, 1, sync_hard = self._sync_hard )
                 
             
         
@@ -922,7 +924,7 @@ class TestClientDBTags( unittest.TestCase ):
                     
                     while still_work_to_do:
                         
-                        still_work_to_do = self._write( 'sync_tag_display_maintenance', other_service_key, 1 )
+                        still_work_to_do = self._write( 'sync_tag_display_maintenance', other_service_key, 1, sync_hard = self._sync_hard )
                         
                     
                 
@@ -1073,6 +1075,27 @@ class TestClientDBTags( unittest.TestCase ):
             } ) )
         
     
+    def test_display_pairs_lookup_whole_service_regen( self ):
+        
+        # big sibling and parent updates regen the whole service in memory rather than walking the chains, so let's run some of the above through that
+        
+        original_threshold = ClientDBTagSiblings.REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD
+        
+        try:
+            
+            ClientDBTagSiblings.REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD = 1
+            
+            self.test_display_pairs_lookup_web_parents()
+            self.test_display_pairs_lookup_tricky()
+            self.test_display_pairs_lookup_bonkers()
+            self.test_display_pairs_sync_transitive()
+            
+        finally:
+            
+            ClientDBTagSiblings.REGEN_CHAINS_WHOLE_SERVICE_THRESHOLD = original_threshold
+            
+        
+    
     def test_display_pending_to_current_bug_both_non_ideal( self ):
         
         # rescinding pending (when you set current on pending) two tags that imply the same thing at once can lead to ghost pending when you don't interleave processing
@@ -1582,6 +1605,91 @@ class TestClientDBTags( unittest.TestCase ):
         self._test_ac( 'jane*', self._public_service_key, CC.COMBINED_FILE_SERVICE_KEY, { jr_tag : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 0, 1 ) }, { jr_tag : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 0, 1 ) } )
         
     
+    def test_display_sync_hard( self ):
+        
+        # syncing hard does many sibling and parent rows at once, so let's run some of the above through that
+        
+        try:
+            
+            self._sync_hard = True
+            
+            self.test_display_pairs_lookup_bonkers()
+            self.test_display_pairs_sync_transitive()
+            self.test_display_pending_regen()
+            self.test_display_pending_to_current_merge_bug_both_non_ideal()
+            self.test_parents_pairs_lookup()
+            self.test_siblings_pairs_lookup()
+            
+            status = self._read( 'tag_display_maintenance_status', self._public_service_key )
+            
+            self.assertEqual( status[ 'num_siblings_to_sync' ] + status[ 'num_parents_to_sync' ], 0 )
+            self.assertIsNotNone( status[ 'sync_rows_per_second' ] )
+            
+        finally:
+            
+            self._sync_hard = False
+            
+        
+    
+    def test_display_sync_hard_mixed_batch( self ):
+        
+        self._clear_db()
+        
+        content_updates = []
+        
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'sbh', ( self._sbh_bad, ) ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'zero suit', ( self._sbh_bad, ) ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'bodysuit', ( self._sbh_both, ) ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'character:samus aran', ( self._sbh_good, ) ) ) )
+        
+        self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( self._my_service_key, content_updates ) )
+        
+        # the parents hang off the ideals and a bad sibling, so the sibling and parent rows all touch each other
+        
+        content_updates = []
+        
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 'sbh', 'character:samus aran' ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 'bodysuit', 'clothing:bodysuit' ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 'character:samus aran', 'series:metroid' ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 'zero suit', 'bodysuit' ) ) )
+        content_updates.append( ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 'clothing:bodysuit', 'outfit' ) ) )
+        
+        self._write( 'content_updates', ClientContentUpdates.ContentUpdatePackage.STATICCreateFromContentUpdates( self._my_service_key, content_updates ) )
+        
+        status = self._read( 'tag_display_maintenance_status', self._my_service_key )
+        
+        self.assertEqual( status[ 'num_siblings_to_sync' ], 2 )
+        # the parents lookup holds every ancestor, so 'zero suit' gets 'outfit' too
+        self.assertEqual( status[ 'num_parents_to_sync' ], 4 )
+        
+        # a fresh service has the initial weight budget, which fits all six rows, so this is one batch
+        
+        still_work_to_do = self._write( 'sync_tag_display_maintenance', self._my_service_key, 1, sync_hard = True )
+        
+        self.assertFalse( still_work_to_do )
+        
+        tag_service_id = TestClientDBTags._db.modules_services.GetServiceId( self._my_service_key )
+        
+        ( num_rows, weight, num_seconds ) = TestClientDBTags._db.modules_tag_display._service_ids_to_sync_speeds[ tag_service_id ]
+        
+        self.assertEqual( num_rows, 6 )
+        
+        status = self._read( 'tag_display_maintenance_status', self._my_service_key )
+        
+        self.assertEqual( status[ 'num_siblings_to_sync' ] + status[ 'num_parents_to_sync' ], 0 )
+        
+        hash_ids_to_tags_managers = self._read( 'force_refresh_tags_managers', self._hash_ids )
+        
+        self.assertEqual( hash_ids_to_tags_managers[ self._sbh_bad_hash_id ].GetCurrent( self._my_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), { 'character:samus aran', 'series:metroid', 'zero suit', 'clothing:bodysuit', 'outfit' } )
+        self.assertEqual( hash_ids_to_tags_managers[ self._sbh_both_hash_id ].GetCurrent( self._my_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), { 'clothing:bodysuit', 'outfit' } )
+        self.assertEqual( hash_ids_to_tags_managers[ self._sbh_good_hash_id ].GetCurrent( self._my_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), { 'character:samus aran', 'series:metroid' } )
+        
+        self._test_ac( 'samus*', self._my_service_key, CC.COMBINED_FILE_SERVICE_KEY, { 'sbh' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 1, 0 ), 'character:samus aran' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 1, 0 ) }, { 'character:samus aran' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 2, 0 ) } )
+        self._test_ac( 'metroid*', self._my_service_key, CC.COMBINED_FILE_SERVICE_KEY, {}, { 'series:metroid' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 2, 0 ) } )
+        self._test_ac( 'body*', self._my_service_key, CC.COMBINED_FILE_SERVICE_KEY, { 'bodysuit' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 1, 0 ) }, { 'clothing:bodysuit' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 2, 0 ) } )
+        self._test_ac( 'outfit*', self._my_service_key, CC.COMBINED_FILE_SERVICE_KEY, {}, { 'outfit' : ClientSearchPredicate.PredicateCount.STATICCreateStaticCount( 2, 0 ) } )
+        
+    
     def test_parents_pairs_lookup( self ):
         
         self._clear_db()
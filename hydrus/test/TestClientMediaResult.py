@@ -0,0 +1,139 @@
+import collections
+import gc
+import os
+import sys
+import tracemalloc
+import unittest
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+
+from hydrus.client import ClientConstants as CC
+from hydrus.client.media import ClientMediaManagers
+from hydrus.client.media import ClientMediaResult
+from hydrus.client.metadata import ClientContentUpdates
+
+from hydrus.test import TestController
+
+def GetDBStyleMediaResult( hash_id: int, tags: list[ str ] ):
+    
+    # the same shape as what ClientDBMediaResults makes for a typical local file with some tags but no ratings, notes or views
+    
+    file_info_manager = ClientMediaManagers.FileInfoManager( hash_id, os.urandom( 32 ), 123456, HC.IMAGE_JPEG, 1000, 800, None, None, False, None )
+    
+    # a fresh copy of each string, like separate fetches would give us
+    tags = { sys.intern( ''.join( tag ) ) for tag in tags }
+    
+    service_keys_to_statuses_to_storage_tags = collections.defaultdict( HydrusData.default_dict_set )
+    service_keys_to_statuses_to_display_tags = collections.defaultdict( HydrusData.default_dict_set )
+    
+    service_keys_to_statuses_to_storage_tags[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+    service_keys_to_statuses_to_display_tags[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+    
+    tags_manager = ClientMediaManagers.TagsManager( service_keys_to_statuses_to_storage_tags, service_keys_to_statuses_to_display_tags )
+    
+    times_manager = ClientMediaManagers.TimesManager()
+    
+    current_file_service_keys_to_timestamps_ms = { CC.LOCAL_FILE_SERVICE_KEY : 1700000000000 + hash_id, CC.HYDRUS_LOCAL_FILE_STORAGE_SERVICE_KEY : 1700000000000 + hash_id }
+    
+    times_manager.SetImportedTimestampsMS( current_file_service_keys_to_timestamps_ms )
+    times_manager.SetFileModifiedTimestampMS( 1600000000000 + hash_id )
+    
+    locations_manager = ClientMediaManagers.LocationsManager( set( current_file_service_keys_to_timestamps_ms.keys() ), set(), set(), set(), times_manager, inbox = True, urls = set(), service_keys_to_filenames = {} )
+    
+    ratings_manager = ClientMediaManagers.RatingsManager.STATICGenerateManager( {} )
+    notes_manager = ClientMediaManagers.NotesManager.STATICGenerateManager( {} )
+    file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager( times_manager )
+    
+    return ClientMediaResult.MediaResult( file_info_manager, tags_manager, times_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager )
+    
+
+def GetBytesPerMediaResult( num_media_results: int, num_tags_per_file: int ):
+    
+    all_tags = [ 'character:test tag {}'.format( i ) for i in range( 1000 ) ]
+    
+    gc.collect()
+    
+    tracemalloc.start()
+    
+    try:
+        
+        start_size = tracemalloc.get_traced_memory()[0]
+        
+        media_results = [ GetDBStyleMediaResult( i, all_tags[ i % 50 : ( i % 50 ) + num_tags_per_file ] ) for i in range( num_media_results ) ]
+        
+        gc.collect()
+        
+        end_size = tracemalloc.get_traced_memory()[0]
+        
+    finally:
+        
+        tracemalloc.stop()
+        
+    
+    return ( end_size - start_size ) / len( media_results )
+    
+
+class TestMediaResultMemory( unittest.TestCase ):
+    
+    def test_footprint( self ):
+        
+        # for reference, before the slots and sharing this was about 6.1KB for 5 tags and 8.4KB for 20
+        
+        self.assertLess( GetBytesPerMediaResult( 5000, 5 ), 5500 )
+        self.assertLess( GetBytesPerMediaResult( 5000, 20 ), 7500 )
+        
+        media_result = GetDBStyleMediaResult( 1, [ 'test' ] )
+        
+        self.assertFalse( hasattr( media_result, '__dict__' ) )
+        
+        for manager in ( media_result.GetFileInfoManager(), media_result.GetTagsManager(), media_result.GetTimesManager(), media_result.GetLocationsManager(), media_result.GetRatingsManager(), media_result.GetNotesManager(), media_result.GetFileViewingStatsManager() ):
+            
+            self.assertFalse( hasattr( manager, '__dict__' ) )
+            
+        
+    
+    def test_shared_managers( self ):
+        
+        media_result_1 = GetDBStyleMediaResult( 1, [ 'test' ] )
+        media_result_2 = GetDBStyleMediaResult( 2, [ 'test' ] )
+        
+        self.assertIs( media_result_1.GetRatingsManager(), media_result_2.GetRatingsManager() )
+        self.assertIs( media_result_1.GetNotesManager(), media_result_2.GetNotesManager() )
+        
+        with self.assertRaises( Exception ):
+            
+            media_result_1.GetNotesManager().SetNamesToNotes( { 'note' : 'hello' } )
+            
+        
+        # editing one file gets it its own manager, and the others are untouched
+        
+        rating_service_key = TestController.LOCAL_RATING_NUMERICAL_SERVICE_KEY
+        
+        media_result_1.ProcessContentUpdate( rating_service_key, ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_RATINGS, HC.CONTENT_UPDATE_ADD, ( 0.8, { media_result_1.GetHash() } ) ) )
+        
+        self.assertEqual( media_result_1.GetRatingsManager().GetRating( rating_service_key ), 0.8 )
+        self.assertEqual( media_result_2.GetRatingsManager().GetRating( rating_service_key ), None )
+        
+        self.assertIs( media_result_2.GetRatingsManager(), ClientMediaManagers.EMPTY_RATINGS_MANAGER )
+        
+        notes_manager = media_result_2.GetNotesManager().Duplicate()
+        
+        notes_manager.SetNamesToNotes( { 'note' : 'hello' } )
+        
+        self.assertFalse( notes_manager.IsShared() )
+        self.assertEqual( notes_manager.GetNamesToNotes(), { 'note' : 'hello' } )
+        self.assertIs( media_result_2.GetNotesManager(), ClientMediaManagers.EMPTY_NOTES_MANAGER )
+        self.assertEqual( media_result_2.GetNotesManager().GetNamesToNotes(), {} )
+        
+        # and the same for view counts
+        
+        media_result_1.ProcessContentUpdate( CC.COMBINED_LOCAL_FILE_DOMAINS_SERVICE_KEY, ClientContentUpdates.ContentUpdate( HC.CONTENT_TYPE_FILE_VIEWING_STATS, HC.CONTENT_UPDATE_ADD, ( media_result_1.GetHash(), CC.CANVAS_MEDIA_VIEWER, 1700000000000, 1, 5000 ) ) )
+        
+        self.assertEqual( media_result_1.GetFileViewingStatsManager().GetViews( CC.CANVAS_MEDIA_VIEWER ), 1 )
+        self.assertEqual( media_result_1.GetFileViewingStatsManager().GetViewtimeMS( CC.CANVAS_MEDIA_VIEWER ), 5000 )
+        self.assertEqual( media_result_2.GetFileViewingStatsManager().GetViews( CC.CANVAS_MEDIA_VIEWER ), 0 )
+        
+        self.assertEqual( len( ClientMediaManagers.EMPTY_COUNTER ), 0 )
+        
+    
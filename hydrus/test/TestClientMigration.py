@@ -17,7 +17,9 @@ from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientLocation
 from hydrus.client import ClientMigration
 from hydrus.client import ClientServices
+from hydrus.client import ClientThreading
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBMappingsStorage
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing.options import ImportOptionsConstants as IOC
 from hydrus.client.importing.options import ImportOptionsManager
@@ -113,6 +115,30 @@ count_filter_pairs[ HC.CONTENT_TYPE_TAG_PARENTS ] = [
     ( 'has_count_g', 'has_count_h' )
 ]
 
+class CancelAfterChecksJobStatus( ClientThreading.JobStatus ):
+    
+    # cancels itself the nth time it is asked, so we can interrupt a long job partway through
+    
+    def __init__( self, num_checks_before_cancel: int ):
+        
+        super().__init__( cancellable = True )
+        
+        self._num_checks_before_cancel = num_checks_before_cancel
+        
+    
+    def IsCancelled( self ):
+        
+        self._num_checks_before_cancel -= 1
+        
+        if self._num_checks_before_cancel <= 0:
+            
+            self.Cancel()
+            
+        
+        return super().IsCancelled()
+        
+    
+
 class TestMigration( unittest.TestCase ):
     
     _db: typing.Any = None
@@ -619,10 +645,12 @@ class TestMigration( unittest.TestCase ):
     
     def _test_mappings_list_to_service( self ):
         
-        def run_test( source, tag_service_key, content_action, expected_data ):
+        def run_test( source, tag_service_key, content_action, expected_data, bulk_ingest = False ):
             
             destination = ClientMigration.MigrationDestinationTagServiceMappings( self, tag_service_key, content_action )
             
+            destination.SetBulkIngest( bulk_ingest )
+            
             job = ClientMigration.MigrationJob( self, 'test', source, destination )
             
             job.Run()
@@ -697,6 +725,73 @@ class TestMigration( unittest.TestCase ):
         
         run_test( source, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HC.CONTENT_UPDATE_ADD, data )
         
+        # local bulk add, in several blocks
+        
+        data = [ ( hash, set( random.sample( to_be_pended_tag_pool, 2 ) ) ) for hash in self._hashes_to_current_tags.keys() ]
+        
+        source = ClientMigration.MigrationSourceList( self, data )
+        
+        original_block_size = ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE
+        
+        try:
+            
+            ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE = 7
+            
+            run_test( source, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HC.CONTENT_UPDATE_ADD, data, bulk_ingest = True )
+            
+        finally:
+            
+            ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE = original_block_size
+            
+        
+        self.assertIsNone( self.Read( 'migration_bulk_ingest_count', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ) )
+        
+        # local bulk add, interrupted after the first block and then resumed
+        
+        bulk_tag_pool = [ 'bulk tag {}'.format( i ) for i in range( 10 ) ]
+        
+        data = [ ( hash, set( random.sample( bulk_tag_pool, 2 ) ) ) for hash in self._hashes_to_current_tags.keys() ]
+        
+        tags_to_hashes = collections.defaultdict( list )
+        
+        for ( hash, tags ) in data:
+            
+            for tag in tags:
+                
+                tags_to_hashes[ tag ].append( hash )
+                
+            
+        
+        self.WriteSynchronous( 'migration_bulk_ingest_stage_mappings', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, list( tags_to_hashes.items() ) )
+        
+        num_staged = self.Read( 'migration_bulk_ingest_count', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        self.assertEqual( num_staged, len( data ) * 2 )
+        
+        original_block_size = ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE
+        
+        try:
+            
+            ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE = 7
+            
+            self.WriteSynchronous( 'migration_bulk_ingest_commit_mappings', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, CancelAfterChecksJobStatus( 2 ) )
+            
+            num_left = self.Read( 'migration_bulk_ingest_count', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+            
+            self.assertGreater( num_left, 0 )
+            self.assertLess( num_left, num_staged )
+            
+            # the next bulk import to the service, even an empty one, finishes the job
+            
+            run_test( ClientMigration.MigrationSourceList( self, [] ), CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HC.CONTENT_UPDATE_ADD, data, bulk_ingest = True )
+            
+        finally:
+            
+            ClientDBMappingsStorage.BULK_INGEST_MAPPINGS_BLOCK_SIZE = original_block_size
+            
+        
+        self.assertIsNone( self.Read( 'migration_bulk_ingest_count', CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ) )
+        
         # local delete
         
         data = [ ( hash, set( random.sample( list( tags ), 2 ) ) ) for ( hash, tags ) in self._hashes_to_current_tags.items() ]
@@ -1,5 +1,8 @@
 import collections
 import collections.abc
+import gc
+import random
+import time
 import unittest
 
 from hydrus.core import HydrusConstants as HC
@@ -15,6 +18,62 @@ from hydrus.client.search import ClientSearchTagContext
 
 from hydrus.test import TestGlobals as TG
 
+def GetSyntheticTagParentPairs( num_leaf_tags: int, seed = 0 ):
+    
+    # something shaped like the PTR: lots of leaf tags, each with a parent or two in a smaller layer above, up to a few very popular roots
+    
+    r = random.Random( seed )
+    
+    layer_sizes = [ num_leaf_tags, max( 1, num_leaf_tags // 5 ), max( 1, num_leaf_tags // 40 ), max( 1, num_leaf_tags // 400 ), max( 1, num_leaf_tags // 5000 ) ]
+    
+    layer_starts = [ sum( layer_sizes[ : i ] ) for i in range( len( layer_sizes ) ) ]
+    
+    pairs = set()
+    
+    for layer in range( len( layer_sizes ) - 1 ):
+        
+        for i in range( layer_sizes[ layer ] ):
+            
+            for j in range( r.choice( ( 1, 1, 1, 2 ) ) ):
+                
+                pairs.add( ( layer_starts[ layer ] + i, layer_starts[ layer + 1 ] + r.randrange( layer_sizes[ layer + 1 ] ) ) )
+                
+            
+        
+    
+    return sorted( pairs )
+    
+
+def BuildTagParentsStructuresTimed( pairs ):
+    
+    # builds the structure with AddPair one at a time and with AddPairs in one go, timing both. for a PTR-sized run, try GetSyntheticTagParentPairs( 300000 )
+    
+    gc.collect()
+    
+    start_time = time.perf_counter()
+    
+    one_at_a_time = ClientTagsHandling.TagParentsStructure()
+    
+    for ( child, parent ) in pairs:
+        
+        one_at_a_time.AddPair( child, parent )
+        
+    
+    one_at_a_time_time = time.perf_counter() - start_time
+    
+    gc.collect()
+    
+    start_time = time.perf_counter()
+    
+    in_one_go = ClientTagsHandling.TagParentsStructure()
+    
+    in_one_go.AddPairs( pairs )
+    
+    in_one_go_time = time.perf_counter() - start_time
+    
+    return ( ( one_at_a_time, one_at_a_time_time ), ( in_one_go, in_one_go_time ) )
+    
+
 class TestMergeTagsManagers( unittest.TestCase ):
     
     def test_merge( self ):
@@ -461,6 +520,65 @@ class TestTagDisplayManager( unittest.TestCase ):
         
     
 
+class TestTagParentsStructure( unittest.TestCase ):
+    
+    def _get_rows( self, tps: ClientTagsHandling.TagParentsStructure ):
+        
+        return set( tps.IterateDescendantAncestorPairs() )
+        
+    
+    def test_add_pairs( self ):
+        
+        # the loop rules depend on order, so the bulk add has to agree with adding one at a time
+        
+        r = random.Random( 0 )
+        
+        for i in range( 200 ):
+            
+            num_tags = r.randint( 2, 30 )
+            
+            pairs = [ ( r.randrange( num_tags ), r.randrange( num_tags ) ) for j in range( r.randint( 1, 60 ) ) ]
+            
+            one_at_a_time = ClientTagsHandling.TagParentsStructure()
+            
+            for ( child, parent ) in pairs:
+                
+                one_at_a_time.AddPair( child, parent )
+                
+            
+            in_one_go = ClientTagsHandling.TagParentsStructure()
+            
+            in_one_go.AddPairs( pairs )
+            
+            self.assertEqual( self._get_rows( in_one_go ), self._get_rows( one_at_a_time ) )
+            
+        
+        tps = ClientTagsHandling.TagParentsStructure()
+        
+        tps.AddPairs( [ ( 'a', 'b' ), ( 'b', 'c' ), ( 'c', 'a' ), ( 'c', 'c' ) ] )
+        
+        self.assertEqual( self._get_rows( tps ), { ( 'a', 'b' ), ( 'a', 'c' ), ( 'b', 'c' ) } )
+        
+        # and single adds still work afterwards
+        
+        tps.AddPair( 'd', 'a' )
+        tps.AddPair( 'c', 'd' )
+        
+        self.assertEqual( self._get_rows( tps ), { ( 'a', 'b' ), ( 'a', 'c' ), ( 'b', 'c' ), ( 'd', 'a' ), ( 'd', 'b' ), ( 'd', 'c' ) } )
+        
+    
+    def test_synthetic_ptr_pairs( self ):
+        
+        pairs = GetSyntheticTagParentPairs( 20000 )
+        
+        # the times are only for looking at by hand, we just check the two builds agree
+        
+        ( ( one_at_a_time, one_at_a_time_time ), ( in_one_go, in_one_go_time ) ) = BuildTagParentsStructuresTimed( pairs )
+        
+        self.assertEqual( self._get_rows( in_one_go ), self._get_rows( one_at_a_time ) )
+        
+    
+
 class TestTagRendering( unittest.TestCase ):
     
     def test_rendering( self ):
@@ -1,6 +1,11 @@
+import threading
 import time
 import unittest
 
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+
+from hydrus.client import ClientServices
 from hydrus.client import ClientThreading
 
 from hydrus.test import TestGlobals as TG
@@ -8,6 +13,8 @@ from hydrus.test import TestGlobals as TG
 READ_JOB_DURATION = 0.1
 WRITE_JOB_DURATION = 0.2
 
+LOAD_UPDATE_DURATION = 0.05
+
 def do_read_job( rwlock, result_list, name ):
     
     with rwlock.read:
@@ -32,6 +39,104 @@ def do_write_job( rwlock, result_list, name ):
         
     
 
+class FakeRepositoryUpdateLoader( ClientServices.RepositoryUpdateLoader ):
+    
+    def __init__( self, *args, **kwargs ):
+        
+        super().__init__( *args, **kwargs )
+        
+        self.max_loaded_ahead = 0
+        
+        self.update_hashes_to_loaded_events = { update_hash : threading.Event() for update_hash in self._update_hashes }
+        
+        self._num_loaded = 0
+        self._num_consumed = 0
+        self._test_lock = threading.Lock()
+        
+    
+    def _LoadUpdate( self, update_hash ):
+        
+        time.sleep( LOAD_UPDATE_DURATION )
+        
+        if update_hash == b'bad':
+            
+            raise HydrusExceptions.SerialisationException( 'bad update' )
+            
+        
+        with self._test_lock:
+            
+            self._num_loaded += 1
+            
+            self.max_loaded_ahead = max( self.max_loaded_ahead, self._num_loaded - self._num_consumed )
+            
+        
+        self.update_hashes_to_loaded_events[ update_hash ].set()
+        
+        return update_hash
+        
+    
+    def GetNextUpdate( self ):
+        
+        update = super().GetNextUpdate()
+        
+        with self._test_lock:
+            
+            self._num_consumed += 1
+            
+        
+        return update
+        
+    
+
+class TestRepositoryUpdateLoader( unittest.TestCase ):
+    
+    def test_pipeline( self ):
+        
+        update_hashes = [ HydrusData.GenerateKey() for i in range( 10 ) ]
+        
+        update_loader = FakeRepositoryUpdateLoader( update_hashes, 0, prefetch_depth = 2 )
+        
+        update_loader.Start()
+        
+        results = []
+        
+        for update_hash in update_hashes:
+            
+            # the loader should have each update ready before we ask for it, so the db never waits on the disk
+            self.assertTrue( update_loader.update_hashes_to_loaded_events[ update_hash ].wait( 5 ) )
+            
+            results.append( update_loader.GetNextUpdate() )
+            
+        
+        update_loader.Stop()
+        
+        self.assertEqual( results, update_hashes )
+        
+        # the queue, plus the one the loader is holding while it waits for room
+        self.assertLessEqual( update_loader.max_loaded_ahead, 3 )
+        
+        ( time_spent_loading, time_spent_waiting ) = update_loader.GetTimes()
+        
+        self.assertGreaterEqual( time_spent_loading, LOAD_UPDATE_DURATION * 9 )
+        
+    
+    def test_error( self ):
+        
+        update_hashes = [ HydrusData.GenerateKey(), b'bad', HydrusData.GenerateKey() ]
+        
+        update_loader = FakeRepositoryUpdateLoader( update_hashes, 0 )
+        
+        self.assertEqual( update_loader.GetNextUpdate(), update_hashes[0] )
+        
+        with self.assertRaises( HydrusExceptions.SerialisationException ):
+            
+            update_loader.GetNextUpdate()
+            
+        
+        update_loader.Stop()
+        
+    
+
 class TestFileRWLock( unittest.TestCase ):
     
     def test_simple( self ):
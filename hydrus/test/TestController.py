@@ -14,6 +14,7 @@ from twisted.internet import reactor
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBJobStats
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusLists
@@ -55,6 +56,7 @@ from hydrus.client.networking import ClientNetworkingURLClass
 from hydrus.server import ServerGlobals as SG
 
 from hydrus.test import TestClientAPI
+from hydrus.test import TestClientCaches
 from hydrus.test import TestClientConstants
 from hydrus.test import TestClientDaemons
 from hydrus.test import TestClientDB
@@ -68,6 +70,7 @@ from hydrus.test import TestClientImportObjects
 from hydrus.test import TestClientImportOptions
 from hydrus.test import TestClientImportSubscriptions
 from hydrus.test import TestClientListBoxes
+from hydrus.test import TestClientMediaResult
 from hydrus.test import TestClientMetadataConditional
 from hydrus.test import TestClientMetadataMigration
 from hydrus.test import TestClientMigration
@@ -261,6 +264,8 @@ class Controller( object ):
         
         self._param_read_responses = {}
         
+        self._db_job_stats = HydrusDBJobStats.DBJobStats()
+        
         self.example_like_rating_service_key = LOCAL_RATING_LIKE_SERVICE_KEY
         self.example_numerical_rating_service_key = LOCAL_RATING_NUMERICAL_SERVICE_KEY
         self.example_incdec_rating_service_key = LOCAL_RATING_INCDEC_SERVICE_KEY
@@ -733,6 +738,11 @@ class Controller( object ):
         }
         
     
+    def GetDBJobStats( self ):
+        
+        return self._db_job_stats.GetReport()
+        
+    
     def GetFilesDir( self ):
         
         return self._server_files_dir
@@ -964,10 +974,12 @@ class Controller( object ):
         
         module_lookup[ 'data' ] = [
             TestHydrusPaths,
+            TestClientCaches,
             TestClientConstants,
             TestClientFileStorage,
             TestClientImportObjects,
             TestClientImportOptions,
+            TestClientMediaResult,
             TestClientParsing,
             TestClientSearch,
             TestClientTags,
@@ -1099,6 +1111,11 @@ class Controller( object ):
         test_thread.start()
         
     
+    def SetDBJobStats( self, db_job_stats: HydrusDBJobStats.DBJobStats ):
+        
+        self._db_job_stats = db_job_stats
+        
+    
     def SetParamRead( self, name, args, value ):
         
         self._param_read_responses[ ( name, args ) ] = value
@@ -1,9 +1,39 @@
+import queue
 import random
+import sys
+import threading
+import time
 import unittest
 
+from hydrus.core import HydrusBitmaps
+from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusDBJobStats
+from hydrus.core import HydrusDBPopulateCache
 from hydrus.core import HydrusLists
 from hydrus.core import HydrusNumbers
 
+def GetBitmapIntersectionTimes( ids_1: set[ int ], ids_2: set[ int ] ):
+    
+    # the bitmap is usually five times faster or more
+    
+    bitmap_1 = HydrusBitmaps.IdBitmap.STATICCreateFromIds( ids_1 )
+    bitmap_2 = HydrusBitmaps.IdBitmap.STATICCreateFromIds( ids_2 )
+    
+    start_time = time.perf_counter()
+    
+    ids_1 & ids_2
+    
+    set_time = time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    
+    bitmap_1 & bitmap_2
+    
+    bitmap_time = time.perf_counter() - start_time
+    
+    return ( set_time, bitmap_time )
+    
+
 class TestHydrusNumbers( unittest.TestCase ):
     
     def test_ordinals( self ):
@@ -22,6 +52,345 @@ class TestHydrusNumbers( unittest.TestCase ):
         
     
 
+class TestHydrusBitmaps( unittest.TestCase ):
+    
+    def test_bitmap_ops( self ):
+        
+        r = random.Random( 42 )
+        
+        # a mix of dense chunks, sparse chunks, chunks only one side has, and the edges
+        
+        id_sets = []
+        
+        for i in range( 3 ):
+            
+            ids = set( r.sample( range( 0, 65536 ), 30000 ) )
+            ids.update( r.sample( range( 65536, 131072 ), 100 ) )
+            ids.update( r.sample( range( 65536 * ( 5 + i ), 65536 * ( 6 + i ) ), 5000 ) )
+            ids.update( ( 0, 65535, 65536, 10000000 ) )
+            
+            id_sets.append( ids )
+            
+        
+        bitmaps = [ HydrusBitmaps.IdBitmap.STATICCreateFromIds( ids ) for ids in id_sets ]
+        
+        for ( ids, bitmap ) in zip( id_sets, bitmaps ):
+            
+            self.assertEqual( bitmap.ToSet(), ids )
+            self.assertEqual( bitmap.ToList(), sorted( ids ) )
+            self.assertEqual( len( bitmap ), len( ids ) )
+            
+        
+        ( a, b, c ) = id_sets
+        ( bitmap_a, bitmap_b, bitmap_c ) = bitmaps
+        
+        self.assertEqual( ( bitmap_a & bitmap_b ).ToSet(), a & b )
+        self.assertEqual( ( bitmap_a | bitmap_b ).ToSet(), a | b )
+        self.assertEqual( ( bitmap_a - bitmap_b ).ToSet(), a - b )
+        self.assertEqual( ( bitmap_b - bitmap_a ).ToSet(), b - a )
+        self.assertEqual( HydrusBitmaps.IdBitmap.STATICIntersectMany( bitmaps ).ToSet(), a & b & c )
+        
+        # ops that empty a chunk out should not leave it hanging around
+        self.assertTrue( ( bitmap_a - bitmap_a ).IsEmpty() )
+        self.assertTrue( ( bitmap_a & HydrusBitmaps.IdBitmap.STATICCreateFromIds( [ 200000000 ] ) ).IsEmpty() )
+        self.assertTrue( HydrusBitmaps.IdBitmap.STATICCreateFromIds( [] ).IsEmpty() )
+        
+        candidates = set( r.sample( range( 0, 65536 * 10 ), 20000 ) )
+        candidates.add( 10000000 )
+        
+        self.assertEqual( bitmap_a.FilterIds( candidates ), candidates & a )
+        self.assertEqual( bitmap_a.FilterIds( candidates, keep_members = False ), candidates - a )
+        self.assertEqual( bitmap_a.FilterIds( set() ), set() )
+        
+    
+    def test_bitmap_performance( self ):
+        
+        # a tag on 1M files in a 5M file client, and another on 2.5M
+        
+        r = random.Random( 42 )
+        
+        ids_1 = set( r.sample( range( 5000000 ), 1000000 ) )
+        ids_2 = set( r.sample( range( 5000000 ), 2500000 ) )
+        
+        bitmap_1 = HydrusBitmaps.IdBitmap.STATICCreateFromIds( ids_1 )
+        bitmap_2 = HydrusBitmaps.IdBitmap.STATICCreateFromIds( ids_2 )
+        
+        # for reference, the set is about 33MB and the bitmap 630KB
+        self.assertLess( bitmap_1.GetMemoryFootprint() * 10, sys.getsizeof( ids_1 ) )
+        
+        self.assertEqual( ( bitmap_1 & bitmap_2 ).ToSet(), ids_1 & ids_2 )
+        
+    
+
+class TestHydrusDBJobQueue( unittest.TestCase ):
+    
+    def _get_job( self, job_type, action, priority, write_seq = None ):
+        
+        job = HydrusDBBase.JobDatabase( job_type, False, action )
+        
+        job.SetPriority( priority )
+        
+        if write_seq is not None:
+            
+            job.SetWriteSeq( write_seq )
+            
+        
+        return job
+        
+    
+    def _get_actions( self, job_queue ):
+        
+        actions = []
+        
+        while not job_queue.empty():
+            
+            ( action, args, kwargs ) = job_queue.get_nowait().GetCallableTuple()
+            
+            actions.append( action )
+            
+        
+        return actions
+        
+    
+    def test_priorities( self ):
+        
+        job_queue = HydrusDBBase.DBJobQueue()
+        
+        job_queue.put( self._get_job( 'write', 'analyze', HydrusDBBase.JOB_PRIORITY_MAINTENANCE ) )
+        job_queue.put( self._get_job( 'read', 'api read', HydrusDBBase.JOB_PRIORITY_CLIENT_API ) )
+        job_queue.put( self._get_job( 'read', 'gui read 1', HydrusDBBase.JOB_PRIORITY_INTERACTIVE ) )
+        job_queue.put( self._get_job( 'read', 'gui read 2', HydrusDBBase.JOB_PRIORITY_INTERACTIVE ) )
+        
+        self.assertTrue( job_queue.HasJobsAbovePriority( HydrusDBBase.JOB_PRIORITY_MAINTENANCE ) )
+        self.assertFalse( job_queue.HasJobsAbovePriority( HydrusDBBase.JOB_PRIORITY_INTERACTIVE ) )
+        
+        self.assertEqual( job_queue.qsize(), 4 )
+        
+        job = job_queue.get_nowait()
+        
+        self.assertEqual( job.GetCallableTuple()[0], 'gui read 1' )
+        
+        # if we can't do it yet, it goes back to the front
+        job_queue.PutBack( job )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ 'gui read 1', 'gui read 2', 'api read', 'analyze' ] )
+        
+        self.assertFalse( job_queue.HasJobsAbovePriority( HydrusDBBase.JOB_PRIORITY_MAINTENANCE ) )
+        
+        with self.assertRaises( queue.Empty ):
+            
+            job_queue.get( timeout = 0.01 )
+            
+        
+    
+    def test_ordered_writes( self ):
+        
+        job_queue = HydrusDBBase.DBJobQueue()
+        
+        job_queue.put( self._get_job( 'read', 'import read', HydrusDBBase.JOB_PRIORITY_IMPORTER ) )
+        job_queue.put( self._get_job( 'write', 'import write', HydrusDBBase.JOB_PRIORITY_IMPORTER, write_seq = 1 ) )
+        job_queue.put( self._get_job( 'write', 'gui write', HydrusDBBase.JOB_PRIORITY_INTERACTIVE, write_seq = 2 ) )
+        job_queue.put( self._get_job( 'read', 'gui read', HydrusDBBase.JOB_PRIORITY_INTERACTIVE ) )
+        
+        # the gui write cannot overtake the importer's write, so the importer's work up to that write goes first
+        self.assertEqual( self._get_actions( job_queue ), [ 'import read', 'import write', 'gui write', 'gui read' ] )
+        
+        job_queue.put( self._get_job( 'write', 'import write', HydrusDBBase.JOB_PRIORITY_IMPORTER, write_seq = 3 ) )
+        job_queue.put( self._get_job( 'write', 'analyze', HydrusDBBase.JOB_PRIORITY_MAINTENANCE ) )
+        job_queue.put( self._get_job( 'read', 'gui read', HydrusDBBase.JOB_PRIORITY_INTERACTIVE ) )
+        job_queue.put( self._get_job( 'write', 'gui write', HydrusDBBase.JOB_PRIORITY_INTERACTIVE, write_seq = 4 ) )
+        
+        # reads and unordered writes are free to move
+        self.assertEqual( self._get_actions( job_queue ), [ 'gui read', 'import write', 'gui write', 'analyze' ] )
+        
+    
+    def test_priority_context( self ):
+        
+        self.assertIsNone( HydrusDBBase.GetThreadLocalJobPriority() )
+        
+        with HydrusDBBase.DBJobPriorityContext( HydrusDBBase.JOB_PRIORITY_CLIENT_API ):
+            
+            self.assertEqual( HydrusDBBase.GetThreadLocalJobPriority(), HydrusDBBase.JOB_PRIORITY_CLIENT_API )
+            
+            with HydrusDBBase.DBJobPriorityContext( None ):
+                
+                self.assertEqual( HydrusDBBase.GetThreadLocalJobPriority(), HydrusDBBase.JOB_PRIORITY_CLIENT_API )
+                
+            
+        
+        self.assertIsNone( HydrusDBBase.GetThreadLocalJobPriority() )
+        
+    
+
+class TestHydrusDBJobStats( unittest.TestCase ):
+    
+    def test_histogram( self ):
+        
+        histogram = HydrusDBJobStats.LatencyHistogram()
+        
+        self.assertEqual( histogram.GetPercentiles( ( 0.5, 0.99 ) ), [ 0.0, 0.0 ] )
+        
+        for i in range( 98 ):
+            
+            histogram.AddSample( 0.001 )
+            
+        
+        histogram.AddSample( 0.5 )
+        histogram.AddSample( 1000 )
+        
+        ( p50, p95, p99, p100 ) = histogram.GetPercentiles( ( 0.5, 0.95, 0.99, 1.0 ) )
+        
+        # buckets are a quarter-doubling wide, so we are accurate to about 20%
+        self.assertTrue( 0.001 <= p50 < 0.0012 )
+        self.assertEqual( p50, p95 )
+        self.assertTrue( 0.5 <= p99 < 0.6 )
+        self.assertEqual( p100, HydrusDBJobStats.GetBucketUpperBound( HydrusDBJobStats.HISTOGRAM_NUM_BUCKETS - 1 ) )
+        
+        histogram.AddSample( 0 )
+        
+        self.assertEqual( histogram.GetNumSamples(), 101 )
+        
+    
+    def test_job_stats( self ):
+        
+        db_job_stats = HydrusDBJobStats.DBJobStats()
+        
+        db_job_stats.AddJob( 'read', 'media_results', 10.0, 10.5, 10.6 )
+        db_job_stats.AddJob( 'read', 'media_results', 20.0, 20.0, 20.2 )
+        db_job_stats.AddJob( 'write', 'content_updates', 30.0, 30.0, 33.0, error = True )
+        
+        report = db_job_stats.GetReport()
+        
+        self.assertEqual( [ ( d[ 'job_type' ], d[ 'action' ] ) for d in report ], [ ( 'write', 'content_updates' ), ( 'read', 'media_results' ) ] )
+        
+        ( write_d, read_d ) = report
+        
+        self.assertEqual( write_d[ 'count' ], 1 )
+        self.assertEqual( write_d[ 'num_errors' ], 1 )
+        self.assertAlmostEqual( write_d[ 'total_run_time' ], 3.0 )
+        
+        self.assertEqual( read_d[ 'count' ], 2 )
+        self.assertEqual( read_d[ 'num_errors' ], 0 )
+        self.assertEqual( read_d[ 'recent_count' ], 2 )
+        self.assertAlmostEqual( read_d[ 'total_wait_time' ], 0.5 )
+        self.assertAlmostEqual( read_d[ 'max_wait_time' ], 0.5 )
+        self.assertAlmostEqual( read_d[ 'max_run_time' ], 0.2 )
+        self.assertTrue( 0.2 <= read_d[ 'run_p99' ] < 0.25 )
+        
+        db_job_stats.Clear()
+        
+        self.assertEqual( db_job_stats.GetReport(), [] )
+        
+    
+
+class TestHydrusDBPopulateCache( unittest.TestCase ):
+    
+    def test_id_to_primitive_cache( self ):
+        
+        id_cache = HydrusDBPopulateCache.IdToPrimitiveCache( 'test', 10 )
+        
+        # fresh strings, like two separate SQLite fetches would give us
+        tag_1 = ''.join( [ 'series:', 'test' ] )
+        tag_2 = ''.join( [ 'series:', 'test' ] )
+        
+        id_cache.update( { 1 : tag_1 } )
+        id_cache.update( { 2 : tag_2 } )
+        
+        self.assertIs( id_cache[ 1 ], id_cache[ 2 ] )
+        
+        self.assertEqual( id_cache.filter_uncached( [ 1, 2, 3 ] ), { 3 } )
+        
+        # an update to a definition we hold replaces it
+        
+        id_cache[ 1 ] = 'series:fixed'
+        
+        self.assertEqual( id_cache[ 1 ], 'series:fixed' )
+        
+        id_cache.update( { 1 : 'series:fixed again' } )
+        
+        self.assertEqual( id_cache[ 1 ], 'series:fixed again' )
+        
+        id_cache.discard_many( [ 2, 3 ] )
+        
+        self.assertNotIn( 2, id_cache )
+        
+        id_cache.update( { i : str( i ) for i in range( 100, 120 ) } )
+        
+        for i in range( 20 ):
+            
+            id_cache.maintain_touch_record()
+            
+        
+        stats = id_cache.get_stats()
+        
+        self.assertEqual( stats[ 'num_items' ], 10 )
+        self.assertEqual( stats[ 'num_hits' ], 2 )
+        self.assertEqual( stats[ 'num_misses' ], 1 )
+        self.assertEqual( stats[ 'num_evictions' ], 11 )
+        
+        self.assertIn( 'test', [ d[ 'name' ] for d in HydrusDBPopulateCache.GetAllIdCacheStats() ] )
+        
+    
+    def test_id_to_primitive_cache_threads( self ):
+        
+        # the read pool and the main db thread hit the same cache, and a reader's answer must not be evicted out from under it
+        
+        id_cache = HydrusDBPopulateCache.IdToPrimitiveCache( 'test threads', 50 )
+        
+        errors = []
+        
+        def work( offset ):
+            
+            try:
+                
+                for i in range( 300 ):
+                    
+                    keys = list( range( offset + i, offset + i + 40 ) )
+                    
+                    id_cache.maintain_touch_record()
+                    
+                    ( keys_to_objs, uncached_keys ) = id_cache.get_many( keys )
+                    
+                    new_keys_to_objs = { key : str( key ) for key in uncached_keys }
+                    
+                    id_cache.update( new_keys_to_objs )
+                    
+                    keys_to_objs.update( new_keys_to_objs )
+                    
+                    if [ keys_to_objs[ key ] for key in keys ] != [ str( key ) for key in keys ]:
+                        
+                        errors.append( 'bad result' )
+                        
+                    
+                    id_cache.discard_many( keys[ : 5 ] )
+                    
+                
+            except Exception as e:
+                
+                errors.append( e )
+                
+            
+        
+        threads = [ threading.Thread( target = work, args = ( i * 1000, ) ) for i in range( 4 ) ]
+        
+        for thread in threads:
+            
+            thread.start()
+            
+        
+        for thread in threads:
+            
+            thread.join()
+            
+        
+        self.assertEqual( errors, [] )
+        
+        id_cache.maintain_touch_record()
+        
+        self.assertLessEqual( id_cache.get_stats()[ 'num_items' ], 200 )
+        
+    
+
 class TestHydrusLists( unittest.TestCase ):
     
     def test_unique_fast_list( self ):
@@ -1,8 +1,69 @@
+import random
+import time
 import unittest
 
+from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusTags
 from hydrus.core import HydrusText
 
+def GetSyntheticTags( num_tags: int, seed = 0 ):
+    
+    # roughly the shape of an import or migration: mostly namespaced, lots of repeats
+    
+    r = random.Random( seed )
+    
+    namespaces = [ '', '', 'character', 'creator', 'series', 'meta', 'title', 'page' ]
+    
+    return [ HydrusTags.CombineTag( r.choice( namespaces ), 'subtag {}'.format( r.randrange( 5000 ) ) ) for i in range( num_tags ) ]
+    
+
+def FilterTagsTimed( tag_filter: HydrusTags.TagFilter, tags: list[ str ] ):
+    
+    # returns ( the tags that passed, tags/s )
+    
+    start_time = time.perf_counter()
+    
+    filtered_tags = tag_filter.FilterMany( tags )
+    
+    time_took = time.perf_counter() - start_time
+    
+    return ( filtered_tags, len( tags ) / max( time_took, 0.000001 ) )
+    
+
+def ReferenceTagOK( tag_slices_to_rules: dict, tag: str, apply_unnamespaced_rules_to_namespaced_tags = False ):
+    
+    # the rules spelled out long-hand: tags, then namespaces, then all namespaces
+    
+    ( namespace, subtag ) = HydrusTags.SplitTag( tag )
+    
+    slices_to_check = [ tag ]
+    
+    if apply_unnamespaced_rules_to_namespaced_tags and namespace != '':
+        
+        slices_to_check.append( subtag )
+        
+    
+    if namespace == '':
+        
+        slices_to_check.append( '' )
+        
+    else:
+        
+        slices_to_check.append( namespace + ':' )
+        slices_to_check.append( ':' )
+        
+    
+    for tag_slice in slices_to_check:
+        
+        if tag_slice in tag_slices_to_rules:
+            
+            return tag_slices_to_rules[ tag_slice ] == HC.FILTER_WHITELIST
+            
+        
+    
+    return True
+    
+
 class TestHydrusTags( unittest.TestCase ):
     
     def test_cleaning_and_combining( self ):
@@ -74,3 +135,83 @@ class TestHydrusTags( unittest.TestCase ):
         self.assertEqual( HydrusText.CleanseImportText( 'test \ud83d\ude1c' ), 'test \U0001f61c' )
         
     
+
+
+class TestTagFilter( unittest.TestCase ):
+    
+    def test_matcher( self ):
+        
+        r = random.Random( 0 )
+        
+        tags = sorted( set( GetSyntheticTags( 2000 ) ) ) + [ '::p', ':)', 'character:creator:hello', 'creator:hello' ]
+        
+        possible_tag_slices = [ '', ':', 'character:', 'creator:', 'series:', 'subtag 1', 'subtag 2', 'character:subtag 3', 'creator:hello', 'hello' ]
+        
+        for i in range( 200 ):
+            
+            tag_filter = HydrusTags.TagFilter()
+            
+            for tag_slice in r.sample( possible_tag_slices, r.randrange( len( possible_tag_slices ) ) ):
+                
+                tag_filter.SetRule( tag_slice, r.choice( [ HC.FILTER_WHITELIST, HC.FILTER_BLACKLIST ] ) )
+                
+            
+            tag_slices_to_rules = tag_filter.GetTagSlicesToRules()
+            
+            for apply_unnamespaced_rules_to_namespaced_tags in ( False, True ):
+                
+                expected = [ tag for tag in tags if ReferenceTagOK( tag_slices_to_rules, tag, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags ) ]
+                
+                self.assertEqual( tag_filter.FilterMany( iter( tags ), apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags ), expected )
+                self.assertEqual( tag_filter.Filter( tags, apply_unnamespaced_rules_to_namespaced_tags = apply_unnamespaced_rules_to_namespaced_tags ), set( expected ) )
+                
+            
+            self.assertEqual( tag_filter.AllowsEverything(), HC.FILTER_BLACKLIST not in tag_slices_to_rules.values() )
+            
+        
+    
+    def test_matcher_swap( self ):
+        
+        tag_filter = HydrusTags.TagFilter()
+        
+        tag_filter_matcher = tag_filter.GetMatcher()
+        
+        tag_filter.SetRule( 'creator:', HC.FILTER_BLACKLIST )
+        
+        # a matcher someone is holding does not change under them
+        
+        self.assertTrue( tag_filter_matcher.TagOK( 'creator:hello' ) )
+        self.assertFalse( tag_filter.TagOK( 'creator:hello' ) )
+        self.assertFalse( tag_filter.GetMatcher().TagOK( 'creator:hello' ) )
+        
+        self.assertEqual( tag_filter.FilterMany( [ 'creator:hello', 'hello', 'hello' ] ), [ 'hello', 'hello' ] )
+        
+        # and it survives a serialisation round trip
+        
+        tag_filter = tag_filter.Duplicate()
+        
+        self.assertFalse( tag_filter.TagOK( 'creator:hello' ) )
+        
+    
+    def test_synthetic_tags( self ):
+        
+        tags = GetSyntheticTags( 50000 )
+        
+        tag_filter = HydrusTags.TagFilter()
+        
+        tag_filter.SetRule( ':', HC.FILTER_BLACKLIST )
+        tag_filter.SetRule( 'creator:', HC.FILTER_WHITELIST )
+        tag_filter.SetRule( 'series:subtag 1', HC.FILTER_WHITELIST )
+        tag_filter.SetRule( 'subtag 2', HC.FILTER_BLACKLIST )
+        
+        tag_slices_to_rules = tag_filter.GetTagSlicesToRules()
+        
+        expected_tags = [ tag for tag in tags if ReferenceTagOK( tag_slices_to_rules, tag ) ]
+        
+        ( filtered_tags, tags_per_second ) = FilterTagsTimed( tag_filter, tags )
+        
+        self.assertEqual( filtered_tags, expected_tags )
+        self.assertEqual( tag_filter.Filter( tags ), set( expected_tags ) )
+        self.assertEqual( [ tag for tag in tags if tag_filter.TagOK( tag ) ], expected_tags )
+        
+    